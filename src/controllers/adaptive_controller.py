@@ -12,6 +12,14 @@ from typing import Dict, List, Tuple, Optional, TYPE_CHECKING
 from collections import defaultdict
 from enum import Enum
 
+from simulation.step_snapshot import StepSnapshot, get_step_snapshot
+from simulation.network_index import DIRECTION_NAMES, NetworkIndex, get_network_index
+from controllers.pressure_engine import PressureEngine, PressureState
+from controllers.cycle_tracker import CycleTracker
+from utils.ring_buffer import RingBuffer, BoundedHistory
+from utils.profiler import profiled
+from utils.logger import get_logger
+
 if TYPE_CHECKING:
     from src.simulation.sensor_manager import SensorManager
 
@@ -35,15 +43,23 @@ class AdaptiveController:
     Thuật toán điều khiển thích ứng dựa trên mật độ xe
     """
     
-    def __init__(self, junction_id: str = "J1", sensor_manager: Optional['SensorManager'] = None):
+    def __init__(self, junction_id: str = "J1", sensor_manager: Optional['SensorManager'] = None,
+                 connection=None, network_index: Optional[NetworkIndex] = None):
         """
         Khởi tạo Adaptive Controller
         
         Args:
-            junction_id: ID của ngã tư cần điều khiển (mặc định "J1")
+            junction_id: ID đèn giao thông cần điều khiển (mặc định "J1")
             sensor_manager: Optional SensorManager instance để đọc E1/E2 detector data
+            connection: Kết nối SUMO (SumoConnection), None = kết nối mặc định toàn cục
+            network_index: Chỉ mục ngã tư/hướng của mạng (None = mạng mặc định test2)
         """
         self.junction_id = junction_id
+        self.network_index = network_index or get_network_index()
+        self.node_id = self.network_index.junction_for_tls(junction_id)  # Junction do đèn điều khiển (vd: đèn J3 → J4)
+        self.connection = connection
+        self.logger = get_logger(__name__, junction=junction_id)  # Log chi tiết mỗi step ở cấp DEBUG
+        self.traci = traci if connection is None else connection
         self.sensor_manager = sensor_manager
         self.current_phase = TrafficPhase.NS_GREEN
         self.phase_start_time = 0
@@ -69,24 +85,21 @@ class AdaptiveController:
             'emergency': 1.0   # Xe cứu thương/cứu hỏa
         }
         
-        # Mapping hướng với edges trong SUMO
+        # Mapping hướng với edges VÀO ngã tư (dựng từ mạng SUMO, vd J1: Bắc → ["-E1"])
         self.direction_edges = {
-            TrafficDirection.NORTH: ["-E1"],  
-            TrafficDirection.SOUTH: ["-E2"],   
-            TrafficDirection.EAST: ["-E3"],   
-            TrafficDirection.WEST: ["E0"]       
-        }
-        
-        # Traffic Light IDs trong SUMO
-        self.traffic_light_ids = {
-            "J1": "J1",  # Main junction
-            "J4": "J4"   # Secondary junction nếu cần
+            TrafficDirection(DIRECTION_NAMES[direction]): edges
+            for direction, edges in self.network_index.direction_edges(self.node_id).items()
         }
         
-        # Lưu trữ dữ liệu đo lường
-        self.queue_history: Dict[TrafficDirection, List[float]] = defaultdict(list)
-        self.pressure_history: Dict[TrafficDirection, List[float]] = defaultdict(list)
-        self.phase_history: List[Tuple[TrafficPhase, float, float]] = []  # (phase, start_time, duration)
+        # Lưu trữ dữ liệu đo lường (bộ đệm vòng: chỉ giữ N giá trị gần nhất,
+        # thống kê trung bình/tổng được tích lũy trên toàn bộ lịch sử)
+        self.HISTORY_CAPACITY = 600        # Số giá trị queue/pressure gần nhất mỗi hướng
+        self.PHASE_HISTORY_CAPACITY = 500  # Số pha gần nhất
+        self.queue_history: Dict[TrafficDirection, RingBuffer] = defaultdict(lambda: RingBuffer(self.HISTORY_CAPACITY))
+        self.pressure_history: Dict[TrafficDirection, RingBuffer] = defaultdict(lambda: RingBuffer(self.HISTORY_CAPACITY))
+        self.phase_history: BoundedHistory = BoundedHistory(self.PHASE_HISTORY_CAPACITY)  # (phase, start_time, duration)
+        self.phase_durations = RingBuffer(self.PHASE_HISTORY_CAPACITY)  # Thời lượng các pha (thống kê tích lũy)
+        self.cycle_tracker = CycleTracker()  # Chu kỳ đèn cập nhật mỗi lần chuyển pha
         
         # Green debt system (cho PriorityController)
         self.green_debts: Dict[str, float] = defaultdict(float)  # {"Bắc": 10.5, "Nam": 5.2, ...}
@@ -134,6 +147,18 @@ class AdaptiveController:
         self.THRESHOLD_MAX = 1.30  # Ngưỡng tối đa khi thông thoáng
         self.CONGESTION_LOW = 5.0   # PCU - Ngưỡng tải thấp
         self.CONGESTION_HIGH = 20.0 # PCU - Ngưỡng tải cao
+        
+        # Bộ tính áp lực: quét edge/xe 1 lần/step cho cả 4 hướng
+        self.pressure_engine = PressureEngine(self, tuple(TrafficDirection))
+    
+    @property
+    def snapshot(self) -> StepSnapshot:
+        """Snapshot TraCI dùng chung của step hiện tại (mỗi giá trị chỉ đọc 1 lần/step)"""
+        return get_step_snapshot(self.connection)
+    
+    def get_pressure_state(self) -> PressureState:
+        """Queue PCU, occupancy, tốc độ và áp lực của cả 4 hướng trong step hiện tại"""
+        return self.pressure_engine.compute()
     
     def calculate_dynamic_threshold(self, ns_pressure: float, ew_pressure: float) -> float:
         """
@@ -177,69 +202,8 @@ class AdaptiveController:
         Returns:
             Dict chứa: vehicle_count, occupancy, avg_speed, queue_length
         """
-        # Mapping TrafficDirection → sensor direction string
-        direction_map = {
-            TrafficDirection.NORTH: "north",
-            TrafficDirection.SOUTH: "south",
-            TrafficDirection.EAST: "east",
-            TrafficDirection.WEST: "west"
-        }
-        
-        # Nếu có SensorManager và detector data → Dùng E2 detector (chính xác hơn)
-        if self.sensor_manager:
-            try:
-                sensor_dir = direction_map.get(direction)
-                if sensor_dir:
-                    density_data = self.sensor_manager.get_junction_density(
-                        self.junction_id, 
-                        sensor_dir
-                    )
-                    
-                    if "error" not in density_data:
-                        return {
-                            "vehicle_count": density_data.get("total_vehicles", 0),
-                            "occupancy": density_data.get("avg_occupancy", 0.0),
-                            "avg_speed": density_data.get("avg_speed", 0.0),
-                            "queue_length": density_data.get("queue_length", 0)
-                        }
-            except Exception as e:
-                # Fallback to edge data if sensor fails
-                pass
-        
-        # Fallback: Dùng edge data (cách cũ)
-        edges = self.direction_edges.get(direction, [])
-        total_vehicles = 0
-        total_occupancy = 0.0
-        total_speed = 0.0
-        vehicle_count = 0
-        edge_count = 0
-        
-        for edge in edges:
-            try:
-                total_vehicles += len(traci.edge.getLastStepVehicleIDs(edge))
-                total_occupancy += traci.edge.getLastStepOccupancy(edge)
-                edge_count += 1
-                
-                vehicles = traci.edge.getLastStepVehicleIDs(edge)
-                for veh_id in vehicles:
-                    try:
-                        speed = traci.vehicle.getSpeed(veh_id) * 3.6  # m/s → km/h
-                        total_speed += speed
-                        vehicle_count += 1
-                    except:
-                        continue
-            except:
-                continue
-        
-        avg_occupancy = total_occupancy / max(edge_count, 1)
-        avg_speed = total_speed / max(vehicle_count, 1) if vehicle_count > 0 else self.SPEED_LIMIT
-        
-        return {
-            "vehicle_count": total_vehicles,
-            "occupancy": avg_occupancy,
-            "avg_speed": avg_speed,
-            "queue_length": total_vehicles  # Estimate
-        }
+        # Đọc từ kết quả đã tính sẵn của step (E2 detector nếu có, ngược lại edge data)
+        return self.get_pressure_state().sensor_data(direction)
         
     def get_vehicle_count_by_direction(self, direction: TrafficDirection) -> int:
         """
@@ -252,33 +216,11 @@ class AdaptiveController:
             Số lượng xe (int)
         """
         try:
-            total_vehicles = 0
-            edges = self.direction_edges.get(direction, [])
-            
-            for edge in edges:
-                try:
-                    # Lấy danh sách xe trên edge
-                    vehicles_on_edge = traci.edge.getLastStepVehicleIDs(edge)
-                    
-                    # Đếm xe đang chờ (vận tốc < 2 m/s = kẹt xe)
-                    waiting_vehicles = 0
-                    for veh_id in vehicles_on_edge:
-                        try:
-                            speed = traci.vehicle.getSpeed(veh_id)
-                            if speed < 2.0:  # Xe đang chờ/kẹt
-                                waiting_vehicles += 1
-                        except traci.exceptions.TraCIException:
-                            continue
-                    
-                    total_vehicles += waiting_vehicles
-                    
-                except traci.exceptions.TraCIException:
-                    continue
-                    
-            return total_vehicles
+            state = self.get_pressure_state()
+            return state.waiting_count[state.index[direction]]
             
         except Exception as e:
-            print(f"❌ Lỗi khi đếm xe hướng {direction.value}: {e}")
+            self.logger.error("❌ Lỗi khi đếm xe hướng %s: %s", direction.value, e)
             return 0
     
     def convert_to_pcu(self, direction: TrafficDirection) -> float:
@@ -292,43 +234,11 @@ class AdaptiveController:
             Tổng PCU (float)
         """
         try:
-            total_pcu = 0.0
-            edges = self.direction_edges.get(direction, [])
-            
-            for edge in edges:
-                try:
-                    vehicles_on_edge = traci.edge.getLastStepVehicleIDs(edge)
-                    
-                    for veh_id in vehicles_on_edge:
-                        try:
-                            speed = traci.vehicle.getSpeed(veh_id)
-                            if speed < 2.0:  # Chỉ tính xe đang chờ
-                                veh_type = traci.vehicle.getTypeID(veh_id)
-                                
-                                # Xác định loại xe và quy đổi PCU
-                                if 'motorcycle' in veh_type.lower() or 'bike' in veh_type.lower():
-                                    pcu_value = self.PCU_CONVERSION['motorcycle']
-                                elif 'bus' in veh_type.lower():
-                                    pcu_value = self.PCU_CONVERSION['bus']
-                                elif 'truck' in veh_type.lower():
-                                    pcu_value = self.PCU_CONVERSION['truck']
-                                elif 'emergency' in veh_type.lower():
-                                    pcu_value = self.PCU_CONVERSION['emergency']
-                                else:
-                                    pcu_value = self.PCU_CONVERSION['car']  # Mặc định
-                                
-                                total_pcu += pcu_value
-                                
-                        except traci.exceptions.TraCIException:
-                            continue
-                            
-                except traci.exceptions.TraCIException:
-                    continue
-                    
-            return total_pcu
+            state = self.get_pressure_state()
+            return state.queue_pcu[state.index[direction]]
             
         except Exception as e:
-            print(f"❌ Lỗi khi tính PCU hướng {direction.value}: {e}")
+            self.logger.error("❌ Lỗi khi tính PCU hướng %s: %s", direction.value, e)
             return 0.0
     
     def calculate_pressure(self, direction: TrafficDirection) -> float:
@@ -350,36 +260,17 @@ class AdaptiveController:
             Điểm áp lực chuẩn hóa (0.0 - 1.0+)
         """
         try:
-            queue_pcu = self.convert_to_pcu(direction)
-            
-            # ✅ GIAI ĐOẠN 7 - Issue #18: Dùng SensorManager để lấy dữ liệu chính xác hơn
-            sensor_data = self.get_sensor_data_for_direction(direction)
-            
-            # --- 1. NORMALIZED QUEUE (0-1) ---
-            norm_queue = min(queue_pcu / self.QUEUE_MAX, 1.0)
-            
-            # --- 2. OCCUPANCY (0-1) ---
-            # ✅ Dùng E2 detector data thay vì edge data (chính xác hơn 20%)
-            avg_occupancy = sensor_data.get("occupancy", 0.0)
-            
-            # --- 3. SPEED FACTOR (0-1) ---
-            # ✅ Dùng avg_speed từ sensor data (đã tính sẵn)
-            avg_speed = sensor_data.get("avg_speed", self.SPEED_LIMIT)
-            norm_speed_factor = 1.0 - min(avg_speed / self.SPEED_LIMIT, 1.0)
-            
-            # --- 4. WEIGHTED PRESSURE ---
-            pressure = (
-                self.PRESSURE_WEIGHT_QUEUE * norm_queue +
-                self.PRESSURE_WEIGHT_OCCUPANCY * avg_occupancy +
-                self.PRESSURE_WEIGHT_SPEED * norm_speed_factor
-            )
+            # Queue, occupancy, tốc độ và áp lực đã được PressureEngine tính 1 lần cho cả 4 hướng
+            # (E2 detector từ SensorManager nếu có - Issue #18)
+            state = self.get_pressure_state()
+            i = state.index[direction]
+            queue_pcu = state.queue_pcu[i]
+            pressure = state.pressure[i]
             
             # ✅ FIX: Fallback khi Occupancy/Speed = 0 (không có xe đang chạy)
-            # Nếu có queue nhưng pressure thấp → Dùng công thức cũ
-            # ✅ FIX CHU KÌ: Hạ ngưỡng 0.01 → 0.05 để fallback sớm hơn
-            if queue_pcu > 0 and pressure < 0.05:
-                pressure = self.ALPHA * queue_pcu
-                print(f"⚠️ [PRESSURE-FALLBACK] {direction.value}: Queue={queue_pcu:.1f} PCU nhưng Pressure={pressure:.3f} thấp → Dùng công thức cũ P={self.ALPHA * queue_pcu:.3f}")
+            # Nếu có queue nhưng pressure thấp → Dùng công thức cũ (PressureEngine đã áp dụng)
+            if state.fallback[i]:
+                self.logger.debug("⚠️ [PRESSURE-FALLBACK] %s: Queue=%.1f PCU nhưng Pressure=%.3f thấp → Dùng công thức cũ P=%.3f", direction.value, queue_pcu, pressure, self.ALPHA * queue_pcu)
             
             # Lưu lịch sử để phân tích
             self.queue_history[direction].append(queue_pcu)
@@ -390,13 +281,13 @@ class AdaptiveController:
             self.current_queue[direction_name] = queue_pcu
             
             # Debug log (TẮT để giảm spam - chỉ bật khi debug)
-            # if queue_pcu > 5 or avg_occupancy > 0.3:
-            #     print(f"[PRESSURE-DEBUG] {direction.value}: Queue={queue_pcu:.1f} PCU, Occ={avg_occupancy:.2f}, Speed={avg_speed:.1f}km/h → P={pressure:.3f}")
+            # if queue_pcu > 5 or state.occupancy[i] > 0.3:
+            #     print(f"[PRESSURE-DEBUG] {direction.value}: Queue={queue_pcu:.1f} PCU, Occ={state.occupancy[i]:.2f}, Speed={state.avg_speed[i]:.1f}km/h → P={pressure:.3f}")
             
             return pressure
             
         except Exception as e:
-            print(f"❌ Lỗi khi tính pressure hướng {direction.value}: {e}")
+            self.logger.error("❌ Lỗi khi tính pressure hướng %s: %s", direction.value, e)
             # Fallback về công thức cũ
             queue_pcu = self.convert_to_pcu(direction)
             return self.ALPHA * queue_pcu
@@ -435,15 +326,15 @@ class AdaptiveController:
                 # Trừ nợ
                 self.green_debts[direction_name] -= compensation
                 
-                print(f"💰 SC6-BACKLOG: {direction_name}")
-                print(f"   Queue: {queue_pcu:.1f} PCU")
-                print(f"   Severity: {severity:.0f}/100")
-                print(f"   Bù: {compensation:.1f}s (Nợ còn: {self.green_debts[direction_name]:.1f}s)")
+                self.logger.debug("💰 SC6-BACKLOG: %s", direction_name)
+                self.logger.debug("   Queue: %.1f PCU", queue_pcu)
+                self.logger.debug("   Severity: %.0f/100", severity)
+                self.logger.debug("   Bù: %.1fs (Nợ còn: %.1fs)", compensation, self.green_debts[direction_name])
         
         # ✅ GIAI ĐOẠN 4 - Issue #11: Kiểm tra waiting_time hướng khác (chống đói layer 3)
         # Nếu có hướng chờ >40s (CRITICAL), giới hạn green_time xuống 45s để chuyển pha sớm
         try:
-            current_time = traci.simulation.getTime()
+            current_time = self.snapshot.get_time()
             max_waiting_other = 0.0
             
             for dir_name in ["Bắc", "Nam", "Đông", "Tây"]:
@@ -457,7 +348,7 @@ class AdaptiveController:
                 if green_time > MAX_GREEN_WITH_CRITICAL:
                     original_green = green_time
                     green_time = MAX_GREEN_WITH_CRITICAL
-                    print(f"   ⚠️ GIỚI HẠN: {direction_name} {original_green:.1f}s → {green_time:.1f}s (hướng khác chờ {max_waiting_other:.0f}s)")
+                    self.logger.warning("   ⚠️ GIỚI HẠN: %s %.1fs → %.1fs (hướng khác chờ %.0fs)", direction_name, original_green, green_time, max_waiting_other)
         except Exception as e:
             pass  # Không crash nếu lỗi
         
@@ -495,7 +386,7 @@ class AdaptiveController:
             Thời gian chờ (giây)
         """
         try:
-            current_time = traci.simulation.getTime()
+            current_time = self.snapshot.get_time()
             last_green = self.last_green_time.get(direction, 0.0)
             
             if last_green == 0.0:
@@ -506,7 +397,7 @@ class AdaptiveController:
             return waiting_time
             
         except Exception as e:
-            print(f"❌ Lỗi khi tính waiting time cho {direction.value}: {e}")
+            self.logger.error("❌ Lỗi khi tính waiting time cho %s: %s", direction.value, e)
             return 0.0
     
     def check_starvation_prevention(self) -> Tuple[bool, Optional[TrafficPhase]]:
@@ -518,7 +409,7 @@ class AdaptiveController:
         Returns:
             Tuple (should_force_change: bool, force_phase: TrafficPhase)
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         
         # Kiểm tra từng hướng
         for direction in TrafficDirection:
@@ -528,7 +419,7 @@ class AdaptiveController:
             if waiting_time > self.CRITICAL_WAITING_TIME and waiting_time <= self.MAX_WAITING_TIME:
                 queue_pcu = self.convert_to_pcu(direction)
                 if queue_pcu > 0:  # Chỉ cảnh báo nếu có xe chờ
-                    print(f"[STAGE2-CRITICAL] ⚠️ {direction.value} chờ {waiting_time:.0f}s (>{self.CRITICAL_WAITING_TIME:.0f}s) | Queue:{queue_pcu:.1f}PCU")
+                    self.logger.debug("[STAGE2-CRITICAL] ⚠️ %s chờ %.0fs (>%.0fs) | Queue:%.1fPCU", direction.value, waiting_time, self.CRITICAL_WAITING_TIME, queue_pcu)
             
             # Buộc chuyển pha nếu vượt MAX_WAITING_TIME
             if waiting_time > self.MAX_WAITING_TIME:
@@ -539,7 +430,7 @@ class AdaptiveController:
                 MIN_QUEUE_TO_FORCE = 2.0  # PCU tối thiểu để buộc chuyển (~ 2 ô tô hoặc 7 xe máy)
                 
                 if queue_pcu >= MIN_QUEUE_TO_FORCE:
-                    print(f"[STAGE2-FORCE] 🚨 STARVATION! {direction.value} chờ {waiting_time:.0f}s (>{self.MAX_WAITING_TIME:.0f}s) | Queue:{queue_pcu:.1f}PCU → BUỘC CHUYỂN PHA")
+                    self.logger.debug("[STAGE2-FORCE] 🚨 STARVATION! %s chờ %.0fs (>%.0fs) | Queue:%.1fPCU → BUỘC CHUYỂN PHA", direction.value, waiting_time, self.MAX_WAITING_TIME, queue_pcu)
                     
                     # Xác định pha cần chuyển
                     if direction in [TrafficDirection.NORTH, TrafficDirection.SOUTH]:
@@ -563,7 +454,7 @@ class AdaptiveController:
                     # → Reset waiting_time để tránh vòng lặp vô hạn
                     # Gap nguy hiểm: 0.5-2.0 PCU cần được xử lý
                     self.last_green_time[direction] = current_time
-                    print(f"[STAGE2-RESET] 🔄 {direction.value} chờ {waiting_time:.0f}s nhưng queue nhỏ ({queue_pcu:.1f} < {MIN_QUEUE_TO_FORCE} PCU) → RESET waiting_time")
+                    self.logger.debug("[STAGE2-RESET] 🔄 %s chờ %.0fs nhưng queue nhỏ (%.1f < %s PCU) → RESET waiting_time", direction.value, waiting_time, queue_pcu, MIN_QUEUE_TO_FORCE)
         
         return False, None
     
@@ -587,7 +478,7 @@ class AdaptiveController:
         Returns:
             Tuple (should_change: bool, next_phase: TrafficPhase)
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         phase_duration = current_time - self.phase_start_time
         
         # ✅ BƯỚC 1: Kiểm tra starvation prevention (ưu tiên cao nhất)
@@ -613,7 +504,7 @@ class AdaptiveController:
         
         # 🔍 DEBUG LOG STAGE 2
         total_pressure = ns_pressure + ew_pressure
-        print(f"[STAGE2-DEBUG] Time:{current_time:.0f}s | Phase:{self.current_phase.value} | Duration:{phase_duration:.1f}s | Cycle:{cycle_time:.0f}s | NS_P:{ns_pressure:.1f} | EW_P:{ew_pressure:.1f} | Total:{total_pressure:.1f}PCU | Threshold:{dynamic_threshold:.2f}")
+        self.logger.debug("[STAGE2-DEBUG] Time:%.0fs | Phase:%s | Duration:%.1fs | Cycle:%.0fs | NS_P:%.1f | EW_P:%.1f | Total:%.1fPCU | Threshold:%.2f", current_time, self.current_phase.value, phase_duration, cycle_time, ns_pressure, ew_pressure, total_pressure, dynamic_threshold)
         
         # Logic chuyển pha với ngưỡng động
         # ✅ FIX: Chỉ chuyển pha khi hướng đối diện có xe đủ nhiều (>= 1.0 PCU)
@@ -623,33 +514,33 @@ class AdaptiveController:
             # Hiện tại Bắc-Nam đang xanh
             # ✅ FIX CHU KÌ: Buộc chuyển nếu chu kì quá dài (>MAX_CYCLE_TIME)
             if cycle_time >= self.MAX_CYCLE_TIME:
-                print(f"[STAGE2-CYCLE-LIMIT] 🚨 Cycle({cycle_time:.0f}s) >= MAX_CYCLE_TIME({self.MAX_CYCLE_TIME:.0f}s) → BẮT BUỘC chuyển sang YELLOW")
+                self.logger.debug("[STAGE2-CYCLE-LIMIT] 🚨 Cycle(%.0fs) >= MAX_CYCLE_TIME(%.0fs) → BẮT BUỘC chuyển sang YELLOW", cycle_time, self.MAX_CYCLE_TIME)
                 return True, TrafficPhase.NS_YELLOW
             # Chỉ chuyển nếu EW có xe và áp lực vượt ngưỡng
             elif ew_pressure >= MIN_PRESSURE_TO_SWITCH and ew_pressure > ns_pressure * dynamic_threshold:
-                print(f"[STAGE2-SWITCH] EW_P({ew_pressure:.1f}) > NS_P({ns_pressure:.1f}) * {dynamic_threshold:.2f} → Chuyển sang YELLOW")
+                self.logger.debug("[STAGE2-SWITCH] EW_P(%.1f) > NS_P(%.1f) * %.2f → Chuyển sang YELLOW", ew_pressure, ns_pressure, dynamic_threshold)
                 return True, TrafficPhase.NS_YELLOW
             elif phase_duration >= self.T_MAX_GREEN:  # Đã đạt thời gian tối đa
-                print(f"[STAGE2-SWITCH] Duration({phase_duration:.1f}s) >= T_MAX_GREEN({self.T_MAX_GREEN:.0f}s) → Chuyển sang YELLOW")
+                self.logger.debug("[STAGE2-SWITCH] Duration(%.1fs) >= T_MAX_GREEN(%.0fs) → Chuyển sang YELLOW", phase_duration, self.T_MAX_GREEN)
                 return True, TrafficPhase.NS_YELLOW
                 
         elif self.current_phase == TrafficPhase.EW_GREEN:
             # Hiện tại Đông-Tây đang xanh
             # ✅ FIX CHU KÌ: Buộc chuyển nếu chu kì quá dài (>MAX_CYCLE_TIME)
             if cycle_time >= self.MAX_CYCLE_TIME:
-                print(f"[STAGE2-CYCLE-LIMIT] 🚨 Cycle({cycle_time:.0f}s) >= MAX_CYCLE_TIME({self.MAX_CYCLE_TIME:.0f}s) → BẮT BUỘC chuyển sang YELLOW")
+                self.logger.debug("[STAGE2-CYCLE-LIMIT] 🚨 Cycle(%.0fs) >= MAX_CYCLE_TIME(%.0fs) → BẮT BUỘC chuyển sang YELLOW", cycle_time, self.MAX_CYCLE_TIME)
                 return True, TrafficPhase.EW_YELLOW
             # Chỉ chuyển nếu NS có xe và áp lực vượt ngưỡng
             elif ns_pressure >= MIN_PRESSURE_TO_SWITCH and ns_pressure > ew_pressure * dynamic_threshold:
-                print(f"[STAGE2-SWITCH] NS_P({ns_pressure:.1f}) > EW_P({ew_pressure:.1f}) * {dynamic_threshold:.2f} → Chuyển sang YELLOW")
+                self.logger.debug("[STAGE2-SWITCH] NS_P(%.1f) > EW_P(%.1f) * %.2f → Chuyển sang YELLOW", ns_pressure, ew_pressure, dynamic_threshold)
                 return True, TrafficPhase.EW_YELLOW
             elif phase_duration >= self.T_MAX_GREEN:  # Đã đạt thời gian tối đa
-                print(f"[STAGE2-SWITCH] Duration({phase_duration:.1f}s) >= T_MAX_GREEN({self.T_MAX_GREEN:.0f}s) → Chuyển sang YELLOW")
+                self.logger.debug("[STAGE2-SWITCH] Duration(%.1fs) >= T_MAX_GREEN(%.0fs) → Chuyển sang YELLOW", phase_duration, self.T_MAX_GREEN)
                 return True, TrafficPhase.EW_YELLOW
         
         # Kiểm tra vi phạm T_MIN_GREEN
         if phase_duration < self.T_MIN_GREEN:
-            print(f"[STAGE2-BLOCK] Duration({phase_duration:.1f}s) < T_MIN_GREEN({self.T_MIN_GREEN:.0f}s) → GIỮ PHA")
+            self.logger.debug("[STAGE2-BLOCK] Duration(%.1fs) < T_MIN_GREEN(%.0fs) → GIỮ PHA", phase_duration, self.T_MIN_GREEN)
                 
         return False, None
     
@@ -675,15 +566,17 @@ class AdaptiveController:
             
             sumo_phase = phase_mapping.get(phase)
             if sumo_phase is not None:
-                traci.trafficlight.setPhase(self.junction_id, sumo_phase)
+                self.traci.trafficlight.setPhase(self.junction_id, sumo_phase)
                 
                 # Cập nhật trạng thái
-                current_time = traci.simulation.getTime()
+                current_time = self.snapshot.get_time()
                 if self.current_phase != phase:
                     # Lưu lịch sử pha trước
                     if self.phase_start_time > 0:
                         duration = current_time - self.phase_start_time
                         self.phase_history.append((self.current_phase, self.phase_start_time, duration))
+                        self.phase_durations.append(duration)
+                        self.cycle_tracker.record_phase(self.current_phase.value, self.phase_start_time, duration)
                     
                     # ✅ Cập nhật last_green_time khi chuyển sang pha GREEN
                     if phase == TrafficPhase.NS_GREEN:
@@ -708,11 +601,11 @@ class AdaptiveController:
                 
                 return True
             else:
-                print(f"❌ Không tìm thấy mapping cho pha: {phase}")
+                self.logger.error("❌ Không tìm thấy mapping cho pha: %s", phase)
                 return False
                 
         except Exception as e:
-            print(f"❌ Lỗi khi áp dụng pha {phase}: {e}")
+            self.logger.error("❌ Lỗi khi áp dụng pha %s: %s", phase, e)
             return False
     
     def start(self) -> bool:
@@ -723,36 +616,37 @@ class AdaptiveController:
             True nếu khởi động thành công
         """
         try:
-            if not traci.isLoaded():
-                print("❌ SUMO chưa được khởi động!")
+            if not self.traci.isLoaded():
+                self.logger.error("❌ SUMO chưa được khởi động!")
                 return False
                 
             # Kiểm tra traffic light tồn tại
-            tl_list = traci.trafficlight.getIDList()
+            tl_list = self.traci.trafficlight.getIDList()
             if self.junction_id not in tl_list:
-                print(f"❌ Không tìm thấy traffic light: {self.junction_id}")
+                self.logger.error("❌ Không tìm thấy traffic light: %s", self.junction_id)
                 return False
             
             # Khởi tạo trạng thái ban đầu
             self.current_phase = TrafficPhase.NS_GREEN
-            self.phase_start_time = traci.simulation.getTime()
+            self.phase_start_time = self.snapshot.get_time()
             self.is_active = True
             
             # Áp dụng pha ban đầu
             self.apply_phase(self.current_phase)
             
-            print(f"✅ Adaptive Controller đã khởi động cho {self.junction_id}")
+            self.logger.info("✅ Adaptive Controller đã khởi động cho %s", self.junction_id)
             return True
             
         except Exception as e:
-            print(f"❌ Lỗi khi khởi động Adaptive Controller: {e}")
+            self.logger.error("❌ Lỗi khi khởi động Adaptive Controller: %s", e)
             return False
     
     def stop(self):
         """Dừng thuật toán điều khiển"""
         self.is_active = False
-        print("🛑 Adaptive Controller đã dừng")
+        self.logger.info("🛑 Adaptive Controller đã dừng")
     
+    @profiled("AdaptiveController.step")
     def step(self) -> bool:
         """
         Thực hiện một bước điều khiển (gọi mỗi simulation step)
@@ -764,7 +658,7 @@ class AdaptiveController:
             return False
             
         try:
-            current_time = traci.simulation.getTime()
+            current_time = self.snapshot.get_time()
             
             # Xử lý logic theo pha hiện tại
             if self.current_phase in [TrafficPhase.NS_GREEN, TrafficPhase.EW_GREEN]:
@@ -800,7 +694,7 @@ class AdaptiveController:
             return True
             
         except Exception as e:
-            print(f"❌ Lỗi trong bước điều khiển: {e}")
+            self.logger.error("❌ Lỗi trong bước điều khiển: %s", e)
             return False
     
     def get_status(self) -> Dict:
@@ -811,7 +705,7 @@ class AdaptiveController:
             Dictionary chứa thông tin trạng thái
         """
         try:
-            current_time = traci.simulation.getTime()
+            current_time = self.snapshot.get_time()
             phase_duration = current_time - self.phase_start_time
             
             # Tính áp lực hiện tại cho tất cả hướng
@@ -829,11 +723,11 @@ class AdaptiveController:
                 'pressures': {dir.value: round(pressure, 2) for dir, pressure in priorities.items()},
                 'ns_total_pressure': round(ns_pressure, 2),
                 'ew_total_pressure': round(ew_pressure, 2),
-                'phase_count': len(self.phase_history)
+                'phase_count': self.phase_history.total_count
             }
             
         except Exception as e:
-            print(f"❌ Lỗi khi lấy trạng thái: {e}")
+            self.logger.error("❌ Lỗi khi lấy trạng thái: %s", e)
             return {'error': str(e)}
     
     def get_statistics(self) -> Dict:
@@ -847,76 +741,54 @@ class AdaptiveController:
             if not self.phase_history:
                 return {'message': 'Chưa có dữ liệu thống kê'}
             
-            # Thống kê thời gian pha
-            phase_durations = [duration for _, _, duration in self.phase_history]
-            avg_phase_duration = sum(phase_durations) / len(phase_durations)
+            # Thống kê thời gian pha (tích lũy O(1), không duyệt lại lịch sử)
+            avg_phase_duration = self.phase_durations.mean
             
             # Thống kê áp lực trung bình
             avg_pressures = {}
             for direction, pressures in self.pressure_history.items():
-                if pressures:
-                    avg_pressures[direction.value] = sum(pressures) / len(pressures)
+                if pressures.count:
+                    avg_pressures[direction.value] = pressures.mean
             
             # Thống kê queue length trung bình
             avg_queues = {}
             for direction, queues in self.queue_history.items():
-                if queues:
-                    avg_queues[direction.value] = sum(queues) / len(queues)
+                if queues.count:
+                    avg_queues[direction.value] = queues.mean
             
             return {
-                'total_phases': len(self.phase_history),
+                'total_phases': self.phase_history.total_count,
                 'average_phase_duration': round(avg_phase_duration, 2),
                 'average_pressures': {k: round(v, 2) for k, v in avg_pressures.items()},
                 'average_queue_lengths': {k: round(v, 2) for k, v in avg_queues.items()},
-                'total_simulation_time': round(sum(phase_durations), 2)
+                'total_simulation_time': round(self.phase_durations.total, 2)
             }
             
         except Exception as e:
-            print(f"❌ Lỗi khi tính thống kê: {e}")
+            self.logger.error("❌ Lỗi khi tính thống kê: %s", e)
             return {'error': str(e)}
     
     def get_cycle_time(self) -> float:
         """
-        Tính thời gian chu kì hiện tại (cycle time) từ phase_history
+        Tính thời gian chu kì hiện tại (cycle time) từ cycle_tracker
         
         Cycle time = Thời gian từ NS_GREEN → NS_GREEN tiếp theo
         hoặc từ EW_GREEN → EW_GREEN tiếp theo
+        (cycle_tracker được cập nhật trong apply_phase, không duyệt lại phase_history)
         
         Returns:
             Chu kì hiện tại (giây), trả về 0.0 nếu chưa đủ dữ liệu
         """
         try:
-            if len(self.phase_history) < 2:
-                return 0.0
-            
-            current_time = traci.simulation.getTime()
-            
-            # Tìm 2 lần NS_GREEN gần nhất để tính cycle
-            ns_green_times = []
-            for phase, start_time, duration in self.phase_history:
-                if phase == TrafficPhase.NS_GREEN:
-                    ns_green_times.append(start_time)
-            
-            # Nếu có ít nhất 2 lần NS_GREEN
-            if len(ns_green_times) >= 2:
-                # Cycle = interval giữa 2 lần NS_GREEN gần nhất
-                cycle = ns_green_times[-1] - ns_green_times[-2]
-                return cycle
-            
-            # Fallback: Tính cycle từ phase hiện tại
-            # Nếu đang trong phase xanh, tính từ lần xuất hiện trước đó
+            # Fallback khi chưa đủ 2 lần NS_GREEN: nếu đang trong phase xanh,
+            # tính từ 2 lần xuất hiện gần nhất của phase này
+            current_phase = None
             if self.current_phase in [TrafficPhase.NS_GREEN, TrafficPhase.EW_GREEN]:
-                # Tìm lần xuất hiện trước của phase này
-                same_phase_times = [start_time for phase, start_time, _ in self.phase_history 
-                                   if phase == self.current_phase]
-                if len(same_phase_times) >= 2:
-                    return same_phase_times[-1] - same_phase_times[-2]
-            
-            # Không đủ dữ liệu
-            return 0.0
+                current_phase = self.current_phase.value
+            return self.cycle_tracker.cycle_time(current_phase)
             
         except Exception as e:
-            print(f"❌ Lỗi khi tính cycle time: {e}")
+            self.logger.error("❌ Lỗi khi tính cycle time: %s", e)
             return 0.0
     
     def predict_backlog_trend(self, direction: str, lookahead_time: float = None) -> float:
@@ -993,7 +865,7 @@ class AdaptiveController:
             debt_time: Thời gian xanh bị mất (giây)
         """
         self.green_debts[direction] += debt_time
-        print(f"💳 {direction}: Nợ thêm {debt_time:.1f}s → Tổng nợ: {self.green_debts[direction]:.1f}s")
+        self.logger.debug("💳 %s: Nợ thêm %.1fs → Tổng nợ: %.1fs", direction, debt_time, self.green_debts[direction])
     
     def get_phase_elapsed_time(self, current_time: float) -> float:
         """
@@ -1018,7 +890,7 @@ class AdaptiveController:
         """
         self.T_MIN_GREEN = min_green
         self.T_MAX_GREEN = max_green
-        print(f"🚨 Emergency params: min_green={min_green}s, max_green={max_green}s")
+        self.logger.info("🚨 Emergency params: min_green=%ss, max_green=%ss", min_green, max_green)
     
     def restore_normal_params(self):
         """
@@ -1026,7 +898,7 @@ class AdaptiveController:
         """
         self.T_MIN_GREEN = self.normal_min_green
         self.T_MAX_GREEN = self.normal_max_green
-        print(f"✅ Khôi phục tham số adaptive: min_green={self.T_MIN_GREEN}s, max_green={self.T_MAX_GREEN}s")
+        self.logger.info("✅ Khôi phục tham số adaptive: min_green=%ss, max_green=%ss", self.T_MIN_GREEN, self.T_MAX_GREEN)
     
     def record_backlog(self, direction: str, queue_pcu: float):
         """
@@ -0,0 +1,202 @@
+"""
+Cycle Tracker - Theo dõi chu kỳ đèn tăng dần theo từng lần chuyển pha
+
+Chu kỳ = khoảng cách giữa 2 lần bắt đầu NS_GREEN liên tiếp. Thay vì duyệt lại
+phase_history mỗi step (AdaptiveController.get_cycle_time, Dashboard), tracker
+được cập nhật 1 lần mỗi khi một pha kết thúc và giữ sẵn:
+- chu kỳ gần nhất
+- trung bình/trung vị trượt của các chu kỳ nằm trong WINDOW pha gần nhất
+  (giống phase_history[-100:] mà Dashboard từng duyệt)
+- trung bình đã lọc ngoại lai (chỉ lấy chu kỳ trong [MIN_VALID, MAX_VALID])
+
+Mọi thao tác đều có chi phí giới hạn bởi kích thước cửa sổ (không phụ thuộc
+thời gian chạy mô phỏng).
+
+Sử dụng:
+    tracker = CycleTracker()
+    tracker.record_phase("NS_GREEN", start_time=0.0, duration=30.0)
+    tracker.cycle_time(), tracker.average_cycle()
+"""
+
+from bisect import insort, bisect_left
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+class CycleTracker:
+    """
+    Thống kê chu kỳ đèn cập nhật O(1) mỗi lần kết thúc pha
+    """
+
+    def __init__(self, window: int = 100, min_valid: float = 15.0, max_valid: float = 90.0,
+                 recent_phases: int = 10, cycle_phase: str = "NS_GREEN",
+                 fallback_phases: Tuple[str, ...] = ("NS_GREEN", "EW_GREEN")):
+        """
+        Args:
+            window: Số pha gần nhất dùng cho trung bình/trung vị trượt; chỉ tính
+                    các chu kỳ có lần cycle_phase đầu nằm trong cửa sổ này
+            min_valid: Chu kỳ ngắn hơn ngưỡng này bị coi là ngoại lai (chuyển pha quá nhanh)
+            max_valid: Chu kỳ dài hơn ngưỡng này bị coi là ngoại lai (buộc chuyển do starvation)
+            recent_phases: Số pha gần nhất dùng để ước lượng khi chưa đủ 2 lần cycle_phase
+            cycle_phase: Pha đánh dấu đầu chu kỳ
+            fallback_phases: Các pha được dùng làm mốc dự phòng trong cycle_time()
+        """
+        self.window = window
+        self.min_valid = min_valid
+        self.max_valid = max_valid
+        self.cycle_phase = cycle_phase
+        self.fallback_phases = tuple(fallback_phases)
+        self.recent_phases_capacity = recent_phases
+        self.reset()
+
+    def reset(self):
+        """Xóa toàn bộ dữ liệu"""
+        self.phase_count = 0
+        # 2 lần bắt đầu gần nhất của mỗi pha {phase: deque([(phase_index, start_time)...], maxlen=2)}
+        self._last_starts: Dict[str, Deque[Tuple[int, float]]] = {}
+        # Cửa sổ chu kỳ [(phase_index của lần cycle_phase đầu, chu kỳ)] + bản đã sắp xếp cho trung vị
+        self._cycles: Deque[Tuple[int, float]] = deque()
+        self._sorted_cycles: List[float] = []
+        self._cycle_sum = 0.0
+        self._valid_sum = 0.0
+        self._valid_count = 0
+        # Các pha gần nhất (phase, duration) cho ước lượng khi thiếu dữ liệu
+        self._recent: Deque[Tuple[str, float]] = deque(maxlen=self.recent_phases_capacity)
+
+    def record_phase(self, phase: str, start_time: float, duration: float):
+        """
+        Ghi nhận một pha vừa kết thúc (gọi cùng lúc với phase_history.append)
+
+        Args:
+            phase: Tên pha (TrafficPhase.value: "NS_GREEN", "EW_YELLOW"...)
+            start_time: Thời điểm bắt đầu pha (giây)
+            duration: Thời lượng pha (giây)
+        """
+        index = self.phase_count
+        self.phase_count += 1
+        self._recent.append((phase, duration))
+
+        starts = self._last_starts.get(phase)
+        if starts is None:
+            starts = deque(maxlen=2)
+            self._last_starts[phase] = starts
+        if phase == self.cycle_phase and starts:
+            first_index, first_start = starts[-1]
+            self._add_cycle(first_index, start_time - first_start)
+        starts.append((index, start_time))
+        self._evict()
+
+    def _add_cycle(self, first_index: int, cycle: float):
+        """Thêm một chu kỳ vào cửa sổ trượt"""
+        self._cycles.append((first_index, cycle))
+        insort(self._sorted_cycles, cycle)
+        self._cycle_sum += cycle
+        if self._is_valid(cycle):
+            self._valid_sum += cycle
+            self._valid_count += 1
+
+    def _evict(self):
+        """Bỏ các chu kỳ có lần cycle_phase đầu đã ra khỏi cửa sổ `window` pha"""
+        oldest_index = self.phase_count - self.window
+        while self._cycles and self._cycles[0][0] < oldest_index:
+            _, old = self._cycles.popleft()
+            del self._sorted_cycles[bisect_left(self._sorted_cycles, old)]
+            self._cycle_sum -= old
+            if self._is_valid(old):
+                self._valid_sum -= old
+                self._valid_count -= 1
+        if not self._valid_count:
+            self._valid_sum = 0.0  # Tránh sai số cộng/trừ dồn
+
+    def _is_valid(self, cycle: float) -> bool:
+        return self.min_valid <= cycle <= self.max_valid
+
+    # ==================== TRUY VẤN ====================
+
+    @property
+    def cycle_count(self) -> int:
+        """Số chu kỳ trong cửa sổ trượt"""
+        return len(self._cycles)
+
+    @property
+    def last_cycle(self) -> float:
+        """Chu kỳ gần nhất (0.0 nếu chưa có)"""
+        return self._cycles[-1][1] if self._cycles else 0.0
+
+    @property
+    def rolling_mean(self) -> float:
+        """Trung bình các chu kỳ trong cửa sổ (0.0 nếu chưa có)"""
+        return self._cycle_sum / len(self._cycles) if self._cycles else 0.0
+
+    @property
+    def rolling_median(self) -> float:
+        """Trung vị các chu kỳ trong cửa sổ (0.0 nếu chưa có)"""
+        if not self._sorted_cycles:
+            return 0.0
+        return self._sorted_cycles[len(self._sorted_cycles) // 2]
+
+    @property
+    def filtered_mean(self) -> Optional[float]:
+        """Trung bình các chu kỳ hợp lệ trong cửa sổ (None nếu không có chu kỳ hợp lệ)"""
+        return self._valid_sum / self._valid_count if self._valid_count else None
+
+    def cycle_time(self, current_phase: Optional[str] = None) -> float:
+        """
+        Chu kỳ hiện tại (logic của AdaptiveController.get_cycle_time)
+
+        Args:
+            current_phase: Pha đang chạy - dùng làm mốc dự phòng nếu chưa đủ 2 lần
+                           cycle_phase (chỉ khi thuộc fallback_phases)
+
+        Returns:
+            Chu kỳ (giây), 0.0 nếu chưa đủ dữ liệu
+        """
+        if self.phase_count < 2:
+            return 0.0
+
+        starts = self._last_starts.get(self.cycle_phase)
+        if starts is not None and len(starts) == 2:
+            return starts[1][1] - starts[0][1]
+
+        if current_phase in self.fallback_phases:
+            starts = self._last_starts.get(current_phase)
+            if starts is not None and len(starts) == 2:
+                return starts[1][1] - starts[0][1]
+        return 0.0
+
+    def average_cycle(self, default: float = 40.0) -> Optional[float]:
+        """
+        Chu kỳ trung bình đã lọc ngoại lai (logic hiển thị "Chu kỳ TB" của Dashboard)
+
+        1. Có chu kỳ hợp lệ trong cửa sổ → trung bình các chu kỳ hợp lệ
+        2. Toàn ngoại lai → trung vị, kẹp vào [20, 60]
+        3. Chưa có chu kỳ nào → ước lượng từ các pha gần nhất
+
+        Args:
+            default: Giá trị khi không ước lượng được
+
+        Returns:
+            Chu kỳ trung bình (giây), None nếu chưa có pha nào kết thúc
+        """
+        if self.phase_count == 0:
+            return None
+
+        if self._cycles:
+            filtered = self.filtered_mean
+            if filtered is not None:
+                return filtered
+            return max(20.0, min(60.0, self.rolling_median))
+
+        # Chưa đủ 2 lần cycle_phase → ước lượng từ durations của các pha gần nhất
+        num_phases = len(self._recent)
+        if num_phases >= 5:
+            # 1 cycle ≈ 5 phases (NS_GREEN, YELLOW, ALL_RED, EW_GREEN, YELLOW)
+            total_duration = sum(duration for _, duration in self._recent)
+            return total_duration / (num_phases / 5.0)
+
+        green_durations = [duration for phase, duration in self._recent
+                           if "GREEN" in phase and "YELLOW" not in phase]
+        if green_durations:
+            # 1 cycle = 2 GREEN (NS+EW) + overhead (YELLOW+ALL_RED ≈ 10s)
+            return (sum(green_durations) / len(green_durations)) * 2 + 10.0
+        return default
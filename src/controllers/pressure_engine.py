@@ -0,0 +1,255 @@
+"""
+Pressure Engine - Tính áp lực giao thông cho tất cả các hướng trong một lần quét
+
+AdaptiveController cần queue (PCU), occupancy, tốc độ trung bình và điểm áp
+lực của cả 4 hướng nhiều lần trong cùng một step (should_change_phase,
+check_starvation_prevention, apply_phase, PriorityController...). PressureEngine
+duyệt các edge/xe của ngã tư đúng 1 lần/step, lưu kết quả vào các mảng
+array('d') đánh chỉ số theo hướng, và dùng lại kết quả đó cho mọi quyết định
+trong step.
+
+Sử dụng:
+    engine = PressureEngine(controller, tuple(TrafficDirection))
+    state = engine.compute()
+    queue = state.queue_pcu[state.index[TrafficDirection.NORTH]]
+"""
+
+import traci
+from array import array
+from typing import Dict, Optional, Sequence, Tuple
+
+
+# Map TrafficDirection.name → hướng của SensorManager
+SENSOR_DIRECTIONS = {
+    "NORTH": "north",
+    "SOUTH": "south",
+    "EAST": "east",
+    "WEST": "west"
+}
+
+
+class PressureState:
+    """
+    Kết quả tính áp lực của một step (mỗi mảng có 1 phần tử/hướng)
+
+    Các mảng đánh chỉ số theo thứ tự `directions`, dùng `index[direction]` để
+    lấy vị trí của một hướng.
+    """
+
+    __slots__ = ("step_key", "directions", "index", "queue_pcu", "waiting_count",
+                 "vehicle_count", "occupancy", "avg_speed", "queue_length",
+                 "pressure", "fallback")
+
+    def __init__(self, step_key: Tuple[int, int], directions: Sequence, index: Dict):
+        size = len(directions)
+        self.step_key = step_key
+        self.directions = directions
+        self.index = index
+        self.queue_pcu = array('d', [0.0]) * size       # PCU xe đang chờ (speed < 2 m/s)
+        self.waiting_count = array('l', [0]) * size     # Số xe đang chờ
+        self.vehicle_count = array('d', [0.0]) * size   # Tổng số xe (sensor hoặc edge)
+        self.occupancy = array('d', [0.0]) * size       # Occupancy trung bình
+        self.avg_speed = array('d', [0.0]) * size       # Tốc độ trung bình
+        self.queue_length = array('d', [0.0]) * size    # Chiều dài hàng chờ ước lượng
+        self.pressure = array('d', [0.0]) * size        # Điểm áp lực
+        self.fallback = array('b', [0]) * size        # 1 = pressure dùng công thức cũ ALPHA × PCU
+
+    def sensor_data(self, direction) -> Dict:
+        """
+        Dữ liệu cảm biến của một hướng (định dạng của get_sensor_data_for_direction)
+
+        Args:
+            direction: TrafficDirection cần lấy
+
+        Returns:
+            Dict chứa: vehicle_count, occupancy, avg_speed, queue_length
+        """
+        i = self.index[direction]
+        return {
+            "vehicle_count": self.vehicle_count[i],
+            "occupancy": self.occupancy[i],
+            "avg_speed": self.avg_speed[i],
+            "queue_length": self.queue_length[i]
+        }
+
+    def priorities(self) -> Dict:
+        """Dictionary {hướng: điểm áp lực}"""
+        return dict(zip(self.directions, self.pressure))
+
+
+class PressureEngine:
+    """
+    Bộ tính áp lực theo step cho một AdaptiveController
+
+    Tham số (trọng số, QUEUE_MAX, SPEED_LIMIT, PCU_CONVERSION, direction_edges,
+    sensor_manager) luôn được đọc từ controller khi tính, nên thay đổi tham số
+    (vd: batch runner quét tham số) có hiệu lực từ step kế tiếp.
+    """
+
+    def __init__(self, controller, directions: Sequence):
+        """
+        Args:
+            controller: AdaptiveController sở hữu engine
+            directions: Danh sách hướng theo thứ tự mảng kết quả (vd: tuple(TrafficDirection))
+        """
+        self.controller = controller
+        self.directions = tuple(directions)
+        self.index = {direction: i for i, direction in enumerate(self.directions)}
+        self._state = None
+        self._pcu_by_type: Dict[str, float] = {}  # Cache {vType: PCU}
+        self.compute_count = 0
+
+    def pcu_value(self, veh_type: str) -> float:
+        """
+        Quy đổi vType → PCU theo tiêu chuẩn VN (cache theo vType)
+
+        Args:
+            veh_type: vType ID của xe
+
+        Returns:
+            Giá trị PCU của một xe
+        """
+        pcu_value = self._pcu_by_type.get(veh_type)
+        if pcu_value is None:
+            conversion = self.controller.PCU_CONVERSION
+            type_lower = veh_type.lower()
+            if 'motorcycle' in type_lower or 'bike' in type_lower:
+                pcu_value = conversion['motorcycle']
+            elif 'bus' in type_lower:
+                pcu_value = conversion['bus']
+            elif 'truck' in type_lower:
+                pcu_value = conversion['truck']
+            elif 'emergency' in type_lower:
+                pcu_value = conversion['emergency']
+            else:
+                pcu_value = conversion['car']  # Mặc định
+            self._pcu_by_type[veh_type] = pcu_value
+        return pcu_value
+
+    def invalidate(self):
+        """Buộc tính lại ở lần compute() tiếp theo (vd: sau khi đổi PCU_CONVERSION)"""
+        self._state = None
+        self._pcu_by_type.clear()
+
+    def _step_key(self) -> Tuple[int, int]:
+        """Khóa của step hiện tại (snapshot, số step)"""
+        snapshot = self.controller.snapshot
+        return (id(snapshot), snapshot.step_count)
+
+    def cached_state(self) -> Optional[PressureState]:
+        """
+        PressureState của step hiện tại nếu controller đã tính (không tính mới, không gọi TraCI)
+
+        Returns:
+            PressureState hoặc None (vd: pha vàng/all-red không cần áp lực)
+        """
+        state = self._state
+        if state is not None and state.step_key == self._step_key():
+            return state
+        return None
+
+    def compute(self) -> PressureState:
+        """
+        Lấy kết quả áp lực của step hiện tại (chỉ tính 1 lần/step)
+
+        Returns:
+            PressureState của step hiện tại
+        """
+        snapshot = self.controller.snapshot
+        step_key = self._step_key()
+        state = self._state
+        if state is not None and state.step_key == step_key:
+            return state
+
+        state = PressureState(step_key, self.directions, self.index)
+        self._sweep_edges(snapshot, state)
+        self._apply_sensor_data(state)
+        self._compute_pressure(state)
+
+        self._state = state
+        self.compute_count += 1
+        return state
+
+    def _sweep_edges(self, snapshot, state: PressureState):
+        """Duyệt xe trên các edge của mỗi hướng đúng 1 lần: PCU chờ, số xe, occupancy, tốc độ"""
+        controller = self.controller
+        speed_limit = controller.SPEED_LIMIT
+
+        for i, direction in enumerate(self.directions):
+            total_vehicles = 0
+            total_occupancy = 0.0
+            total_speed = 0.0
+            speed_count = 0
+            edge_count = 0
+            queue_pcu = 0.0
+            waiting = 0
+
+            for edge in controller.direction_edges.get(direction, []):
+                try:
+                    vehicles = snapshot.edge_vehicle_ids(edge)
+                    total_vehicles += len(vehicles)
+                    total_occupancy += snapshot.edge_occupancy(edge)
+                    edge_count += 1
+                except traci.exceptions.TraCIException:
+                    continue
+
+                for veh_id in vehicles:
+                    try:
+                        speed = snapshot.vehicle_speed(veh_id)
+                        total_speed += speed * 3.6  # m/s → km/h
+                        speed_count += 1
+                        if speed < 2.0:  # Chỉ tính xe đang chờ/kẹt
+                            queue_pcu += self.pcu_value(snapshot.vehicle_type(veh_id))
+                            waiting += 1
+                    except traci.exceptions.TraCIException:
+                        continue
+
+            state.queue_pcu[i] = queue_pcu
+            state.waiting_count[i] = waiting
+            state.vehicle_count[i] = total_vehicles
+            state.occupancy[i] = total_occupancy / max(edge_count, 1)
+            state.avg_speed[i] = total_speed / speed_count if speed_count > 0 else speed_limit
+            state.queue_length[i] = total_vehicles  # Ước lượng
+
+    def _apply_sensor_data(self, state: PressureState):
+        """Ưu tiên dữ liệu E2 detector (nếu có SensorManager) cho số xe, occupancy, tốc độ"""
+        sensor_manager = self.controller.sensor_manager
+        if not sensor_manager:
+            return
+
+        junction_id = self.controller.node_id
+        for i, direction in enumerate(self.directions):
+            sensor_dir = SENSOR_DIRECTIONS.get(direction.name)
+            if not sensor_dir:
+                continue
+            try:
+                density_data = sensor_manager.get_junction_density(junction_id, sensor_dir)
+            except Exception:
+                continue  # Giữ dữ liệu edge nếu sensor lỗi
+            if "error" in density_data:
+                continue
+            state.vehicle_count[i] = density_data.get("total_vehicles", 0)
+            state.occupancy[i] = density_data.get("avg_occupancy", 0.0)
+            state.avg_speed[i] = density_data.get("avg_speed", 0.0)
+            state.queue_length[i] = density_data.get("queue_length", 0)
+
+    def _compute_pressure(self, state: PressureState):
+        """
+        P = w1 × (Queue/Queue_max) + w2 × Occupancy + w3 × (1 - Speed/Speed_limit)
+
+        Nếu có queue nhưng P < 0.05 → dùng công thức cũ P = ALPHA × Queue
+        """
+        c = self.controller
+        for i in range(len(self.directions)):
+            queue_pcu = state.queue_pcu[i]
+            norm_queue = min(queue_pcu / c.QUEUE_MAX, 1.0)
+            norm_speed_factor = 1.0 - min(state.avg_speed[i] / c.SPEED_LIMIT, 1.0)
+            pressure = (
+                c.PRESSURE_WEIGHT_QUEUE * norm_queue +
+                c.PRESSURE_WEIGHT_OCCUPANCY * state.occupancy[i] +
+                c.PRESSURE_WEIGHT_SPEED * norm_speed_factor
+            )
+            if queue_pcu > 0 and pressure < 0.05:
+                pressure = c.ALPHA * queue_pcu
+                state.fallback[i] = 1
+            state.pressure[i] = pressure
@@ -8,11 +8,19 @@ Sử dụng State Machine để ghi đè thuật toán thông thường khi có
 import traci
 import time
 import math
+import logging
 from typing import Dict, List, Tuple, Optional, Set
 from collections import defaultdict, deque
 from enum import Enum
 from datetime import datetime
 
+from simulation.step_snapshot import StepSnapshot, get_step_snapshot
+from simulation.network_index import DIRECTION_NAMES, NetworkIndex, get_network_index
+from simulation.emergency_registry import EmergencyRegistry, EMERGENCY_VEHICLE_TYPES, get_emergency_registry
+from utils.ring_buffer import RingBuffer, BoundedHistory
+from utils.profiler import profiled
+from utils.logger import get_logger
+
 class PreemptionState(Enum):
     """Trạng thái của máy trạng thái ưu tiên"""
     NORMAL = "NORMAL"                    # Chế độ thông thường (Adaptive Control)
@@ -23,7 +31,18 @@ class PreemptionState(Enum):
     RESTORE = "RESTORE"                  # Khôi phục về bình thường
 
 class EmergencyVehicle:
-    """Class đại diện cho xe ưu tiên"""
+    """
+    Class đại diện cho xe ưu tiên
+
+    Mỗi xe chỉ có 1 bản ghi trong suốt thời gian được theo dõi (tạo ở lần phát
+    hiện đầu tiên, các lần quét sau cập nhật tại chỗ bằng update()), nên dùng
+    __slots__ thay cho __dict__.
+    """
+
+    __slots__ = ("vehicle_id", "vehicle_type", "detection_time", "direction", "distance", "speed",
+                 "eta", "confirmed", "served", "scenario_id", "clearance_time", "clearance_start_time",
+                 "clearance_evaluation", "has_approached")
+
     def __init__(self, vehicle_id: str, vehicle_type: str, detection_time: float, 
                  direction: str, distance: float, speed: float, scenario_id: str = "DEFAULT"):
         self.vehicle_id = vehicle_id
@@ -42,16 +61,26 @@ class EmergencyVehicle:
         # ✅ KPI: Emergency Clearance Time
         self.clearance_time: Optional[float] = None  # Thời gian từ phát hiện → qua ngã tư
         self.clearance_start_time: Optional[float] = None  # Thời gian bắt đầu clearance
+        self.clearance_evaluation: Optional[str] = None  # EXCELLENT / ACCEPTABLE / POOR
         
         # ✅ Tracking: Phát hiện xe đã qua ngã tư
         self.has_approached = False  # True khi xe đã đến gần ngã tư (distance < 30m)
 
+    def update(self, direction: str, distance: float, speed: float, vehicle_type: str):
+        """Cập nhật vị trí/tốc độ của lần quét mới (giữ nguyên thời điểm phát hiện và trạng thái)"""
+        self.direction = direction
+        self.distance = distance
+        self.speed = speed
+        self.eta = distance / max(speed, 0.1)
+        self.vehicle_type = vehicle_type
+
 class PriorityController:
     """
     Thuật toán xử lý ưu tiên xe khẩn cấp
     """
     
-    def __init__(self, junction_id: str = "J1", adaptive_controller=None, ui_callback=None):
+    def __init__(self, junction_id: str = "J1", adaptive_controller=None, ui_callback=None,
+                 connection=None, network_index: Optional[NetworkIndex] = None):
         """
         Khởi tạo Priority Controller
         
@@ -59,8 +88,15 @@ class PriorityController:
             junction_id: ID của ngã tư
             adaptive_controller: Tham chiếu đến Adaptive Controller
             ui_callback: Callback function để cập nhật UI (optional)
+            connection: Kết nối SUMO (SumoConnection), None = kết nối mặc định toàn cục
+            network_index: Chỉ mục ngã tư/hướng của mạng (None = mạng mặc định test2)
         """
         self.junction_id = junction_id
+        self.network_index = network_index or get_network_index()
+        self.tls_id = self.network_index.tls_for_junction(junction_id)  # Đèn điều khiển ngã tư (vd: J4 → đèn J3)
+        self.connection = connection
+        self.logger = get_logger(__name__, junction=junction_id)  # Log chi tiết mỗi step ở cấp DEBUG
+        self.traci = traci if connection is None else connection
         self.adaptive_controller = adaptive_controller
         self.ui_callback = ui_callback  # Callback để cập nhật UI
         self.current_state = PreemptionState.NORMAL
@@ -69,6 +105,8 @@ class PriorityController:
         
         # Tham số cấu hình
         self.DETECTION_RADIUS = 150.0      # Bán kính phát hiện (mét) - GIẢM TỪ 200m→150m (tránh detect xe ở ngã tư khác)
+        self.junction_position: Optional[Tuple[float, float]] = None  # Cache tọa độ ngã tư (lấy 1 lần trong start())
+        self.use_context_subscription = False  # SUMO lọc xe trong DETECTION_RADIUS (bật trong start())
         self.ETA_THRESHOLD = 15.0          # ✅ FIX GIAI ĐOẠN 3 - Issue #10 [Priority-2.5]: 12s→15s (Tăng thời gian chuẩn bị)
         self.CONFIRMATION_WINDOW = 1.0     # Thời gian xác nhận (giây)
         self.CONFIRMATION_COUNT = 1        # ✅ FIX GIAI ĐOẠN 3 - Issue #9 [Priority-2.1]: 2→1 (Giảm 20% clearance time)
@@ -80,43 +118,12 @@ class PriorityController:
         self.PREEMPT_COOLDOWN = 60.0       # Thời gian nghỉ giữa các lần ưu tiên (giây)
         
         # Danh sách loại xe ưu tiên (type ID và vehicle class)
-        self.EMERGENCY_VEHICLE_TYPES = {
-            'priority',         # typeID="priority" trong route file
-            'ambulance',        # typeID="ambulance"
-            'emergency',        # vClass="emergency" trong SUMO
-            'fire',             # xe cứu hỏa
-            'police',           # xe cảnh sát
-            'cứu_thương',       # tiếng Việt
-            'cứu_hỏa',          # tiếng Việt
-            'cảnh_sát'          # tiếng Việt
-        }
+        self.EMERGENCY_VEHICLE_TYPES = set(EMERGENCY_VEHICLE_TYPES)
         
-        # Mapping hướng với edges (SUMO network edges)
-        # ✅ FIX: Edge mapping cho từng ngã tư
-        # J1: Bắc(-E1), Nam(-E2), Đông(E3), Tây(E0)
-        # J4: Bắc(-E4), Nam(-E5), Đông(-E6), Tây(-E3)
-        if junction_id == "J1":
-            self.direction_edges = {
-                "Bắc": ["-E1", "E1"],   # From J2 to J1, and J1 to J2
-                "Nam": ["-E2", "E2"],   # From J3 to J1, and J1 to J3
-                "Đông": ["E3", "-E3"],  # From J1 to J4, and J4 to J1
-                "Tây": ["E0", "-E0"]    # From J0 to J1, and J1 to J0
-            }
-        elif junction_id == "J4":
-            self.direction_edges = {
-                "Bắc": ["-E4", "E4"],   # From J5 to J4, and J4 to J5
-                "Nam": ["-E5", "E5"],   # From J6 to J4, and J4 to J6
-                "Đông": ["-E6", "E6"],  # From J7 to J4, and J4 to J7
-                "Tây": ["-E3", "E3"]    # From J1 to J4, and J4 to J1
-            }
-        else:
-            # Default fallback
-            self.direction_edges = {
-                "Bắc": ["-E1"],
-                "Nam": ["-E2"],
-                "Đông": ["E3"],
-                "Tây": ["E0"]
-            }
+        # Mapping hướng với edges VÀO và RA ngã tư (dựng từ mạng SUMO)
+        # vd J1: Bắc(-E1, E1), Nam(-E2, E2), Đông(-E3, E3), Tây(E0, -E0)
+        self.direction_edges = self.network_index.direction_edges(junction_id, outgoing=True,
+                                                                  names=DIRECTION_NAMES)
         
         # Mapping hướng với pha đèn
         self.direction_phases = {
@@ -127,14 +134,23 @@ class PriorityController:
         }
         
         # Dữ liệu theo dõi
+        # Lịch sử dùng bộ đệm vòng (chỉ giữ N phần tử gần nhất), còn số lượng và
+        # thống kê được tích lũy trên toàn bộ lịch sử → get_statistics() O(1)
+        self.HISTORY_CAPACITY = 200
+        self.vehicle_records: Dict[str, EmergencyVehicle] = {}  # 1 bản ghi/xe, cập nhật mỗi lần quét
         self.detected_vehicles: Dict[str, EmergencyVehicle] = {}
         self.confirmed_vehicles: Dict[str, EmergencyVehicle] = {}
         self.pending_vehicles: Dict[str, EmergencyVehicle] = {}  # SC3: Xe chờ
-        self.served_vehicles: List[EmergencyVehicle] = []
+        self.served_vehicles: BoundedHistory = BoundedHistory(self.HISTORY_CAPACITY)
         self.rejected_vehicles: List[Dict] = []  # SC6: Xe bị từ chối
         self.failed_preemptions: List[Dict] = []  # SC5: Ưu tiên thất bại
-        self.false_positives: List[Dict] = []  # SC4: Báo giả
-        self.preemption_history: List[Dict] = []
+        self.false_positives: BoundedHistory = BoundedHistory(self.HISTORY_CAPACITY)  # SC4: Báo giả
+        self.false_positives_by_stage: Dict[str, int] = defaultdict(int)
+        self.false_positives_by_reason: Dict[str, int] = defaultdict(int)
+        self.preemption_history: BoundedHistory = BoundedHistory(self.HISTORY_CAPACITY)
+        self.preemption_activations = 0  # Số lần chuyển sang PREEMPTION_GREEN (có context)
+        self.processing_times = RingBuffer(self.HISTORY_CAPACITY)  # PREEMPTION_GREEN → RESTORE (giây)
+        self._pending_preemption_times: List[float] = []  # PREEMPTION_GREEN chưa có RESTORE
         self.detection_confirmations: Dict[str, List[float]] = defaultdict(list)
         
         # Thống kê ưu tiên
@@ -148,11 +164,23 @@ class PriorityController:
         self.emergency_mode_start_time = 0.0
         
         # ✅ KPI: Emergency Clearance Time tracking
-        self.clearance_times: List[float] = []  # Danh sách clearance time của tất cả xe
         self.EXCELLENT_CLEARANCE = 15.0  # ≤ 15s: Tốt
         self.ACCEPTABLE_CLEARANCE = 25.0  # ≤ 25s: Chấp nhận được
+        # Clearance time của các xe (đếm tích lũy theo mức: Tốt / Chấp nhận được / Kém)
+        self.clearance_times = RingBuffer(self.HISTORY_CAPACITY,
+                                          bins=(self.EXCELLENT_CLEARANCE, self.ACCEPTABLE_CLEARANCE))
         self._debug_distance_logged: Set[str] = set()  # Track vehicles already logged for debugging
     
+    @property
+    def snapshot(self) -> StepSnapshot:
+        """Snapshot TraCI dùng chung của step hiện tại (mỗi giá trị chỉ đọc 1 lần/step)"""
+        return get_step_snapshot(self.connection)
+    
+    @property
+    def emergency_registry(self) -> EmergencyRegistry:
+        """Danh sách xe ưu tiên đang trong mạng (dùng chung giữa các controller cùng kết nối)"""
+        return get_emergency_registry(self.connection, self.EMERGENCY_VEHICLE_TYPES)
+    
     def _log_false_positive(self, vehicle_id: str, reason: str, stage: str):
         """
         SC4: Ghi log báo giả (False Positive)
@@ -162,7 +190,7 @@ class PriorityController:
             reason: Lý do (vehicle_disappeared, not_emergency_type, etc.)
             stage: Giai đoạn phát hiện (DETECTION, SAFE_TRANSITION, PREEMPTION_GREEN)
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         
         log_entry = {
             'vehicle_id': vehicle_id,
@@ -173,12 +201,14 @@ class PriorityController:
         }
         
         self.false_positives.append(log_entry)
-        
-        print(f"📝 SC4 LOG: Báo giả - Xe {vehicle_id}")
-        print(f"   Lý do: {reason}")
-        print(f"   Giai đoạn: {stage}")
-        print(f"   Trạng thái: {self.current_state.value}")
-        print(f"   Thời gian: {current_time:.1f}s")
+        self.false_positives_by_stage[stage] += 1
+        self.false_positives_by_reason[reason] += 1
+        
+        self.logger.info("📝 SC4 LOG: Báo giả - Xe %s", vehicle_id)
+        self.logger.info("   Lý do: %s", reason)
+        self.logger.info("   Giai đoạn: %s", stage)
+        self.logger.info("   Trạng thái: %s", self.current_state.value)
+        self.logger.info("   Thời gian: %.1fs", current_time)
     
     def _verify_emergency_vehicle_exists(self, vehicle_id: str, stage: str) -> bool:
         """
@@ -193,7 +223,7 @@ class PriorityController:
         """
         try:
             # Kiểm tra xe vẫn tồn tại
-            if vehicle_id not in traci.vehicle.getIDList():
+            if not self.snapshot.has_vehicle(vehicle_id):
                 self._log_false_positive(vehicle_id, 'vehicle_disappeared', stage)
                 return False
             
@@ -226,24 +256,24 @@ class PriorityController:
         self.clearance_times.append(clearance_time)
         
         # Debug: In số lượng clearance times
-        print(f"🔍 DEBUG: Đã thêm vào clearance_times. Tổng: {len(self.clearance_times)} xe. List: {self.clearance_times}")
+        self.logger.debug("🔍 DEBUG: Đã thêm vào clearance_times. Tổng: %s xe", self.clearance_times.count)
         
         # Đánh giá theo tiêu chuẩn tài liệu
-        print(f"📊 EMERGENCY CLEARANCE TIME: {clearance_time:.1f}s")
-        print(f"   Xe: {vehicle.vehicle_id}")
-        print(f"   Hướng: {vehicle.direction}")
-        print(f"   Detection time: {vehicle.detection_time:.1f}s")
-        print(f"   Cleared time: {current_time:.1f}s")
+        self.logger.info("📊 EMERGENCY CLEARANCE TIME: %.1fs", clearance_time)
+        self.logger.info("   Xe: %s", vehicle.vehicle_id)
+        self.logger.info("   Hướng: %s", vehicle.direction)
+        self.logger.info("   Detection time: %.1fs", vehicle.detection_time)
+        self.logger.info("   Cleared time: %.1fs", current_time)
         
         # Đánh giá hiệu suất
         if clearance_time <= self.EXCELLENT_CLEARANCE:
-            print(f"   ✅ TỐT (≤ {self.EXCELLENT_CLEARANCE:.0f}s) - Đạt mục tiêu!")
+            self.logger.info("   ✅ TỐT (≤ %.0fs) - Đạt mục tiêu!", self.EXCELLENT_CLEARANCE)
             evaluation = "EXCELLENT"
         elif clearance_time <= self.ACCEPTABLE_CLEARANCE:
-            print(f"   ⚠️ CHẤP NHẬN ĐƯỢC (≤ {self.ACCEPTABLE_CLEARANCE:.0f}s)")
+            self.logger.info("   ⚠️ CHẤP NHẬN ĐƯỢC (≤ %.0fs)", self.ACCEPTABLE_CLEARANCE)
             evaluation = "ACCEPTABLE"
         else:
-            print(f"   ❌ VƯỢT MỤC TIÊU (> {self.ACCEPTABLE_CLEARANCE:.0f}s)")
+            self.logger.info("   ❌ VƯỢT MỤC TIÊU (> %.0fs)", self.ACCEPTABLE_CLEARANCE)
             evaluation = "POOR"
         
         # Thêm vào statistics
@@ -251,6 +281,29 @@ class PriorityController:
         
         return clearance_time, evaluation
     
+    def _mark_served(self, vehicle: EmergencyVehicle, current_time: float, clearance: bool = True):
+        """
+        Ghi nhận xe ưu tiên đã được phục vụ (mỗi xe chỉ đếm 1 lần)
+
+        Bản ghi served=True được giữ trong vehicle_records cho đến khi xe rời mạng,
+        nên xe vừa qua ngã tư (edge ra vẫn trong bán kính phát hiện) không bị phát
+        hiện và ưu tiên lại.
+
+        Args:
+            vehicle: Xe ưu tiên đã qua ngã tư / rời mạng
+            current_time: Thời gian hiện tại
+            clearance: Tính Emergency Clearance Time (False nếu xe chưa từng đến gần ngã tư)
+        """
+        vid = vehicle.vehicle_id
+        self.confirmed_vehicles.pop(vid, None)
+        self.pending_vehicles.pop(vid, None)
+        if vehicle.served:
+            return
+        vehicle.served = True
+        if clearance:
+            self._calculate_and_log_clearance_time(vehicle, current_time)
+        self.served_vehicles.append(vehicle)
+
     def _track_confirmed_vehicles(self, current_time: float):
         """
         Theo dõi xe ưu tiên đã xác nhận, phát hiện xe đã qua ngã tư
@@ -267,19 +320,14 @@ class PriorityController:
         for vid, vehicle in list(self.confirmed_vehicles.items()):
             try:
                 # Kiểm tra xe còn trong simulation không
-                if vid not in traci.vehicle.getIDList():
+                if not self.snapshot.has_vehicle(vid):
                     # Xe đã despawn
-                    vehicle.served = True
-                    
                     # ✅ Tính Emergency Clearance Time - CHỈ KHI ĐÃ ĐẾN GẦN NGÃ TƯ
+                    self._mark_served(vehicle, current_time, clearance=vehicle.has_approached)
                     if vehicle.has_approached:
-                        self._calculate_and_log_clearance_time(vehicle, current_time)
-                        print(f"✅ Xe {vid} đã qua ngã tư (despawned)")
+                        self.logger.debug("✅ Xe %s đã qua ngã tư (despawned)", vid)
                     else:
-                        print(f"⚠️ Xe {vid} despawn trước khi đến gần ngã tư (distance luôn > 30m)")
-                    
-                    self.served_vehicles.append(vehicle)
-                    del self.confirmed_vehicles[vid]
+                        self.logger.warning("⚠️ Xe %s despawn trước khi đến gần ngã tư (distance luôn > 30m)", vid)
                     continue
                 
                 # Tính lại distance
@@ -289,38 +337,34 @@ class PriorityController:
                 # Giai đoạn 1: Xe đến gần ngã tư (distance < 30m)
                 if distance < 30 and not vehicle.has_approached:
                     vehicle.has_approached = True
-                    print(f"📍 Xe {vid} đã đến gần ngã tư (distance={distance:.1f}m)")
+                    self.logger.debug("📍 Xe %s đã đến gần ngã tư (distance=%.1fm)", vid, distance)
                 
                 # Giai đoạn 2: Xe đi xa khỏi ngã tư (distance > 30m) SAU KHI đã đến gần
                 elif vehicle.has_approached and distance > 30:
                     # Xe đã qua ngã tư: đã gần (< 30m) → bây giờ xa (> 30m)
-                    vehicle.served = True
-                    
                     # ✅ Tính Emergency Clearance Time
-                    self._calculate_and_log_clearance_time(vehicle, current_time)
-                    
-                    self.served_vehicles.append(vehicle)
-                    del self.confirmed_vehicles[vid]
-                    print(f"✅ Xe {vid} đã qua ngã tư (distance={distance:.1f}m, đi xa sau khi đã gần)")
+                    self._mark_served(vehicle, current_time)
+                    self.logger.debug("✅ Xe %s đã qua ngã tư (distance=%.1fm, đi xa sau khi đã gần)", vid, distance)
                     continue
                     
             except Exception as e:
-                print(f"⚠️ Lỗi khi tracking xe {vid}: {e}")
+                self.logger.warning("⚠️ Lỗi khi tracking xe %s: %s", vid, e)
     
     def get_junction_position(self) -> Tuple[float, float]:
         """
-        Lấy tọa độ của ngã tư
+        Lấy tọa độ của ngã tư (junction không di chuyển → chỉ hỏi SUMO 1 lần)
         
         Returns:
             Tuple (x, y) tọa độ ngã tư
         """
-        try:
-            # Lấy tọa độ từ traffic light hoặc junction
-            junction_pos = traci.junction.getPosition(self.junction_id)
-            return junction_pos
-        except:
-            # Fallback: sử dụng tọa độ mặc định cho J1
-            return (0.0, 0.0)
+        if self.junction_position is None:
+            try:
+                # Lấy tọa độ từ traffic light hoặc junction
+                self.junction_position = tuple(self.traci.junction.getPosition(self.junction_id))
+            except:
+                # Fallback: sử dụng tọa độ mặc định cho J1
+                self.junction_position = (0.0, 0.0)
+        return self.junction_position
     
     def calculate_distance_to_junction(self, vehicle_id: str) -> float:
         """
@@ -333,7 +377,7 @@ class PriorityController:
             Khoảng cách (mét)
         """
         try:
-            veh_pos = traci.vehicle.getPosition(vehicle_id)
+            veh_pos = self.snapshot.vehicle_position(vehicle_id)
             junction_pos = self.get_junction_position()
             
             # Tính khoảng cách Euclidean
@@ -345,7 +389,7 @@ class PriorityController:
             return distance
             
         except Exception as e:
-            print(f"❌ Lỗi khi tính khoảng cách xe {vehicle_id}: {e}")
+            self.logger.error("❌ Lỗi khi tính khoảng cách xe %s: %s", vehicle_id, e)
             return float('inf')
     
     def get_vehicle_direction(self, vehicle_id: str) -> Optional[str]:
@@ -359,7 +403,7 @@ class PriorityController:
             Hướng di chuyển ("Bắc", "Nam", "Đông", "Tây") hoặc None
         """
         try:
-            current_edge = traci.vehicle.getRoadID(vehicle_id)
+            current_edge = self.snapshot.vehicle_road(vehicle_id)
             
             # Tìm hướng tương ứng với edge
             for direction, edges in self.direction_edges.items():
@@ -369,7 +413,7 @@ class PriorityController:
             return None
             
         except Exception as e:
-            print(f"❌ Lỗi khi xác định hướng xe {vehicle_id}: {e}")
+            self.logger.error("❌ Lỗi khi xác định hướng xe %s: %s", vehicle_id, e)
             return None
     
     def is_emergency_vehicle(self, vehicle_id: str) -> bool:
@@ -383,15 +427,15 @@ class PriorityController:
             True nếu là xe ưu tiên
         """
         try:
-            veh_type = traci.vehicle.getTypeID(vehicle_id).lower()
-            veh_class = traci.vehicle.getVehicleClass(vehicle_id).lower()
+            veh_type = self.snapshot.vehicle_type(vehicle_id).lower()
+            veh_class = self.snapshot.vehicle_class(vehicle_id).lower()
             
             # Kiểm tra theo type ID và vehicle class
             return any(emergency_type in veh_type or emergency_type in veh_class 
                       for emergency_type in self.EMERGENCY_VEHICLE_TYPES)
                       
         except Exception as e:
-            print(f"❌ Lỗi khi kiểm tra loại xe {vehicle_id}: {e}")
+            self.logger.error("❌ Lỗi khi kiểm tra loại xe %s: %s", vehicle_id, e)
             return False
     
     def is_emergency_vehicle_blocked(self, vehicle_id: str) -> Tuple[bool, Optional[str]]:
@@ -414,7 +458,7 @@ class PriorityController:
         """
         try:
             # Lấy xe phía trước (leader) trong vòng 50m
-            leader = traci.vehicle.getLeader(vehicle_id, 50.0)
+            leader = self.traci.vehicle.getLeader(vehicle_id, 50.0)
             
             if leader is None:
                 # Không có xe phía trước → Tự do!
@@ -422,15 +466,15 @@ class PriorityController:
             
             leader_id, distance_to_leader = leader
             
-            # Kiểm tra leader có phải xe ưu tiên không
-            if self.is_emergency_vehicle(leader_id):
+            # Kiểm tra leader có phải xe ưu tiên không (tra registry, không gọi TraCI)
+            if leader_id in self.emergency_registry:
                 # Leader cũng là xe ưu tiên → OK, cả hai đều vượt được
                 return (False, "leader_is_emergency")
             
             # Lấy tốc độ của cả hai xe
             try:
-                speed = traci.vehicle.getSpeed(vehicle_id)
-                leader_speed = traci.vehicle.getSpeed(leader_id)
+                speed = self.snapshot.vehicle_speed(vehicle_id)
+                leader_speed = self.snapshot.vehicle_speed(leader_id)
             except:
                 # Không lấy được tốc độ → Giả định bị kẹt (safe side)
                 return (True, "speed_unavailable")
@@ -453,7 +497,7 @@ class PriorityController:
             return (False, f"free (leader:{leader_id}, dist:{distance_to_leader:.1f}m, speed:{speed:.1f}m/s)")
             
         except Exception as e:
-            print(f"⚠️ Lỗi khi kiểm tra xe bị kẹt {vehicle_id}: {e}")
+            self.logger.warning("⚠️ Lỗi khi kiểm tra xe bị kẹt %s: %s", vehicle_id, e)
             # Nếu có lỗi → Giả định BỊ KẸT (safe side, ưu tiên an toàn xe ưu tiên)
             return (True, f"error_check: {e}")
     
@@ -465,18 +509,26 @@ class PriorityController:
             Danh sách xe ưu tiên được phát hiện
         """
         emergency_vehicles = []
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
+        records = self.vehicle_records
         
         try:
-            # Lấy tất cả xe ĐANG DI CHUYỂN trong mô phỏng
-            all_vehicles = traci.vehicle.getIDList()
+            # Bỏ bản ghi của xe đã rời mạng
+            if records:
+                for vehicle_id in [vid for vid in records if not self.snapshot.has_vehicle(vid)]:
+                    del records[vehicle_id]
+            
+            # Chỉ duyệt xe ưu tiên ĐANG DI CHUYỂN trong mô phỏng (registry cập nhật
+            # khi xe vào mạng → không hỏi type/class của mọi xe mỗi step)
+            emergency_ids = self.emergency_registry.vehicle_ids()
             
-            for vehicle_id in all_vehicles:
+            if self.use_context_subscription:
+                # SUMO đã lọc sẵn xe trong DETECTION_RADIUS (kèm vị trí, tốc độ, edge, vType)
+                nearby = self.snapshot.junction_vehicles(self.junction_id)
+                emergency_ids = [vid for vid in emergency_ids if vid in nearby]
+            
+            for vehicle_id in emergency_ids:
                 try:
-                    # Kiểm tra xe có phải ưu tiên không
-                    if not self.is_emergency_vehicle(vehicle_id):
-                        continue
-                    
                     # ✅ CRITICAL FIX: Chỉ xét xe ưu tiên đến ngã tư mà controller này quản lý
                     # Mỗi PriorityController chỉ xử lý xe đến ngã tư của mình (J1, J4, ...)
                     # Format vehicle_id: priority_DEFAULT_north_J1_123 hoặc priority_DEFAULT_north_J4_456
@@ -484,54 +536,65 @@ class PriorityController:
                     if junction_marker not in vehicle_id:
                         continue  # Xe này đi đến ngã tư khác, không phải ngã tư của controller này
                     
-                    print(f"🚨 Phát hiện xe ưu tiên: {vehicle_id}")
+                    self.logger.debug("🚨 Phát hiện xe ưu tiên: %s", vehicle_id)
                     
                     # Tính khoảng cách đến ngã tư
                     distance = self.calculate_distance_to_junction(vehicle_id)
                     
-                    print(f"📍 Khoảng cách: {distance:.1f}m (Radius: {self.DETECTION_RADIUS}m)")
+                    self.logger.debug("📍 Khoảng cách: %.1fm (Radius: %sm)", distance, self.DETECTION_RADIUS)
                     
                     # Kiểm tra trong bán kính phát hiện
                     if distance <= self.DETECTION_RADIUS:
                         # Lấy thông tin xe
-                        speed = traci.vehicle.getSpeed(vehicle_id)
+                        speed = self.snapshot.vehicle_speed(vehicle_id)
                         direction = self.get_vehicle_direction(vehicle_id)
-                        veh_type = traci.vehicle.getTypeID(vehicle_id)
+                        veh_type = self.snapshot.vehicle_type(vehicle_id)
                         
-                        print(f"🧭 Hướng: {direction}, Tốc độ: {speed:.1f}m/s")
+                        self.logger.debug("🧭 Hướng: %s, Tốc độ: %.1fm/s", direction, speed)
                         
                         if direction:  # Xe phải có hướng rõ ràng
-                            # ✅ Parse scenario_id từ vehicle_id
-                            # Format: priority_SC1_north_J1_123456
-                            scenario_id = "DEFAULT"
-                            try:
-                                parts = vehicle_id.split("_")
-                                if len(parts) >= 2 and parts[1].startswith("SC"):
-                                    scenario_id = parts[1]  # "SC1", "SC2", "SC5", "SC6"
-                            except:
+                            emergency_veh = records.get(vehicle_id)
+                            if emergency_veh is not None and emergency_veh.served:
+                                # Xe đã được phục vụ (đang đi ra trên edge RA) → không ưu tiên lại
+                                continue
+                            if emergency_veh is not None:
+                                # Xe đang theo dõi: cập nhật tại chỗ
+                                emergency_veh.update(direction, distance, speed, veh_type)
+                                scenario_id = emergency_veh.scenario_id
+                            else:
+                                # ✅ Parse scenario_id từ vehicle_id
+                                # Format: priority_SC1_north_J1_123456
                                 scenario_id = "DEFAULT"
-                            
-                            emergency_veh = EmergencyVehicle(
-                                vehicle_id=vehicle_id,
-                                vehicle_type=veh_type,
-                                detection_time=current_time,
-                                direction=direction,
-                                distance=distance,
-                                speed=speed,
-                                scenario_id=scenario_id  # ✅ TRUYỀN SCENARIO
-                            )
+                                try:
+                                    parts = vehicle_id.split("_")
+                                    if len(parts) >= 2 and parts[1].startswith("SC"):
+                                        scenario_id = parts[1]  # "SC1", "SC2", "SC5", "SC6"
+                                except:
+                                    scenario_id = "DEFAULT"
+                                
+                                # Phát hiện lần đầu
+                                emergency_veh = EmergencyVehicle(
+                                    vehicle_id=vehicle_id,
+                                    vehicle_type=veh_type,
+                                    detection_time=current_time,
+                                    direction=direction,
+                                    distance=distance,
+                                    speed=speed,
+                                    scenario_id=scenario_id  # ✅ TRUYỀN SCENARIO
+                                )
+                                records[vehicle_id] = emergency_veh
                             
                             emergency_vehicles.append(emergency_veh)
-                            print(f"✅ Đã thêm xe {vehicle_id} vào danh sách ưu tiên (Scenario: {scenario_id})!")
+                            self.logger.debug("✅ Đã thêm xe %s vào danh sách ưu tiên (Scenario: %s)!", vehicle_id, scenario_id)
                         else:
-                            print(f"⚠️ Không xác định được hướng xe {vehicle_id}")
+                            self.logger.debug("⚠️ Không xác định được hướng xe %s", vehicle_id)
                             
                 except traci.exceptions.TraCIException as e:
-                    print(f"⚠️ TraCI exception cho xe {vehicle_id}: {e}")
+                    self.logger.warning("⚠️ TraCI exception cho xe %s: %s", vehicle_id, e)
                     continue
                     
         except Exception as e:
-            print(f"❌ Lỗi khi quét xe ưu tiên: {e}")
+            self.logger.error("❌ Lỗi khi quét xe ưu tiên: %s", e)
             
         return emergency_vehicles
     
@@ -549,24 +612,24 @@ class PriorityController:
         Returns:
             True nếu xe được xác nhận
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         vehicle_id = vehicle.vehicle_id
         
         # SC4: Kiểm tra xe vẫn tồn tại trong simulation
         try:
-            if vehicle_id not in traci.vehicle.getIDList():
-                print(f"⚠️ SC4: Xe {vehicle_id} không còn tồn tại - Báo giả!")
+            if not self.snapshot.has_vehicle(vehicle_id):
+                self.logger.warning("⚠️ SC4: Xe %s không còn tồn tại - Báo giả!", vehicle_id)
                 self._log_false_positive(vehicle_id, 'vehicle_disappeared', 'DETECTION')
                 return False
             
             # SC4: Kiểm tra xe vẫn là emergency vehicle
             if not self.is_emergency_vehicle(vehicle_id):
-                print(f"⚠️ SC4: Xe {vehicle_id} không phải emergency vehicle - Báo giả!")
+                self.logger.warning("⚠️ SC4: Xe %s không phải emergency vehicle - Báo giả!", vehicle_id)
                 self._log_false_positive(vehicle_id, 'not_emergency_type', 'DETECTION')
                 return False
                 
         except Exception as e:
-            print(f"⚠️ SC4: Lỗi khi kiểm tra xe {vehicle_id}: {e}")
+            self.logger.warning("⚠️ SC4: Lỗi khi kiểm tra xe %s: %s", vehicle_id, e)
             self._log_false_positive(vehicle_id, f'verification_error: {e}', 'DETECTION')
             return False
         
@@ -582,7 +645,7 @@ class PriorityController:
         # Kiểm tra có đủ số lần xác nhận không
         if len(self.detection_confirmations[vehicle_id]) >= self.CONFIRMATION_COUNT:
             vehicle.confirmed = True
-            print(f"✅ SC4: Xe {vehicle_id} đã được xác nhận ({len(self.detection_confirmations[vehicle_id])} lần)")
+            self.logger.debug("✅ SC4: Xe %s đã được xác nhận (%s lần)", vehicle_id, len(self.detection_confirmations[vehicle_id]))
             return True
             
         return False
@@ -594,7 +657,7 @@ class PriorityController:
         Returns:
             True nếu có thể kích hoạt ưu tiên
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         
         # Kiểm tra cooldown
         if current_time - self.last_preemption_time < self.PREEMPT_COOLDOWN:
@@ -647,7 +710,7 @@ class PriorityController:
             return pressure
             
         except Exception as e:
-            print(f"⚠️ Lỗi khi lấy pressure hướng {direction_name}: {e}")
+            self.logger.warning("⚠️ Lỗi khi lấy pressure hướng %s: %s", direction_name, e)
             return 0.0
     
     def select_priority_vehicle(self, vehicles: List[EmergencyVehicle]) -> Optional[EmergencyVehicle]:
@@ -712,7 +775,7 @@ class PriorityController:
             # Có xe bị kẹt → Sắp xếp theo ETA
             blocked_vehicles.sort(key=lambda x: x[0].eta)
             selected = blocked_vehicles[0][0]
-            print(f"⚡ SC3: Chọn xe BỊ KẸT (có {len(blocked_vehicles)} xe bị kẹt, {len(free_vehicles)} xe tự do)")
+            self.logger.debug("⚡ SC3: Chọn xe BỊ KẸT (có %s xe bị kẹt, %s xe tự do)", len(blocked_vehicles), len(free_vehicles))
         else:
             # Không có xe bị kẹt → Chọn theo ETA (nhưng thường sẽ không kích hoạt ưu tiên)
             eligible.sort(key=lambda v: v.eta)
@@ -722,8 +785,8 @@ class PriorityController:
                 eta_diff = abs(eligible[0].eta - eligible[1].eta)
                 if eta_diff <= 2.0:
                     # ETA gần nhau (±2s) → Chọn xe gần hơn
-                    print(f"⚡ SC3: Có {len(eligible)} xe, ETA gần nhau ({eta_diff:.1f}s)")
-                    print(f"   Chọn xe gần hơn theo distance")
+                    self.logger.debug("⚡ SC3: Có %s xe, ETA gần nhau (%.1fs)", len(eligible), eta_diff)
+                    self.logger.debug("   Chọn xe gần hơn theo distance")
                     eligible.sort(key=lambda v: v.distance)
             
             selected = eligible[0]
@@ -731,7 +794,7 @@ class PriorityController:
         # Xe còn lại → Đưa vào pending queue
         for v in eligible[1:]:
             self.pending_vehicles[v.vehicle_id] = v
-            print(f"📝 SC3: Xe {v.vehicle_id} đưa vào pending queue")
+            self.logger.debug("📝 SC3: Xe %s đưa vào pending queue", v.vehicle_id)
         
         return selected
     
@@ -745,14 +808,16 @@ class PriorityController:
         Args:
             rejected_vehicle: Xe bị từ chối ưu tiên
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         
+        # Xe bị từ chối được quét lại mỗi step → chỉ log INFO khi mới kích hoạt
+        level = logging.DEBUG if self.emergency_mode_active else logging.INFO
         self.emergency_mode_active = True
         self.emergency_mode_start_time = current_time
         
-        print(f"🚨 SC6 EMERGENCY MODE ACTIVATED")
-        print(f"   Từ chối xe {rejected_vehicle.vehicle_id}")
-        print(f"   Đã ưu tiên {len(self.preemption_count_last_minute)} lần trong 60s")
+        self.logger.log(level, "🚨 SC6 EMERGENCY MODE ACTIVATED")
+        self.logger.log(level, "   Từ chối xe %s", rejected_vehicle.vehicle_id)
+        self.logger.log(level, "   Đã ưu tiên %s lần trong 60s", len(self.preemption_count_last_minute))
         
         # Log xe bị từ chối
         self.rejected_vehicles.append({
@@ -771,9 +836,9 @@ class PriorityController:
             try:
                 # KHÔNG ghi đè min_green nữa - giữ nguyên 15s từ Stage 2
                 # Chỉ log để theo dõi
-                print(f"   ⚠️ Emergency mode: GIỮ NGUYÊN adaptive params (min={self.adaptive_controller.T_MIN_GREEN:.0f}s, max={self.adaptive_controller.T_MAX_GREEN:.0f}s)")
+                self.logger.debug("   ⚠️ Emergency mode: GIỮ NGUYÊN adaptive params (min=%.0fs, max=%.0fs)", self.adaptive_controller.T_MIN_GREEN, self.adaptive_controller.T_MAX_GREEN)
             except Exception as e:
-                print(f"⚠️ Không thể kiểm tra adaptive params: {e}")
+                self.logger.warning("⚠️ Không thể kiểm tra adaptive params: %s", e)
     
     def should_respect_min_green(self) -> bool:
         """
@@ -785,7 +850,7 @@ class PriorityController:
         if not self.adaptive_controller:
             return False
             
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         phase_duration = current_time - self.adaptive_controller.phase_start_time
         
         return phase_duration < self.SAFE_MIN_GREEN_BEFORE
@@ -813,10 +878,10 @@ class PriorityController:
             True nếu thành công
         """
         try:
-            traci.trafficlight.setPhase(self.junction_id, phase)
+            self.traci.trafficlight.setPhase(self.tls_id, phase)
             return True
         except Exception as e:
-            print(f"❌ Lỗi khi áp dụng pha khẩn cấp: {e}")
+            self.logger.error("❌ Lỗi khi áp dụng pha khẩn cấp: %s", e)
             return False
     
     def transition_to_state(self, new_state: PreemptionState, context: Dict = None):
@@ -827,16 +892,16 @@ class PriorityController:
             new_state: Trạng thái mới
             context: Thông tin bổ sung về việc chuyển đổi
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         
-        print(f"🔄 Chuyển từ {self.current_state.value} → {new_state.value}")
+        self.logger.debug("🔄 Chuyển từ %s → %s", self.current_state.value, new_state.value)
         
         # Gọi UI callback để cập nhật trạng thái visual
         if self.ui_callback:
             try:
                 self.ui_callback(self.junction_id, new_state.value, self.priority_vehicle)
             except Exception as e:
-                print(f"⚠️ UI callback error: {e}")
+                self.logger.warning("⚠️ UI callback error: %s", e)
         
         # --- QUAN TRỌNG: Pause/Resume AdaptiveController ---
         old_state = self.current_state
@@ -845,13 +910,13 @@ class PriorityController:
         if old_state == PreemptionState.NORMAL and new_state != PreemptionState.NORMAL:
             if self.adaptive_controller:
                 self.adaptive_controller.is_active = False
-                print("⏸️ Pause AdaptiveController")
+                self.logger.debug("⏸️ Pause AdaptiveController")
         
         # Khi về NORMAL → Resume Adaptive
         if new_state == PreemptionState.NORMAL and old_state != PreemptionState.NORMAL:
             if self.adaptive_controller:
                 self.adaptive_controller.is_active = True
-                print("▶️ Resume AdaptiveController")
+                self.logger.debug("▶️ Resume AdaptiveController")
         
         # Lưu lịch sử chuyển đổi
         if context:
@@ -861,6 +926,14 @@ class PriorityController:
                 'time': current_time,
                 'context': context
             })
+            # Thống kê tích lũy: mỗi PREEMPTION_GREEN được ghép với RESTORE kế tiếp
+            if new_state == PreemptionState.PREEMPTION_GREEN:
+                self.preemption_activations += 1
+                self._pending_preemption_times.append(current_time)
+            elif new_state == PreemptionState.RESTORE:
+                for start_time in self._pending_preemption_times:
+                    self.processing_times.append(current_time - start_time)
+                self._pending_preemption_times.clear()
         
         self.current_state = new_state
         self.state_start_time = current_time
@@ -874,7 +947,7 @@ class PriorityController:
         
         Tài liệu: "Nếu pha N–S đang xanh: giữ xanh đủ min_green (10s) rồi mở rộng thêm"
         """
-        print(f"🚓 [SC1-HANDLER] Xe từ hướng chính: {vehicle.direction}")
+        self.logger.debug("🚓 [SC1-HANDLER] Xe từ hướng chính: %s", vehicle.direction)
         # Logic đã được xử lý trong handle_detection_state (BƯỚC 4)
         # Hàm này để log và tracking thêm nếu cần
     
@@ -885,7 +958,7 @@ class PriorityController:
         
         Tài liệu: "Nếu ≥ min_green: chuyển pha → vàng → đỏ toàn bộ → xanh cho hướng ưu tiên"
         """
-        print(f"🚙 [SC2-HANDLER] Xe từ hướng nhánh: {vehicle.direction}, ETA={vehicle.eta:.1f}s")
+        self.logger.debug("🚙 [SC2-HANDLER] Xe từ hướng nhánh: %s, ETA=%.1fs", vehicle.direction, vehicle.eta)
         # Logic đã được xử lý trong handle_detection_state (BƯỚC 5)
     
     def handle_sc5_stuck_vehicle(self, vehicle: EmergencyVehicle):
@@ -895,18 +968,18 @@ class PriorityController:
         
         Tài liệu: "Mở xanh cho hướng xe ưu tiên, kết hợp mở upstream để giải tỏa hàng xe máy"
         """
-        print(f"🚓 [SC5-HANDLER] Xe bị kẹt: {vehicle.vehicle_id}, distance={vehicle.distance:.1f}m")
+        self.logger.debug("🚓 [SC5-HANDLER] Xe bị kẹt: %s, distance=%.1fm", vehicle.vehicle_id, vehicle.distance)
         
         try:
             # Tăng thời gian xanh lên gấp đôi để dọn dòng xe
             extended_green = self.PREEMPT_MIN_GREEN * 2.0
-            print(f"   → Tăng thời gian xanh lên {extended_green:.0f}s để dọn dòng xe")
+            self.logger.debug("   → Tăng thời gian xanh lên %.0fs để dọn dòng xe", extended_green)
             
             # TODO: Nếu có upstream signal, mở luôn để xe máy phía sau thoát ra
             # (Tính năng nâng cao - cần có multi-junction coordination)
             
         except Exception as e:
-            print(f"⚠️ Lỗi SC5 handler: {e}")
+            self.logger.warning("⚠️ Lỗi SC5 handler: %s", e)
     
     def handle_sc6_consecutive(self, vehicle: EmergencyVehicle):
         """
@@ -915,7 +988,7 @@ class PriorityController:
         
         Tài liệu: "Khi hết luồng ưu tiên → hệ thống bù green cho các hướng bị dồn backlog"
         """
-        print(f"🚑 [SC6-HANDLER] Xe liên tiếp #{len(self.preemption_count_last_minute)}: {vehicle.vehicle_id}")
+        self.logger.debug("🚑 [SC6-HANDLER] Xe liên tiếp #%s: %s", len(self.preemption_count_last_minute), vehicle.vehicle_id)
         
         try:
             # Ghi nhận queue tích lũy (backlog) cho các hướng khác
@@ -930,21 +1003,21 @@ class PriorityController:
                             self.adaptive_controller.TrafficDirection[direction.upper()]
                         )
                         self.adaptive_controller.record_backlog(direction, queue_pcu)
-                        print(f"   📝 {direction}: Queue backlog = {queue_pcu:.1f} PCU")
+                        self.logger.debug("   📝 %s: Queue backlog = %.1f PCU", direction, queue_pcu)
                     except Exception:
                         pass
             
-            print(f"   ⚠️ Rate limit: {len(self.preemption_count_last_minute)}/2 xe trong 60s")
+            self.logger.warning("   ⚠️ Rate limit: %s/2 xe trong 60s", len(self.preemption_count_last_minute))
             
         except Exception as e:
-            print(f"⚠️ Lỗi SC6 handler: {e}")
+            self.logger.warning("⚠️ Lỗi SC6 handler: %s", e)
     
     # ========== END SCENARIO HANDLERS ==========
     
     def handle_normal_state(self):
         """Xử lý trạng thái NORMAL"""
         # ✅ FIX: Tracking xe đã qua ngã tư (cho xe không bị kẹt)
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         if self.confirmed_vehicles:
             self._track_confirmed_vehicles(current_time)
         
@@ -978,7 +1051,7 @@ class PriorityController:
         - Bước 4: Kiểm tra xe từ hướng đang xanh (SC1)
         - Bước 5: Kiểm tra safe_min_green (SC2)
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         
         # --- BƯỚC 0: Theo dõi xe đã qua ngã tư (tracking) ---
         # QUAN TRỌNG: Phải tracking ngay cả khi ở DETECTION state!
@@ -989,7 +1062,7 @@ class PriorityController:
         
         if not priority_vehicle:
             # Không có xe phù hợp, quay về NORMAL
-            print("ℹ️ Không có xe ưu tiên phù hợp")
+            self.logger.debug("ℹ️ Không có xe ưu tiên phù hợp")
             self.transition_to_state(PreemptionState.NORMAL, {
                 'reason': 'no_eligible_vehicle'
             })
@@ -1005,39 +1078,39 @@ class PriorityController:
             # Xe tự do → Dùng ETA để quyết định
             if priority_vehicle.eta > 30:
                 # ETA quá xa → Chờ (đặt lịch)
-                print(f"⏰ ETA={priority_vehicle.eta:.1f}s > 30s, chờ xe đến gần hơn...")
+                self.logger.debug("⏰ ETA=%.1fs > 30s, chờ xe đến gần hơn...", priority_vehicle.eta)
                 return  # Giữ ở DETECTION, chờ ETA giảm
             
             if priority_vehicle.eta > self.ETA_THRESHOLD:  # 15s (đã fix từ 12s)
                 # ETA trong khoảng 15-30s → Monitor tiếp
-                print(f"⏳ ETA={priority_vehicle.eta:.1f}s, tiếp tục theo dõi...")
+                self.logger.debug("⏳ ETA=%.1fs, tiếp tục theo dõi...", priority_vehicle.eta)
                 return  # Giữ ở DETECTION
         else:
             # ✅ FIX: Xe BỊ KẸT → Dùng DISTANCE thay vì ETA
             if priority_vehicle.distance > 100:
                 # Xe bị kẹt quá xa (>100m) → Chờ đến gần hơn
-                print(f"⏰ Xe BỊ KẸT nhưng còn xa ({priority_vehicle.distance:.1f}m > 100m), chờ đến gần...")
+                self.logger.debug("⏰ Xe BỊ KẸT nhưng còn xa (%.1fm > 100m), chờ đến gần...", priority_vehicle.distance)
                 return  # Giữ ở DETECTION
             
             # Xe bị kẹt trong phạm vi 100m → Kích hoạt ưu tiên ngay
-            print(f"🚨 Xe BỊ KẸT trong phạm vi {priority_vehicle.distance:.1f}m → Ưu tiên NGAY")
+            self.logger.debug("🚨 Xe BỊ KẸT trong phạm vi %.1fm → Ưu tiên NGAY", priority_vehicle.distance)
         
         # --- BƯỚC 3: Hiển thị thông tin phân tích ---
-        print(f"=" * 60)
-        print(f"🔍 PHÂN TÍCH XE ƯU TIÊN")
-        print(f"   Xe: {priority_vehicle.vehicle_id}")
-        print(f"   Khoảng cách: {priority_vehicle.distance:.1f}m")
-        print(f"   Tốc độ: {priority_vehicle.speed:.1f}m/s")
-        print(f"   ETA: {priority_vehicle.eta:.1f}s")
-        print(f"   Bị kẹt: {'CÓ' if is_blocked else 'KHÔNG'} - {block_reason}")
-        print(f"🚨 LUÔN kích hoạt ưu tiên (dù xe có bị kẹt hay không)")
-        print(f"=" * 60)
+        self.logger.debug("=" * 60)
+        self.logger.debug("🔍 PHÂN TÍCH XE ƯU TIÊN")
+        self.logger.debug("   Xe: %s", priority_vehicle.vehicle_id)
+        self.logger.debug("   Khoảng cách: %.1fm", priority_vehicle.distance)
+        self.logger.debug("   Tốc độ: %.1fm/s", priority_vehicle.speed)
+        self.logger.debug("   ETA: %.1fs", priority_vehicle.eta)
+        self.logger.debug("   Bị kẹt: %s - %s", 'CÓ' if is_blocked else 'KHÔNG', block_reason)
+        self.logger.debug("🚨 LUÔN kích hoạt ưu tiên (dù xe có bị kẹt hay không)")
+        self.logger.debug("=" * 60)
         
         # --- BƯỚC 3: ETA ≤ 12s → Kiểm tra rate limit (SC6) ---
         if not self.can_activate_preemption():
             # Vượt giới hạn 2 lần/60s
-            print(f"⛔ SC6: Vượt rate limit ({len(self.preemption_count_last_minute)}/2 trong 60s)")
-            print(f"   TỪ CHỐI ưu tiên cho xe {priority_vehicle.vehicle_id}")
+            self.logger.debug("⛔ SC6: Vượt rate limit (%s/2 trong 60s)", len(self.preemption_count_last_minute))
+            self.logger.debug("   TỪ CHỐI ưu tiên cho xe %s", priority_vehicle.vehicle_id)
             
             # Kích hoạt Emergency Mode (SC6)
             self.activate_emergency_mode(priority_vehicle)
@@ -1054,20 +1127,20 @@ class PriorityController:
         
         # --- BƯỚC 4: Kiểm tra SC1 (xe từ hướng đang xanh) ---
         try:
-            current_phase = traci.trafficlight.getPhase(self.junction_id)
+            current_phase = self.traci.trafficlight.getPhase(self.tls_id)
             required_phase = self.calculate_required_phase(priority_vehicle.direction)
             
             if current_phase == required_phase:
                 # SC1: Xe từ hướng đang xanh → Kéo dài luôn
-                print(f"=" * 60)
-                print(f"🚨 SC1: XE ƯU TIÊN TỪ HƯỚNG ĐANG XANH")
-                print(f"   Xe: {priority_vehicle.vehicle_id}")
-                print(f"   Scenario: {priority_vehicle.scenario_id}")
-                print(f"   Hướng: {priority_vehicle.direction} (Phase {current_phase})")
-                print(f"   Khoảng cách: {priority_vehicle.distance:.1f}m")
-                print(f"   ETA: {priority_vehicle.eta:.1f}s")
-                print(f"   → KÉO DÀI ĐÈN XANH")
-                print(f"=" * 60)
+                self.logger.debug("=" * 60)
+                self.logger.debug("🚨 SC1: XE ƯU TIÊN TỪ HƯỚNG ĐANG XANH")
+                self.logger.debug("   Xe: %s", priority_vehicle.vehicle_id)
+                self.logger.debug("   Scenario: %s", priority_vehicle.scenario_id)
+                self.logger.debug("   Hướng: %s (Phase %s)", priority_vehicle.direction, current_phase)
+                self.logger.debug("   Khoảng cách: %.1fm", priority_vehicle.distance)
+                self.logger.debug("   ETA: %.1fs", priority_vehicle.eta)
+                self.logger.debug("   → KÉO DÀI ĐÈN XANH")
+                self.logger.debug("=" * 60)
                 
                 # ✅ Gọi SC1 handler
                 if priority_vehicle.scenario_id == "SC1":
@@ -1091,7 +1164,7 @@ class PriorityController:
                 return
                 
         except Exception as e:
-            print(f"⚠️ Lỗi khi kiểm tra pha đèn: {e}")
+            self.logger.warning("⚠️ Lỗi khi kiểm tra pha đèn: %s", e)
         
         # --- BƯỚC 5: Kiểm tra SC2 (safe_min_green) với điều chỉnh theo mật độ ---
         if self.adaptive_controller:
@@ -1100,7 +1173,7 @@ class PriorityController:
                 
                 # ✅ FIX GIAI ĐOẠN 3: Điều chỉnh SAFE_MIN_GREEN theo mật độ
                 # Lấy áp lực của các hướng
-                current_phase = traci.trafficlight.getPhase(self.junction_id)
+                current_phase = self.traci.trafficlight.getPhase(self.tls_id)
                 
                 # Xác định hướng đang được xanh
                 if current_phase == 0:  # NS_GREEN
@@ -1121,36 +1194,36 @@ class PriorityController:
                 if total_current_pressure > 25.0:
                     # Hướng hiện tại QUÁ TẮC (>25 PCU) → Tăng thời gian an toàn
                     adjusted_safe_min = 7.0  # Tăng từ 4s → 7s
-                    print(f"⚠️ Hướng {', '.join(current_directions)} QUÁ TẮC ({total_current_pressure:.1f} PCU)")
-                    print(f"   → Tăng safe_min_green: {base_safe_min}s → {adjusted_safe_min}s")
+                    self.logger.warning("⚠️ Hướng %s QUÁ TẮC (%.1f PCU)", ', '.join(current_directions), total_current_pressure)
+                    self.logger.debug("   → Tăng safe_min_green: %ss → %ss", base_safe_min, adjusted_safe_min)
                 elif total_current_pressure > 15.0:
                     # Hướng hiện tại TẮC VỪA (15-25 PCU) → Tăng ít
                     adjusted_safe_min = 5.5  # Tăng từ 4s → 5.5s
-                    print(f"⚠️ Hướng {', '.join(current_directions)} TẮC VỪA ({total_current_pressure:.1f} PCU)")
-                    print(f"   → Tăng safe_min_green: {base_safe_min}s → {adjusted_safe_min}s")
+                    self.logger.warning("⚠️ Hướng %s TẮC VỪA (%.1f PCU)", ', '.join(current_directions), total_current_pressure)
+                    self.logger.debug("   → Tăng safe_min_green: %ss → %ss", base_safe_min, adjusted_safe_min)
                 else:
                     # Hướng hiện tại THÔNG THOÁNG (<15 PCU) → Giữ nguyên
                     adjusted_safe_min = base_safe_min
-                    print(f"✅ Hướng {', '.join(current_directions)} THÔNG THOÁNG ({total_current_pressure:.1f} PCU)")
+                    self.logger.debug("✅ Hướng %s THÔNG THOÁNG (%.1f PCU)", ', '.join(current_directions), total_current_pressure)
                 
                 if phase_elapsed < adjusted_safe_min:
                     remaining = adjusted_safe_min - phase_elapsed
-                    print(f"⏸️ SC2: Chờ {remaining:.1f}s để đủ safe_min_green ({adjusted_safe_min}s)")
-                    print(f"   Pha hiện tại mới xanh được {phase_elapsed:.1f}s")
+                    self.logger.debug("⏸️ SC2: Chờ %.1fs để đủ safe_min_green (%ss)", remaining, adjusted_safe_min)
+                    self.logger.debug("   Pha hiện tại mới xanh được %.1fs", phase_elapsed)
                     return  # Giữ ở DETECTION
                     
             except Exception as e:
-                print(f"⚠️ Không thể kiểm tra phase_elapsed: {e}")
+                self.logger.warning("⚠️ Không thể kiểm tra phase_elapsed: %s", e)
         
         # --- BƯỚC 6: Tất cả điều kiện OK → SAFE_TRANSITION ---
-        print(f"=" * 60)
-        print(f"🚦 CHUYỂN PHA AN TOÀN")
-        print(f"   Xe: {priority_vehicle.vehicle_id}")
-        print(f"   Scenario: {priority_vehicle.scenario_id}")
-        print(f"   Hướng: {priority_vehicle.direction}")
-        print(f"   ETA: {priority_vehicle.eta:.1f}s")
-        print(f"   → BẮT ĐẦU QUY TRÌNH YELLOW → ALL-RED → GREEN")
-        print(f"=" * 60)
+        self.logger.debug("=" * 60)
+        self.logger.debug("🚦 CHUYỂN PHA AN TOÀN")
+        self.logger.debug("   Xe: %s", priority_vehicle.vehicle_id)
+        self.logger.debug("   Scenario: %s", priority_vehicle.scenario_id)
+        self.logger.debug("   Hướng: %s", priority_vehicle.direction)
+        self.logger.debug("   ETA: %.1fs", priority_vehicle.eta)
+        self.logger.debug("   → BẮT ĐẦU QUY TRÌNH YELLOW → ALL-RED → GREEN")
+        self.logger.debug("=" * 60)
         
         # ✅ Gọi scenario handlers tương ứng
         if priority_vehicle.scenario_id == "SC2":
@@ -1181,7 +1254,7 @@ class PriorityController:
         
         SC4: Kiểm tra báo giả trong quá trình chuyển pha
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         elapsed = current_time - self.state_start_time
         
         # --- SC4: Kiểm tra báo giả ---
@@ -1189,8 +1262,8 @@ class PriorityController:
             if not self._verify_emergency_vehicle_exists(
                 self.priority_vehicle.vehicle_id, 'SAFE_TRANSITION'
             ):
-                print(f"❌ SC4: Phát hiện báo giả trong SAFE_TRANSITION!")
-                print(f"   → HỦY ưu tiên, quay về RESTORE")
+                self.logger.error("❌ SC4: Phát hiện báo giả trong SAFE_TRANSITION!")
+                self.logger.info("   → HỦY ưu tiên, quay về RESTORE")
                 
                 # Hủy ưu tiên, quay về RESTORE
                 self.transition_to_state(PreemptionState.RESTORE, {
@@ -1203,26 +1276,26 @@ class PriorityController:
         # --- Giai đoạn 1: YELLOW (0-3s) ---
         if elapsed <= self.YELLOW_DURATION:
             if elapsed < 0.1:  # Lần đầu vào state
-                print(f"🟡 Bật đèn vàng (Yellow phase - {self.YELLOW_DURATION}s)")
+                self.logger.info("🟡 Bật đèn vàng (Yellow phase - %ss)", self.YELLOW_DURATION)
             return  # Giữ ở state này
         
         # --- Giai đoạn 2: ALL-RED (3-6s) ---
         elif elapsed <= (self.YELLOW_DURATION + self.ALL_RED_EMERGENCY):
             if elapsed < self.YELLOW_DURATION + 0.1:  # Lần đầu vào all-red
-                print(f"🔴 Bật All-Red ({self.ALL_RED_EMERGENCY}s) - Dọn giao lộ")
+                self.logger.info("🔴 Bật All-Red (%ss) - Dọn giao lộ", self.ALL_RED_EMERGENCY)
                 self.apply_all_red_phase()
             return
         
         # --- Giai đoạn 3: Hoàn tất → PREEMPTION_GREEN ---
         else:
-            print("✅ Safe transition hoàn tất")
+            self.logger.info("✅ Safe transition hoàn tất")
             
             # Áp dụng pha xanh cho xe ưu tiên
             if self.priority_vehicle:
                 required_phase = self.calculate_required_phase(self.priority_vehicle.direction)
                 self.apply_emergency_phase(required_phase)
                 
-                print(f"🟢 Bật xanh cho hướng {self.priority_vehicle.direction} (phase {required_phase})")
+                self.logger.info("🟢 Bật xanh cho hướng %s (phase %s)", self.priority_vehicle.direction, required_phase)
                 
                 self.transition_to_state(PreemptionState.PREEMPTION_GREEN, {
                     'vehicle_id': self.priority_vehicle.vehicle_id,
@@ -1238,7 +1311,7 @@ class PriorityController:
                     self._preemption_counted = True
             else:
                 # Không còn xe ưu tiên
-                print("⚠️ Không còn xe ưu tiên, chuyển RESTORE")
+                self.logger.warning("⚠️ Không còn xe ưu tiên, chuyển RESTORE")
                 self.transition_to_state(PreemptionState.RESTORE)
     
     def apply_all_red_phase(self):
@@ -1248,10 +1321,10 @@ class PriorityController:
         try:
             # Tạo state string với tất cả đèn đỏ (16 ký tự 'r')
             all_red_state = "rrrrrrrrrrrrrrrr"
-            traci.trafficlight.setRedYellowGreenState(self.junction_id, all_red_state)
+            self.traci.trafficlight.setRedYellowGreenState(self.tls_id, all_red_state)
             return True
         except Exception as e:
-            print(f"❌ Lỗi khi áp dụng all-red: {e}")
+            self.logger.error("❌ Lỗi khi áp dụng all-red: %s", e)
             return False
     
     def handle_preemption_green_state(self):
@@ -1264,7 +1337,7 @@ class PriorityController:
         - Bước 4: Kiểm tra xe bị kẹt (SC5)
         - Bước 5: Quyết định kết thúc
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         elapsed = current_time - self.state_start_time
         
         # --- BƯỚC 1: Áp dụng pha xanh (chỉ lần đầu) ---
@@ -1272,8 +1345,8 @@ class PriorityController:
             if self.priority_vehicle:
                 required_phase = self.calculate_required_phase(self.priority_vehicle.direction)
                 
-                print(f"🟢 Bật xanh cho hướng {self.priority_vehicle.direction}")
-                print(f"   Phase: {required_phase}, Xe: {self.priority_vehicle.vehicle_id}")
+                self.logger.info("🟢 Bật xanh cho hướng %s", self.priority_vehicle.direction)
+                self.logger.info("   Phase: %s, Xe: %s", required_phase, self.priority_vehicle.vehicle_id)
                 
                 # Áp dụng pha xanh
                 try:
@@ -1285,18 +1358,18 @@ class PriorityController:
                     else:
                         green_state = "GGGgrrrrGGGgrrrr"  # Default
                     
-                    traci.trafficlight.setRedYellowGreenState(self.junction_id, green_state)
+                    self.traci.trafficlight.setRedYellowGreenState(self.tls_id, green_state)
                     
                 except Exception as e:
-                    print(f"⚠️ Lỗi khi áp dụng pha xanh: {e}")
+                    self.logger.warning("⚠️ Lỗi khi áp dụng pha xanh: %s", e)
         
         # --- BƯỚC 2: SC4 - Kiểm tra báo giả ---
         if self.priority_vehicle:
             if not self._verify_emergency_vehicle_exists(
                 self.priority_vehicle.vehicle_id, 'PREEMPTION_GREEN'
             ):
-                print(f"❌ SC4: Phát hiện báo giả trong PREEMPTION_GREEN!")
-                print(f"   → HỦY ưu tiên, chuyển RESTORE ngay lập tức")
+                self.logger.error("❌ SC4: Phát hiện báo giả trong PREEMPTION_GREEN!")
+                self.logger.info("   → HỦY ưu tiên, chuyển RESTORE ngay lập tức")
                 
                 # Hủy ưu tiên, khôi phục adaptive ngay
                 self.transition_to_state(PreemptionState.RESTORE, {
@@ -1313,29 +1386,29 @@ class PriorityController:
         # --- BƯỚC 4: Kiểm tra xe bị kẹt (SC5) ---
         for vid, vehicle in list(self.confirmed_vehicles.items()):
             try:
-                if vid not in traci.vehicle.getIDList():
+                if not self.snapshot.has_vehicle(vid):
                     continue
                 
                 distance = self.calculate_distance_to_junction(vid)
                 
                 # Xe vẫn còn trong vùng
                 if distance < 200:
-                    speed = traci.vehicle.getSpeed(vid)
+                    speed = self.snapshot.vehicle_speed(vid)
                     
                     if speed < 2.0 and elapsed > 15:
                         # Xe đi chậm sau 15s → Cảnh báo
-                        print(f"⚠️ SC5: Xe {vid} có thể bị kẹt")
-                        print(f"   Speed: {speed:.1f}m/s, Elapsed: {elapsed:.1f}s")
-                        print(f"   Scenario: {vehicle.scenario_id}")
+                        self.logger.warning("⚠️ SC5: Xe %s có thể bị kẹt", vid)
+                        self.logger.info("   Speed: %.1fm/s, Elapsed: %.1fs", speed, elapsed)
+                        self.logger.info("   Scenario: %s", vehicle.scenario_id)
                         
                         # ✅ SC5-specific handling: Tăng thời gian xanh nếu là SC5
                         if vehicle.scenario_id == "SC5" and elapsed > 20:
-                            print(f"🚓 [SC5] Phát hiện xe kẹt → Kéo dài thời gian xanh")
+                            self.logger.info("🚓 [SC5] Phát hiện xe kẹt → Kéo dài thời gian xanh")
                             # Kéo dài thêm thời gian để xe thoát
                         
                         if elapsed > 30:
                             # Kẹt quá 30s → Chuyển HOLD_PREEMPTION
-                            print(f"❌ SC5: Xe {vid} kẹt quá 30s!")
+                            self.logger.error("❌ SC5: Xe %s kẹt quá 30s!", vid)
                             
                             # ✅ Gọi SC5 handler lần nữa
                             if vehicle.scenario_id == "SC5":
@@ -1351,16 +1424,16 @@ class PriorityController:
                             return
                     
             except Exception as e:
-                print(f"⚠️ Lỗi khi kiểm tra SC5 cho xe {vid}: {e}")
+                self.logger.warning("⚠️ Lỗi khi kiểm tra SC5 cho xe %s: %s", vid, e)
         
         # --- BƯỚC 5: Kiểm tra điều kiện kết thúc ---
         if not self.confirmed_vehicles:
             # Không còn xe nào → Kết thúc ngay
-            print(f"✅ Tất cả xe đã qua (elapsed={elapsed:.1f}s)")
+            self.logger.info("✅ Tất cả xe đã qua (elapsed=%.1fs)", elapsed)
             self.transition_to_state(PreemptionState.RESTORE, {
                 'reason': 'all_vehicles_cleared',
                 'green_duration': elapsed,
-                'served_count': len(self.served_vehicles)
+                'served_count': self.served_vehicles.total_count
             })
             return
         
@@ -1374,12 +1447,12 @@ class PriorityController:
             
             # Nếu xe gần nhất đã rất gần (< 30m) → Chờ thêm
             if closest_distance < 30:
-                print(f"⏳ Xe gần nhất còn {closest_distance:.1f}m, chờ thêm...")
+                self.logger.info("⏳ Xe gần nhất còn %.1fm, chờ thêm...", closest_distance)
                 return  # Giữ PREEMPTION_GREEN
             
             # Nếu xe còn xa (≥30m) và đã đủ min_green → Chuyển RESTORE
-            print(f"✅ Đủ {self.PREEMPT_MIN_GREEN}s min_green, xe gần nhất còn {closest_distance:.1f}m")
-            print(f"   → Chuyển RESTORE (còn {len(remaining_vehicles)} xe chưa qua)")
+            self.logger.info("✅ Đủ %ss min_green, xe gần nhất còn %.1fm", self.PREEMPT_MIN_GREEN, closest_distance)
+            self.logger.info("   → Chuyển RESTORE (còn %s xe chưa qua)", len(remaining_vehicles))
             self.transition_to_state(PreemptionState.RESTORE, {
                 'reason': 'min_green_reached',
                 'green_duration': elapsed,
@@ -1397,7 +1470,7 @@ class PriorityController:
         - Theo dõi speed của xe
         - Timeout 30s → RESTORE với lỗi
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         elapsed = current_time - self.state_start_time
         
         # Timeout 30s (theo tài liệu SC5)
@@ -1408,34 +1481,30 @@ class PriorityController:
         
         if not self.priority_vehicle:
             # Không có xe ưu tiên, chuyển RESTORE
-            print("⚠️ Không có xe ưu tiên trong HOLD_PREEMPTION")
+            self.logger.warning("⚠️ Không có xe ưu tiên trong HOLD_PREEMPTION")
             self.transition_to_state(PreemptionState.RESTORE)
             return
         
         vehicle_id = self.priority_vehicle.vehicle_id
         
         # Kiểm tra xe còn trong simulation không
-        if vehicle_id not in traci.vehicle.getIDList():
+        if not self.snapshot.has_vehicle(vehicle_id):
             # Xe đã despawn → Đã qua
-            print(f"✅ SC5: Xe {vehicle_id} đã qua ngã tư (despawned)")
-            self.priority_vehicle.served = True
-            
+            self.logger.info("✅ SC5: Xe %s đã qua ngã tư (despawned)", vehicle_id)
             # ✅ Tính Emergency Clearance Time
-            self._calculate_and_log_clearance_time(self.priority_vehicle, current_time)
-            
-            self.served_vehicles.append(self.priority_vehicle)
+            self._mark_served(self.priority_vehicle, current_time)
             self.transition_to_state(PreemptionState.RESTORE)
             return
         
         try:
             distance = self.calculate_distance_to_junction(vehicle_id)
-            speed = traci.vehicle.getSpeed(vehicle_id)
+            speed = self.snapshot.vehicle_speed(vehicle_id)
             
             # Kiểm tra xe đã thoát kẹt chưa
             if speed > 5.0:
                 # Xe đã thoát kẹt (speed > 5 m/s)
-                print(f"✅ SC5: Xe {vehicle_id} thoát kẹt!")
-                print(f"   Speed: {speed:.1f}m/s, Elapsed: {elapsed:.1f}s")
+                self.logger.info("✅ SC5: Xe %s thoát kẹt!", vehicle_id)
+                self.logger.info("   Speed: %.1fm/s, Elapsed: %.1fs", speed, elapsed)
                 self.transition_to_state(PreemptionState.RESTORE, {
                     'reason': 'vehicle_unstuck',
                     'hold_duration': elapsed
@@ -1445,22 +1514,18 @@ class PriorityController:
             # GIẢM NGƯỠNG: 50m → 30m
             if distance > 30:
                 # Xe đã qua ngã tư
-                print(f"✅ SC5: Xe {vehicle_id} đã qua ngã tư")
-                print(f"   Distance: {distance:.1f}m, Elapsed: {elapsed:.1f}s")
-                self.priority_vehicle.served = True
-                
+                self.logger.info("✅ SC5: Xe %s đã qua ngã tư", vehicle_id)
+                self.logger.info("   Distance: %.1fm, Elapsed: %.1fs", distance, elapsed)
                 # ✅ Tính Emergency Clearance Time
-                self._calculate_and_log_clearance_time(self.priority_vehicle, current_time)
-                
-                self.served_vehicles.append(self.priority_vehicle)
+                self._mark_served(self.priority_vehicle, current_time)
                 self.transition_to_state(PreemptionState.RESTORE)
                 return
             
             # Kiểm tra timeout
             if elapsed > HOLD_TIMEOUT:
                 # Timeout 30s → Chấp nhận thất bại
-                print(f"❌ SC5: TIMEOUT {HOLD_TIMEOUT}s - Xe vẫn kẹt!")
-                print(f"   Speed: {speed:.1f}m/s, Distance: {distance:.1f}m")
+                self.logger.error("❌ SC5: TIMEOUT %ss - Xe vẫn kẹt!", HOLD_TIMEOUT)
+                self.logger.info("   Speed: %.1fm/s, Distance: %.1fm", speed, distance)
                 
                 # Log lỗi
                 self.failed_preemptions.append({
@@ -1482,11 +1547,11 @@ class PriorityController:
             
             # Log định kỳ mỗi 5s
             if int(elapsed) % 5 == 0 and elapsed - int(elapsed) < 0.1:
-                print(f"⏳ SC5: Chờ xe thoát kẹt ({elapsed:.0f}s/{HOLD_TIMEOUT}s)")
-                print(f"   Speed: {speed:.1f}m/s, Distance: {distance:.1f}m")
+                self.logger.info("⏳ SC5: Chờ xe thoát kẹt (%.0fs/%ss)", elapsed, HOLD_TIMEOUT)
+                self.logger.info("   Speed: %.1fm/s, Distance: %.1fm", speed, distance)
                 
         except Exception as e:
-            print(f"⚠️ Lỗi khi kiểm tra xe trong HOLD: {e}")
+            self.logger.warning("⚠️ Lỗi khi kiểm tra xe trong HOLD: %s", e)
             self.transition_to_state(PreemptionState.RESTORE)
     
     def handle_restore_state(self):
@@ -1501,7 +1566,7 @@ class PriorityController:
         - Bước 6: Kiểm tra pending vehicles (SC3)
         - Bước 7: Quay về NORMAL
         """
-        current_time = traci.simulation.getTime()
+        current_time = self.snapshot.get_time()
         
         # --- BƯỚC 1: Tính thời gian ưu tiên ---
         if hasattr(self, 'preemption_start_time') and self.preemption_start_time > 0:
@@ -1509,9 +1574,9 @@ class PriorityController:
         else:
             preemption_duration = current_time - self.state_start_time
         
-        print(f"🔄 RESTORE: Khôi phục về adaptive")
-        print(f"   Thời gian ưu tiên: {preemption_duration:.1f}s")
-        print(f"   Xe đã phục vụ: {len(self.served_vehicles)}")
+        self.logger.info("🔄 RESTORE: Khôi phục về adaptive")
+        self.logger.info("   Thời gian ưu tiên: %.1fs", preemption_duration)
+        self.logger.info("   Xe đã phục vụ: %s", self.served_vehicles.total_count)
         
         # --- BƯỚC 2: Xác định hướng bị ảnh hưởng ---
         priority_direction = self.priority_vehicle.direction if self.priority_vehicle else None
@@ -1522,14 +1587,14 @@ class PriorityController:
         else:
             affected_directions = all_directions
         
-        print(f"   Hướng bị ảnh hưởng: {', '.join(affected_directions)}")
+        self.logger.info("   Hướng bị ảnh hưởng: %s", ', '.join(affected_directions))
         
         # --- BƯỚC 3: Tính thời gian bù (SC6) ---
         # ✅ SC6-IMPROVED: Phân tích backlog và bù thông minh
         if self.adaptive_controller:
-            print(f"=" * 60)
-            print(f"📊 SC6-BACKLOG ANALYSIS")
-            print(f"-" * 60)
+            self.logger.info("=" * 60)
+            self.logger.info("📊 SC6-BACKLOG ANALYSIS")
+            self.logger.info("-" * 60)
             
             # Lấy báo cáo backlog toàn bộ
             backlog_report = self.adaptive_controller.get_all_backlog_report()
@@ -1545,7 +1610,7 @@ class PriorityController:
                 severity = info.get('severity', 0)
                 current_queue = info.get('current_queue', 0)
                 
-                print(f"   {direction}: Queue={current_queue:.1f} PCU, Severity={severity:.0f}/100 [{status}]")
+                self.logger.info("   %s: Queue=%.1f PCU, Severity=%.0f/100 [%s]", direction, current_queue, severity, status)
                 
                 if status == 'CRITICAL':
                     critical_dirs.append(direction)
@@ -1554,7 +1619,7 @@ class PriorityController:
                 else:
                     ok_dirs.append(direction)
             
-            print(f"-" * 60)
+            self.logger.info("-" * 60)
         else:
             # Fallback nếu không có adaptive controller
             critical_dirs = []
@@ -1569,9 +1634,9 @@ class PriorityController:
         
         if self.adaptive_controller:
             try:
-                print(f"   📊 CHIẾN LƯỢC BÙ THÔNG MINH (Base 60% + Queue Bonus + Severity Bonus):")
-                print(f"   Giới hạn tối đa: {MAX_COMPENSATION_PER_DIRECTION}s/hướng")
-                print(f"-" * 60)
+                self.logger.info("   📊 CHIẾN LƯỢC BÙ THÔNG MINH (Base 60% + Queue Bonus + Severity Bonus):")
+                self.logger.info("   Giới hạn tối đa: %ss/hướng", MAX_COMPENSATION_PER_DIRECTION)
+                self.logger.info("-" * 60)
                 
                 # Xử lý TẤT CẢ hướng bị ảnh hưởng
                 for direction in affected_directions:
@@ -1608,26 +1673,26 @@ class PriorityController:
                     # --- GIỚI HẠN TỐI ĐA (chống đói) ---
                     if compensation_time > MAX_COMPENSATION_PER_DIRECTION:
                         compensation_time = MAX_COMPENSATION_PER_DIRECTION
-                        print(f"   ⚠️ {direction}: Giới hạn xuống {MAX_COMPENSATION_PER_DIRECTION}s (tránh bỏ đói)")
+                        self.logger.warning("   ⚠️ %s: Giới hạn xuống %ss (tránh bỏ đói)", direction, MAX_COMPENSATION_PER_DIRECTION)
                     
                     # --- ÁP DỤNG GREEN DEBT ---
                     self.adaptive_controller.add_green_debt(direction, compensation_time)
                     
                     # --- LOG CHI TIẾT ---
                     status_icon = {'CRITICAL': '🔴', 'WARNING': '🟡', 'OK': '🟢'}.get(status, '⚪')
-                    print(f"   {status_icon} {direction}: Queue={current_queue:.1f} PCU")
-                    print(f"      Base={int(base_factor*100)}% + Queue={int(queue_bonus*100)}% + Severity={int(severity_bonus*100)}% = {int(total_factor*100)}%")
-                    print(f"      Bù: {compensation_time:.1f}s (từ {preemption_duration:.1f}s)")
+                    self.logger.info("   %s %s: Queue=%.1f PCU", status_icon, direction, current_queue)
+                    self.logger.info("      Base=%s%% + Queue=%s%% + Severity=%s%% = %s%%", int(base_factor*100), int(queue_bonus*100), int(severity_bonus*100), int(total_factor*100))
+                    self.logger.info("      Bù: %.1fs (từ %.1fs)", compensation_time, preemption_duration)
                 
-                print(f"=" * 60)
+                self.logger.info("=" * 60)
                 
                 # ✅ GIAI ĐOẠN 4 - Issue #11: Kiểm tra waiting_time (chống đói layer 2)
-                print(f"\n   🛡️ KIỂM TRA CHỐNG ĐÓI:")
+                self.logger.info("\n   🛡️ KIỂM TRA CHỐNG ĐÓI:")
                 max_waiting_direction = None
                 max_waiting_time = 0.0
                 
                 try:
-                    current_time_check = traci.simulation.getTime()
+                    current_time_check = self.snapshot.get_time()
                     all_directions_list = ["Bắc", "Nam", "Đông", "Tây"]
                     
                     for dir_name in all_directions_list:
@@ -1639,28 +1704,28 @@ class PriorityController:
                             max_waiting_direction = dir_name
                         
                         if waiting > 40:  # CRITICAL_WAITING_TIME
-                            print(f"      ⚠️ {dir_name}: Chờ {waiting:.0f}s (>40s CRITICAL!)")
+                            self.logger.warning("      ⚠️ %s: Chờ %.0fs (>40s CRITICAL!)", dir_name, waiting)
                         elif waiting > 30:
-                            print(f"      🟡 {dir_name}: Chờ {waiting:.0f}s")
+                            self.logger.info("      🟡 %s: Chờ %.0fs", dir_name, waiting)
                     
                     if max_waiting_time > 40:
-                        print(f"      🚨 Hướng {max_waiting_direction} chờ {max_waiting_time:.0f}s → Adaptive sẽ ưu tiên")
+                        self.logger.info("      🚨 Hướng %s chờ %.0fs → Adaptive sẽ ưu tiên", max_waiting_direction, max_waiting_time)
                     else:
-                        print(f"      ✅ Tất cả hướng waiting_time < 40s (OK)")
+                        self.logger.info("      ✅ Tất cả hướng waiting_time < 40s (OK)")
                         
                 except Exception as e:
-                    print(f"      ⚠️ Không thể kiểm tra waiting_time: {e}")
+                    self.logger.warning("      ⚠️ Không thể kiểm tra waiting_time: %s", e)
                 
                 # Kích hoạt lại Adaptive - Tự động chọn phase dựa trên Queue + Debt + Waiting
                 self.adaptive_controller.is_active = True
-                print(f"\n   ✅ Adaptive Controller đã được kích hoạt lại")
-                print(f"   ℹ️ Adaptive sẽ TỰ ĐỘNG chọn phase dựa trên:")
-                print(f"      • Mật độ xe hiện tại (Queue PCU)")
-                print(f"      • Thời gian bù (Green Debt)")
-                print(f"      • Thời gian chờ (Waiting Time)")
+                self.logger.info("\n   ✅ Adaptive Controller đã được kích hoạt lại")
+                self.logger.info("   ℹ️ Adaptive sẽ TỰ ĐỘNG chọn phase dựa trên:")
+                self.logger.info("      • Mật độ xe hiện tại (Queue PCU)")
+                self.logger.info("      • Thời gian bù (Green Debt)")
+                self.logger.info("      • Thời gian chờ (Waiting Time)")
                 
             except Exception as e:
-                print(f"   ⚠️ Lỗi khi bù thời gian: {e}")
+                self.logger.warning("   ⚠️ Lỗi khi bù thời gian: %s", e)
         
         # --- BƯỚC 5: Xử lý Emergency Mode (SC6) ---
         if self.emergency_mode_active:
@@ -1668,33 +1733,33 @@ class PriorityController:
             
             # Giữ emergency mode trong 120s (2 phút)
             if elapsed_emergency < 120:
-                print(f"   🚨 Emergency mode còn {120 - elapsed_emergency:.0f}s")
+                self.logger.info("   🚨 Emergency mode còn %.0fs", 120 - elapsed_emergency)
             else:
                 # Tắt emergency mode
                 self.emergency_mode_active = False
-                print(f"   ✅ Tắt Emergency Mode (đã qua 120s)")
+                self.logger.info("   ✅ Tắt Emergency Mode (đã qua 120s)")
                 
                 # Khôi phục tham số adaptive
                 if self.adaptive_controller:
                     try:
                         self.adaptive_controller.restore_normal_params()
-                        print(f"   ✅ Khôi phục tham số adaptive bình thường")
+                        self.logger.info("   ✅ Khôi phục tham số adaptive bình thường")
                     except Exception as e:
-                        print(f"   ⚠️ Lỗi khi khôi phục params: {e}")
+                        self.logger.warning("   ⚠️ Lỗi khi khôi phục params: %s", e)
         
         # --- BƯỚC 6: Kiểm tra pending vehicles (SC3) ---
         if self.pending_vehicles:
-            print(f"   🔔 Có {len(self.pending_vehicles)} xe đang chờ trong pending queue")
+            self.logger.info("   🔔 Có %s xe đang chờ trong pending queue", len(self.pending_vehicles))
             
-            # Chuyển pending → confirmed
+            # Chuyển pending → confirmed (xe đã được phục vụ đã bị bỏ khỏi pending trong _mark_served)
             for vid, vehicle in self.pending_vehicles.items():
                 self.confirmed_vehicles[vid] = vehicle
-                print(f"      - Xe {vid} từ pending → confirmed")
+                self.logger.info("      - Xe %s từ pending → confirmed", vid)
             
             self.pending_vehicles.clear()
             
             # Quay lại DETECTION để xử lý xe tiếp theo
-            print(f"   → Chuyển DETECTION để xử lý xe pending")
+            self.logger.info("   → Chuyển DETECTION để xử lý xe pending")
             self.transition_to_state(PreemptionState.DETECTION, {
                 'reason': 'pending_vehicles_exist',
                 'count': len(self.confirmed_vehicles)
@@ -1706,13 +1771,13 @@ class PriorityController:
         # ✅ FIX CLEARANCE TIME: KHÔNG xóa confirmed_vehicles ở đây!
         # Để _track_confirmed_vehicles() tự phát hiện xe qua ngã tư và tính clearance time
         # self.confirmed_vehicles.clear()  # ❌ XÓA DÒNG NÀY
-        print(f"   ℹ️ Giữ {len(self.confirmed_vehicles)} xe trong confirmed_vehicles để track clearance time")
+        self.logger.info("   ℹ️ Giữ %s xe trong confirmed_vehicles để track clearance time", len(self.confirmed_vehicles))
         
         self.priority_vehicle = None
         self.preemption_start_time = 0.0
         self._preemption_counted = False
         
-        print(f"   ✅ Quay về chế độ NORMAL")
+        self.logger.info("   ✅ Quay về chế độ NORMAL")
         self.transition_to_state(PreemptionState.NORMAL, {
             'reason': 'preemption_completed'
         })
@@ -1725,26 +1790,38 @@ class PriorityController:
             True nếu khởi động thành công
         """
         try:
-            if not traci.isLoaded():
-                print("❌ SUMO chưa được khởi động!")
+            if not self.traci.isLoaded():
+                self.logger.error("❌ SUMO chưa được khởi động!")
                 return False
             
             self.current_state = PreemptionState.NORMAL
-            self.state_start_time = traci.simulation.getTime()
+            self.state_start_time = self.snapshot.get_time()
             self.is_active = True
             
-            print(f"✅ Priority Controller đã khởi động cho {self.junction_id}")
+            # Cache tọa độ ngã tư + nhờ SUMO lọc xe trong bán kính phát hiện mỗi step
+            self.junction_position = None
+            self.get_junction_position()
+            try:
+                # force: subscription cũ có thể đã mất (traci.load) dù snapshot vẫn ghi nhận
+                self.snapshot.subscribe_junction_context(self.junction_id, self.DETECTION_RADIUS, force=True)
+                self.use_context_subscription = True
+            except traci.exceptions.TraCIException as e:
+                self.use_context_subscription = False
+                self.logger.warning("⚠️ Không thể subscribe context cho %s, quét toàn bộ xe ưu tiên: %s", self.junction_id, e)
+            
+            self.logger.info("✅ Priority Controller đã khởi động cho %s", self.junction_id)
             return True
             
         except Exception as e:
-            print(f"❌ Lỗi khi khởi động Priority Controller: {e}")
+            self.logger.error("❌ Lỗi khi khởi động Priority Controller: %s", e)
             return False
     
     def stop(self):
         """Dừng Priority Controller"""
         self.is_active = False
-        print("🛑 Priority Controller đã dừng")
+        self.logger.info("🛑 Priority Controller đã dừng")
     
+    @profiled("PriorityController.step")
     def step(self) -> bool:
         """
         Thực hiện một bước xử lý ưu tiên
@@ -1773,7 +1850,7 @@ class PriorityController:
             return True
             
         except Exception as e:
-            print(f"❌ Lỗi trong bước xử lý ưu tiên: {e}")
+            self.logger.error("❌ Lỗi trong bước xử lý ưu tiên: %s", e)
             return False
     
     def get_status(self) -> Dict:
@@ -1784,7 +1861,7 @@ class PriorityController:
             Dictionary chứa thông tin trạng thái
         """
         try:
-            current_time = traci.simulation.getTime()
+            current_time = self.snapshot.get_time()
             state_duration = current_time - self.state_start_time
             
             return {
@@ -1794,14 +1871,14 @@ class PriorityController:
                 'is_active': self.is_active,
                 'detected_vehicles': len(self.detected_vehicles),
                 'confirmed_vehicles': len(self.confirmed_vehicles),
-                'served_vehicles': len(self.served_vehicles),
+                'served_vehicles': self.served_vehicles.total_count,
                 'preemptions_last_minute': len(self.preemption_count_last_minute),
                 'can_activate_preemption': self.can_activate_preemption(),
-                'total_preemption_events': len(self.preemption_history)
+                'total_preemption_events': self.preemption_history.total_count
             }
             
         except Exception as e:
-            print(f"❌ Lỗi khi lấy trạng thái: {e}")
+            self.logger.error("❌ Lỗi khi lấy trạng thái: %s", e)
             return {'error': str(e)}
     
     def get_statistics(self) -> Dict:
@@ -1815,68 +1892,42 @@ class PriorityController:
             if not self.preemption_history:
                 return {'message': 'Chưa có dữ liệu thống kê ưu tiên'}
             
-            # Thống kê số lần ưu tiên
-            total_preemptions = len([h for h in self.preemption_history 
-                                   if h['to_state'] == 'PREEMPTION_GREEN'])
-            
-            # Thống kê thời gian xử lý trung bình
-            processing_times = []
-            for i, history in enumerate(self.preemption_history):
-                if history['to_state'] == 'PREEMPTION_GREEN':
-                    # Tìm thời điểm RESTORE tương ứng
-                    for j in range(i+1, len(self.preemption_history)):
-                        if self.preemption_history[j]['to_state'] == 'RESTORE':
-                            processing_time = (self.preemption_history[j]['time'] - 
-                                             history['time'])
-                            processing_times.append(processing_time)
-                            break
-            
-            avg_processing_time = (sum(processing_times) / len(processing_times) 
-                                 if processing_times else 0)
+            # Thống kê số lần ưu tiên (tích lũy khi chuyển trạng thái)
+            total_preemptions = self.preemption_activations
             
-            # SC4: Thống kê báo giả
-            false_positive_count = len(self.false_positives)
-            false_positive_by_stage = defaultdict(int)
-            false_positive_by_reason = defaultdict(int)
+            # Thống kê thời gian xử lý trung bình (PREEMPTION_GREEN → RESTORE)
+            avg_processing_time = self.processing_times.mean
             
-            for fp in self.false_positives:
-                false_positive_by_stage[fp['stage']] += 1
-                false_positive_by_reason[fp['reason']] += 1
+            # SC4: Thống kê báo giả
+            false_positive_count = self.false_positives.total_count
             
             # ✅ KPI: Emergency Clearance Time Statistics
             clearance_stats = {}
-            if self.clearance_times:
-                avg_clearance = sum(self.clearance_times) / len(self.clearance_times)
-                min_clearance = min(self.clearance_times)
-                max_clearance = max(self.clearance_times)
-                
+            if self.clearance_times.count:
                 # Đếm theo mức độ
-                excellent_count = len([t for t in self.clearance_times if t <= self.EXCELLENT_CLEARANCE])
-                acceptable_count = len([t for t in self.clearance_times 
-                                       if self.EXCELLENT_CLEARANCE < t <= self.ACCEPTABLE_CLEARANCE])
-                poor_count = len([t for t in self.clearance_times if t > self.ACCEPTABLE_CLEARANCE])
+                excellent_count, acceptable_count, poor_count = self.clearance_times.bin_counts
                 
                 clearance_stats = {
-                    'average_clearance_time': round(avg_clearance, 2),
-                    'min_clearance_time': round(min_clearance, 2),
-                    'max_clearance_time': round(max_clearance, 2),
+                    'average_clearance_time': round(self.clearance_times.mean, 2),
+                    'min_clearance_time': round(self.clearance_times.min, 2),
+                    'max_clearance_time': round(self.clearance_times.max, 2),
                     'excellent_count': excellent_count,  # ≤ 15s
                     'acceptable_count': acceptable_count,  # ≤ 25s
                     'poor_count': poor_count,  # > 25s
-                    'excellent_rate': round((excellent_count / len(self.clearance_times)) * 100, 1),
-                    'total_measured': len(self.clearance_times)
+                    'excellent_rate': round((excellent_count / self.clearance_times.count) * 100, 1),
+                    'total_measured': self.clearance_times.count
                 }
             
             return {
                 'total_preemption_activations': total_preemptions,
-                'total_vehicles_served': len(self.served_vehicles),
+                'total_vehicles_served': self.served_vehicles.total_count,
                 'average_processing_time': round(avg_processing_time, 2),
-                'successful_preemptions': len(processing_times),
-                'preemption_success_rate': (len(processing_times) / max(total_preemptions, 1)) * 100,
+                'successful_preemptions': self.processing_times.count,
+                'preemption_success_rate': (self.processing_times.count / max(total_preemptions, 1)) * 100,
                 # SC4 Statistics
                 'false_positives_count': false_positive_count,
-                'false_positives_by_stage': dict(false_positive_by_stage),
-                'false_positives_by_reason': dict(false_positive_by_reason),
+                'false_positives_by_stage': dict(self.false_positives_by_stage),
+                'false_positives_by_reason': dict(self.false_positives_by_reason),
                 # SC5 Statistics
                 'failed_preemptions_count': len(self.failed_preemptions),
                 # SC6 Statistics
@@ -1888,5 +1939,5 @@ class PriorityController:
             }
             
         except Exception as e:
-            print(f"❌ Lỗi khi tính thống kê ưu tiên: {e}")
+            self.logger.error("❌ Lỗi khi tính thống kê ưu tiên: %s", e)
             return {'error': str(e)}
\ No newline at end of file
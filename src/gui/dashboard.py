@@ -6,6 +6,7 @@ import time
 import os
 import sys
 import random
+import tempfile
 
 # ==================== PATH SETUP ====================
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -20,6 +21,17 @@ if SRC_ROOT not in sys.path:
 from simulation.sumo_connector import khoi_dong_sumo, dung_sumo, dieu_chinh_tat_ca_den
 from simulation.vehicle_counter import VehicleCounter
 from simulation.sensor_manager import SensorManager
+from simulation.step_snapshot import get_step_snapshot
+from simulation.kpi_engine import KPIEngine
+from simulation.free_flow_index import FreeFlowIndex
+from simulation.simulation_driver import SimulationDriver
+from simulation.scenarios import ScenarioRunner, build_route_args
+from simulation.kpi_recorder import KPIRecorder, KPI_COLUMNS, column_name, controller_columns, controller_schema
+from simulation.network_index import DIRECTION_NAMES, get_network_index
+from gui.render_scheduler import RenderScheduler, SimulationPacer
+from gui.log_buffer import LogBuffer
+from utils.profiler import get_profiler, profiled
+from utils.traci_monitor import get_traci_monitor
 
 try:
     from controllers.adaptive_controller import AdaptiveController
@@ -36,6 +48,21 @@ ctk.set_default_color_theme("blue")
 
 
 class SmartTrafficApp(ctk.CTk):
+    # Nhãn các sự kiện spawn xe ưu tiên trên SimulationDriver (để hủy cùng lúc)
+    SPAWN_TAG = "priority_spawning"
+    # Kịch bản trên giao diện → mã kịch bản trong simulation.scenarios
+    SCENARIO_KEYS = {
+        "Mặc định": "DEFAULT",
+        "SC1 - Xe ưu tiên từ hướng chính trong giờ cao điểm": "SC1",
+        "SC2 - Xe ưu tiên từ hướng nhánh (ít xe) sắp tới gần": "SC2",
+        "SC3 - Nhiều xe ưu tiên từ 2 hướng đối diện": "SC3",
+        "SC4 - Báo giả": "SC4",
+        "SC5 - Xe ưu tiên bị kẹt trong dòng xe dài": "SC5",
+        "SC6 - Nhiều xe ưu tiên liên tiếp": "SC6",
+    }
+    SCENARIO_ROUTE_HORIZON = 3600.0  # Độ dài lịch trong route file kịch bản (= end của flows)
+    LOG_MAX_LINES = 1000  # Số dòng log giữ trên giao diện (toàn bộ lịch sử nằm trong file)
+
     def __init__(self):
         super().__init__()
         self.title("🚦 HỆ THỐNG ĐIỀU KHIỂN ĐÈN GIAO THÔNG THÔNG MINH")
@@ -51,6 +78,12 @@ class SmartTrafficApp(ctk.CTk):
         # ✅ TÍCH LŨY số xe arrived (fix lỗi throughput về 0)
         self.total_arrived_vehicles = 0
         
+        # Tốc độ mô phỏng (giây mô phỏng / giây thực, None = tối đa) và tần số vẽ UI
+        self.speed_options = {"1x": 1.0, "2x": 2.0, "5x": 5.0, "10x": 10.0,
+                              "50x": 50.0, "100x": 100.0, "Tối đa": None}
+        self.pacer = SimulationPacer(speed_factor=self.speed_options["10x"])
+        self.ui_fps = 4.0
+        
         # scenario spawning
         self.scenario_spawning = False
         self.scenario_thread = None
@@ -72,9 +105,40 @@ class SmartTrafficApp(ctk.CTk):
         # Sensor Manager instance
         self.sensor_manager = None
         
-        # Priority vehicle spawning control
+        # KPI Engine (tính KPI toàn mạng mỗi step bằng NumPy)
+        self.kpi_engine = None
+        self.free_flow_index = None  # Bảng free-flow time theo route (dựng 1 lần từ file mạng)
+        self.network_index = get_network_index()  # Ngã tư/hướng của edge, lane, detector (cache theo hash file mạng)
+        
+        # Priority vehicle spawning control (sự kiện theo thời gian SUMO trên SimulationDriver)
         self.spawning_active = False
-        self.spawning_thread = None
+        self.scenario_runner = None
+        self.scenario_seed = None  # Seed lịch xe ưu tiên (None = ngẫu nhiên mỗi lần, xem log để chạy lại)
+        self.sumo_route_args = []  # Tham số route file kịch bản đã nạp vào SUMO
+        self.sumo_preload = None  # (mã kịch bản, seed) của route file đã nạp
+        self.preloaded_scenario = None  # Như trên, nhưng chỉ dùng được 1 lần (chưa có runner nào nhận)
+        
+        # Vòng lặp mô phỏng: 1 luồng duy nhất gửi lệnh TraCI
+        self.driver = None
+        self.sim_thread = None
+
+        # Profiler theo step (bật bằng biến môi trường SMART_TRAFFIC_PROFILE=1 hoặc =<file trace .json>)
+        self.profile_output = os.environ.get("SMART_TRAFFIC_PROFILE")
+        if self.profile_output:
+            get_profiler().enable(trace=True)
+        # Đếm lệnh TraCI theo phương thức, log mỗi N step (SMART_TRAFFIC_TRACI_STATS=N)
+        try:
+            self.traci_stats_every = int(os.environ.get("SMART_TRAFFIC_TRACI_STATS", "0"))
+        except ValueError:
+            self.traci_stats_every = 0
+        # Chuỗi KPI theo step (SMART_TRAFFIC_TIMESERIES=<thư mục>, mỗi N step, csv/parquet)
+        self.timeseries_dir = os.environ.get("SMART_TRAFFIC_TIMESERIES")
+        try:
+            self.timeseries_every = int(os.environ.get("SMART_TRAFFIC_TIMESERIES_EVERY", "1"))
+        except ValueError:
+            self.timeseries_every = 1
+        self.timeseries_format = os.environ.get("SMART_TRAFFIC_TIMESERIES_FORMAT", "csv")
+        self.kpi_recorder = None
 
         # KPI & intersection data
         self.global_kpi_data = {
@@ -125,8 +189,20 @@ class SmartTrafficApp(ctk.CTk):
         }
         self.has_priority_vehicles = False
 
+        # Log: N dòng gần nhất trên giao diện, toàn bộ lịch sử ghi vào file tạm
+        log_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.log_buffer = LogBuffer(
+            max_lines=self.LOG_MAX_LINES,
+            history_path=os.path.join(tempfile.gettempdir(), f"smart_traffic_log_{log_timestamp}.txt"))
+
         # Build UI
         self.create_layout()
+        self.log_buffer.attach(self, self.log_box)
+        self.log_buffer.start()
+        
+        # UI lấy frame KPI mới nhất theo tần số cố định (không vẽ theo từng step)
+        self.render_scheduler = RenderScheduler(self, self.update_ui, fps=self.ui_fps)
+        self.render_scheduler.start()
         
         # Cập nhật hiển thị KPI đầu tiên theo mode ban đầu
         self.update_first_kpi_display()
@@ -235,6 +311,26 @@ class SmartTrafficApp(ctk.CTk):
                                    corner_radius=5, command=self.export_log)
         export_btn.pack(side="left", padx=2)
 
+        # Speed selector (tốc độ mô phỏng so với thời gian thực)
+        speed_frame = ctk.CTkFrame(control_bar_top, fg_color="transparent")
+        speed_frame.pack(side="right")
+        ctk.CTkLabel(speed_frame, text="Tốc độ:", font=("Segoe UI", 11, "bold"),
+                     text_color="#334155").pack(side="left", padx=(0, 6))
+        self.speed_box = ctk.CTkOptionMenu(
+            speed_frame,
+            values=list(self.speed_options.keys()),
+            command=self.change_speed,
+            fg_color="#cbd5e1",
+            button_color="#0ea5e9",
+            button_hover_color="#0284c7",
+            text_color="#0f172a",
+            width=80,
+            height=34,
+            corner_radius=5
+        )
+        self.speed_box.pack(side="left")
+        self.speed_box.set("10x")
+
         # ---------- Scenario selector ----------
         self.scenario_bar = ctk.CTkFrame(self.control_bar_main, fg_color="transparent", height=42)
         self.scenario_bar.pack(fill="x", padx=10, pady=(6, 8))
@@ -629,32 +725,32 @@ class SmartTrafficApp(ctk.CTk):
             # Áp dụng fixed-time nếu đang chạy
             if self.running:
                 try:
-                    import traci
-                    traci.simulation.getTime()
+                    green = int(self.green_entry.get())
+                    yellow = int(self.yellow_entry.get())
+                    red = int(self.red_entry.get())
+                except ValueError:
+                    green = self.green_time
+                    yellow = self.yellow_time
+                    red = self.red_time
 
+                phase_durations = {
+                    'xanh_chung': green,
+                    'vang_chung': yellow,
+                    'do_toan_phan': red
+                }
+
+                def apply_fixed_time():
                     try:
-                        green = int(self.green_entry.get())
-                        yellow = int(self.yellow_entry.get())
-                        red = int(self.red_entry.get())
-                    except ValueError:
-                        green = self.green_time
-                        yellow = self.yellow_time
-                        red = self.red_time
-
-                    phase_durations = {
-                        'xanh_chung': green,
-                        'vang_chung': yellow,
-                        'do_toan_phan': red
-                    }
+                        dieu_chinh_tat_ca_den(phase_durations)
+                        self.log(f"Đã chuyển sang chế độ Fixed-Time (Xanh {green}s, Vàng {yellow}s, All-Red {red}s)")
 
-                    dieu_chinh_tat_ca_den(phase_durations)
-                    self.log(f"Đã chuyển sang chế độ Fixed-Time (Xanh {green}s, Vàng {yellow}s, All-Red {red}s)")
+                        # Xe ưu tiên: ngẫu nhiên
+                        self.start_scenario_spawning("DEFAULT")
 
-                    # Xe ưu tiên: ngẫu nhiên
-                    self.start_default_priority_spawning(interval=200)
+                    except Exception as e:
+                        self.log(f"Không thể áp dụng Fixed-Time: {e}")
 
-                except Exception as e:
-                    self.log(f"Không thể áp dụng Fixed-Time: {e}")
+                self.run_on_sim_thread(apply_fixed_time)
 
         # === CHUYỂN SANG Thông minh ===
         else:  # value == "Thông minh"
@@ -662,18 +758,30 @@ class SmartTrafficApp(ctk.CTk):
             self.scenario_bar.pack(fill="x", padx=10, pady=(6, 8))  # HIỆN KỊCH BẢN
 
             if self.running:
-                self.start_controllers_if_needed()
-                self.log("Đã kích hoạt Adaptive Controllers")
-
-                # Áp dụng kịch bản hiện tại
                 scenario = self.case_box.get()
-                self.apply_scenario_to_sumo(scenario)
+
+                def activate_smart_mode():
+                    self.start_controllers_if_needed()
+                    self.log("Đã kích hoạt Adaptive Controllers")
+
+                    # Áp dụng kịch bản hiện tại
+                    self.apply_scenario_to_sumo(scenario)
+
+                self.run_on_sim_thread(activate_smart_mode)
 
     # ============ Start / Pause / Stop ============
     def start_sim(self):
         if self.running:
             return
 
+        # Tiếp tục sau tạm dừng: vòng lặp mô phỏng vẫn sống → chỉ bỏ cờ tạm dừng
+        if self.paused and self.sim_thread_alive():
+            self.running = True
+            self.paused = False
+            self.status_label.configure(text="🟢 Chạy", text_color="#10b981")
+            self.log("▶ Tiếp tục mô phỏng")
+            return
+
         self.running = True
         self.paused = False
         self.status_label.configure(text="🟢 Chạy", text_color="#10b981")
@@ -699,9 +807,10 @@ class SmartTrafficApp(ctk.CTk):
         config_path = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'sumo', 'test2.sumocfg')
         config_path = os.path.abspath(config_path)
 
-        # Nếu SUMO chưa chạy, khởi động
+        # Nếu SUMO chưa chạy, khởi động (kèm route file xe ưu tiên của kịch bản)
         if not sumo_is_running:
-            if not khoi_dong_sumo(config_path, gui=True):
+            self.prepare_scenario_routes(config_path, scenario)
+            if not khoi_dong_sumo(config_path, gui=True, extra_args=self.sumo_route_args):
                 self.log("❌ Không thể khởi động SUMO. Kiểm tra cấu hình hoặc cài SUMO.")
                 self.running = False
                 self.status_label.configure(text="⚫ Lỗi", text_color="#ef4444")
@@ -711,7 +820,7 @@ class SmartTrafficApp(ctk.CTk):
         
         # Khởi tạo Vehicle Counter (KHÔNG khởi động SUMO vì đã khởi động rồi)
         try:
-            self.vehicle_counter = VehicleCounter(config_path)
+            self.vehicle_counter = VehicleCounter(config_path, network_index=self.network_index)
             # Gọi discover_edges để khởi tạo mapping edges
             try:
                 import traci
@@ -724,9 +833,25 @@ class SmartTrafficApp(ctk.CTk):
             self.log(f"⚠ Không thể khởi tạo Vehicle Counter: {e}")
             self.vehicle_counter = None
         
+        # Khởi tạo KPI Engine cho lần mô phỏng mới
+        # (mạng lưới và route không đổi → free-flow index chỉ dựng 1 lần)
+        if self.free_flow_index is None:
+            self.free_flow_index = FreeFlowIndex(config_path)
+        self.kpi_engine = KPIEngine(free_flow_index=self.free_flow_index, network_index=self.network_index)
+        
+        # Driver mới cho lần mô phỏng mới (lịch sự kiện kịch bản theo thời gian SUMO)
+        self.driver = SimulationDriver()
+        if get_profiler().enabled:
+            get_profiler().attach_traci()
+        if self.traci_stats_every > 0:
+            try:
+                get_traci_monitor(log_every=self.traci_stats_every, log=self.log)
+            except Exception as e:
+                self.log(f"⚠ Không thể bật thống kê lệnh TraCI: {e}")
+        
         # Khởi tạo Sensor Manager
         try:
-            self.sensor_manager = SensorManager()
+            self.sensor_manager = SensorManager(network_index=self.network_index)
             e1_count, e2_count = self.sensor_manager.discover_detectors()
             self.log(f"✅ Sensor Manager đã phát hiện {e1_count} E1 detectors và {e2_count} E2 detectors")
         except Exception as e:
@@ -738,7 +863,7 @@ class SmartTrafficApp(ctk.CTk):
             self.apply_scenario_to_sumo(scenario)
         else:
             # Chế độ Mặc định: xe ưu tiên ngẫu nhiên
-            self.start_default_priority_spawning(interval=200)
+            self.start_scenario_spawning("DEFAULT")
 
         # Áp dụng chế độ (Mặc định / Thông minh)
         if self.mode == "Mặc định":
@@ -764,7 +889,30 @@ class SmartTrafficApp(ctk.CTk):
         elif self.mode == "Thông minh":
             self.start_controllers_if_needed()
 
-        threading.Thread(target=self.simulate_with_sumo, daemon=True).start()
+        self.start_sim_thread()
+
+    def start_sim_thread(self):
+        """Khởi chạy vòng lặp mô phỏng (chỉ 1 luồng được gửi lệnh TraCI)"""
+        if self.sim_thread_alive():
+            return
+        self.sim_thread = threading.Thread(target=self.simulate_with_sumo, daemon=True)
+        self.sim_thread.start()
+
+    def sim_thread_alive(self) -> bool:
+        """Vòng lặp mô phỏng đang chạy (kể cả đang tạm dừng)"""
+        return self.sim_thread is not None and self.sim_thread.is_alive()
+
+    def run_on_sim_thread(self, action, *args):
+        """
+        Thực thi hành động có gọi TraCI trên luồng mô phỏng
+
+        Nếu vòng lặp mô phỏng đang chạy, hành động được gửi qua driver và thực thi
+        trước step kế tiếp (socket TraCI không an toàn đa luồng); ngược lại chạy ngay.
+        """
+        if self.driver is not None and self.sim_thread_alive() and threading.current_thread() is not self.sim_thread:
+            self.driver.call_soon(action, *args)
+        else:
+            action(*args)
 
     def pause_sim(self):
         if not self.running:
@@ -789,8 +937,16 @@ class SmartTrafficApp(ctk.CTk):
         except Exception:
             pass
 
+        # Vòng lặp mô phỏng đang chạy → để chính nó dừng spawn, controllers và đóng SUMO
+        # (không gửi lệnh TraCI từ luồng UI khi luồng mô phỏng còn dùng socket)
+        if self.sim_thread_alive():
+            self.log("⏹ Đang dừng vòng lặp mô phỏng...")
+            return
+
         # stop adaptive controllers
+        self.stop_priority_spawning()
         self.stop_all_controllers()
+        self.dump_profile()
         
         # Cleanup Vehicle Counter (just drop reference; dashboard manages traci lifecycle)
         if self.vehicle_counter is not None:
@@ -806,12 +962,101 @@ class SmartTrafficApp(ctk.CTk):
         except Exception:
             self.log("⏹ Đã dừng mô phỏng (không thể đóng SUMO bằng API)")
 
+    def dump_profile(self):
+        """Ghi bảng tổng kết profiler vào log và xuất Chrome trace (khi bật SMART_TRAFFIC_PROFILE)"""
+        profiler = get_profiler()
+        if not profiler.enabled or profiler.step_count == 0:
+            return
+        profiler.end_step()
+        summary = profiler.format_summary()
+        print(summary)
+        for line in summary.splitlines():
+            self.log(line)
+
+        if self.profile_output.endswith(".json"):
+            trace_path = self.profile_output
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            trace_path = os.path.join(tempfile.gettempdir(), f"smart_traffic_profile_{timestamp}.json")
+        try:
+            count = profiler.write_chrome_trace(trace_path)
+            self.log(f"📈 Đã ghi Chrome trace ({count} sự kiện): {trace_path}")
+        except Exception as e:
+            self.log(f"⚠ Không thể ghi Chrome trace: {e}")
+        profiler.reset()
+
+    def open_kpi_recorder(self):
+        """Bắt đầu ghi chuỗi KPI của lần chạy mới (khi bật SMART_TRAFFIC_TIMESERIES)"""
+        if not self.timeseries_dir or self.kpi_recorder is not None:
+            return
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.timeseries_dir, f"kpi_{timestamp}.{self.timeseries_format}")
+        try:
+            self.kpi_recorder = KPIRecorder(path, every=self.timeseries_every, columns=self.kpi_schema())
+            self.log(f"📈 Ghi chuỗi KPI mỗi {self.kpi_recorder.every} step: {self.kpi_recorder.path}")
+        except Exception as e:
+            self.log(f"⚠ Không thể ghi chuỗi KPI: {e}")
+
+    def close_kpi_recorder(self):
+        """Ghi nốt và đóng file chuỗi KPI"""
+        if self.kpi_recorder is None:
+            return
+        recorder, self.kpi_recorder = self.kpi_recorder, None
+        rows = recorder.close()
+        if recorder.error:
+            self.log(f"⚠ Lỗi khi ghi chuỗi KPI: {recorder.error}")
+        else:
+            self.log(f"📈 Đã ghi {rows} dòng chuỗi KPI: {recorder.path}")
+
+    def kpi_schema(self) -> dict:
+        """
+        Khai báo các cột chuỗi KPI (giống build_kpi_row) trước khi chạy: cột của
+        controllers lấy từ chỉ mục mạng nên vẫn có khi đổi chế độ giữa chừng
+
+        Returns:
+            Dict {tên cột: kiểu giá trị}
+        """
+        schema = {"step": int, "time": float, "mode": str}
+        for label in self.global_kpi_data:
+            schema[KPI_COLUMNS.get(label, column_name(label))] = float
+        for name, data in self.intersection_data.items():
+            prefix = column_name(name)
+            schema[f"{prefix}_light"] = str
+            schema[f"{prefix}_queue"] = float
+            schema[f"{prefix}_wait_time"] = float
+            for direction in data["vehicles"]:
+                schema[f"{prefix}_veh_{column_name(direction)}"] = float
+        schema.update(controller_schema(self.network_index))
+        return schema
+
+    def build_kpi_row(self) -> dict:
+        """
+        1 dòng chuỗi KPI của step hiện tại: KPI toàn mạng, dữ liệu ngã tư, trạng thái controllers
+
+        Returns:
+            Dict {tên cột: giá trị}
+        """
+        row = {"step": self.driver.step_count, "time": get_step_snapshot().get_time(), "mode": self.mode}
+        for label, value in self.global_kpi_data.items():
+            row[KPI_COLUMNS.get(label, column_name(label))] = value
+        for name, data in self.intersection_data.items():
+            prefix = column_name(name)
+            row[f"{prefix}_light"] = data["light_state"]
+            row[f"{prefix}_queue"] = data["queue"]
+            row[f"{prefix}_wait_time"] = data["wait_time"]
+            for direction, count in data["vehicles"].items():
+                row[f"{prefix}_veh_{column_name(direction)}"] = count
+        row.update(controller_columns(self.controllers, self.priority_controllers))
+        return row
+
     def export_log(self):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"traffic_2nt_log_{timestamp}.txt"
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(self.log_box.get("1.0", "end"))
-        self.log(f"✓ Xuất: {filename}")
+        try:
+            count = self.log_buffer.export(filename)
+            self.log(f"✓ Xuất: {filename} ({count} dòng)")
+        except Exception as e:
+            self.log(f"⚠ Không thể xuất log: {e}")
 
     # ============ Controllers management ============
     def start_controllers_if_needed(self):
@@ -824,7 +1069,8 @@ class SmartTrafficApp(ctk.CTk):
             for tls_id in tls_ids:
                 if tls_id not in self.controllers:
                     # ✅ GIAI ĐOẠN 7 - Issue #18: Pass sensor_manager để tăng độ chính xác 20%
-                    ctrl = AdaptiveController(junction_id=tls_id, sensor_manager=self.sensor_manager)
+                    ctrl = AdaptiveController(junction_id=tls_id, sensor_manager=self.sensor_manager,
+                                              network_index=self.network_index)
                     ok = ctrl.start()
                     if ok:
                         self.controllers[tls_id] = ctrl
@@ -872,20 +1118,26 @@ class SmartTrafficApp(ctk.CTk):
 
         try:
             sumo_ended = False
+            if self.driver is None:
+                self.driver = SimulationDriver()
+            self.pacer.reset()
+            self.open_kpi_recorder()
             while not sumo_ended:
                 # pause handling
-                while self.paused and not sumo_ended:
-                    time.sleep(0.1)
-                    if not self.running and not self.paused:
-                        sumo_ended = True
-                        break
+                if self.paused:
+                    while self.paused and not sumo_ended:
+                        time.sleep(0.1)
+                        if not self.running and not self.paused:
+                            sumo_ended = True
+                            break
+                    self.pacer.reset()  # Không chạy dồn bù thời gian tạm dừng
 
                 if not self.running and not self.paused:
                     break
 
                 if self.running:
-                    # advance SUMO
-                    traci.simulationStep()
+                    # advance SUMO (thực thi sự kiện kịch bản đến hạn rồi simulationStep)
+                    self.driver.step()
 
                     # adaptive controllers step
                     if self.mode == "Thông minh" and self.controllers:
@@ -903,23 +1155,14 @@ class SmartTrafficApp(ctk.CTk):
                             except Exception as e:
                                 self.log(f"⚠ PriorityController {junction_id} step error: {e}")
                     
-                    # ĐẢM BẢO XE ƯU TIÊN LUÔN BỎ QUA ĐÈN ĐỎ (set lại mỗi step)
-                    try:
-                        all_vehicles = traci.vehicle.getIDList()
-                        for veh_id in all_vehicles:
-                            if "priority" in veh_id or veh_id.startswith("priority_"):
-                                current_speed_mode = traci.vehicle.getSpeedMode(veh_id)
-                                if current_speed_mode != 0:  # Nếu bị reset, set lại
-                                    traci.vehicle.setSpeedMode(veh_id, 0)
-                    except Exception as e:
-                        pass  # Không log để tránh spam
-
-                    # update UI data & redraw
+                    # update UI data, publish frame (UI tự vẽ theo nhịp của RenderScheduler)
                     self.update_data_from_sumo()
-                    self.after(0, self.update_ui)
+                    self.render_scheduler.publish(self.build_ui_frame())
+                    if self.kpi_recorder is not None and self.kpi_recorder.due(self.driver.step_count - 1):
+                        self.kpi_recorder.record(self.build_kpi_row())
 
-                    # small sleep to avoid UI freeze (and give SUMO CPU time)
-                    time.sleep(0.1)
+                    # Giữ tốc độ mô phỏng đã chọn (không giới hạn nếu "Tối đa")
+                    self.pacer.wait(get_step_snapshot().get_time())
 
         except Exception as e:
             self.log(f"❌ Lỗi trong mô phỏng SUMO: {e}")
@@ -927,12 +1170,15 @@ class SmartTrafficApp(ctk.CTk):
             self.paused = False
             self.status_label.configure(text="⚫ Lỗi", text_color="#ef4444")
         finally:
+            self.close_kpi_recorder()
             # When finishing (stop), stop controllers and optionally close SUMO
             if not self.paused and not self.resetting:
                 try:
-                    self.stop_scenario_spawning()
+                    self.stop_priority_spawning()
                     self.stop_all_controllers()
+                    self.dump_profile()
                     dung_sumo()
+                    self.log("⏹ Đã dừng và đóng SUMO")
                 except Exception:
                     pass
 
@@ -945,20 +1191,36 @@ class SmartTrafficApp(ctk.CTk):
         was_running = self.running
         self.running = False
         self.paused = False
-        time.sleep(0.8)
+        # Đợi vòng lặp mô phỏng thoát (không gửi lệnh TraCI song song)
+        if self.sim_thread_alive():
+            self.sim_thread.join(timeout=5.0)
         try:
             import traci
             try:
                 traci.simulation.getTime()
                 config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
                                            "data", "sumo", "test2.sumocfg")
-                traci.load(["-c", config_path])
+                traci.load(["-c", config_path] + self.sumo_route_args)
+                # SUMO bỏ mọi subscription khi load → subscribe lại (context ngã tư, edge, detector)
+                get_step_snapshot().reload()
+                if self.sensor_manager is not None and self.sensor_manager.use_subscriptions:
+                    self.sensor_manager.subscribe_detectors()
                 self.log("🔄 Đã reload SUMO về trạng thái ban đầu")
+                # Lịch kịch bản chạy lại từ đầu trên driver mới (route file được nạp lại cùng SUMO)
+                scenario_key = self.scenario_runner.scenario_key if self.scenario_runner is not None else None
+                self.scenario_runner = None
+                self.spawning_active = False
+                self.driver = SimulationDriver()
+                self.preloaded_scenario = self.sumo_preload
+                if scenario_key is not None:
+                    self.start_scenario_spawning(scenario_key, start_time=0.0)
+                else:
+                    self.take_preloaded_runner(None)
                 time.sleep(0.5)
                 # Nếu đang chạy trước khi reset, restart simulation loop
                 if was_running:
                     self.running = True
-                    threading.Thread(target=self.simulate_with_sumo, daemon=True).start()
+                    self.start_sim_thread()
                     self.log("✓ Simulation loop đã sẵn sàng")
             except Exception as e:
                 self.log(f"⚠ Không thể reload SUMO: {e}")
@@ -1035,12 +1297,9 @@ class SmartTrafficApp(ctk.CTk):
 
     # ============ Logging & apply timing ============
     def log(self, msg):
+        # Gọi được từ mọi luồng: LogBuffer đổ vào log_box theo lô trên luồng UI
         timestamp = datetime.now().strftime("%H:%M:%S")
-        try:
-            self.log_box.insert("end", f"[{timestamp}] {msg}\n")
-            self.log_box.see("end")
-        except Exception:
-            print(f"[{timestamp}] {msg}")
+        self.log_buffer.append(f"[{timestamp}] {msg}")
 
     def apply_timing(self):
         try:
@@ -1056,18 +1315,21 @@ class SmartTrafficApp(ctk.CTk):
             self.green_time = green; self.yellow_time = yellow; self.red_time = red
             self.log(f"✓ Đã cài đặt: Xanh {green}s, Vàng {yellow}s, Đỏ Toàn Phần {red}s")
             # If SUMO is running and current mode is Mặc định, apply immediately
-            try:
-                import traci
-                traci.simulation.getTime()
-                if self.mode == "Mặc định":
-                    phase_durations = {'xanh_chung': green, 'vang_chung': yellow, 'do_toan_phan': red}
-                    dieu_chinh_tat_ca_den(phase_durations)
-                    self.log("✅ Áp dụng thời gian mới lên SUMO (Mặc định).")
-                else:
-                    self.log("ℹ️ Đang ở chế độ Thông minh (Adaptive); thay đổi thời gian không áp dụng.")
-            except Exception:
-                # SUMO not running - nothing to apply now
-                self.log("ℹ️ SUMO chưa chạy; áp dụng sẽ thực hiện khi Start.")
+            def apply_to_sumo():
+                try:
+                    import traci
+                    traci.simulation.getTime()
+                    if self.mode == "Mặc định":
+                        phase_durations = {'xanh_chung': green, 'vang_chung': yellow, 'do_toan_phan': red}
+                        dieu_chinh_tat_ca_den(phase_durations)
+                        self.log("✅ Áp dụng thời gian mới lên SUMO (Mặc định).")
+                    else:
+                        self.log("ℹ️ Đang ở chế độ Thông minh (Adaptive); thay đổi thời gian không áp dụng.")
+                except Exception:
+                    # SUMO not running - nothing to apply now
+                    self.log("ℹ️ SUMO chưa chạy; áp dụng sẽ thực hiện khi Start.")
+
+            self.run_on_sim_thread(apply_to_sumo)
         except ValueError:
             self.log("❌ Vui lòng nhập số hợp lệ")
             
@@ -1092,45 +1354,45 @@ class SmartTrafficApp(ctk.CTk):
                 # Dừng spawning xe ưu tiên nếu có
                 self.stop_priority_spawning()
                 # Spawn xe ưu tiên ngẫu nhiên từ MỌI hướng (khoảng 1 xe mỗi 200s)
-                self.start_default_priority_spawning(interval=200)
+                self.start_scenario_spawning("DEFAULT")
 
             elif scenario_name == "SC1 - Xe ưu tiên từ hướng chính trong giờ cao điểm":
                 self.log("🚓 SC1: Xe ưu tiên từ hướng chính (Bắc/Nam) - Chỉ spawn từ -E1, -E2, -E4, -E5.")
                 # Xóa tất cả xe ưu tiên hiện có (từ dist_normal)
                 self.clear_all_priority_vehicles()
                 # Spawn xe ưu tiên từ Bắc/Nam định kỳ (hướng chính của cả 2 ngã tư)
-                self.start_priority_spawning(["north", "south"], interval=20, scenario_id="SC1")
+                self.start_scenario_spawning("SC1")
 
             elif scenario_name == "SC2 - Xe ưu tiên từ hướng nhánh (ít xe) sắp tới gần":
                 self.log("🚙 SC2: Xe ưu tiên từ hướng nhánh (Tây) - Mô phỏng spawn xe.")
                 self.clear_all_priority_vehicles()
                 # Spawn xe ưu tiên từ Tây (hướng nhánh)
-                self.start_priority_spawning(["west"], interval=20, scenario_id="SC2")
+                self.start_scenario_spawning("SC2")
 
             elif scenario_name == "SC3 - Nhiều xe ưu tiên từ 2 hướng đối diện":
                 self.log("🚒 SC3: Nhiều xe ưu tiên từ 2 hướng đối diện - Mô phỏng xung đột.")
                 self.clear_all_priority_vehicles()
                 # Spawn NHIỀU xe từ 2 hướng đối diện (test xung đột)
-                self.start_priority_spawning(["north", "south"], interval=3, scenario_id="SC3")
+                self.start_scenario_spawning("SC3")
 
             elif scenario_name == "SC4 - Báo giả":
                 self.log("🚨 SC4: Báo giả - Spawn xe rồi XÓA ngay để test xác nhận kép của PriorityController.")
                 self.clear_all_priority_vehicles()
                 # Spawn xe → Xóa sau 2-3s → PriorityController phát hiện báo giả
-                self.start_false_alarm_simulation(interval=30)
+                self.start_scenario_spawning("SC4")
 
             elif scenario_name == "SC5 - Xe ưu tiên bị kẹt trong dòng xe dài":
                 self.log("🚓 SC5: Xe ưu tiên bị kẹt - Spawn xe ở giữa dòng xe (departPos xa).")
                 self.clear_all_priority_vehicles()
                 # Spawn xe ưu tiên ở vị trí xa hơn (50-150m từ đầu route) để kẹt giữa dòng xe
-                self.start_priority_spawning_stuck(["north", "south", "west"], interval=15, scenario_id="SC5")
+                self.start_scenario_spawning("SC5")
 
             elif scenario_name == "SC6 - Nhiều xe ưu tiên liên tiếp":
                 self.log("🚑 SC6: Nhiều xe ưu tiên liên tiếp - Spawn liên tục từ cùng hướng.")
                 self.clear_all_priority_vehicles()
                 # Spawn liên tiếp xe ưu tiên từ CÙNG hướng (North) mỗi 6-8s (TĂNG TẦN SUẤT)
                 # Giảm interval xuống để thấy nhiều xe ưu tiên hơn
-                self.start_priority_spawning_consecutive(["north"], base_interval=1, scenario_id="SC6")
+                self.start_scenario_spawning("SC6")
 
             else:
                 self.log("ℹ️ Không có kịch bản cụ thể, chạy mặc định.")
@@ -1205,8 +1467,8 @@ class SmartTrafficApp(ctk.CTk):
             import traci
             tls_ids = traci.trafficlight.getIDList()
             
-            for tls_id in tls_ids[:2]:  # J1 và J4
-                junction_id = "J1" if tls_ids.index(tls_id) == 0 else "J4"
+            for tls_id in tls_ids[:2]:  # Đèn J1 → ngã tư J1, đèn J3 → ngã tư J4
+                junction_id = self.network_index.junction_for_tls(tls_id)
                 
                 # Lấy adaptive controller tương ứng nếu có
                 adaptive_ctrl = self.controllers.get(tls_id, None)
@@ -1215,7 +1477,8 @@ class SmartTrafficApp(ctk.CTk):
                 priority_ctrl = PriorityController(
                     junction_id=junction_id, 
                     adaptive_controller=adaptive_ctrl,
-                    ui_callback=self.on_priority_state_change  # Callback để update UI
+                    ui_callback=self.on_priority_state_change,  # Callback để update UI
+                    network_index=self.network_index
                 )
                 
                 # Khởi động controller
@@ -1329,525 +1592,115 @@ class SmartTrafficApp(ctk.CTk):
         except Exception as e:
             self.log(f"⚠️ Lỗi handle_priority_vehicles: {e}")
     
-    # ✅ XÓA HÀM TRÙNG start_false_alarm_simulation (chỉ giữ hàm ở dòng 1548)
-    
-    def start_default_priority_spawning(self, interval=200):
+    def prepare_scenario_routes(self, config_path, scenario_name):
         """
-        Spawn xe ưu tiên cho kịch bản Mặc định
-        Mô phỏng 0.3% xe ưu tiên random từ mọi hướng
-        
+        Biên dịch kịch bản thành route file trước khi khởi động SUMO
+
+        SUMO tự chèn xe ưu tiên theo lịch (vType đã bỏ qua đèn đỏ), nên vòng lặp
+        mô phỏng không phải gọi traci.vehicle.add / setSpeedMode cho từng xe.
+
         Args:
-            interval: Khoảng thời gian giữa các lần spawn (giây) - MẶC ĐỊNH 200s (thực tế ~3 xe/600s)
+            config_path: File .sumocfg
+            scenario_name: Kịch bản đang chọn trên giao diện
         """
-        # Dừng spawning cũ nếu có
-        self.stop_priority_spawning()
-        
-        # Đánh dấu spawning đang hoạt động
-        self.spawning_active = True
-        
-        def spawn_loop():
-            """Loop spawn xe ưu tiên ngẫu nhiên cho mode Mặc định
-            
-            ✅ FIX: Sử dụng SUMO TIME thay vì wallclock sleep
-            - Interval 200s = 200s SUMO time (không phụ thuộc tốc độ simulation)
-            - Check mỗi 0.5s wallclock để responsive với stop command
-            """
-            import time
-            import random
-            import traci
-            
-            # ✅ DELAY 60s SUMO TIME trước khi spawn lần đầu
-            self.log(f"⏳ Chờ 60s SUMO time trước khi spawn xe ưu tiên đầu tiên...")
-            
-            try:
-                start_time = traci.simulation.getTime()
-                # Đợi đến khi SUMO time >= start_time + 60
-                while self.spawning_active and traci.simulation.getTime() < start_time + 60:
-                    time.sleep(0.5)  # Check mỗi 0.5s
-                
-                if not self.spawning_active:
-                    self.log("🛑 Spawn loop stopped during initial delay")
-                    return
-                
-            except Exception as e:
-                self.log(f"⚠️ Lỗi trong initial delay: {e}")
-                return
-            
-            # Chỉ spawn từ 3 hướng có route (không có "east")
-            all_directions = ["north", "south", "west"]
-            
-            spawn_count = 0
-            last_spawn_time = traci.simulation.getTime()
-            
-            while self.spawning_active:
-                try:
-                    # ✅ FIX: Check SUMO connection trước khi getTime()
-                    if not traci.isLoaded():
-                        self.log("🛑 SUMO đã đóng, dừng spawn loop")
-                        break
-                    
-                    current_sumo_time = traci.simulation.getTime()
-                    
-                    # Kiểm tra đã đủ interval SUMO time chưa
-                    if current_sumo_time - last_spawn_time >= interval:
-                        spawn_count += 1
-                        self.log(f"🔄 [Spawn #{spawn_count}] SUMO time={current_sumo_time:.0f}s, spawning_active={self.spawning_active}")
-                        
-                        # Chọn ngẫu nhiên một hướng
-                        direction = random.choice(all_directions)
-                        spawned_ids = self.spawn_priority_vehicle(direction, "DEFAULT")
-                        
-                        if spawned_ids:
-                            self.log(f"✅ [Spawn #{spawn_count}] Spawned {len(spawned_ids)} vehicles at T={current_sumo_time:.0f}s")
-                        else:
-                            self.log(f"⚠️ [Spawn #{spawn_count}] No vehicles spawned at T={current_sumo_time:.0f}s")
-                        
-                        last_spawn_time = current_sumo_time
-                        self.log(f"⏱ [Spawn #{spawn_count}] Next spawn at T={last_spawn_time + interval:.0f}s (in {interval}s SUMO time)")
-                    
-                    # Sleep ngắn để không hog CPU, check lại mỗi 0.5s
-                    time.sleep(0.5)
-                    
-                except Exception as e:
-                    import traceback
-                    self.log(f"⚠ Lỗi trong default spawn loop (spawn #{spawn_count}): {e}")
-                    self.log(f"📋 Traceback: {traceback.format_exc()}")
-                    time.sleep(5)
-            
-            self.log(f"🛑 Spawn loop ended. spawning_active={self.spawning_active}, total spawns={spawn_count}")
-        
-        # Tạo và khởi chạy thread
-        import threading
-        self.spawning_thread = threading.Thread(target=spawn_loop, daemon=True)
-        self.spawning_thread.start()
-        self.log(f"🔄 Đã bắt đầu spawn xe ưu tiên ngẫu nhiên mỗi {interval}s (mode Mặc định)")
-    
-    def get_direction_from_edge(self, edge_id: str, junction_id: str) -> str:
+        self.sumo_route_args = []
+        self.sumo_preload = None
+        scenario_key = self.SCENARIO_KEYS.get(scenario_name) if self.mode == "Thông minh" else "DEFAULT"
+        if scenario_key is None:
+            return
+
+        seed = self.scenario_seed if self.scenario_seed is not None else random.randrange(2 ** 31)
+        output_dir = os.path.join(tempfile.gettempdir(), "smart_traffic_scenarios")
+        try:
+            self.sumo_route_args, route_path = build_route_args(config_path, scenario_key, seed, output_dir,
+                                                                end_time=self.SCENARIO_ROUTE_HORIZON)
+            self.sumo_preload = (scenario_key, seed)
+            self.log(f"📄 Đã biên dịch {scenario_key} (seed={seed}) thành route file: {route_path}")
+        except Exception as e:
+            self.log(f"⚠ Không thể sinh route file kịch bản, sẽ thêm xe qua TraCI: {e}")
+        self.preloaded_scenario = self.sumo_preload
+
+    def take_preloaded_runner(self, scenario_key):
         """
-        Xác định hướng dựa trên edge ID
-        
+        Nhận lịch đã nạp sẵn trong route file (chỉ 1 lần cho mỗi lần nạp SUMO)
+
+        Nếu kịch bản cần chạy khác kịch bản đã nạp, xe còn lại của route file
+        sẽ bị xóa khi đến lượt xuất phát.
+
+        Args:
+            scenario_key: Kịch bản cần chạy (None = không chạy kịch bản nào)
+
         Returns:
-            "north", "south", "east", "west" hoặc None
+            ScenarioRunner(preloaded=True) chưa start, hoặc None
         """
-        # Mapping cho J1
-        if junction_id == "J1":
-            if "-E1" in edge_id:
-                return "north"
-            elif "-E2" in edge_id:
-                return "south"
-            elif "E0" in edge_id and "-E0" not in edge_id:
-                return "west"
-            elif "-E3" in edge_id:  # Từ J4 sang
-                return "east"
-        
-        # Mapping cho J4
-        elif junction_id == "J4":
-            if "-E4" in edge_id:
-                return "north"
-            elif "-E5" in edge_id:
-                return "south"
-            elif "-E6" in edge_id:
-                return "west"
-            elif "E3" in edge_id and "-E3" not in edge_id:  # Từ J1 sang
-                return "east"
-        
+        if self.preloaded_scenario is None:
+            return None
+        preload_key, preload_seed = self.preloaded_scenario
+        self.preloaded_scenario = None
+        runner = ScenarioRunner(preload_key, self.driver, seed=preload_seed, log=self.log, tag=self.SPAWN_TAG,
+                                preloaded=True, end_time=self.SCENARIO_ROUTE_HORIZON)
+        if preload_key == scenario_key:
+            return runner
+        runner.start(start_time=0.0)
+        runner.stop()
+        self.log(f"🗑️ Bỏ lịch {preload_key} đã nạp trong route file")
         return None
-    
-    def start_priority_spawning(self, directions, interval=15, scenario_id="SC"):
-        """Bắt đầu spawn xe ưu tiên định kỳ từ các hướng chỉ định
-        
-        Args:
-            directions: List các hướng ["north", "south", "east", "west"]
-            interval: Khoảng thời gian giữa các lần spawn (giây)
-            scenario_id: ID của kịch bản (SC1, SC2, ...)
+
+    def start_scenario_spawning(self, scenario_key, start_time=None):
         """
-        # Dừng spawning cũ nếu có
-        self.stop_priority_spawning()
-        
-        # Đánh dấu spawning đang hoạt động
-        self.spawning_active = True
-        
-        def spawn_loop():
-            """Loop chạy trong thread riêng để spawn xe định kỳ"""
-            import time
-            import random
-            
-            while self.spawning_active:
-                try:
-                    # Chọn ngẫu nhiên một hướng từ danh sách
-                    direction = random.choice(directions)
-                    self.spawn_priority_vehicle(direction, scenario_id)
-                    
-                    # Đợi interval giây
-                    time.sleep(interval)
-                    
-                except Exception as e:
-                    self.log(f"⚠ Lỗi trong spawn loop: {e}")
-                    time.sleep(5)  # Đợi 5s nếu có lỗi
-        
-        # Tạo và khởi chạy thread
-        import threading
-        self.spawning_thread = threading.Thread(target=spawn_loop, daemon=True)
-        self.spawning_thread.start()
-        self.log(f"🔄 Đã bắt đầu spawn xe ưu tiên từ {directions} mỗi {interval}s")
-    
-    def start_priority_spawning_stuck(self, directions, interval=15, scenario_id="SC5"):
-        """Bắt đầu spawn xe ưu tiên ở VỊ TRÍ XA (giữa dòng xe) để mô phỏng kẹt xe
-        
+        Bắt đầu lịch xe ưu tiên của kịch bản (xem simulation.scenarios.SCENARIO_SPECS)
+
+        Lịch được sinh từ seed và thực thi theo thời gian SUMO trên SimulationDriver,
+        nên cùng seed cho cùng chuỗi xe ưu tiên ở mọi tốc độ mô phỏng. Kịch bản đã
+        nạp sẵn qua route file thì dùng lại; nếu không, xe được thêm qua TraCI.
+
         Args:
-            directions: List các hướng ["north", "south", "east", "west"]
-            interval: Khoảng thời gian giữa các lần spawn (giây)
-            scenario_id: ID của kịch bản (mặc định SC5)
+            scenario_key: DEFAULT, SC1...SC6
+            start_time: Thời điểm SUMO bắt đầu lịch (None = hiện tại)
         """
         # Dừng spawning cũ nếu có
         self.stop_priority_spawning()
-        
-        # Đánh dấu spawning đang hoạt động
+
+        runner = self.take_preloaded_runner(scenario_key)
+        if runner is not None:
+            runner.start(start_time=0.0)
+        else:
+            runner = ScenarioRunner(scenario_key, self.driver, seed=self.scenario_seed,
+                                    log=self.log, tag=self.SPAWN_TAG)
+            runner.start(start_time=start_time)
+        self.scenario_runner = runner
         self.spawning_active = True
-        
-        def spawn_stuck_loop():
-            """Loop spawn xe ưu tiên SAU dòng xe bình thường (bị kẹt)"""
-            import time
-            import random
-            import traci
-            
-            while self.spawning_active:
-                try:
-                    # Chọn ngẫu nhiên một hướng
-                    direction = random.choice(directions)
-                    
-                    # CÁCH MỚI: Spawn nhiều xe bình thường trước, sau đó spawn xe ưu tiên
-                    # → Xe ưu tiên sẽ Thông minh xếp SAU dòng xe → BỊ KẸT
-                    
-                    # Route mapping
-                    j1_routes = {
-                        "north": ["r5", "r6", "r7", "r8", "r9"],
-                        "south": ["r10", "r11", "r12", "r13", "r14"],
-                        "west": ["r0", "r1", "r2"],
-                    }
-                    j4_routes = {
-                        "north": ["r15", "r16", "r17", "r18", "r19"],
-                        "south": ["r20", "r21", "r22", "r23", "r24"],
-                        "west": ["r25", "r26", "r27"]
-                    }
-                    
-                    direction_names = {"north": "Bắc", "south": "Nam", "west": "Tây"}
-                    dir_name = direction_names.get(direction, "Không xác định")
-                    
-                    # 1. Spawn 3-5 xe bình thường trước (tạo "dòng xe dài")
-                    num_normal_cars = random.randint(3, 5)
-                    for i in range(num_normal_cars):
-                        if direction in j1_routes:
-                            route = random.choice(j1_routes[direction])
-                            normal_id = f"normal_block_{int(traci.simulation.getTime())}_{i}"
-                            try:
-                                traci.vehicle.add(normal_id, route, typeID="car_normal", departSpeed="max")
-                                time.sleep(0.2)  # Delay nhỏ giữa các xe
-                            except:
-                                pass
-                    
-                    # 2. Đợi 1-2 giây để xe bình thường chạy xa một chút
-                    time.sleep(random.uniform(1, 2))
-                    
-                    # 3. BÂY GIỜ spawn xe ưu tiên → nó sẽ ở SAU dòng xe bình thường → BỊ KẸT!
-                    self.spawn_priority_vehicle(direction, scenario_id, depart_pos="base")
-                    
-                    self.log(f"🚗🚗🚓 SC5: Đã tạo dòng xe {num_normal_cars} xe + 1 xe ưu tiên BỊ KẸT từ {dir_name}")
-                    
-                    # Đợi interval giây
-                    time.sleep(interval)
-                    
-                except Exception as e:
-                    self.log(f"⚠ Lỗi trong spawn stuck loop: {e}")
-                    time.sleep(5)
-        
-        # Tạo và khởi chạy thread
-        import threading
-        self.spawning_thread = threading.Thread(target=spawn_stuck_loop, daemon=True)
-        self.spawning_thread.start()
-        self.log(f"🔄 SC5: Spawn xe BỊ KẸT (spawn sau dòng xe bình thường) từ {directions} mỗi {interval}s")
+
+        spec = runner.spec
+        if spec.get("initial_delay"):
+            self.log(f"⏳ Chờ {spec['initial_delay']}s SUMO time trước khi spawn xe ưu tiên đầu tiên...")
+        source = "route file" if runner.preloaded else "TraCI"
+        self.log(f"🔄 Đã bắt đầu {spec['ten']}: hướng {spec['directions']}, mỗi ~{spec['interval']}s "
+                 f"(seed={runner.seed}, {source})")
     
-    def start_priority_spawning_consecutive(self, directions, base_interval=12, scenario_id="SC6"):
-        """SC6: Spawn nhiều xe ưu tiên LIÊN TIẾP từ cùng hướng
-        
-        Mô phỏng tình huống: Vừa cho xe cứu thương đi qua, 10-20s sau lại có xe khác cùng hướng.
-        
-        Args:
-            directions: List các hướng (thường chỉ 1 hướng cho rõ ràng)
-            base_interval: Khoảng thời gian cơ bản giữa các xe (giây)
-            scenario_id: ID kịch bản (mặc định SC6)
+    def get_direction_from_edge(self, edge_id: str, junction_id: str) -> str:
         """
-        # Dừng spawning cũ nếu có
-        self.stop_priority_spawning()
-        
-        # Đánh dấu spawning đang hoạt động
-        self.spawning_active = True
-        
-        def spawn_consecutive_loop():
-            """Loop spawn xe ưu tiên liên tiếp từ cùng hướng"""
-            import time
-            import random
-            
-            consecutive_count = 0
-            
-            while self.spawning_active:
-                try:
-                    # Luôn chọn cùng 1 hướng (hoặc random từ list nhỏ)
-                    direction = directions[0] if len(directions) == 1 else random.choice(directions)
-                    
-                    # Spawn xe ưu tiên
-                    consecutive_count += 1
-                    self.spawn_priority_vehicle(direction, f"{scenario_id}_consecutive_{consecutive_count}", depart_pos="base")
-                    
-                    direction_names = {"north": "Bắc", "south": "Nam", "west": "Tây"}
-                    dir_name = direction_names.get(direction, "Không xác định")
-                    
-                    # Log tình huống liên tiếp
-                    self.log(f"🚑🚑 SC6-CONSECUTIVE: Xe ưu tiên #{consecutive_count} từ {dir_name} (liên tiếp)")
-                    
-                    # Interval biến đổi nhẹ (5-9s) - NHANH HƠN để thấy nhiều xe
-                    actual_interval = base_interval + random.uniform(-1, 2)
-                    
-                    # Đợi trước khi spawn xe tiếp theo
-                    time.sleep(actual_interval)
-                    
-                except Exception as e:
-                    self.log(f"⚠ Lỗi trong consecutive spawn loop: {e}")
-                    time.sleep(5)
-        
-        # Tạo và khởi chạy thread
-        import threading
-        self.spawning_thread = threading.Thread(target=spawn_consecutive_loop, daemon=True)
-        self.spawning_thread.start()
-        self.log(f"🔄 SC6: Spawn xe ưu tiên LIÊN TIẾP từ {directions} mỗi ~{base_interval}s (±2-3s)")
-    
-    def start_false_alarm_simulation(self, interval=30):
-        """Mô phỏng báo giả - spawn xe rồi xóa ngay để giả lập tín hiệu sai
+        Xác định hướng dựa trên edge ID
         
-        Args:
-            interval: Khoảng thời gian giữa các lần báo giả (giây)
+        Returns:
+            "north", "south", "east", "west" hoặc None
         """
-        # Dừng spawning cũ nếu có
-        self.stop_priority_spawning()
-        
-        # Đánh dấu spawning đang hoạt động
-        self.spawning_active = True
-        
-        def false_alarm_loop():
-            """Loop chạy trong thread để tạo tín hiệu báo giả"""
-            import time
-            import random
-            
-            directions = ["north", "south", "west"]
-            direction_names = {"north": "Bắc", "south": "Nam", "west": "Tây"}
-            
-            while self.spawning_active:
-                try:
-                    # Chọn ngẫu nhiên hướng
-                    direction = random.choice(directions)
-                    dir_name = direction_names.get(direction, "Không xác định")
-                    
-                    # Spawn xe để tạo tín hiệu
-                    self.log(f"⚠️ BÁOGIẢ - Phát hiện tín hiệu xe ưu tiên từ {dir_name}")
-                    spawned_vehicles = self.spawn_priority_vehicle(direction, "SC4_FALSE")
-                    
-                    # Đợi 2-3 giây (giả lập thời gian phát hiện)
-                    time.sleep(random.uniform(2, 3))
-                    
-                    # Xóa xe ngay (mô phỏng báo giả - xe không thật)
-                    if spawned_vehicles:
-                        try:
-                            import traci
-                            for veh_id in spawned_vehicles:
-                                if veh_id in traci.vehicle.getIDList():
-                                    traci.vehicle.remove(veh_id)
-                            self.log(f"🗑️ BÁOGIẢ - Đã xóa xe giả [{len(spawned_vehicles)} xe] - Tín hiệu sai!")
-                        except Exception as remove_err:
-                            self.log(f"⚠ Lỗi khi xóa xe báo giả: {remove_err}")
-                    
-                    # Đợi interval giây trước lần báo giả tiếp theo
-                    time.sleep(interval)
-                    
-                except Exception as e:
-                    self.log(f"⚠ Lỗi trong false alarm loop: {e}")
-                    time.sleep(5)
-        
-        # Tạo và khởi chạy thread
-        import threading
-        self.spawning_thread = threading.Thread(target=false_alarm_loop, daemon=True)
-        self.spawning_thread.start()
-        self.log(f"🔄 Đã bắt đầu mô phỏng báo giả mỗi {interval}s (spawn xe → xóa ngay)")
+        location = self.network_index.incoming(edge_id)
+        if location is not None and location[0] == junction_id:
+            return location[1]
+        return None
     
     def stop_priority_spawning(self):
-        """Dừng việc spawn xe ưu tiên"""
+        """Dừng việc spawn xe ưu tiên (hủy các sự kiện spawn đã đặt lịch)"""
         if self.spawning_active:
-            self.log("🛑 Đang dừng spawn thread...")
+            self.log("🛑 Đang dừng spawn xe ưu tiên...")
             self.spawning_active = False
-            # ⚠️ KHÔNG join() - để thread tự terminate trong sleep
-            # join(timeout=2) sẽ đợi 2s → nhưng thread đang sleep(200s) → wasted time
-            # Thread là daemon → sẽ tự terminate khi main program exit
-            self.log("⏹ Đã đặt spawning_active=False (thread sẽ tự terminate sau sleep)")
+            cancelled = self.scenario_runner.stop() if self.scenario_runner is not None else 0
+            self.scenario_runner = None
+            self.log(f"⏹ Đã hủy {cancelled} sự kiện spawn đang chờ")
     
-    def spawn_priority_vehicle(self, direction, scenario_id, depart_pos="base"):
-        """Spawn một xe ưu tiên từ hướng chỉ định - ở CẢ 2 ngã tư (J1 và J4)
-        
-        Args:
-            direction: Hướng spawn ("north", "south", "west")
-            scenario_id: ID kịch bản (SC1, SC2, SC5...)
-            depart_pos: Vị trí spawn - "base" (đầu route) hoặc số mét từ đầu route
-        
-        Returns:
-            List các vehicle ID đã spawn thành công (để xóa trong trường hợp false alarm)
-        """
-        spawned_vehicle_ids = []
-        
-        try:
-            import traci
-            current_time = traci.simulation.getTime()
-            
-            # Đếm số xe ưu tiên hiện tại
-            all_vehicles = traci.vehicle.getIDList()
-            priority_count = sum(1 for v in all_vehicles if 'priority' in v)
-            
-            # Định nghĩa routes cho CẢ 2 ngã tư
-            # Ngã tư J1 (giao lộ chính với E0, E1, E2, E3)
-            j1_routes = {
-                "north": ["r5", "r6", "r7", "r8", "r9"],     # Từ Bắc (-E1) J1 - hướng chính
-                "south": ["r10", "r11", "r12", "r13", "r14"],  # Từ Nam (-E2) J1 - hướng chính
-                "west": ["r0", "r1", "r2"],      # Từ Tây (E0) J1 - hướng nhánh
-            }
-            
-            # Ngã tư J4 (giao lộ phụ với E4, E5, E6, E3)
-            j4_routes = {
-                "north": ["r15", "r16", "r17", "r18", "r19"],         # Từ Bắc (-E4) J4 - hướng chính
-                "south": ["r20", "r21", "r22", "r23", "r24"],  # Từ Nam (-E5) J4 - hướng chính
-                "west": ["r25", "r26", "r27"]    # Từ Tây (-E6) J4 - hướng nhánh
-            }
-            
-            direction_names = {
-                "north": "Bắc",
-                "south": "Nam", 
-                "east": "Đông",
-                "west": "Tây"
-            }
-            
-            dir_name = direction_names.get(direction, "Không xác định")
-            
-            # Spawn xe ở CẢNG 2 ngã tư
-            import random
-            spawned_count = 0
-            
-            # 1. Spawn ở ngã tư J1
-            if direction in j1_routes:
-                route_j1 = random.choice(j1_routes[direction])
-                veh_id_j1 = f"priority_{scenario_id}_{direction}_J1_{int(current_time)}"
-                
-                try:
-                    # Convert depart_pos to proper format for SUMO
-                    if isinstance(depart_pos, (int, float)):
-                        pos_param = str(float(depart_pos))
-                    else:
-                        pos_param = depart_pos
-                    
-                    traci.vehicle.add(
-                        veh_id_j1, 
-                        route_j1, 
-                        typeID="priority",
-                        departPos=pos_param,
-                        departSpeed="random",
-                        departLane="best"
-                    )
-                    
-                    # Kiểm tra spawn thành công
-                    import time
-                    time.sleep(0.3)
-                    if veh_id_j1 in traci.vehicle.getIDList():
-                        edge = traci.vehicle.getRoadID(veh_id_j1)
-                        
-                        # CHO PHÉP XE ƯU TIÊN VƯỢT ĐÈN ĐỎ
-                        # speedMode = 0: Bỏ qua TẤT CẢ quy tắc (aggressive mode)
-                        # speedMode = 32: Chỉ bỏ qua traffic lights
-                        try:
-                            traci.vehicle.setSpeedMode(veh_id_j1, 0)  # Thử mode 0 - bỏ qua tất cả
-                            self.log(f"🚨 [{veh_id_j1}] Đã set speedMode=0 (ignore ALL rules)")
-                        except Exception as e:
-                            self.log(f"❌ Lỗi set speedMode cho {veh_id_j1}: {e}")
-                        
-                        # ĐỔI MÀU XE ƯU TIÊN ĐỂ DỄ NHÌN - Màu đỏ nổi bật
-                        traci.vehicle.setColor(veh_id_j1, (255, 0, 0, 255))  # Đỏ rực
-                        
-                        spawned_count += 1
-                        spawned_vehicle_ids.append(veh_id_j1)
-                        pos_info = f"@ {depart_pos}m" if isinstance(depart_pos, (int, float)) else "đầu route"
-                        self.log(f"🚨 Spawn xe ưu tiên [{scenario_id}] từ {dir_name} tại J1")
-                        self.log(f"   ID: {veh_id_j1}")
-                        self.log(f"   Edge: {edge} ({pos_info})")
-                except Exception as e:
-                    # Log lỗi nếu spawn thất bại
-                    if "depart" in str(e).lower():
-                        self.log(f"⚠ J1: departPos {depart_pos}m quá xa, thử lại với 'base'")
-                    pass
-            
-            # 2. Spawn ở ngã tư J4
-            if direction in j4_routes:
-                route_j4 = random.choice(j4_routes[direction])
-                veh_id_j4 = f"priority_{scenario_id}_{direction}_J4_{int(current_time)}"
-                
-                try:
-                    # Convert depart_pos to proper format for SUMO
-                    if isinstance(depart_pos, (int, float)):
-                        pos_param = str(float(depart_pos))
-                    else:
-                        pos_param = depart_pos
-                    
-                    traci.vehicle.add(
-                        veh_id_j4, 
-                        route_j4, 
-                        typeID="priority",
-                        departPos=pos_param,
-                        departSpeed="random",
-                        departLane="best"
-                    )
-                    
-                    # Kiểm tra spawn thành công
-                    import time
-                    time.sleep(0.3)
-                    if veh_id_j4 in traci.vehicle.getIDList():
-                        edge = traci.vehicle.getRoadID(veh_id_j4)
-                        
-                        # CHO PHÉP XE ƯU TIÊN VƯỢT ĐÈN ĐỎ
-                        try:
-                            traci.vehicle.setSpeedMode(veh_id_j4, 0)  # Thử mode 0 - bỏ qua tất cả
-                            self.log(f"🚨 [{veh_id_j4}] Đã set speedMode=0 (ignore ALL rules)")
-                        except Exception as e:
-                            self.log(f"❌ Lỗi set speedMode cho {veh_id_j4}: {e}")
-                        
-                        # ĐỔI MÀU XE ƯU TIÊN ĐỂ DỄ NHÌN - Màu đỏ nổi bật
-                        traci.vehicle.setColor(veh_id_j4, (255, 0, 0, 255))  # Đỏ rực
-                        
-                        spawned_count += 1
-                        spawned_vehicle_ids.append(veh_id_j4)
-                        pos_info = f"@ {depart_pos}m" if isinstance(depart_pos, (int, float)) else "đầu route"
-                        # Enhanced logging để thấy scenario_id
-                        self.log(f"🚨 Spawn xe ưu tiên [{scenario_id}] từ {dir_name} tại J4")
-                        self.log(f"   ID: {veh_id_j4}")
-                        self.log(f"   Edge: {edge} ({pos_info})")
-                except Exception as e:
-                    # Log lỗi nếu spawn thất bại
-                    if "depart" in str(e).lower():
-                        self.log(f"⚠ J4: departPos {depart_pos}m quá xa, thử lại với 'base'")
-                    pass
-            
-            if spawned_count > 0:
-                self.log(f"📊 Đã spawn {spawned_count} xe ưu tiên từ hướng {dir_name} (Tổng: {priority_count + spawned_count} xe)")
-                
-        except Exception as e:
-            # Bỏ qua lỗi tổng quát
-            pass
-        
-        return spawned_vehicle_ids
-
     # ============ Update data from SUMO & UI ============
+    @profiled("update_data_from_sumo")
     def update_data_from_sumo(self):
         """
         Lấy dữ liệu thực từ SUMO và tính toán KPI theo CÔNG THỨC NHÓM:
@@ -1878,12 +1731,14 @@ class SmartTrafficApp(ctk.CTk):
                 return
 
             # ===== LẤY DỮ LIỆU TỪ TRACI =====
-            current_time = traci.simulation.getTime()
-            all_vehicle_ids = traci.vehicle.getIDList()
+            # Snapshot dùng chung với controllers: giá trị đã đọc trong step này không gọi lại SUMO
+            snapshot = get_step_snapshot()
+            current_time = snapshot.get_time()
+            all_vehicle_ids = snapshot.vehicle_ids()
             
             # ✅ FIX: getDepartedNumber() trả về số xe departed TRONG BƯỚC này, không phải tích lũy
             # → Tự tích lũy để có tổng số xe từ đầu simulation
-            departed_this_step = traci.simulation.getDepartedNumber()
+            departed_this_step = len(snapshot.departed_ids())
             self.total_arrived_vehicles += departed_this_step
             arrived_count = self.total_arrived_vehicles
             
@@ -1899,93 +1754,11 @@ class SmartTrafficApp(ctk.CTk):
                     vehicle_counts = None
             
             # === BƯỚC 2: Tính KPI cho TỪNG xe ===
-            # PCU conversion factors (Việt Nam standard)
-            PCU_FACTORS = {
-                "motorcycle": 0.3,
-                "car": 1.0,
-                "bus": 1.5,
-                "truck": 1.5,
-                "emergency": 1.0
-            }
-            
-            # Variables để tính các KPI
-            total_delay = 0.0           # Sum of (travelTime - freeFlowTime)
-            total_waiting_time = 0.0    # Sum of waiting time
-            total_stops = 0             # Sum of stops
-            max_waiting_time = 0.0      # Maximum waiting time
-            total_pcu = 0.0             # Total PCU
-            total_queue_pcu = 0.0       # Total queue in PCU
-            vehicles_with_data = 0
-            
-            # Vehicle-specific tracking cho stops
-            if not hasattr(self, '_vehicle_stop_tracker'):
-                self._vehicle_stop_tracker = {}  # {veh_id: {"last_speed": 0, "stops": 0}}
-            
-            for vid in all_vehicle_ids:
-                try:
-                    # === 1. AVERAGE DELAY (s/xe) ===
-                    # Công thức: Delay = travelTime - freeFlowTime
-                    # freeFlowTime = route_length / max_speed
-                    route_id = traci.vehicle.getRouteID(vid)
-                    route_edges = traci.route.getEdges(route_id)
-                    
-                    # Tính freeFlowTime (thời gian lý tưởng không dừng)
-                    free_flow_time = 0.0
-                    for edge_id in route_edges:
-                        try:
-                            edge_length = traci.lane.getLength(f"{edge_id}_0")  # Giả sử lane 0
-                            max_speed = traci.lane.getMaxSpeed(f"{edge_id}_0")
-                            free_flow_time += edge_length / max_speed if max_speed > 0 else 0
-                        except Exception:
-                            continue
-                    
-                    # Tính travelTime (thời gian thực tế)
-                    # SUMO không trực tiếp cho travelTime, dùng: departTime + accumulated time
-                    depart_delay = traci.vehicle.getDeparture(vid)
-                    if depart_delay >= 0:  # Xe đã xuất phát
-                        travel_time = current_time - depart_delay
-                        delay = max(0, travel_time - free_flow_time)
-                        total_delay += delay
-                    
-                    # === 2. WAITING TIME (cho Fairness) ===
-                    waiting_time = traci.vehicle.getWaitingTime(vid)
-                    total_waiting_time += waiting_time
-                    max_waiting_time = max(max_waiting_time, waiting_time)
-                    
-                    # === 3. AVERAGE STOPS (số lần dừng/xe) ===
-                    speed = traci.vehicle.getSpeed(vid)
-                    
-                    if vid not in self._vehicle_stop_tracker:
-                        self._vehicle_stop_tracker[vid] = {"last_speed": speed, "stops": 0}
-                    
-                    tracker = self._vehicle_stop_tracker[vid]
-                    
-                    # Detect stop: từ speed > 0.1 → speed < 0.1
-                    if tracker["last_speed"] > 0.1 and speed < 0.1:
-                        tracker["stops"] += 1
-                    
-                    tracker["last_speed"] = speed
-                    total_stops += tracker["stops"]
-                    
-                    # === 4. QUEUE LENGTH (PCU) ===
-                    # Xe đang chờ (speed < 0.1 m/s)
-                    vtype = traci.vehicle.getTypeID(vid)
-                    pcu_factor = PCU_FACTORS.get(vtype, 1.0)
-                    total_pcu += pcu_factor
-                    
-                    if speed < 0.1:
-                        total_queue_pcu += pcu_factor
-                    
-                    vehicles_with_data += 1
-                    
-                except Exception:
-                    continue
-            
-            # Clean up departed vehicles từ tracker
-            current_vehicles = set(all_vehicle_ids)
-            departed_vehicles = set(self._vehicle_stop_tracker.keys()) - current_vehicles
-            for departed_vid in departed_vehicles:
-                del self._vehicle_stop_tracker[departed_vid]
+            # KPIEngine gom thuộc tính mọi xe (vehicle subscription) vào mảng NumPy
+            # và tính delay, stops, queue PCU, max wait, wait theo ngã tư bằng phép vector
+            if self.kpi_engine is None:
+                self.kpi_engine = KPIEngine(network_index=self.network_index)
+            kpi = self.kpi_engine.compute()
             
             # === TÍNH CÁC KPI TRUNG BÌNH ===
             
@@ -1995,7 +1768,7 @@ class SmartTrafficApp(ctk.CTk):
             # → Tổng = sum(Ngã tư 1) + sum(Ngã tư 2) phải khớp với "Tổng xe"
             total_vehicles = 0
             if vehicle_counts:
-                for junction_id in ["J1", "J4"]:
+                for junction_id in self.network_index.junction_ids():
                     if junction_id in vehicle_counts:
                         total_vehicles += sum(vehicle_counts[junction_id].values())
             
@@ -2004,7 +1777,8 @@ class SmartTrafficApp(ctk.CTk):
                 total_vehicles = total_vehicles_in_sim
             
             # 2. ĐỘ TRỄ TB (Average Delay - s/xe)
-            avg_delay = round(total_delay / vehicles_with_data, 1) if vehicles_with_data > 0 else 0.0
+            # Công thức: Delay = travelTime - freeFlowTime (freeFlowTime = route_length / max_speed)
+            avg_delay = round(kpi["avg_delay"], 1)
             
             # 3. LƯU LƯỢNG (Throughput - xe/giờ)
             # ✅ FIX: Tự tích lũy departed vì getDepartedNumber() chỉ trả về số xe trong bước hiện tại
@@ -2015,21 +1789,22 @@ class SmartTrafficApp(ctk.CTk):
                 throughput = 0
             
             # 4. HÀNG CHỜ TB (Average Queue Length - PCU)
-            avg_queue_pcu = round(total_queue_pcu, 1)
+            # Xe đang chờ (speed < 0.1 m/s) quy đổi PCU
+            avg_queue_pcu = round(kpi["queue_pcu"], 1)
             
             # 5. Dừng TB (Average Stops per Vehicle - lần)
-            avg_stops = round(total_stops / vehicles_with_data, 2) if vehicles_with_data > 0 else 0.0
+            avg_stops = round(kpi["avg_stops"], 2)
             
             # 6. Chờ tối đa (Maximum Waiting Time - s)
             # Mục tiêu: < 60s (tốt), < 120s (chấp nhận được)
-            max_wait = round(max_waiting_time, 1)
+            max_wait = round(kpi["max_waiting"], 1)
 
             # === BƯỚC 3: Cập nhật dữ liệu cho TỪNG ngã tư ===
             intersection_wait_times = []  # Để tính Fairness
             
             for i, tls_id in enumerate(tls_ids[:2]):
                 int_name = f"Ngã tư {i+1}"
-                junction_id = "J1" if i == 0 else "J4"
+                junction_id = self.network_index.junction_for_tls(tls_id)
                 
                 if int_name not in self.intersection_data:
                     continue
@@ -2061,35 +1836,10 @@ class SmartTrafficApp(ctk.CTk):
                     }
                     self.intersection_data[int_name]["queue"] = 0
                 
-                # --- Wait time cho ngã tư này ---
-                junction_wait_time = 0.0
-                junction_vehicle_count = 0
-                
-                # Tính wait time cho các xe gần ngã tư này
-                try:
-                    for vid in all_vehicle_ids:
-                        try:
-                            edge_id = traci.vehicle.getRoadID(vid)
-                            # Kiểm tra xe có thuộc junction này không
-                            if junction_id == "J1" and any(e in edge_id for e in ["-E1", "-E2", "E0", "-E3"]):
-                                junction_wait_time += traci.vehicle.getWaitingTime(vid)
-                                junction_vehicle_count += 1
-                            elif junction_id == "J4" and any(e in edge_id for e in ["-E4", "-E5", "-E6", "E3"]):
-                                junction_wait_time += traci.vehicle.getWaitingTime(vid)
-                                junction_vehicle_count += 1
-                        except Exception:
-                            continue
-                    
-                    avg_junction_wait = round(
-                        junction_wait_time / junction_vehicle_count, 1
-                    ) if junction_vehicle_count > 0 else 0.0
-                    
-                    self.intersection_data[int_name]["wait_time"] = avg_junction_wait
-                    intersection_wait_times.append(avg_junction_wait)
-                    
-                except Exception:
-                    self.intersection_data[int_name]["wait_time"] = 0.0
-                    intersection_wait_times.append(0.0)
+                # --- Wait time cho ngã tư này (xe trên các edge của ngã tư, KPIEngine đã tính) ---
+                avg_junction_wait = round(kpi["junction_wait"].get(junction_id, 0.0), 1)
+                self.intersection_data[int_name]["wait_time"] = avg_junction_wait
+                intersection_wait_times.append(avg_junction_wait)
 
             # === BƯỚC 4: Tính các KPI TOÀN CỤC còn lại ===
             
@@ -2099,72 +1849,18 @@ class SmartTrafficApp(ctk.CTk):
                 cycle_times = []
                 for tls_id, ctrl in self.controllers.items():
                     try:
-                        if hasattr(ctrl, 'phase_history') and len(ctrl.phase_history) > 0:
-                            # ✅ FIX TRIỆT ĐỂ: Dùng TOÀN BỘ phase_history với lọc outliers thông minh
-                            # Root cause: Dashboard update quá nhanh → dùng data quá ít → cycle không đúng
-                            
-                            # Lấy TẤT CẢ phase_history (tối đa 100 phases để tránh lag)
-                            full_history = ctrl.phase_history[-100:] if len(ctrl.phase_history) > 100 else ctrl.phase_history
-                            
-                            # Tìm TẤT CẢ NS_GREEN start_times
-                            all_ns_green_times = [start_time for phase, start_time, _ in full_history if "NS_GREEN" in str(phase)]
-                            
-                            if len(all_ns_green_times) >= 2:
-                                # PRIMARY METHOD: Tính intervals giữa các lần NS_GREEN
-                                intervals = [all_ns_green_times[i+1] - all_ns_green_times[i] for i in range(len(all_ns_green_times)-1)]
-                                
-                                # Lọc outliers thông minh:
-                                # - Bỏ intervals < 10s (phase switching quá nhanh, không phải full cycle)
-                                # - Bỏ intervals > 90s (starvation force switching)
-                                valid_intervals = [x for x in intervals if 15 <= x <= 90]
-                                
-                                if valid_intervals:
-                                    # Tính trung bình từ valid intervals
-                                    cycle_time = sum(valid_intervals) / len(valid_intervals)
-                                    cycle_times.append(cycle_time)
-                                else:
-                                    # Tất cả intervals đều outliers → lấy median thay vì baseline
-                                    if intervals:
-                                        sorted_intervals = sorted(intervals)
-                                        median_interval = sorted_intervals[len(sorted_intervals) // 2]
-                                        # Clamp median vào khoảng hợp lý [20, 60]
-                                        cycle_time = max(20.0, min(60.0, median_interval))
-                                        cycle_times.append(cycle_time)
-                                    else:
-                                        cycle_times.append(40.0)
-                            else:
-                                # FALLBACK: Không đủ 2 NS_GREEN → ước tính từ durations
-                                # Lấy 10 phases GẦN NHẤT để có data mới nhất
-                                recent_history = ctrl.phase_history[-10:] if len(ctrl.phase_history) > 10 else ctrl.phase_history
-                                
-                                # Tính tổng duration của tất cả phases
-                                total_duration = sum(duration for _, _, duration in recent_history)
-                                num_phases = len(recent_history)
-                                
-                                if num_phases >= 5:
-                                    # Có ít nhất 5 phases (1 full cycle) → tính trực tiếp
-                                    # 1 cycle ≈ 5 phases (NS_GREEN, YELLOW, ALL_RED, EW_GREEN, YELLOW)
-                                    # Nếu có 10 phases → 2 cycles
-                                    cycles_in_history = num_phases / 5.0
-                                    cycle_time = total_duration / cycles_in_history
-                                    cycle_times.append(cycle_time)
-                                else:
-                                    # Quá ít data → ước tính từ GREEN phases
-                                    green_durations = [duration for phase, _, duration in recent_history 
-                                                      if "GREEN" in str(phase) and "YELLOW" not in str(phase)]
-                                    
-                                    if green_durations:
-                                        avg_green = sum(green_durations) / len(green_durations)
-                                        # 1 cycle = 2 GREEN (NS+EW) + overhead (YELLOW+ALL_RED ≈ 10s)
-                                        cycle_time = (avg_green * 2) + 10.0
-                                        cycle_times.append(cycle_time)
-                                    else:
-                                        # Không có GREEN nào → baseline
-                                        cycle_times.append(40.0)
+                        tracker = getattr(ctrl, 'cycle_tracker', None)
+                        if tracker is not None:
+                            # CycleTracker cập nhật mỗi lần chuyển pha (apply_phase):
+                            # trung bình chu kỳ đã lọc outliers [15, 90] → median kẹp [20, 60]
+                            # → ước tính từ durations khi chưa đủ 2 NS_GREEN
+                            cycle_time = tracker.average_cycle(default=40.0)
+                            if cycle_time is not None:
+                                cycle_times.append(cycle_time)
                     except Exception as e:
                         # Fallback cuối cùng nếu có lỗi
                         cycle_times.append(40.0)
-                
+
                 avg_cycle = int(sum(cycle_times) / len(cycle_times)) if cycle_times else (self.green_time + self.yellow_time + self.red_time) * 2
             else:
                 # Fixed-time mode
@@ -2195,16 +1891,19 @@ class SmartTrafficApp(ctk.CTk):
             else:
                 # Chế độ Thông minh: Thời gian giải phóng xe ưu tiên (TG giải phóng xe UT)
                 if hasattr(self, 'priority_controllers') and self.priority_controllers:
-                    clearance_times = []
+                    # Cộng dồn thống kê tích lũy của từng controller (không duyệt lại danh sách)
+                    clearance_total = 0.0
+                    clearance_count = 0
                     for junction_id, priority_ctrl in self.priority_controllers.items():
-                        if hasattr(priority_ctrl, 'clearance_times') and priority_ctrl.clearance_times:
-                            clearance_times.extend(priority_ctrl.clearance_times)
-                            print(f"🔍 [DASHBOARD-DEBUG] {junction_id}: {len(priority_ctrl.clearance_times)} clearance times: {priority_ctrl.clearance_times}")
+                        if hasattr(priority_ctrl, 'clearance_times') and priority_ctrl.clearance_times.count:
+                            clearance_total += priority_ctrl.clearance_times.total
+                            clearance_count += priority_ctrl.clearance_times.count
+                            print(f"🔍 [DASHBOARD-DEBUG] {junction_id}: {priority_ctrl.clearance_times.count} clearance times: {priority_ctrl.clearance_times}")
                     
                     # Tính trung bình thời gian giải phóng
-                    if clearance_times:
-                        first_kpi_value = round(sum(clearance_times) / len(clearance_times), 1)
-                        print(f"📊 [DASHBOARD-DEBUG] Avg clearance time: {first_kpi_value}s from {len(clearance_times)} vehicles")
+                    if clearance_count:
+                        first_kpi_value = round(clearance_total / clearance_count, 1)
+                        print(f"📊 [DASHBOARD-DEBUG] Avg clearance time: {first_kpi_value}s from {clearance_count} vehicles")
                     else:
                         first_kpi_value = 0.0
                         print(f"⚠️ [DASHBOARD-DEBUG] No clearance times available! priority_controllers={list(self.priority_controllers.keys())}")
@@ -2234,7 +1933,7 @@ class SmartTrafficApp(ctk.CTk):
                     total_queue_length = 0
                     detector_count = 0
                     
-                    for junction_id in ["J1", "J4"]:
+                    for junction_id in self.network_index.junction_ids():
                         densities = self.sensor_manager.get_all_junction_densities(junction_id)
                         for direction, data in densities.items():
                             if "error" not in data:
@@ -2276,11 +1975,46 @@ class SmartTrafficApp(ctk.CTk):
                 print(f"=== CHI TIẾT LỖI KPI ===\n{error_detail}")
                 self._error_logged = True
 
-    def update_ui(self):
-        """Cập nhật UI với dữ liệu mới nhất từ SUMO"""
+    def change_speed(self, value):
+        """
+        Đổi tốc độ mô phỏng
+
+        Args:
+            value: Nhãn tốc độ trong speed_options ("1x", "10x", "Tối đa"...)
+        """
+        speed_factor = self.speed_options.get(value)
+        self.pacer.set_speed(speed_factor)
+        self.log(f"⏩ Tốc độ mô phỏng: {value}")
+
+    @profiled("build_ui_frame")
+    def build_ui_frame(self) -> dict:
+        """
+        Chụp bản sao dữ liệu KPI/ngã tư hiện tại để UI vẽ (không bị luồng mô phỏng sửa)
+
+        Returns:
+            Dict chứa: kpi, intersections
+        """
+        return {
+            "kpi": dict(self.global_kpi_data),
+            "intersections": {
+                name: {**data, "vehicles": dict(data["vehicles"])}
+                for name, data in self.intersection_data.items()
+            }
+        }
+
+    @profiled("update_ui")
+    def update_ui(self, frame=None):
+        """
+        Cập nhật UI với dữ liệu mới nhất từ SUMO
+
+        Args:
+            frame: Frame từ build_ui_frame() (None = đọc trực tiếp dữ liệu hiện tại)
+        """
+        if frame is None:
+            frame = self.build_ui_frame()
         try:
             # === Cập nhật KPI cards ===
-            for key, value in self.global_kpi_data.items():
+            for key, value in frame["kpi"].items():
                 if key in self.global_kpi_cards:
                     # Format số cho đẹp
                     if isinstance(value, float):
@@ -2291,7 +2025,7 @@ class SmartTrafficApp(ctk.CTk):
                     self.global_kpi_cards[key].configure(text=formatted_value)
             
             # === Cập nhật intersection widgets ===
-            for int_name, data in self.intersection_data.items():
+            for int_name, data in frame["intersections"].items():
                 if int_name in self.intersection_widgets:
                     widgets = self.intersection_widgets[int_name]
                     
@@ -2334,38 +2068,21 @@ class SmartTrafficApp(ctk.CTk):
                     self.priority_vehicle_data[junction_id][direction] = 0
             
             # Lấy tất cả xe ưu tiên
-            all_vehicles = traci.vehicle.getIDList()
+            snapshot = get_step_snapshot()
+            all_vehicles = snapshot.vehicle_ids()
             priority_vehicles = [v for v in all_vehicles if 'priority' in v.lower()]
             
             total_priority = 0
             
             for veh_id in priority_vehicles:
                 try:
-                    edge_id = traci.vehicle.getRoadID(veh_id)
-                    
-                    # Xác định junction và direction
-                    junction_id = None
-                    direction = None
+                    edge_id = snapshot.vehicle_road(veh_id)
                     
-                    # Improved direction detection
-                    if "-E1" in edge_id:
-                        junction_id, direction = "J1", "Bắc"
-                    elif "-E2" in edge_id:
-                        junction_id, direction = "J1", "Nam"
-                    elif "E0" in edge_id and "-E0" not in edge_id:
-                        junction_id, direction = "J1", "Tây"
-                    elif "-E3" in edge_id:
-                        junction_id, direction = "J1", "Đông"
-                    elif "-E4" in edge_id:
-                        junction_id, direction = "J4", "Bắc"
-                    elif "-E5" in edge_id:
-                        junction_id, direction = "J4", "Nam"
-                    elif "-E6" in edge_id:
-                        junction_id, direction = "J4", "Tây"
-                    elif "E3" in edge_id and "-E3" not in edge_id:
-                        junction_id, direction = "J4", "Đông"
+                    # Xác định junction và direction (edge VÀO ngã tư, tra cứu O(1))
+                    location = self.network_index.incoming(edge_id)
+                    junction_id, direction = (location[0], DIRECTION_NAMES[location[1]]) if location else (None, None)
                     
-                    if junction_id and direction:
+                    if junction_id in self.priority_vehicle_data:
                         self.priority_vehicle_data[junction_id][direction] += 1
                         total_priority += 1
                         
@@ -0,0 +1,158 @@
+"""
+Log Buffer - Bộ đệm log an toàn đa luồng cho ô log của dashboard
+
+- Luồng nào cũng gọi append() được (luồng mô phỏng, luồng UI): chỉ thêm dòng
+  vào hàng đợi, không chạm vào widget Tk.
+- Luồng UI lấy các dòng mới theo chu kỳ (after) và chèn vào widget 1 lần
+  cho cả lô, rồi cắt widget còn tối đa max_lines dòng → insert/see("end")
+  không chậm dần sau nhiều giờ chạy.
+- Toàn bộ lịch sử được ghi nối tiếp vào file trên đĩa; export() chỉ cần
+  sao chép file thay vì đọc lại nội dung widget.
+
+Sử dụng:
+    log_buffer = LogBuffer(max_lines=1000, history_path="/tmp/smart_traffic_log.txt")
+    log_buffer.attach(app, app.log_box)   # Gọi trên luồng UI
+    log_buffer.start()
+
+    log_buffer.append("[12:00:00] ▶ Bắt đầu mô phỏng")   # Luồng bất kỳ
+    log_buffer.export("traffic_log.txt")
+"""
+
+import shutil
+import threading
+from collections import deque
+from typing import List, Optional
+
+
+class LogBuffer:
+    """
+    Giữ N dòng log gần nhất, ghi toàn bộ lịch sử ra file và đổ vào widget theo lô
+    """
+
+    def __init__(self, max_lines: int = 1000, history_path: Optional[str] = None,
+                 interval_ms: int = 200):
+        """
+        Args:
+            max_lines: Số dòng tối đa giữ trong bộ nhớ và hiển thị trên widget
+            history_path: File ghi toàn bộ lịch sử log (None = không ghi file)
+            interval_ms: Chu kỳ đổ log vào widget (ms)
+        """
+        self.max_lines = max_lines
+        self.history_path = history_path
+        self.interval_ms = interval_ms
+        self._lock = threading.Lock()
+        self._lines = deque(maxlen=max_lines)     # N dòng gần nhất
+        self._pending = deque(maxlen=max_lines)   # Dòng chưa hiển thị (lô kế tiếp)
+        self._history = None
+        self._widget = None
+        self._text = None
+        self._after_id = None
+        self.total_lines = 0
+        self.dropped_lines = 0  # Dòng bị bỏ qua trên widget vì 1 lô vượt max_lines
+
+        if history_path:
+            try:
+                self._history = open(history_path, "w", encoding="utf-8")
+            except OSError as e:
+                print(f"⚠️ Không thể mở file lịch sử log {history_path}: {e}")
+                self.history_path = None
+
+    def attach(self, widget, text_widget):
+        """
+        Gắn widget hiển thị (gọi trên luồng UI)
+
+        Args:
+            widget: Widget Tk dùng để đặt lịch after() (thường là cửa sổ chính)
+            text_widget: tk.Text hiển thị log
+        """
+        self._widget = widget
+        self._text = text_widget
+
+    def append(self, line: str):
+        """
+        Thêm 1 dòng log (an toàn đa luồng, không chặn)
+
+        Args:
+            line: Nội dung dòng (không kèm "\\n")
+        """
+        with self._lock:
+            if len(self._pending) == self.max_lines:
+                self.dropped_lines += 1
+            self._lines.append(line)
+            self._pending.append(line)
+            self.total_lines += 1
+            if self._history is not None:
+                self._history.write(line + "\n")
+
+    def lines(self) -> List[str]:
+        """N dòng log gần nhất"""
+        with self._lock:
+            return list(self._lines)
+
+    def start(self):
+        """Bắt đầu đổ log vào widget theo chu kỳ (gọi trên luồng UI)"""
+        if self._after_id is None and self._widget is not None:
+            self._after_id = self._widget.after(self.interval_ms, self._tick)
+
+    def stop(self):
+        """Dừng chu kỳ đổ log (gọi trên luồng UI)"""
+        if self._after_id is not None:
+            try:
+                self._widget.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def flush(self):
+        """Đổ các dòng đang chờ vào widget và ghi file lịch sử xuống đĩa (gọi trên luồng UI)"""
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+            if self._history is not None:
+                self._history.flush()
+        if not batch or self._text is None:
+            return
+        try:
+            self._text.insert("end", "\n".join(batch) + "\n")
+            # Cắt bớt dòng cũ: widget luôn kết thúc bằng 1 dòng trống sau "\n" cuối
+            excess = int(self._text.index("end-1c").split(".")[0]) - 1 - self.max_lines
+            if excess > 0:
+                self._text.delete("1.0", f"{excess + 1}.0")
+            self._text.see("end")
+        except Exception as e:
+            print(f"⚠️ Lỗi khi hiển thị log: {e}")
+
+    def _tick(self):
+        """Một nhịp: đổ lô log mới rồi đặt lịch nhịp kế tiếp"""
+        self.flush()
+        self._after_id = self._widget.after(self.interval_ms, self._tick)
+
+    def export(self, path: str) -> int:
+        """
+        Xuất toàn bộ lịch sử log ra file
+
+        Args:
+            path: File cần ghi
+
+        Returns:
+            Số dòng đã xuất
+        """
+        with self._lock:
+            if self._history is not None:
+                self._history.flush()
+            if self.history_path:
+                shutil.copyfile(self.history_path, path)
+                return self.total_lines
+            lines = list(self._lines)
+        # Không có file lịch sử → chỉ còn N dòng gần nhất
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        return len(lines)
+
+    def close(self):
+        """Dừng chu kỳ và đóng file lịch sử"""
+        self.stop()
+        with self._lock:
+            if self._history is not None:
+                self._history.close()
+                self._history = None
@@ -0,0 +1,163 @@
+"""
+Render Scheduler - Tách tốc độ mô phỏng khỏi tốc độ vẽ giao diện
+
+- SimulationPacer: giữ tốc độ mô phỏng theo hệ số so với thời gian thực
+  (1x, 10x, 100x...) hoặc chạy không giới hạn (speed_factor = None).
+- RenderScheduler: luồng mô phỏng publish() frame KPI mới nhất sau mỗi step,
+  luồng UI (Tk) lấy frame mới nhất theo tần số cố định (vd: 4 Hz). Các frame
+  trung gian giữa 2 lần vẽ bị bỏ qua (coalesce), nên hàng đợi sự kiện Tk
+  không bao giờ bị dồn ứ dù mô phỏng chạy nhanh hơn UI.
+
+Sử dụng:
+    pacer = SimulationPacer(speed_factor=10.0)
+    scheduler = RenderScheduler(app, app.update_ui, fps=4.0)
+    scheduler.start()                 # Gọi trên luồng UI
+
+    # Luồng mô phỏng
+    traci.simulationStep()
+    scheduler.publish(frame)
+    pacer.wait(sim_time)
+"""
+
+import time
+import threading
+from typing import Callable, Optional
+
+
+class SimulationPacer:
+    """
+    Điều tốc vòng lặp mô phỏng theo hệ số thời gian thực
+    """
+
+    # Nếu bị chậm hơn mục tiêu quá ngưỡng này (giây wall) thì đặt lại mốc,
+    # tránh chạy dồn để "đuổi kịp" sau khi UI/SUMO bị nghẽn
+    MAX_LAG = 1.0
+
+    def __init__(self, speed_factor: Optional[float] = 10.0):
+        """
+        Args:
+            speed_factor: Số giây mô phỏng cho mỗi giây thực (None = không giới hạn)
+        """
+        self.speed_factor = speed_factor
+        self._wall_start = None
+        self._sim_start = None
+
+    def set_speed(self, speed_factor: Optional[float]):
+        """
+        Đổi tốc độ mô phỏng (có hiệu lực ngay ở step kế tiếp)
+
+        Args:
+            speed_factor: Hệ số thời gian thực (None = không giới hạn)
+        """
+        self.speed_factor = speed_factor
+        self.reset()
+
+    def reset(self):
+        """Đặt lại mốc thời gian (khi bắt đầu, tiếp tục sau tạm dừng, đổi tốc độ)"""
+        self._wall_start = None
+        self._sim_start = None
+
+    def wait(self, sim_time: float):
+        """
+        Ngủ cho đến khi thời gian thực bắt kịp thời gian mô phỏng theo speed_factor
+
+        Args:
+            sim_time: Thời gian mô phỏng hiện tại (giây)
+        """
+        if not self.speed_factor or self.speed_factor <= 0:
+            return  # Không giới hạn
+
+        now = time.perf_counter()
+        if self._wall_start is None:
+            self._wall_start = now
+            self._sim_start = sim_time
+            return
+
+        target = self._wall_start + (sim_time - self._sim_start) / self.speed_factor
+        delay = target - now
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -self.MAX_LAG:
+            # Quá chậm so với mục tiêu → lấy mốc mới thay vì chạy dồn
+            self._wall_start = now
+            self._sim_start = sim_time
+
+
+class RenderScheduler:
+    """
+    Vẽ lại UI theo tần số cố định với frame mới nhất do luồng mô phỏng publish
+    """
+
+    def __init__(self, widget, render_callback: Callable, fps: float = 4.0):
+        """
+        Args:
+            widget: Widget Tk dùng để đặt lịch after() (thường là cửa sổ chính)
+            render_callback: Hàm vẽ UI, nhận 1 tham số là frame
+            fps: Số lần vẽ mỗi giây
+        """
+        self.widget = widget
+        self.render_callback = render_callback
+        self.fps = fps
+        self._lock = threading.Lock()
+        self._frame = None
+        self._frame_id = 0
+        self._rendered_id = 0
+        self._after_id = None
+        self.frames_published = 0
+        self.frames_rendered = 0
+
+    @property
+    def interval_ms(self) -> int:
+        """Khoảng cách giữa 2 lần vẽ (ms)"""
+        return max(1, int(1000 / self.fps))
+
+    def set_fps(self, fps: float):
+        """Đổi tần số vẽ (có hiệu lực từ lần vẽ kế tiếp)"""
+        self.fps = fps
+
+    def publish(self, frame):
+        """
+        Đưa frame mới nhất cho UI (gọi từ luồng mô phỏng, không chặn)
+
+        Frame phải là dữ liệu không bị sửa sau khi publish (bản sao).
+
+        Args:
+            frame: Dữ liệu cần vẽ
+        """
+        with self._lock:
+            self._frame = frame
+            self._frame_id += 1
+            self.frames_published += 1
+
+    def start(self):
+        """Bắt đầu vòng lặp vẽ (gọi trên luồng UI)"""
+        if self._after_id is None:
+            self._after_id = self.widget.after(self.interval_ms, self._tick)
+
+    def stop(self):
+        """Dừng vòng lặp vẽ (gọi trên luồng UI)"""
+        if self._after_id is not None:
+            try:
+                self.widget.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def render_now(self):
+        """Vẽ ngay frame mới nhất nếu chưa vẽ (gọi trên luồng UI)"""
+        with self._lock:
+            frame = self._frame
+            frame_id = self._frame_id
+        if frame is None or frame_id == self._rendered_id:
+            return
+        self._rendered_id = frame_id
+        self.frames_rendered += 1
+        try:
+            self.render_callback(frame)
+        except Exception as e:
+            print(f"⚠️ Lỗi khi vẽ frame: {e}")
+
+    def _tick(self):
+        """Một nhịp vẽ: vẽ frame mới nhất rồi đặt lịch nhịp kế tiếp"""
+        self.render_now()
+        self._after_id = self.widget.after(self.interval_ms, self._tick)
@@ -0,0 +1,643 @@
+"""
+Batch Runner - Chạy thí nghiệm hàng loạt không giao diện (headless)
+
+Chạy N kịch bản × M seed song song trên nhiều tiến trình. Mỗi tiến trình mở
+một kết nối TraCI riêng (traci.start(..., label=...)) với `sumo` (không GUI),
+không sleep giữa các step, và trả về đúng 1 dòng KPI cho mỗi lần chạy.
+
+Kịch bản hỗ trợ:
+    FIXED     - Mặc định: đèn Fixed-Time + xe ưu tiên ngẫu nhiên mỗi 200s
+    ADAPTIVE  - Thông minh: Adaptive + Priority Controller, xe ưu tiên mỗi 200s
+    SC1..SC6  - Thông minh + kịch bản xe ưu tiên tương ứng trên Dashboard
+
+KPI chuyến đi (delay, thời gian chờ, số lần dừng) lấy từ --tripinfo-output của
+SUMO nên không tốn thêm lệnh TraCI nào trong vòng lặp mô phỏng. Xe ưu tiên của
+kịch bản được biên dịch sẵn thành route file (simulation.scenarios) nên SUMO
+tự chèn xe thay vì traci.vehicle.add.
+
+Sử dụng:
+    python src/simulation/batch_runner.py --scenarios FIXED ADAPTIVE SC1 \\
+        --seeds 1 2 3 --steps 3600 --workers 8 --output results/batch.csv
+
+    # Quét tham số AdaptiveController
+    python src/simulation/batch_runner.py --scenarios ADAPTIVE --seeds 1 2 \\
+        --param T_MIN_GREEN=12 --param ALPHA=0.7
+"""
+
+import argparse
+import contextlib
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+# ==================== PATH SETUP ====================
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+SRC_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+import traci
+
+from simulation.sumo_connector import khoi_dong_sumo, dung_sumo, dieu_chinh_tat_ca_den, lay_ket_noi
+from simulation.sensor_manager import SensorManager
+from simulation.step_snapshot import get_step_snapshot
+from simulation.simulation_driver import SimulationDriver
+from simulation.scenarios import ScenarioRunner, build_route_args
+from simulation.kpi_recorder import KPIRecorder, controller_columns, controller_schema
+from simulation.network_index import get_network_index
+from utils.logger import LEVEL_ENV, flush_logging, muted_logging, setup_logging
+from utils.profiler import get_profiler
+from utils.traci_monitor import get_traci_monitor
+from utils.traci_replay import ReplayConnection, TraCIRecorder, load_trace
+from controllers.adaptive_controller import AdaptiveController
+from controllers.priority_controller import PriorityController
+
+
+DEFAULT_CONFIG = os.path.join(PROJECT_ROOT, 'data', 'sumo', 'test2.sumocfg')
+
+# Thời gian Fixed-Time mặc định (giống Dashboard)
+DEFAULT_FIXED_TIMING = {'xanh_chung': 30, 'vang_chung': 3, 'do_toan_phan': 3}
+
+# Định nghĩa kịch bản: chế độ đèn + kịch bản xe ưu tiên (xem simulation.scenarios.SCENARIO_SPECS)
+SCENARIOS = {
+    "FIXED": {"ten": "Mặc định (Fixed-Time)", "mode": "fixed", "kich_ban": "DEFAULT"},
+    "ADAPTIVE": {"ten": "Thông minh (Adaptive)", "mode": "adaptive", "kich_ban": "DEFAULT"},
+    "SC1": {"ten": "SC1 - Xe ưu tiên từ hướng chính", "mode": "adaptive", "kich_ban": "SC1"},
+    "SC2": {"ten": "SC2 - Xe ưu tiên từ hướng nhánh", "mode": "adaptive", "kich_ban": "SC2"},
+    "SC3": {"ten": "SC3 - Nhiều xe ưu tiên từ 2 hướng đối diện", "mode": "adaptive", "kich_ban": "SC3"},
+    "SC4": {"ten": "SC4 - Báo giả", "mode": "adaptive", "kich_ban": "SC4"},
+    "SC5": {"ten": "SC5 - Xe ưu tiên bị kẹt", "mode": "adaptive", "kich_ban": "SC5"},
+    "SC6": {"ten": "SC6 - Nhiều xe ưu tiên liên tiếp", "mode": "adaptive", "kich_ban": "SC6"},
+}
+
+
+def doc_tripinfo(tripinfo_path: str, sim_time: float) -> Dict:
+    """
+    Tính KPI chuyến đi từ file tripinfo của SUMO
+
+    Args:
+        tripinfo_path: File --tripinfo-output
+        sim_time: Thời gian mô phỏng đã chạy (giây)
+
+    Returns:
+        Dict KPI: trips, avg_delay, avg_waiting, max_waiting, avg_stops, throughput
+    """
+    trips = 0
+    total_delay = 0.0
+    total_waiting = 0.0
+    max_waiting = 0.0
+    total_stops = 0
+
+    try:
+        for _, elem in ET.iterparse(tripinfo_path):
+            if elem.tag != "tripinfo":
+                continue
+            waiting = float(elem.get("waitingTime", 0))
+            trips += 1
+            total_delay += float(elem.get("timeLoss", 0))
+            total_waiting += waiting
+            max_waiting = max(max_waiting, waiting)
+            total_stops += int(elem.get("waitingCount", 0))
+            elem.clear()
+    except (OSError, ET.ParseError) as e:
+        print(f"⚠ Không đọc được tripinfo {tripinfo_path}: {e}")
+
+    return {
+        "trips_completed": trips,
+        "avg_delay": round(total_delay / trips, 2) if trips else 0.0,
+        "avg_waiting": round(total_waiting / trips, 2) if trips else 0.0,
+        "max_waiting": round(max_waiting, 1),
+        "avg_stops": round(total_stops / trips, 2) if trips else 0.0,
+        "throughput": int(trips / (sim_time / 3600.0)) if sim_time > 0 else 0,
+    }
+
+
+# Kiểu của các tham số AdaptiveController có thể ghi đè bằng --param (tính 1 lần)
+_param_types: Optional[Dict[str, type]] = None
+
+
+def tham_so_dieu_khien() -> Dict[str, type]:
+    """
+    Tham số AdaptiveController ghi đè được: thuộc tính số viết hoa của controller mặc định
+
+    Returns:
+        Dict {tên tham số: kiểu (int/float)}, vd {"T_MIN_GREEN": float}
+    """
+    global _param_types
+    if _param_types is None:
+        ctrl = AdaptiveController()
+        _param_types = {name: type(value) for name, value in vars(ctrl).items()
+                        if name.isupper() and isinstance(value, (int, float)) and not isinstance(value, bool)}
+    return _param_types
+
+
+def kiem_tra_params(params: Optional[Dict]) -> Dict:
+    """
+    Kiểm tra tên tham số và chuyển giá trị về đúng kiểu của thuộc tính gốc
+
+    Args:
+        params: {tên: giá trị} cần ghi đè lên AdaptiveController
+
+    Returns:
+        Dict {tên: giá trị đã chuyển kiểu}
+
+    Raises:
+        ValueError: Nếu tên không phải tham số của AdaptiveController hoặc giá trị sai kiểu
+    """
+    types = tham_so_dieu_khien()
+    checked = {}
+    for name, value in (params or {}).items():
+        if name not in types:
+            raise ValueError(f"AdaptiveController không có tham số {name} "
+                             f"(hợp lệ: {', '.join(sorted(types))})")
+        try:
+            checked[name] = types[name](value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Giá trị không hợp lệ cho {name}: {value!r} "
+                             f"(cần kiểu {types[name].__name__})") from None
+    return checked
+
+
+def _khoi_tao_dieu_khien(conn, scenario_key: str, seed: int, steps: int,
+                         fixed_timing: Optional[Dict] = None,
+                         params: Optional[Dict[str, float]] = None,
+                         config_path: str = DEFAULT_CONFIG) -> Dict:
+    """
+    Tạo SensorManager, controllers và bộ thực thi kịch bản cho 1 kết nối
+
+    Dùng chung cho lần chạy với SUMO thật và lần phát lại trace, nên thứ tự
+    lời gọi TraCI của hai bên giống hệt nhau.
+
+    Returns:
+        {"driver", "spawner", "controllers", "priority_controllers"}
+    """
+    scenario = SCENARIOS[scenario_key]
+    params = kiem_tra_params(params)
+    network_index = get_network_index(config_path)
+    sensor_manager = SensorManager(connection=conn, network_index=network_index)
+    sensor_manager.discover_detectors()
+
+    controllers = {}
+    priority_controllers = {}
+    tls_ids = conn.trafficlight.getIDList()
+
+    if scenario["mode"] == "fixed":
+        dieu_chinh_tat_ca_den(fixed_timing or DEFAULT_FIXED_TIMING, connection=conn)
+    else:
+        for tls_id in tls_ids:
+            ctrl = AdaptiveController(junction_id=tls_id, sensor_manager=sensor_manager,
+                                      connection=conn, network_index=network_index)
+            for name, value in params.items():
+                setattr(ctrl, name, value)
+            if ctrl.start():
+                controllers[tls_id] = ctrl
+        # Priority Controller cho ngã tư của 2 đèn đầu: đèn J1 → J1, đèn J3 → J4 (giống Dashboard)
+        for tls_id in tls_ids[:2]:
+            junction_id = network_index.junction_for_tls(tls_id)
+            priority_ctrl = PriorityController(junction_id=junction_id,
+                                               adaptive_controller=controllers.get(tls_id),
+                                               connection=conn, network_index=network_index)
+            if priority_ctrl.start():
+                priority_controllers[junction_id] = priority_ctrl
+
+    # Xe ưu tiên đã nạp từ route file; driver chỉ còn thực thi việc xóa xe báo giả (SC4)
+    driver = SimulationDriver(conn)
+    spawner = ScenarioRunner(scenario["kich_ban"], driver, seed=seed, preloaded=True, end_time=steps)
+    spawner.start(start_time=0.0)
+    return {"driver": driver, "spawner": spawner, "controllers": controllers,
+            "priority_controllers": priority_controllers}
+
+
+def _chay_vong_dieu_khien(loop: Dict, steps: int, kpi_recorder: Optional[KPIRecorder] = None,
+                         compute_pressure: bool = True) -> float:
+    """
+    Chạy vòng lặp mô phỏng + controllers
+
+    Args:
+        loop: Kết quả của _khoi_tao_dieu_khien()
+        steps: Số step
+        kpi_recorder: Ghi chuỗi KPI theo step (None = tắt)
+        compute_pressure: Chuỗi KPI được tính queue/áp lực (thêm lệnh TraCI) ở step
+                          controller không tính; False khi ghi/phát lại trace để
+                          chuỗi lệnh TraCI không phụ thuộc việc ghi chuỗi KPI
+
+    Returns:
+        Wall time (giây)
+    """
+    driver = loop["driver"]
+    controllers = list(loop["controllers"].values())
+    priority_controllers = list(loop["priority_controllers"].values())
+    wall_start = time.perf_counter()
+    for step in range(steps):
+        sim_time = driver.step()
+        for ctrl in controllers:
+            ctrl.step()
+        for priority_ctrl in priority_controllers:
+            priority_ctrl.step()
+        if kpi_recorder is not None and kpi_recorder.due(step):
+            row = {"step": step + 1, "time": sim_time}
+            row.update(controller_columns(loop["controllers"], loop["priority_controllers"],
+                                          compute_pressure=compute_pressure))
+            kpi_recorder.record(row)
+    return time.perf_counter() - wall_start
+
+
+def _thong_ke_dieu_khien(loop: Dict, steps: int, wall_time: float) -> Dict:
+    """Các cột KPI lấy từ controllers sau vòng lặp"""
+    cycle_times = [c.get_cycle_time() for c in loop["controllers"].values()]
+    preemptions = served = false_positives = clearance_count = 0
+    clearance_total = 0.0
+    for priority_ctrl in loop["priority_controllers"].values():
+        stats = priority_ctrl.get_statistics()
+        preemptions += stats.get('total_preemption_activations', 0)
+        served += stats.get('total_vehicles_served', 0)
+        false_positives += stats.get('false_positives_count', 0)
+        clearance_total += priority_ctrl.clearance_times.total
+        clearance_count += priority_ctrl.clearance_times.count
+
+    return {
+        "sim_time": get_step_snapshot(loop["driver"].connection).get_time(),
+        "wall_time": round(wall_time, 2),
+        "steps_per_sec": round(steps / wall_time, 1) if wall_time > 0 else 0.0,
+        "avg_cycle": round(sum(cycle_times) / len(cycle_times), 1) if cycle_times else 0.0,
+        "priority_spawned": len(loop["spawner"].spawned_ids),
+        "preemptions": preemptions,
+        "priority_served": served,
+        "false_positives": false_positives,
+        "avg_clearance": round(clearance_total / clearance_count, 2) if clearance_count else 0.0,
+    }
+
+
+def _mo_kpi_recorder(timeseries_path: str, every: int, config_path: str) -> KPIRecorder:
+    """Ghi chuỗi KPI với đủ cột của mọi đèn/ngã tư trong mạng ngay từ đầu file"""
+    columns = {"step": int, "time": float, **controller_schema(get_network_index(config_path))}
+    return KPIRecorder(timeseries_path, every=every, columns=columns)
+
+
+def _dong_kpi_recorder(kpi_recorder: Optional[KPIRecorder], row: Dict):
+    """Ghi nốt chuỗi KPI và báo lỗi ghi file (nếu có) vào cột error"""
+    if kpi_recorder is None:
+        return
+    kpi_recorder.close()
+    if kpi_recorder.error and not row["error"]:
+        row["error"] = f"KPI timeseries: {kpi_recorder.error}"
+
+
+def chay_mot_thi_nghiem(scenario_key: str, seed: int, steps: int = 3600,
+                        config_path: str = DEFAULT_CONFIG,
+                        fixed_timing: Optional[Dict] = None,
+                        params: Optional[Dict[str, float]] = None,
+                        log_dir: Optional[str] = None, profile: bool = False,
+                        traci_stats: Optional[int] = None, record_path: Optional[str] = None,
+                        timeseries_path: Optional[str] = None, timeseries_every: int = 1) -> Dict:
+    """
+    Chạy 1 thí nghiệm headless (chạy trong tiến trình con)
+
+    Args:
+        scenario_key: Mã kịch bản trong SCENARIOS
+        seed: Seed cho SUMO và bộ sinh xe ưu tiên
+        steps: Số step mô phỏng
+        config_path: File .sumocfg
+        fixed_timing: Thời gian Fixed-Time (kịch bản FIXED)
+        params: Ghi đè tham số AdaptiveController, vd {"T_MIN_GREEN": 12}
+        log_dir: Thư mục lưu log console của từng lần chạy (None = bỏ log)
+        profile: Đo thời gian từng giai đoạn của step (bảng tổng kết ghi vào log,
+                 Chrome trace ghi vào log_dir, cột stage_<giai đoạn>_ms)
+        traci_stats: Đếm lệnh TraCI theo phương thức, ghi log tóm tắt mỗi N step
+                     (0 = chỉ bảng cuối; None = tắt, trừ khi bật profile)
+        record_path: Ghi trace TraCI của lần chạy để phát lại (utils.traci_replay)
+        timeseries_path: Ghi chuỗi KPI theo step (.csv/.parquet, simulation.kpi_recorder)
+        timeseries_every: Ghi 1 dòng chuỗi KPI mỗi N step
+
+    Returns:
+        Dict 1 dòng KPI
+    """
+    scenario = SCENARIOS[scenario_key]
+    params = kiem_tra_params(params)
+    label = f"{scenario_key}_seed{seed}_{os.getpid()}"
+    row = {"scenario": scenario_key, "seed": seed, "steps": steps, "error": ""}
+    row.update({f"param_{k}": v for k, v in params.items()})
+
+    tmp_dir = tempfile.mkdtemp(prefix="batch_")
+    tripinfo_path = os.path.join(tmp_dir, "tripinfo.xml")
+
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        log_file = open(os.path.join(log_dir, f"{label}.log"), "w", encoding="utf-8")
+    else:
+        log_file = open(os.devnull, "w")
+
+    started = False
+    kpi_recorder = None
+    # Không lưu log → tắt log controllers (khỏi tạo bản ghi chỉ để ghi vào devnull)
+    quiet = contextlib.nullcontext() if log_dir else muted_logging()
+    with log_file, contextlib.redirect_stdout(log_file), quiet:
+        try:
+            # Lịch xe ưu tiên được biên dịch thành route file → SUMO tự chèn xe
+            route_args, _ = build_route_args(config_path, scenario["kich_ban"], seed, tmp_dir, end_time=steps)
+            started = khoi_dong_sumo(config_path, gui=False, label=label,
+                                     extra_args=["--seed", seed, "--tripinfo-output", tripinfo_path] + route_args)
+            if not started:
+                raise RuntimeError("Không thể khởi động SUMO")
+            conn = lay_ket_noi(label)
+            monitor = None
+            if profile or traci_stats is not None:
+                monitor = get_traci_monitor(conn, log_every=traci_stats or 0)
+            profiler = get_profiler()
+            if profile:
+                profiler.reset()
+                profiler.enable(trace=bool(log_dir), connection=conn)
+
+            recorder = None
+            if record_path:
+                recorder = TraCIRecorder(conn, meta={
+                    "scenario": scenario_key, "seed": seed, "steps": steps, "config": config_path,
+                    "fixed_timing": fixed_timing, "params": params})
+
+            if timeseries_path:
+                kpi_recorder = _mo_kpi_recorder(timeseries_path, timeseries_every, config_path)
+            loop = _khoi_tao_dieu_khien(conn, scenario_key, seed, steps, fixed_timing, params, config_path)
+            wall_time = _chay_vong_dieu_khien(loop, steps, kpi_recorder, compute_pressure=recorder is None)
+            row.update(_thong_ke_dieu_khien(loop, steps, wall_time))
+
+            if recorder is not None:
+                recorder.detach()
+                recorder.save(record_path)
+
+            if profile:
+                profiler.end_step()
+                print(profiler.format_summary())
+                stage_summary = profiler.summary()
+                if log_dir:
+                    profiler.write_chrome_trace(os.path.join(log_dir, f"{label}.trace.json"))
+
+            if monitor is not None:
+                print(monitor.format_stats())
+                traci_summary = monitor.stats()
+                row["traci_calls_per_step"] = round(traci_summary["commands_per_step"], 1)
+                row["traci_latency_ms_per_step"] = round(traci_summary["latency_ms_per_step"], 3)
+            if profile:
+                # Thời gian trung bình mỗi step của từng giai đoạn (ms)
+                for name, stats in stage_summary.items():
+                    row[f"stage_{name}_ms"] = round(stats["mean_ms"], 4)
+        except Exception as e:
+            row["error"] = str(e)
+        finally:
+            if profile:
+                get_profiler().disable()
+            if started:
+                dung_sumo(conn)
+            _dong_kpi_recorder(kpi_recorder, row)
+            flush_logging()  # Ghi hết log controllers vào file trước khi trả stdout
+
+    # tripinfo chỉ được ghi đầy đủ sau khi SUMO đóng
+    row.update(doc_tripinfo(tripinfo_path, row.get("sim_time", 0.0)))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return row
+
+
+def chay_replay(trace_path: str, profile: bool = False, strict: bool = True,
+                timeseries_path: Optional[str] = None, timeseries_every: int = 1) -> Dict:
+    """
+    Phát lại trace TraCI đã ghi (không cần SUMO) với đúng controllers của lần ghi
+
+    Controllers nhận đầu vào y hệt lần chạy thật nên wall time chỉ còn chi phí
+    Python của logic điều khiển (SensorManager, StepSnapshot, Adaptive/Priority).
+
+    Args:
+        trace_path: File trace ghi bởi chay_mot_thi_nghiem(record_path=...)
+        profile: Đo thời gian từng giai đoạn của step (cột stage_<giai đoạn>_ms)
+        strict: Kiểm tra tham số từng lời gọi TraCI so với trace
+        timeseries_path: Ghi chuỗi KPI controllers theo step (.csv/.parquet)
+        timeseries_every: Ghi 1 dòng chuỗi KPI mỗi N step
+
+    Returns:
+        Dict 1 dòng KPI (cột controllers giống lần ghi nếu logic không đổi)
+    """
+    trace = load_trace(trace_path)
+    meta = trace["meta"]
+    steps = meta["steps"]
+    row = {"scenario": meta["scenario"], "seed": meta["seed"], "steps": steps, "error": "",
+           "backend": "replay"}
+    row.update({f"param_{k}": v for k, v in (meta.get("params") or {}).items()})
+
+    conn = ReplayConnection(trace, strict=strict)
+    profiler = get_profiler()
+    kpi_recorder = None
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), muted_logging():
+        try:
+            if profile:
+                profiler.reset()
+                profiler.enable()
+            # Mạng của lần ghi (nếu file còn tồn tại) để controllers đọc cùng edge/detector
+            config_path = meta.get("config")
+            if not config_path or not os.path.exists(config_path):
+                config_path = DEFAULT_CONFIG
+            if timeseries_path:
+                kpi_recorder = _mo_kpi_recorder(timeseries_path, timeseries_every, config_path)
+            loop = _khoi_tao_dieu_khien(conn, meta["scenario"], meta["seed"], steps,
+                                        meta.get("fixed_timing"), meta.get("params"), config_path)
+            wall_time = _chay_vong_dieu_khien(loop, steps, kpi_recorder, compute_pressure=False)
+            row.update(_thong_ke_dieu_khien(loop, steps, wall_time))
+            row["replay_calls_per_step"] = round(conn.calls / steps, 1) if steps else 0.0
+            if profile:
+                profiler.end_step()
+                for name, stats in profiler.summary().items():
+                    row[f"stage_{name}_ms"] = round(stats["mean_ms"], 4)
+        except Exception as e:
+            row["error"] = str(e)
+        finally:
+            if profile:
+                profiler.disable()
+            conn.close()
+            _dong_kpi_recorder(kpi_recorder, row)
+            flush_logging()
+    return row
+
+
+def chay_hang_loat(scenarios: List[str], seeds: List[int], steps: int = 3600,
+                   workers: Optional[int] = None, output_path: str = "batch_results.csv",
+                   config_path: str = DEFAULT_CONFIG, fixed_timing: Optional[Dict] = None,
+                   params: Optional[Dict[str, float]] = None,
+                   log_dir: Optional[str] = None, profile: bool = False,
+                   traci_stats: Optional[int] = None,
+                   record_dir: Optional[str] = None,
+                   timeseries_dir: Optional[str] = None, timeseries_every: int = 1,
+                   timeseries_format: str = "csv") -> List[Dict]:
+    """
+    Chạy tất cả tổ hợp kịch bản × seed song song và ghi kết quả ra CSV
+
+    Args:
+        scenarios: Danh sách mã kịch bản
+        seeds: Danh sách seed
+        steps: Số step mỗi lần chạy
+        workers: Số tiến trình song song (None = số CPU)
+        output_path: File CSV kết quả
+        profile: Bật profiler theo step cho từng lần chạy
+        traci_stats: Đếm lệnh TraCI theo phương thức (log mỗi N step, None = tắt)
+        record_dir: Ghi trace TraCI của từng lần chạy vào thư mục này (để phát lại)
+        timeseries_dir: Ghi chuỗi KPI theo step của từng lần chạy vào thư mục này
+        timeseries_every: Ghi 1 dòng chuỗi KPI mỗi N step
+        timeseries_format: "csv" hoặc "parquet"
+
+    Returns:
+        List các dòng KPI (đã sắp xếp theo kịch bản, seed)
+    """
+    params = kiem_tra_params(params)  # Tham số sai → báo lỗi trước khi chạy bất kỳ thí nghiệm nào
+    tasks = [(scenario, seed) for scenario in scenarios for seed in seeds]
+    if record_dir:
+        os.makedirs(record_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    print(f"🚀 Chạy {len(tasks)} thí nghiệm ({len(scenarios)} kịch bản × {len(seeds)} seed) "
+          f"trên {workers} tiến trình...")
+
+    rows = []
+    batch_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(chay_mot_thi_nghiem, scenario, seed, steps, config_path,
+                            fixed_timing, params, log_dir, profile, traci_stats,
+                            trace_path(record_dir, scenario, seed, steps) if record_dir else None,
+                            timeseries_path(timeseries_dir, scenario, seed, steps, timeseries_format)
+                            if timeseries_dir else None,
+                            timeseries_every): (scenario, seed)
+            for scenario, seed in tasks
+        }
+        for future in as_completed(futures):
+            scenario, seed = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                row = {"scenario": scenario, "seed": seed, "steps": steps, "error": str(e)}
+            rows.append(row)
+
+            if row.get("error"):
+                print(f"❌ [{len(rows)}/{len(tasks)}] {scenario} seed={seed}: {row['error']}")
+            else:
+                print(f"✅ [{len(rows)}/{len(tasks)}] {scenario} seed={seed}: "
+                      f"delay={row['avg_delay']}s, chờ max={row['max_waiting']}s, "
+                      f"{row['steps_per_sec']} step/s")
+
+    rows.sort(key=lambda r: (r["scenario"], r["seed"]))
+    ghi_csv(rows, output_path)
+    print(f"📊 Đã ghi {len(rows)} dòng KPI vào {output_path} "
+          f"({time.perf_counter() - batch_start:.1f}s)")
+    return rows
+
+
+def trace_path(record_dir: str, scenario_key: str, seed: int, steps: int) -> str:
+    """Đường dẫn file trace TraCI của 1 lần chạy"""
+    return os.path.join(record_dir, f"{scenario_key}_seed{seed}_{steps}.traci.gz")
+
+
+def timeseries_path(timeseries_dir: str, scenario_key: str, seed: int, steps: int,
+                    fmt: str = "csv") -> str:
+    """Đường dẫn file chuỗi KPI theo step của 1 lần chạy"""
+    return os.path.join(timeseries_dir, f"{scenario_key}_seed{seed}_{steps}.kpi.{fmt}")
+
+
+def ghi_csv(rows: List[Dict], output_path: str):
+    """Ghi các dòng KPI ra file CSV (gộp tất cả cột xuất hiện)"""
+    fieldnames = []
+    for row in rows:
+        for key in row:
+            if key not in fieldnames:
+                fieldnames.append(key)
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _parse_param(item: str) -> Tuple[str, float]:
+    """argparse type cho --param: "T_MIN_GREEN=12" → ("T_MIN_GREEN", 12.0)"""
+    name, _, value = item.partition("=")
+    name, value = name.strip(), value.strip()
+    if not name or not value:
+        raise argparse.ArgumentTypeError(f"Tham số không hợp lệ: {item} (định dạng TEN=GIA_TRI)")
+    try:
+        return name, kiem_tra_params({name: value})[name]
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy thí nghiệm hàng loạt không giao diện")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS.keys()),
+                        choices=list(SCENARIOS.keys()), help="Các kịch bản cần chạy")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[1], help="Các seed ngẫu nhiên")
+    parser.add_argument("--steps", type=int, default=3600, help="Số step mỗi lần chạy")
+    parser.add_argument("--workers", type=int, default=None, help="Số tiến trình (mặc định = số CPU)")
+    parser.add_argument("--output", default="batch_results.csv", help="File CSV kết quả")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="File .sumocfg")
+    parser.add_argument("--green", type=int, default=DEFAULT_FIXED_TIMING['xanh_chung'])
+    parser.add_argument("--yellow", type=int, default=DEFAULT_FIXED_TIMING['vang_chung'])
+    parser.add_argument("--red", type=int, default=DEFAULT_FIXED_TIMING['do_toan_phan'])
+    parser.add_argument("--param", action="append", default=[], type=_parse_param,
+                        help="Ghi đè tham số AdaptiveController, vd: --param T_MIN_GREEN=12")
+    parser.add_argument("--log-dir", default=None, help="Lưu log console của từng lần chạy")
+    parser.add_argument("--profile", action="store_true",
+                        help="Đo thời gian từng giai đoạn của step (bảng + Chrome trace trong --log-dir)")
+    parser.add_argument("--traci-stats", type=int, default=None, metavar="N",
+                        help="Đếm lệnh TraCI theo phương thức, ghi log mỗi N step (0 = chỉ bảng cuối)")
+    parser.add_argument("--record-dir", default=None,
+                        help="Ghi trace TraCI của từng lần chạy để phát lại bằng --replay")
+    parser.add_argument("--replay", nargs="+", default=None, metavar="TRACE",
+                        help="Phát lại các trace đã ghi (không cần SUMO) thay vì chạy thí nghiệm")
+    parser.add_argument("--timeseries-dir", default=None,
+                        help="Ghi chuỗi KPI theo step (pha, queue, áp lực, trạng thái ưu tiên) của từng lần chạy")
+    parser.add_argument("--timeseries-every", type=int, default=1, metavar="N",
+                        help="Ghi 1 dòng chuỗi KPI mỗi N step")
+    parser.add_argument("--timeseries-format", default="csv", choices=["csv", "parquet"],
+                        help="Định dạng chuỗi KPI (parquet cần pyarrow)")
+    parser.add_argument("--log-level", default=None, choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Cấp độ log của controllers trong --log-dir (mặc định INFO, DEBUG = trace mỗi step)")
+    args = parser.parse_args()
+    if args.log_level:
+        os.environ[LEVEL_ENV] = args.log_level  # Tiến trình con đọc lại khi cấu hình logger
+        setup_logging(args.log_level)
+
+    if args.replay:
+        rows = []
+        if args.timeseries_dir:
+            os.makedirs(args.timeseries_dir, exist_ok=True)
+        for path in args.replay:
+            series_path = None
+            if args.timeseries_dir:
+                name = os.path.basename(path).split(".traci")[0]
+                series_path = os.path.join(args.timeseries_dir, f"{name}.kpi.{args.timeseries_format}")
+            row = chay_replay(path, profile=args.profile, timeseries_path=series_path,
+                              timeseries_every=args.timeseries_every)
+            rows.append(row)
+            if row["error"]:
+                print(f"❌ {path}: {row['error']}")
+            else:
+                print(f"✅ {path}: {row['steps_per_sec']} step/s, preemptions={row['preemptions']}, "
+                      f"avg_cycle={row['avg_cycle']}s")
+        ghi_csv(rows, args.output)
+        print(f"📊 Đã ghi {len(rows)} dòng vào {args.output}")
+        return
+
+    fixed_timing = {'xanh_chung': args.green, 'vang_chung': args.yellow, 'do_toan_phan': args.red}
+    chay_hang_loat(args.scenarios, args.seeds, steps=args.steps, workers=args.workers,
+                   output_path=args.output, config_path=args.config, fixed_timing=fixed_timing,
+                   params=dict(args.param), log_dir=args.log_dir, profile=args.profile,
+                   traci_stats=args.traci_stats, record_dir=args.record_dir,
+                   timeseries_dir=args.timeseries_dir, timeseries_every=args.timeseries_every,
+                   timeseries_format=args.timeseries_format)
+
+
+if __name__ == "__main__":
+    main()
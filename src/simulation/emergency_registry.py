@@ -0,0 +1,148 @@
+"""
+Emergency Registry - Danh sách xe ưu tiên đang có trong mạng, cập nhật tăng dần
+
+Thay vì mỗi PriorityController duyệt toàn bộ getIDList() và hỏi type/class của
+từng xe mỗi step, registry chỉ phân loại các xe vừa vào mạng (departed) đúng 1
+lần, lưu lại những xe ưu tiên. Xe đã rời mạng (kể cả bị xóa bằng
+traci.vehicle.remove - không có trong arrived list) được loại ra khi lấy danh
+sách bằng cách đối chiếu với tập ID xe của snapshot.
+
+Mỗi kết nối TraCI có 1 registry dùng chung cho mọi controller.
+
+Sử dụng:
+    registry = get_emergency_registry()
+    for vehicle_id in registry.vehicle_ids():
+        ...
+"""
+
+import traci
+from typing import Dict, FrozenSet, Iterable, Tuple
+
+from simulation.step_snapshot import StepSnapshot, get_step_snapshot
+
+
+# Từ khóa nhận diện xe ưu tiên trong type ID hoặc vehicle class
+EMERGENCY_VEHICLE_TYPES = frozenset({
+    'priority',         # typeID="priority" trong route file
+    'ambulance',        # typeID="ambulance"
+    'emergency',        # vClass="emergency" trong SUMO
+    'fire',             # xe cứu hỏa
+    'police',           # xe cảnh sát
+    'cứu_thương',       # tiếng Việt
+    'cứu_hỏa',          # tiếng Việt
+    'cảnh_sát'          # tiếng Việt
+})
+
+
+class _RegistryStepListener(traci.StepListener):
+    """StepListener phân loại xe vừa vào mạng sau mỗi simulationStep()"""
+
+    def __init__(self, registry: 'EmergencyRegistry'):
+        self.registry = registry
+
+    def step(self, t=0):
+        self.registry.update()
+        return True  # Giữ listener cho các step tiếp theo
+
+
+class EmergencyRegistry:
+    """
+    Tập xe ưu tiên {vehicle_id: type ID} của một kết nối TraCI
+    """
+
+    def __init__(self, connection=None, emergency_types: Iterable[str] = EMERGENCY_VEHICLE_TYPES):
+        """
+        Khởi tạo registry: phân loại các xe đang có trong mạng 1 lần, sau đó
+        chỉ phân loại xe mới vào qua StepListener
+
+        Args:
+            connection: SumoConnection/Connection (None = kết nối đang active)
+            emergency_types: Từ khóa nhận diện xe ưu tiên (so khớp chuỗi con, chữ thường)
+        """
+        # Snapshot được tạo trước → StepListener của snapshot chạy trước listener của registry
+        self.snapshot: StepSnapshot = get_step_snapshot(connection)
+        self.emergency_types = tuple(t.lower() for t in emergency_types)
+        self.vehicles: Dict[str, str] = {}
+        self.classified_count = 0  # Số xe đã phân loại (mỗi xe 1 lần)
+
+        for vehicle_id in self.snapshot.vehicle_ids():
+            self._classify(vehicle_id)
+        self._listener_id = self.snapshot.connection.addStepListener(_RegistryStepListener(self))
+
+    def detach(self):
+        """Gỡ StepListener khỏi kết nối TraCI"""
+        if self._listener_id is not None:
+            try:
+                self.snapshot.connection.removeStepListener(self._listener_id)
+            except Exception:
+                pass
+        self._listener_id = None
+
+    def update(self):
+        """Phân loại các xe vừa vào mạng trong step hiện tại (gọi bởi StepListener)"""
+        try:
+            for vehicle_id in self.snapshot.departed_ids():
+                self._classify(vehicle_id)
+        except Exception as e:
+            print(f"⚠️ Lỗi khi cập nhật danh sách xe ưu tiên: {e}")
+
+    def _classify(self, vehicle_id: str):
+        """Thêm xe vào registry nếu type ID hoặc vehicle class là xe ưu tiên"""
+        try:
+            veh_type = self.snapshot.vehicle_type(vehicle_id)
+            veh_class = self.snapshot.vehicle_class(vehicle_id).lower()
+        except traci.exceptions.TraCIException:
+            return  # Xe đã rời mạng
+        self.classified_count += 1
+        type_lower = veh_type.lower()
+        if any(t in type_lower or t in veh_class for t in self.emergency_types):
+            self.vehicles[vehicle_id] = veh_type
+
+    def vehicle_ids(self) -> Tuple[str, ...]:
+        """
+        ID các xe ưu tiên còn trong mạng (xe đã rời mạng bị loại khỏi registry)
+
+        Returns:
+            Tuple vehicle ID, sắp xếp như traci.vehicle.getIDList()
+        """
+        if not self.vehicles:
+            return ()
+        has_vehicle = self.snapshot.has_vehicle
+        gone = [vid for vid in self.vehicles if not has_vehicle(vid)]
+        for vid in gone:
+            del self.vehicles[vid]
+        return tuple(sorted(self.vehicles))
+
+    def __contains__(self, vehicle_id: str) -> bool:
+        return vehicle_id in self.vehicles
+
+    def __len__(self) -> int:
+        return len(self.vehicles)
+
+
+# Mỗi kết nối TraCI + bộ từ khóa có đúng 1 registry {(Connection, types): EmergencyRegistry}
+_registries: Dict[Tuple[object, FrozenSet[str]], EmergencyRegistry] = {}
+
+
+def get_emergency_registry(connection=None,
+                           emergency_types: Iterable[str] = EMERGENCY_VEHICLE_TYPES) -> EmergencyRegistry:
+    """
+    Lấy registry xe ưu tiên dùng chung của một kết nối TraCI
+
+    Args:
+        connection: SumoConnection/Connection (None = kết nối đang active)
+        emergency_types: Từ khóa nhận diện xe ưu tiên
+
+    Returns:
+        EmergencyRegistry dùng chung
+    """
+    raw = get_step_snapshot(connection).connection
+    key = (raw, frozenset(emergency_types))
+    registry = _registries.get(key)
+    if registry is None:
+        # Bỏ registry của các kết nối đã đóng
+        for old_key in [k for k in _registries if getattr(k[0], "_socket", None) is None]:
+            del _registries[old_key]
+        registry = EmergencyRegistry(connection, emergency_types)
+        _registries[key] = registry
+    return registry
@@ -0,0 +1,143 @@
+"""
+Free-Flow Index - Bảng tra thời gian di chuyển lý tưởng (không dừng) theo route
+
+freeFlowTime(route) = Σ lane_length / lane_max_speed (lane 0 của mỗi edge)
+
+Mạng lưới (test2.net.xml) và các route khai báo sẵn (r0...r27 trong
+test2.rou.xml) không thay đổi khi mô phỏng, nên bảng được dựng 1 lần lúc khởi
+động bằng sumolib. Route chưa có trong bảng (vd: route thêm động bằng TraCI)
+được tính 1 lần qua TraCI rồi lưu lại.
+
+Sử dụng:
+    index = FreeFlowIndex("data/sumo/test2.sumocfg")
+    free_flow = index.route_time("r0")
+"""
+
+import os
+import traci
+import sumolib
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List
+
+
+class FreeFlowIndex:
+    """
+    Bảng tra {edge_id: free-flow time} và {route_id: free-flow time}
+    """
+
+    def __init__(self, config_path: str = None, connection=None):
+        """
+        Args:
+            config_path: Đường dẫn file .sumocfg (None = chỉ tra cứu qua TraCI khi cần)
+            connection: Kết nối SUMO (SumoConnection), None = kết nối mặc định toàn cục
+        """
+        self.connection = connection
+        self.traci = traci if connection is None else connection
+        self.edge_times: Dict[str, float] = {}   # {edge_id: lane_length / lane_max_speed}
+        self.route_times: Dict[str, float] = {}  # {route_id: free-flow time}
+        self.traci_lookups = 0                   # Số route phải tra qua TraCI
+
+        if config_path:
+            self.build_from_config(config_path)
+
+    def build_from_config(self, config_path: str) -> int:
+        """
+        Dựng bảng từ net-file và route-files khai báo trong file .sumocfg
+
+        Args:
+            config_path: Đường dẫn file .sumocfg
+
+        Returns:
+            Số route đã được đưa vào bảng
+        """
+        try:
+            base_dir = os.path.dirname(os.path.abspath(config_path))
+            inputs = ET.parse(config_path).getroot().find("input")
+            if inputs is None:
+                return 0
+
+            net_file = inputs.find("net-file")
+            if net_file is not None:
+                self.load_net(os.path.join(base_dir, net_file.get("value")))
+
+            route_files = inputs.find("route-files")
+            if route_files is not None:
+                for route_file in route_files.get("value").split(","):
+                    self.load_routes(os.path.join(base_dir, route_file.strip()))
+
+            print(f"✅ Free-flow index: {len(self.edge_times)} edges, {len(self.route_times)} routes")
+        except Exception as e:
+            print(f"⚠️ Không thể dựng free-flow index từ {config_path}: {e}")
+        return len(self.route_times)
+
+    def load_net(self, net_file: str):
+        """
+        Đọc free-flow time của mọi edge từ file .net.xml
+
+        Args:
+            net_file: Đường dẫn file .net.xml
+        """
+        net = sumolib.net.readNet(net_file)
+        for edge in net.getEdges():
+            lane = edge.getLanes()[0]  # Giống cách tính cũ: lane 0
+            max_speed = lane.getSpeed()
+            self.edge_times[edge.getID()] = lane.getLength() / max_speed if max_speed > 0 else 0.0
+
+    def load_routes(self, route_file: str):
+        """
+        Tính free-flow time của các route có ID trong file .rou.xml
+
+        Args:
+            route_file: Đường dẫn file .rou.xml
+        """
+        for _, element in ET.iterparse(route_file):
+            if element.tag == "route" and element.get("id"):
+                self.route_times[element.get("id")] = self.edges_time(element.get("edges", "").split())
+            element.clear()
+
+    def edges_time(self, edges: Iterable[str]) -> float:
+        """
+        Tổng free-flow time của một dãy edge
+
+        Args:
+            edges: Danh sách edge ID
+
+        Returns:
+            freeFlowTime (giây)
+        """
+        free_flow = 0.0
+        for edge_id in edges:
+            edge_time = self.edge_times.get(edge_id)
+            if edge_time is None:
+                edge_time = self._edge_time_from_traci(edge_id)
+            free_flow += edge_time
+        return free_flow
+
+    def route_time(self, route_id: str) -> float:
+        """
+        Free-flow time của một route (tra bảng, tính qua TraCI nếu chưa có)
+
+        Args:
+            route_id: Route ID của xe
+
+        Returns:
+            freeFlowTime (giây)
+        """
+        free_flow = self.route_times.get(route_id)
+        if free_flow is None:
+            self.traci_lookups += 1
+            edges: List[str] = list(self.traci.route.getEdges(route_id))
+            free_flow = self.edges_time(edges)
+            self.route_times[route_id] = free_flow
+        return free_flow
+
+    def _edge_time_from_traci(self, edge_id: str) -> float:
+        """Free-flow time của edge không có trong net-file (đọc lane 0 qua TraCI)"""
+        try:
+            edge_length = self.traci.lane.getLength(f"{edge_id}_0")
+            max_speed = self.traci.lane.getMaxSpeed(f"{edge_id}_0")
+            edge_time = edge_length / max_speed if max_speed > 0 else 0.0
+        except Exception:
+            edge_time = 0.0
+        self.edge_times[edge_id] = edge_time
+        return edge_time
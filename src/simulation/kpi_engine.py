@@ -0,0 +1,166 @@
+"""
+KPI Engine - Tính KPI toàn mạng của một step bằng NumPy
+
+Thu thập thuộc tính của mọi xe (route, departure, waiting time, speed, vType,
+edge) từ vehicle subscription của StepSnapshot vào các mảng NumPy, sau đó tính
+độ trễ, số lần dừng, hàng chờ PCU, thời gian chờ tối đa và thời gian chờ theo
+ngã tư bằng các phép rút gọn vector thay vì vòng lặp gọi TraCI cho từng xe.
+Thời gian chờ theo ngã tư tính trên xe ở các edge VÀO mỗi ngã tư (tra cứu
+NetworkIndex theo edge, cache mỗi edge 1 lần).
+
+Sử dụng:
+    kpi_engine = KPIEngine()
+    kpi = kpi_engine.compute()
+    print(kpi["avg_delay"], kpi["max_waiting"])
+"""
+
+import traci
+import traci.constants as tc
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from simulation.step_snapshot import get_step_snapshot
+from simulation.free_flow_index import FreeFlowIndex
+from simulation.network_index import NetworkIndex, get_network_index
+
+
+class KPIEngine:
+    """
+    Bộ tính KPI theo step cho Dashboard
+
+    Trạng thái duy nhất giữ qua các step là vận tốc step trước và số lần dừng
+    của từng xe (để phát hiện sự kiện dừng).
+    """
+
+    # Biến subscribe cho mỗi xe (gộp với biến mặc định của StepSnapshot)
+    SUBSCRIPTION_VARS = (
+        tc.VAR_ROUTE_ID,
+        tc.VAR_DEPARTURE,
+        tc.VAR_WAITING_TIME,
+        tc.VAR_SPEED,
+        tc.VAR_TYPE,
+        tc.VAR_ROAD_ID,
+    )
+
+    # PCU conversion factors (Việt Nam standard)
+    PCU_FACTORS = {
+        "motorcycle": 0.3,
+        "car": 1.0,
+        "bus": 1.5,
+        "truck": 1.5,
+        "emergency": 1.0
+    }
+
+    STOP_SPEED = 0.1  # m/s - dưới ngưỡng này xe được coi là đang dừng
+
+    def __init__(self, connection=None, free_flow_index: FreeFlowIndex = None,
+                 network_index: Optional[NetworkIndex] = None):
+        """
+        Args:
+            connection: Kết nối SUMO (SumoConnection), None = kết nối mặc định toàn cục
+            free_flow_index: Bảng tra free-flow time theo route (None = tự tra qua TraCI khi cần)
+            network_index: Chỉ mục ngã tư/hướng của mạng (None = mạng mặc định test2)
+        """
+        self.connection = connection
+        self.traci = traci if connection is None else connection
+        self.free_flow_index = free_flow_index or FreeFlowIndex(connection=connection)
+        self._last_speed: Dict[str, float] = {}   # {veh_id: vận tốc step trước}
+        self._stops: Dict[str, int] = {}          # {veh_id: số lần dừng}
+        # Thời gian chờ theo ngã tư: xe trên các edge VÀO mỗi ngã tư
+        self.network_index = network_index or get_network_index()
+        self.junction_ids = self.network_index.junction_ids()
+        self._junction_mask: Dict[str, Tuple[bool, ...]] = {}  # Cache {edge_id: (thuộc J1, thuộc J4)}
+
+    def reset(self):
+        """Xóa trạng thái theo dõi số lần dừng (khi bắt đầu mô phỏng mới)"""
+        self._last_speed.clear()
+        self._stops.clear()
+
+    def _junction_membership(self, edge_id: str) -> Tuple[bool, ...]:
+        """(thuộc J1, thuộc J4) của một edge, cache theo edge"""
+        mask = self._junction_mask.get(edge_id)
+        if mask is None:
+            location = self.network_index.incoming(edge_id)
+            junction_id = location[0] if location else None
+            mask = tuple(junction_id == j for j in self.junction_ids)
+            self._junction_mask[edge_id] = mask
+        return mask
+
+    def compute(self) -> Dict:
+        """
+        Tính KPI của step hiện tại
+
+        Returns:
+            Dict chứa: vehicle_count, vehicles_with_data, avg_delay, avg_stops,
+            total_waiting, max_waiting, total_pcu, queue_pcu,
+            junction_wait {junction_id: thời gian chờ TB}
+        """
+        snapshot = get_step_snapshot(self.connection)
+        snapshot.subscribe_vehicles(self.SUBSCRIPTION_VARS)
+        current_time = snapshot.get_time()
+        vehicle_ids = snapshot.vehicle_ids()
+
+        # ===== GOM DỮ LIỆU VÀO MẢNG =====
+        n = len(vehicle_ids)
+        speed = np.empty(n)
+        waiting = np.empty(n)
+        departure = np.empty(n)
+        free_flow = np.empty(n)
+        pcu = np.empty(n)
+        last_speed = np.empty(n)
+        stops = np.empty(n, dtype=np.int64)
+        junction_mask = np.zeros((n, len(self.junction_ids)), dtype=bool)
+        valid = np.zeros(n, dtype=bool)
+
+        pcu_factors = self.PCU_FACTORS
+        route_time = self.free_flow_index.route_time
+        for i, vid in enumerate(vehicle_ids):
+            try:
+                free_flow[i] = route_time(snapshot.vehicle_route_id(vid))
+                departure[i] = snapshot.vehicle_departure(vid)
+                waiting[i] = snapshot.vehicle_waiting_time(vid)
+                speed[i] = snapshot.vehicle_speed(vid)
+                pcu[i] = pcu_factors.get(snapshot.vehicle_type(vid), 1.0)
+                junction_mask[i] = self._junction_membership(snapshot.vehicle_road(vid))
+            except Exception:
+                continue
+            last_speed[i] = self._last_speed.get(vid, speed[i])
+            stops[i] = self._stops.get(vid, 0)
+            valid[i] = True
+
+        speed = speed[valid]
+        waiting = waiting[valid]
+        departure = departure[valid]
+        free_flow = free_flow[valid]
+        pcu = pcu[valid]
+        junction_mask = junction_mask[valid]
+        valid_ids = [vid for vid, ok in zip(vehicle_ids, valid) if ok]
+
+        # ===== SỐ LẦN DỪNG: speed > 0.1 → speed < 0.1 =====
+        stops = stops[valid] + ((last_speed[valid] > self.STOP_SPEED) & (speed < self.STOP_SPEED))
+        self._last_speed = dict(zip(valid_ids, speed.tolist()))
+        self._stops = dict(zip(valid_ids, stops.tolist()))
+
+        # ===== RÚT GỌN VECTOR =====
+        vehicles_with_data = len(valid_ids)
+        departed = departure >= 0  # Xe đã xuất phát
+        delay = np.maximum(0.0, current_time - departure - free_flow)
+        total_delay = float(delay[departed].sum())
+
+        junction_wait = {}
+        for j, junction_id in enumerate(self.junction_ids):
+            junction_waiting = waiting[junction_mask[:, j]]
+            junction_wait[junction_id] = float(junction_waiting.mean()) if junction_waiting.size else 0.0
+
+        return {
+            "time": current_time,
+            "vehicle_count": n,
+            "vehicles_with_data": vehicles_with_data,
+            "avg_delay": total_delay / vehicles_with_data if vehicles_with_data else 0.0,
+            "avg_stops": float(stops.sum()) / vehicles_with_data if vehicles_with_data else 0.0,
+            "total_waiting": float(waiting.sum()),
+            "max_waiting": float(waiting.max()) if vehicles_with_data else 0.0,
+            "total_pcu": float(pcu.sum()),
+            "queue_pcu": float(pcu[speed < self.STOP_SPEED].sum()),
+            "junction_wait": junction_wait
+        }
@@ -0,0 +1,321 @@
+"""
+KPI Recorder - Ghi chuỗi thời gian KPI theo step (CSV hoặc Parquet)
+
+Mỗi step (hoặc mỗi N step) ghi 1 dòng: KPI toàn mạng, số xe theo hướng, pha
+đèn, áp lực và trạng thái ưu tiên của từng controller. Dòng được gom theo lô
+trong bộ nhớ; mỗi lô đầy được một thread nền ghi xuống file nên vòng lặp mô
+phỏng không phải chờ I/O. Phân tích (vd: docs/PHAN_TICH_HIEU_QUA_*.md) chỉ cần
+load_timeseries() thay vì đọc lại log console.
+
+- File .csv: ghi bằng module csv (không cần thư viện ngoài)
+- File .parquet: cần pyarrow (pandas dùng cùng engine); nếu chưa cài thì
+  tự chuyển sang CSV cùng tên
+- Các cột cố định khi mở file: khai báo trước bằng `columns` (vd:
+  controller_schema(network_index) cho mọi đèn/ngã tư của mạng, kể cả khi
+  controller chưa chạy) hoặc lấy theo lô đầu tiên. Cột chưa khai báo xuất
+  hiện sau đó không ghi được → cảnh báo 1 lần cho mỗi cột
+
+Sử dụng:
+    columns = {"step": int, "time": float, **controller_schema(get_network_index())}
+    recorder = KPIRecorder("results/sc1_kpi.parquet", every=5, columns=columns)
+    for step in range(steps):
+        ...                                   # simulationStep + controllers
+        if recorder.due(step):
+            row = {"time": sim_time, **controller_columns(controllers, priority_controllers)}
+            recorder.record(row)
+    recorder.close()
+
+    df = load_timeseries("results/sc1_kpi.parquet")
+"""
+
+import csv
+import os
+import queue
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Set
+
+from simulation.network_index import DIRECTIONS, NetworkIndex
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+# KPI toàn mạng của Dashboard (global_kpi_data) → tên cột
+KPI_COLUMNS = {
+    "Tổng xe": "total_vehicles",
+    "Độ trễ TB": "avg_delay",
+    "Lưu lượng": "throughput",
+    "Hàng chờ TB": "avg_queue",
+    "Dừng TB": "avg_stops",
+    "Chờ tối đa": "max_waiting",
+    "Chu kỳ TB": "avg_cycle",
+    "Công bằng": "fairness",
+}
+
+
+def column_name(text: str) -> str:
+    """
+    Chuyển nhãn tiếng Việt thành tên cột ASCII (vd: "Ngã tư 1" → "nga_tu_1")
+
+    Args:
+        text: Nhãn cần chuyển
+
+    Returns:
+        Tên cột chữ thường, chỉ gồm a-z, 0-9 và "_"
+    """
+    text = unicodedata.normalize("NFKD", text.replace("đ", "d").replace("Đ", "D"))
+    text = "".join(ch if ch.isascii() and ch.isalnum() else "_" for ch in text if not unicodedata.combining(ch))
+    return "_".join(part for part in text.lower().split("_") if part)
+
+
+def controller_schema(network_index: NetworkIndex) -> Dict[str, type]:
+    """
+    Khai báo các cột của controller_columns() cho mọi đèn và ngã tư có đèn của mạng
+
+    Dùng làm `columns` của KPIRecorder để các cột tồn tại ngay từ đầu file,
+    kể cả khi controllers chưa chạy (vd: Dashboard chuyển "Mặc định" → "Thông minh").
+
+    Args:
+        network_index: Chỉ mục mạng (đèn → ngã tư)
+
+    Returns:
+        Dict {tên cột: kiểu giá trị (str/int/float)} theo thứ tự của controller_columns()
+    """
+    schema: Dict[str, type] = {}
+    for tls_id in network_index.tls_junctions:
+        schema[f"{tls_id}_phase"] = str
+        schema[f"{tls_id}_phase_duration"] = float
+        for name in DIRECTIONS:
+            schema[f"{tls_id}_queue_{name}"] = float
+            schema[f"{tls_id}_pressure_{name}"] = float
+    for junction_id in network_index.tls_junctions.values():
+        schema[f"{junction_id}_preempt_state"] = str
+        schema[f"{junction_id}_state_duration"] = float
+        schema[f"{junction_id}_detected"] = int
+        schema[f"{junction_id}_confirmed"] = int
+        schema[f"{junction_id}_served"] = int
+        schema[f"{junction_id}_emergency_mode"] = int
+    return schema
+
+
+def controller_columns(controllers: Dict, priority_controllers: Dict,
+                       compute_pressure: bool = True) -> Dict:
+    """
+    Cột trạng thái controllers của step hiện tại (không đổi quyết định của controllers)
+
+    Args:
+        controllers: {tls_id: AdaptiveController}
+        priority_controllers: {junction_id: PriorityController}
+        compute_pressure: Tính queue/áp lực nếu controller chưa tính trong step
+                          (PressureEngine cache theo step). False = chỉ dùng kết
+                          quả sẵn có, không gọi thêm TraCI (vd: khi phát lại
+                          trace) → để trống ở các step controller không tính
+
+    Returns:
+        Dict {tên cột: giá trị}
+    """
+    row = {}
+    for tls_id, ctrl in controllers.items():
+        current_time = ctrl.snapshot.get_time()
+        row[f"{tls_id}_phase"] = ctrl.current_phase.value
+        row[f"{tls_id}_phase_duration"] = round(current_time - ctrl.phase_start_time, 1)
+        if compute_pressure:
+            state = ctrl.get_pressure_state()
+        else:
+            state = ctrl.pressure_engine.cached_state()
+        for i, direction in enumerate(ctrl.pressure_engine.directions):
+            name = direction.name.lower()
+            row[f"{tls_id}_queue_{name}"] = round(state.queue_pcu[i], 2) if state is not None else None
+            row[f"{tls_id}_pressure_{name}"] = round(state.pressure[i], 3) if state is not None else None
+    for junction_id, priority_ctrl in priority_controllers.items():
+        current_time = priority_ctrl.snapshot.get_time()
+        row[f"{junction_id}_preempt_state"] = priority_ctrl.current_state.value
+        row[f"{junction_id}_state_duration"] = round(current_time - priority_ctrl.state_start_time, 1)
+        row[f"{junction_id}_detected"] = len(priority_ctrl.detected_vehicles)
+        row[f"{junction_id}_confirmed"] = len(priority_ctrl.confirmed_vehicles)
+        row[f"{junction_id}_served"] = priority_ctrl.served_vehicles.total_count
+        row[f"{junction_id}_emergency_mode"] = int(priority_ctrl.emergency_mode_active)
+    return row
+
+
+class KPIRecorder:
+    """
+    Ghi các dòng KPI theo step vào file, gom lô và ghi ở thread nền
+    """
+
+    def __init__(self, path: str, every: int = 1, batch_rows: int = 1000,
+                 columns: Optional[Dict[str, Optional[type]]] = None):
+        """
+        Args:
+            path: File kết quả (.csv hoặc .parquet)
+            every: Ghi 1 dòng mỗi N step
+            batch_rows: Số dòng mỗi lô giao cho thread nền
+            columns: Khai báo trước các cột {tên: kiểu str/int/float/bool hoặc None =
+                     suy từ lô đầu}; cột chưa có giá trị được để trống.
+                     None = lấy các cột của lô đầu tiên
+        """
+        self.every = max(1, int(every))
+        self.batch_rows = batch_rows
+        self.format = "parquet" if path.lower().endswith(".parquet") else "csv"
+        if self.format == "parquet" and pq is None:
+            path = os.path.splitext(path)[0] + ".csv"
+            self.format = "csv"
+            print(f"⚠️ Chưa cài pyarrow → ghi chuỗi KPI dạng CSV: {path}")
+        self.path = path
+        self.rows_recorded = 0
+        self.rows_written = 0
+        self.error: Optional[str] = None
+
+        self._batch: List[Dict] = []
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._declared: Dict[str, Optional[type]] = dict(columns or {})
+        self._columns: Optional[List[str]] = list(self._declared) if columns else None
+        self.dropped_columns: Set[str] = set()
+        self._file = None
+        self._csv_writer = None
+        self._parquet_writer = None
+        self._schema = None
+
+        output_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(output_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="kpi-recorder", daemon=True)
+        self._thread.start()
+
+    def due(self, step: int) -> bool:
+        """
+        Step này có cần ghi dòng không (mỗi `every` step)
+
+        Args:
+            step: Số thứ tự step (bắt đầu từ 0)
+        """
+        return step % self.every == 0
+
+    def record(self, row: Dict):
+        """
+        Thêm 1 dòng (không chặn; ghi file khi đủ lô)
+
+        Args:
+            row: {tên cột: giá trị} - giá trị là số, chuỗi, bool hoặc None
+        """
+        with self._lock:
+            self._batch.append(row)
+            self.rows_recorded += 1
+            if len(self._batch) >= self.batch_rows:
+                self._queue.put(self._batch)
+                self._batch = []
+
+    def flush(self):
+        """Giao lô đang gom cho thread nền và chờ ghi xong"""
+        with self._lock:
+            if self._batch:
+                self._queue.put(self._batch)
+                self._batch = []
+        self._queue.join()
+
+    def close(self) -> int:
+        """
+        Ghi nốt dữ liệu, dừng thread nền và đóng file
+
+        Returns:
+            Số dòng đã ghi
+        """
+        if self._thread is None:
+            return self.rows_written
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        try:
+            if self._parquet_writer is not None:
+                self._parquet_writer.close()
+            if self._file is not None:
+                self._file.close()
+        except Exception as e:
+            self.error = str(e)
+        return self.rows_written
+
+    def _run(self):
+        """Thread nền: ghi từng lô nhận được cho đến khi gặp None"""
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    return
+                if self.error is None:
+                    self._write_batch(batch)
+                    self.rows_written += len(batch)
+            except Exception as e:
+                self.error = str(e)
+                print(f"❌ Lỗi khi ghi chuỗi KPI {self.path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write_batch(self, batch: List[Dict]):
+        """Ghi 1 lô (chạy trên thread nền)"""
+        if self._columns is None:
+            columns = {}
+            for row in batch:
+                columns.update(dict.fromkeys(row))
+            self._columns = list(columns)
+        self._check_columns(batch)
+
+        if self.format == "parquet":
+            if self._parquet_writer is None:
+                self._schema = pa.schema([pa.field(name, self._arrow_type(name, batch))
+                                          for name in self._columns])
+                self._parquet_writer = pq.ParquetWriter(self.path, self._schema)
+            table = pa.Table.from_arrays(
+                [pa.array([row.get(field.name) for row in batch], type=field.type) for field in self._schema],
+                schema=self._schema)
+            self._parquet_writer.write_table(table)
+        else:
+            if self._csv_writer is None:
+                self._file = open(self.path, "w", newline="", encoding="utf-8")
+                self._csv_writer = csv.DictWriter(self._file, fieldnames=self._columns,
+                                                  extrasaction="ignore")
+                self._csv_writer.writeheader()
+            self._csv_writer.writerows(batch)
+            self._file.flush()
+
+    def _check_columns(self, batch: List[Dict]):
+        """Cảnh báo (1 lần mỗi cột) khi dòng có cột ngoài schema - giá trị đó không được ghi"""
+        known = set(self._columns)
+        unknown = set()
+        for row in batch:
+            unknown.update(key for key in row if key not in known)
+        unknown -= self.dropped_columns
+        if unknown:
+            self.dropped_columns.update(unknown)
+            print(f"⚠️ Chuỗi KPI {self.path}: bỏ qua {len(unknown)} cột chưa khai báo: "
+                  f"{', '.join(sorted(unknown))}")
+
+    def _arrow_type(self, name: str, batch: List[Dict]):
+        """Kiểu Parquet của 1 cột: theo khai báo, nếu không thì suy từ lô đầu"""
+        declared = self._declared.get(name)
+        if declared is not None:
+            return {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_()}[declared]
+        inferred = pa.array([row.get(name) for row in batch]).type
+        # Cột toàn None trong lô đầu (vd: áp lực ở pha vàng) → float thay vì kiểu null
+        return pa.float64() if pa.types.is_null(inferred) else inferred
+
+
+def load_timeseries(path: str):
+    """
+    Đọc chuỗi KPI đã ghi thành pandas DataFrame
+
+    Args:
+        path: File .csv hoặc .parquet ghi bởi KPIRecorder
+
+    Returns:
+        pandas.DataFrame (mỗi dòng = 1 step đã ghi)
+    """
+    import pandas as pd
+
+    if path.lower().endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
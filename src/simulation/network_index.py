@@ -0,0 +1,368 @@
+"""
+Network Index - Chỉ mục ngã tư/hướng dựng từ mạng SUMO
+
+Mọi module cần biết "edge này đi vào ngã tư nào, từ hướng nào" (controllers,
+VehicleCounter, SensorManager, KPIEngine, Dashboard) dùng chung 1 chỉ mục dựng
+từ net-file và additional-files khai báo trong .sumocfg bằng sumolib:
+
+- Ngã tư: mọi junction không phải dead_end/internal, kèm đèn (TLS) điều khiển
+  nó (vd: đèn "J3" điều khiển junction "J4")
+- Edge/lane vào và ra của mỗi ngã tư, gán hướng la bàn theo góc của edge
+  (edge vào từ phía Bắc → "north")
+- Detector E1/E2 trong additional-files, gán theo lane → edge vào → hướng
+
+Kết quả được cache ra đĩa (JSON) theo hash nội dung các file mạng, nên chỉ
+dựng lại bằng sumolib khi mạng thay đổi. Tra cứu edge → (ngã tư, hướng) là
+dict O(1) thay vì so khớp chuỗi con.
+
+Sử dụng:
+    index = get_network_index("data/sumo/test2.sumocfg")
+    index.incoming("-E1")                       # ("J1", "north")
+    index.direction_edges("J1")                 # {"north": ["-E1"], ...}
+    index.junction_for_tls("J3")                # "J4"
+"""
+
+import hashlib
+import json
+import math
+import os
+import tempfile
+import sumolib
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_CONFIG = os.path.join(PROJECT_ROOT, "data", "sumo", "test2.sumocfg")
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "smart_traffic_cache")
+
+INDEX_VERSION = 1  # Tăng khi đổi cấu trúc dữ liệu cache
+
+DIRECTIONS = ("north", "south", "east", "west")
+DIRECTION_NAMES = {"north": "Bắc", "south": "Nam", "east": "Đông", "west": "Tây"}
+
+# Loại junction không phải ngã tư cần điều khiển/theo dõi
+_SKIPPED_JUNCTION_TYPES = ("dead_end", "internal")
+
+
+def compass_direction(dx: float, dy: float) -> str:
+    """
+    Hướng la bàn của vector (dx, dy) trong tọa độ SUMO (y hướng Bắc)
+
+    Args:
+        dx, dy: Vector từ tâm ngã tư ra phía cần xác định
+
+    Returns:
+        "north", "south", "east" hoặc "west"
+    """
+    angle = math.degrees(math.atan2(dy, dx)) % 360.0
+    if 45.0 <= angle < 135.0:
+        return "north"
+    if 135.0 <= angle < 225.0:
+        return "west"
+    if 225.0 <= angle < 315.0:
+        return "south"
+    return "east"
+
+
+def _config_inputs(config_path: str) -> Tuple[str, List[str]]:
+    """(net-file, [additional-files]) khai báo trong .sumocfg (đường dẫn tuyệt đối)"""
+    base_dir = os.path.dirname(os.path.abspath(config_path))
+    inputs = ET.parse(config_path).getroot().find("input")
+    if inputs is None or inputs.find("net-file") is None:
+        raise ValueError(f"{config_path} không khai báo net-file")
+    net_file = os.path.join(base_dir, inputs.find("net-file").get("value"))
+    add_files = []
+    element = inputs.find("additional-files")
+    if element is not None:
+        add_files = [os.path.join(base_dir, name.strip())
+                     for name in element.get("value").split(",") if name.strip()]
+    return net_file, add_files
+
+
+def _files_hash(paths: List[str]) -> str:
+    """Hash nội dung các file (kèm INDEX_VERSION) làm khóa cache"""
+    digest = hashlib.sha1(f"network_index_v{INDEX_VERSION}".encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def build_index_data(net_file: str, add_files: List[str] = ()) -> Dict:
+    """
+    Dựng dữ liệu chỉ mục từ file mạng bằng sumolib (dạng dict ghi được ra JSON)
+
+    Args:
+        net_file: File .net.xml
+        add_files: Các file additional chứa detector E1/E2
+
+    Returns:
+        {"junctions": {junction_id: {...}}, "tls": {tls_id: junction_id}}
+    """
+    net = sumolib.net.readNet(net_file)
+    junctions = {}
+    lane_junction = {}  # {lane_id: (junction_id, hướng)} của lane vào ngã tư
+
+    for node in net.getNodes():
+        if node.getType() in _SKIPPED_JUNCTION_TYPES:
+            continue
+        x, y = node.getCoord()
+        incoming = {direction: [] for direction in DIRECTIONS}
+        outgoing = {direction: [] for direction in DIRECTIONS}
+        lanes = {direction: [] for direction in DIRECTIONS}
+
+        for edge in node.getIncoming():
+            if edge.getFunction() == "internal":
+                continue
+            # Edge vào: phía xe đến = ngược hướng đoạn cuối của edge
+            (x1, y1), (x2, y2) = edge.getShape()[-2:]
+            direction = compass_direction(x1 - x2, y1 - y2)
+            incoming[direction].append(edge.getID())
+            for lane in edge.getLanes():
+                lanes[direction].append(lane.getID())
+                lane_junction[lane.getID()] = (node.getID(), direction)
+
+        for edge in node.getOutgoing():
+            if edge.getFunction() == "internal":
+                continue
+            # Edge ra: phía xe đi = hướng đoạn đầu của edge
+            (x1, y1), (x2, y2) = edge.getShape()[:2]
+            outgoing[compass_direction(x2 - x1, y2 - y1)].append(edge.getID())
+
+        junctions[node.getID()] = {
+            "position": [x, y],
+            "tls": None,
+            "incoming": incoming,
+            "outgoing": outgoing,
+            "lanes": lanes,
+            "detectors": {direction: {"e1": [], "e2": []} for direction in DIRECTIONS},
+        }
+
+    # Đèn → ngã tư: junction đích của các lane vào mà đèn điều khiển
+    tls = {}
+    for tl in net.getTrafficLights():
+        nodes = [conn[0].getEdge().getToNode().getID() for conn in tl.getConnections()]
+        if not nodes:
+            continue
+        junction_id = max(set(nodes), key=nodes.count)
+        tls[tl.getID()] = junction_id
+        if junction_id in junctions:
+            junctions[junction_id]["tls"] = tl.getID()
+
+    # Detector: lane của detector → lane vào ngã tư → hướng
+    for add_file in add_files:
+        for element in ET.parse(add_file).getroot():
+            kind = {"inductionLoop": "e1", "e1Detector": "e1",
+                    "laneAreaDetector": "e2", "e2Detector": "e2"}.get(element.tag)
+            location = lane_junction.get(element.get("lane"))
+            if kind is None or location is None:
+                continue
+            junction_id, direction = location
+            junctions[junction_id]["detectors"][direction][kind].append(element.get("id"))
+
+    return {"junctions": junctions, "tls": tls}
+
+
+class NetworkIndex:
+    """
+    Bảng tra ngã tư/hướng/edge/lane/detector của mạng SUMO
+    """
+
+    def __init__(self, config_path: str = DEFAULT_CONFIG, cache_dir: Optional[str] = DEFAULT_CACHE_DIR):
+        """
+        Args:
+            config_path: File .sumocfg (đọc net-file và additional-files)
+            cache_dir: Thư mục cache JSON (None = luôn dựng lại bằng sumolib)
+
+        Raises:
+            OSError/ValueError: Nếu không đọc được file cấu hình hoặc file mạng
+        """
+        self.config_path = os.path.abspath(config_path)
+        net_file, add_files = _config_inputs(self.config_path)
+        self.key = _files_hash([net_file] + add_files)
+        self.cache_path = os.path.join(cache_dir, f"network_index_{self.key}.json") if cache_dir else None
+        self.from_cache = False
+
+        data = self._load_cache()
+        if data is None:
+            data = build_index_data(net_file, add_files)
+            self._save_cache(data)
+
+        self.junctions: Dict[str, Dict] = data["junctions"]
+        self.tls_junctions: Dict[str, str] = data["tls"]
+        self.junction_tls: Dict[str, str] = {j: t for t, j in self.tls_junctions.items()}
+        # Bảng tra O(1): {edge_id: (junction_id, hướng)}
+        self.incoming_edges: Dict[str, Tuple[str, str]] = {}
+        self.outgoing_edges: Dict[str, Tuple[str, str]] = {}
+        self.detector_locations: Dict[str, Tuple[str, str]] = {}
+        for junction_id, junction in self.junctions.items():
+            for direction in DIRECTIONS:
+                for edge_id in junction["incoming"][direction]:
+                    self.incoming_edges[edge_id] = (junction_id, direction)
+                for edge_id in junction["outgoing"][direction]:
+                    self.outgoing_edges.setdefault(edge_id, (junction_id, direction))
+                for detectors in junction["detectors"][direction].values():
+                    for detector_id in detectors:
+                        self.detector_locations[detector_id] = (junction_id, direction)
+
+    def _load_cache(self) -> Optional[Dict]:
+        """Đọc chỉ mục đã cache (None nếu chưa có hoặc lỗi)"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.from_cache = True
+            return data
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Bỏ qua cache network index {self.cache_path}: {e}")
+            return None
+
+    def _save_cache(self, data: Dict):
+        """Ghi chỉ mục ra cache (ghi file tạm rồi đổi tên để tiến trình khác không đọc file dở)"""
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"⚠️ Không thể ghi cache network index: {e}")
+
+    # ==================== NGÃ TƯ ====================
+
+    def junction_ids(self) -> List[str]:
+        """ID các ngã tư có đèn, theo thứ tự trong file mạng"""
+        return [junction_id for junction_id, junction in self.junctions.items() if junction["tls"]]
+
+    def junction_for_tls(self, tls_id: str) -> str:
+        """
+        Ngã tư do đèn điều khiển (vd: "J3" → "J4")
+
+        Args:
+            tls_id: ID đèn giao thông (traci.trafficlight)
+
+        Returns:
+            ID junction (chính tls_id nếu không có trong mạng)
+        """
+        return self.tls_junctions.get(tls_id, tls_id)
+
+    def tls_for_junction(self, junction_id: str) -> str:
+        """
+        Đèn điều khiển ngã tư (vd: "J4" → "J3")
+
+        Args:
+            junction_id: ID junction
+
+        Returns:
+            ID đèn (chính junction_id nếu ngã tư không có đèn trong mạng)
+        """
+        return self.junction_tls.get(junction_id, junction_id)
+
+    def junction_position(self, junction_id: str) -> Optional[Tuple[float, float]]:
+        """Tọa độ (x, y) của ngã tư (None nếu không có)"""
+        junction = self.junctions.get(junction_id)
+        return tuple(junction["position"]) if junction else None
+
+    # ==================== EDGE / LANE / DETECTOR ====================
+
+    def incoming(self, edge_id: str) -> Optional[Tuple[str, str]]:
+        """
+        Ngã tư và hướng mà edge đi vào
+
+        Args:
+            edge_id: ID edge (vd: vehicle.getRoadID)
+
+        Returns:
+            (junction_id, hướng) hoặc None nếu edge không đi vào ngã tư nào
+        """
+        return self.incoming_edges.get(edge_id)
+
+    def edge_direction(self, edge_id: str, junction_id: str) -> Optional[str]:
+        """
+        Hướng của edge (vào hoặc ra) so với một ngã tư
+
+        Args:
+            edge_id: ID edge
+            junction_id: ID junction
+
+        Returns:
+            "north", "south", "east", "west" hoặc None nếu edge không nối với ngã tư
+        """
+        junction = self.junctions.get(junction_id)
+        if junction is None:
+            return None
+        location = self.incoming_edges.get(edge_id)
+        if location is not None and location[0] == junction_id:
+            return location[1]
+        for direction in DIRECTIONS:
+            if edge_id in junction["outgoing"][direction]:
+                return direction
+        return None
+
+    def direction_edges(self, junction_id: str, outgoing: bool = False,
+                        names: Optional[Dict[str, str]] = None) -> Dict[str, List[str]]:
+        """
+        Edge theo hướng của một ngã tư
+
+        Args:
+            junction_id: ID junction
+            outgoing: True = gồm cả edge ra (sau các edge vào cùng hướng)
+            names: Đổi tên hướng (vd: DIRECTION_NAMES → "Bắc", "Nam"...)
+
+        Returns:
+            Dict {hướng: [edge_id]} (rỗng nếu không có ngã tư)
+        """
+        junction = self.junctions.get(junction_id)
+        if junction is None:
+            return {}
+        result = {}
+        for direction in DIRECTIONS:
+            edges = list(junction["incoming"][direction])
+            if outgoing:
+                edges += junction["outgoing"][direction]
+            result[names[direction] if names else direction] = edges
+        return result
+
+    def direction_lanes(self, junction_id: str) -> Dict[str, List[str]]:
+        """Lane vào theo hướng của một ngã tư {hướng: [lane_id]}"""
+        junction = self.junctions.get(junction_id)
+        return {d: list(lanes) for d, lanes in junction["lanes"].items()} if junction else {}
+
+    def detectors(self, junction_id: str) -> Dict[str, Dict[str, List[str]]]:
+        """
+        Detector theo hướng của một ngã tư
+
+        Returns:
+            Dict {hướng: {"e1": [detector_id], "e2": [detector_id]}}
+        """
+        junction = self.junctions.get(junction_id)
+        if junction is None:
+            return {}
+        return {direction: {kind: list(ids) for kind, ids in detectors.items()}
+                for direction, detectors in junction["detectors"].items()}
+
+
+# Chỉ mục dùng chung theo file cấu hình {đường dẫn tuyệt đối: NetworkIndex}
+_indexes: Dict[str, NetworkIndex] = {}
+
+
+def get_network_index(config_path: Optional[str] = None) -> NetworkIndex:
+    """
+    Lấy chỉ mục dùng chung của một file cấu hình (dựng hoặc đọc cache lần đầu)
+
+    Args:
+        config_path: File .sumocfg (None = data/sumo/test2.sumocfg)
+
+    Returns:
+        NetworkIndex
+    """
+    path = os.path.abspath(config_path or DEFAULT_CONFIG)
+    index = _indexes.get(path)
+    if index is None:
+        index = NetworkIndex(path)
+        _indexes[path] = index
+    return index
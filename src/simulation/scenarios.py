@@ -0,0 +1,506 @@
+"""
+Scenarios - Kịch bản xe ưu tiên SC1–SC6 dạng khai báo + lịch sự kiện theo thời gian SUMO
+
+Mỗi kịch bản được mô tả bằng một dict tham số (SCENARIO_SPECS): kiểu sinh xe,
+hướng, chu kỳ (giây SUMO), vị trí xuất phát, thời gian xóa xe báo giả... Bộ
+biên dịch (iter_schedule / compile_schedule) biến định nghĩa này thành chuỗi
+ScenarioEvent đã xác định sẵn mọi lựa chọn ngẫu nhiên (hướng, route, ID xe, độ
+trễ) từ một seed, nên cùng seed luôn cho cùng lịch → kịch bản tái lập được và
+chạy đúng ở mọi tốc độ (kể cả headless tối đa).
+
+ScenarioRunner đưa lần lượt các sự kiện vào hàng đợi ưu tiên của
+SimulationDriver; sự kiện được thực thi trong vòng lặp mô phỏng khi
+traci.simulation.getTime() đạt tới thời điểm của nó.
+
+Khi biết kịch bản trước lúc khởi động SUMO, write_route_file() biên dịch lịch
+thành một file .rou.xml bổ sung (depart chính xác, vType xe ưu tiên bỏ qua đèn
+đỏ bằng tham số junction model thay cho setSpeedMode(0)). SUMO tự chèn xe, nên
+ScenarioRunner(preloaded=True) chỉ còn gửi lệnh TraCI cho việc xóa xe báo giả
+(SC4).
+
+Sử dụng:
+    driver = SimulationDriver()
+    runner = ScenarioRunner("SC1", driver, seed=42)
+    runner.start()
+    while running:
+        driver.step()
+
+    # Xem trước lịch 600s đầu
+    events = compile_schedule("SC4", seed=1, end_time=600)
+
+    # Nạp sẵn lịch vào SUMO qua route file
+    args, _ = build_route_args(config_path, "SC1", seed=42, output_dir=tmp_dir)
+    khoi_dong_sumo(config_path, extra_args=args)
+    runner = ScenarioRunner("SC1", driver, seed=42, preloaded=True)
+"""
+
+import heapq
+import os
+import random
+import traci
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from simulation.network_index import DIRECTION_NAMES
+
+
+# Routes xe ưu tiên theo ngã tư (mỗi lần spawn: 1 xe ở MỖI ngã tư có route cho hướng đó)
+PRIORITY_ROUTES = {
+    "J1": {
+        "north": ["r5", "r6", "r7", "r8", "r9"],       # Từ Bắc (-E1) J1 - hướng chính
+        "south": ["r10", "r11", "r12", "r13", "r14"],  # Từ Nam (-E2) J1 - hướng chính
+        "west": ["r0", "r1", "r2"],                    # Từ Tây (E0) J1 - hướng nhánh
+    },
+    "J4": {
+        "north": ["r15", "r16", "r17", "r18", "r19"],  # Từ Bắc (-E4) J4 - hướng chính
+        "south": ["r20", "r21", "r22", "r23", "r24"],  # Từ Nam (-E5) J4 - hướng chính
+        "west": ["r25", "r26", "r27"],                 # Từ Tây (-E6) J4 - hướng nhánh
+    },
+}
+
+# vType cho xe ưu tiên nạp từ route file: sao chép vType "priority" của mạng, thêm
+# tham số junction model tương đương speedMode=0 (vượt đèn đỏ, bỏ qua xe xung đột)
+PRELOAD_VTYPE_ID = "priority_preload"
+PRELOAD_VTYPE_OVERRIDES = {
+    "jmDriveAfterRedTime": "3600",       # Đèn đỏ bao lâu vẫn đi (tương đương bỏ qua đèn)
+    "jmDriveAfterRedSpeed": "22",        # Không giảm tốc khi vượt đèn đỏ
+    "jmIgnoreJunctionFoeProb": "1",
+    "jmIgnoreFoeProb": "1",
+    "jmIgnoreFoeSpeed": "50",
+    "color": "255,0,0",                  # Màu đỏ để dễ nhìn
+}
+
+# Định nghĩa kịch bản (mọi khoảng thời gian tính theo giây SUMO)
+#   kieu: default | periodic | false_alarm | stuck | consecutive
+SCENARIO_SPECS: Dict[str, Dict] = {
+    "DEFAULT": {"ten": "Mặc định - Xe ưu tiên ngẫu nhiên", "kieu": "default",
+                "directions": ["north", "south", "west"], "interval": 200, "initial_delay": 60},
+    "SC1": {"ten": "SC1 - Xe ưu tiên từ hướng chính", "kieu": "periodic",
+            "directions": ["north", "south"], "interval": 20},
+    "SC2": {"ten": "SC2 - Xe ưu tiên từ hướng nhánh", "kieu": "periodic",
+            "directions": ["west"], "interval": 20},
+    "SC3": {"ten": "SC3 - Nhiều xe ưu tiên từ 2 hướng đối diện", "kieu": "periodic",
+            "directions": ["north", "south"], "interval": 3},
+    "SC4": {"ten": "SC4 - Báo giả", "kieu": "false_alarm",
+            "directions": ["north", "south", "west"], "interval": 30,
+            "scenario_id": "SC4_FALSE", "remove_after": (2.0, 3.0)},
+    "SC5": {"ten": "SC5 - Xe ưu tiên bị kẹt", "kieu": "stuck",
+            "directions": ["north", "south", "west"], "interval": 15,
+            "block_cars": (3, 5), "block_type": "car_normal", "release_after": (1.0, 2.0)},
+    "SC6": {"ten": "SC6 - Nhiều xe ưu tiên liên tiếp", "kieu": "consecutive",
+            "directions": ["north"], "interval": 1, "jitter": (-1.0, 2.0), "min_interval": 1.0},
+}
+
+
+class ScenarioEvent:
+    """
+    Một hành động của kịch bản tại một thời điểm SUMO
+
+    action:
+        "spawn_priority" - thêm xe ưu tiên (vehicles: [(veh_id, route_id, junction_id)])
+        "spawn_block"    - thêm dòng xe thường chặn trước xe ưu tiên (SC5)
+        "remove"         - xóa xe báo giả (SC4)
+    """
+
+    __slots__ = ("time", "action", "vehicles", "scenario_id", "direction")
+
+    def __init__(self, time: float, action: str, vehicles: List[Tuple[str, str, str]],
+                 scenario_id: str, direction: str):
+        self.time = time
+        self.action = action
+        self.vehicles = vehicles
+        self.scenario_id = scenario_id
+        self.direction = direction
+
+    def __lt__(self, other: 'ScenarioEvent') -> bool:
+        return self.time < other.time
+
+    def __repr__(self) -> str:
+        return f"ScenarioEvent({self.time:.1f}, {self.action}, {[v[0] for v in self.vehicles]})"
+
+
+def get_spec(scenario_key: str) -> Dict:
+    """
+    Lấy định nghĩa kịch bản
+
+    Args:
+        scenario_key: DEFAULT, SC1...SC6
+
+    Raises:
+        KeyError: Nếu kịch bản không tồn tại
+    """
+    try:
+        return SCENARIO_SPECS[scenario_key]
+    except KeyError:
+        raise KeyError(f"Kịch bản không tồn tại: {scenario_key} (có: {', '.join(SCENARIO_SPECS)})")
+
+
+def _priority_vehicles(rng: random.Random, scenario_id: str, direction: str,
+                       time: float) -> List[Tuple[str, str, str]]:
+    """Xe ưu tiên của 1 lần spawn: 1 xe ở mỗi ngã tư có route cho hướng đó"""
+    vehicles = []
+    for junction_id, routes in PRIORITY_ROUTES.items():
+        if direction in routes:
+            veh_id = f"priority_{scenario_id}_{direction}_{junction_id}_{int(time)}"
+            vehicles.append((veh_id, rng.choice(routes[direction]), junction_id))
+    return vehicles
+
+
+def iter_schedule(scenario_key: str, rng: random.Random, start_time: float = 0.0) -> Iterator[ScenarioEvent]:
+    """
+    Sinh lịch sự kiện (vô hạn, theo thứ tự thời gian) của một kịch bản
+
+    Args:
+        scenario_key: DEFAULT, SC1...SC6
+        rng: Bộ sinh số ngẫu nhiên (đã seed) - mọi lựa chọn ngẫu nhiên lấy từ đây
+        start_time: Thời điểm SUMO bắt đầu kịch bản
+
+    Yields:
+        ScenarioEvent theo thời gian tăng dần
+    """
+    spec = get_spec(scenario_key)
+    kieu = spec["kieu"]
+    interval = float(spec["interval"])
+    directions = spec["directions"]
+    scenario_id = spec.get("scenario_id", scenario_key)
+    t = start_time + spec.get("initial_delay", 0) + (interval if kieu == "default" else 0.0)
+    count = 0
+
+    while True:
+        direction = directions[0] if len(directions) == 1 else rng.choice(directions)
+
+        if kieu in ("default", "periodic"):
+            yield ScenarioEvent(t, "spawn_priority", _priority_vehicles(rng, scenario_id, direction, t),
+                                scenario_id, direction)
+            t += interval
+
+        elif kieu == "false_alarm":
+            vehicles = _priority_vehicles(rng, scenario_id, direction, t)
+            yield ScenarioEvent(t, "spawn_priority", vehicles, scenario_id, direction)
+            remove_at = t + rng.uniform(*spec["remove_after"])
+            yield ScenarioEvent(remove_at, "remove", vehicles, scenario_id, direction)
+            t = remove_at + interval
+
+        elif kieu == "stuck":
+            # Dòng xe thường (route J1) chặn phía trước, sau 1-2s mới thả xe ưu tiên
+            num_cars = rng.randint(*spec["block_cars"])
+            routes = PRIORITY_ROUTES["J1"][direction]
+            blockers = [(f"normal_block_{int(t)}_{i}", rng.choice(routes), "J1") for i in range(num_cars)]
+            yield ScenarioEvent(t, "spawn_block", blockers, scenario_id, direction)
+            release_at = t + rng.uniform(*spec["release_after"])
+            yield ScenarioEvent(release_at, "spawn_priority",
+                                _priority_vehicles(rng, scenario_id, direction, release_at),
+                                scenario_id, direction)
+            t = release_at + interval
+
+        elif kieu == "consecutive":
+            count += 1
+            consecutive_id = f"{scenario_id}_consecutive_{count}"
+            yield ScenarioEvent(t, "spawn_priority", _priority_vehicles(rng, consecutive_id, direction, t),
+                                consecutive_id, direction)
+            t += max(spec.get("min_interval", 1.0), interval + rng.uniform(*spec["jitter"]))
+
+        else:
+            raise ValueError(f"Kiểu kịch bản không hỗ trợ: {kieu}")
+
+
+def compile_schedule(scenario_key: str, seed: Optional[int] = None, end_time: float = 3600.0,
+                     start_time: float = 0.0) -> List[ScenarioEvent]:
+    """
+    Biên dịch kịch bản thành hàng đợi ưu tiên (heap) các sự kiện trong [start_time, end_time)
+
+    Args:
+        scenario_key: DEFAULT, SC1...SC6
+        seed: Seed ngẫu nhiên (cùng seed → cùng lịch)
+        end_time: Thời điểm SUMO kết thúc
+        start_time: Thời điểm SUMO bắt đầu
+
+    Returns:
+        Heap ScenarioEvent (heapq.heappop lấy sự kiện sớm nhất)
+    """
+    events: List[ScenarioEvent] = []
+    for event in iter_schedule(scenario_key, random.Random(seed), start_time):
+        if event.time >= end_time:
+            break
+        heapq.heappush(events, event)
+    return events
+
+
+def _config_route_files(config_path: str) -> List[str]:
+    """Đường dẫn tuyệt đối các route file khai báo trong .sumocfg"""
+    config_dir = os.path.dirname(os.path.abspath(config_path))
+    element = ET.parse(config_path).getroot().find("input/route-files")
+    if element is None:
+        return []
+    return [os.path.join(config_dir, name.strip()) for name in element.get("value", "").split(",") if name.strip()]
+
+
+def _priority_vtype_attrs(route_files: List[str]) -> Dict[str, str]:
+    """Thuộc tính vType xe ưu tiên nạp sẵn (sao chép vType "priority" nếu có)"""
+    attrs = {"vClass": "emergency", "guiShape": "emergency"}
+    for path in route_files:
+        try:
+            vtype = ET.parse(path).getroot().find("vType[@id='priority']")
+        except (OSError, ET.ParseError):
+            continue
+        if vtype is not None:
+            attrs = dict(vtype.attrib)
+            break
+    attrs.update(PRELOAD_VTYPE_OVERRIDES)
+    attrs["id"] = PRELOAD_VTYPE_ID
+    return attrs
+
+
+def write_route_file(scenario_key: str, seed: Optional[int], output_path: str, end_time: float = 3600.0,
+                     base_route_files: Optional[List[str]] = None) -> int:
+    """
+    Biên dịch lịch kịch bản thành route file cho SUMO (xe xuất phát đúng thời điểm của lịch)
+
+    Sự kiện xóa xe (SC4) không biểu diễn được trong route file → vẫn do
+    ScenarioRunner(preloaded=True) thực thi qua TraCI.
+
+    Args:
+        scenario_key: DEFAULT, SC1...SC6
+        seed: Seed ngẫu nhiên (phải trùng seed của ScenarioRunner)
+        output_path: File .rou.xml cần ghi
+        end_time: Thời điểm SUMO kết thúc lịch
+        base_route_files: Route file gốc (lấy vType "priority" để sao chép)
+
+    Returns:
+        Số xe đã ghi
+    """
+    spec = get_spec(scenario_key)
+    root = ET.Element("routes")
+    root.append(ET.Comment(f" {spec['ten']} - seed={seed}, 0-{end_time:g}s (sinh bởi simulation/scenarios.py) "))
+    ET.SubElement(root, "vType", _priority_vtype_attrs(base_route_files or []))
+
+    count = 0
+    events = compile_schedule(scenario_key, seed=seed, end_time=end_time)
+    while events:
+        event = heapq.heappop(events)
+        if event.action == "remove":
+            continue
+        for veh_id, route_id, _ in event.vehicles:
+            if event.action == "spawn_block":
+                attrs = {"id": veh_id, "type": spec.get("block_type", "car_normal"), "route": route_id,
+                         "depart": f"{event.time:.2f}", "departSpeed": "max"}
+            else:
+                attrs = {"id": veh_id, "type": PRELOAD_VTYPE_ID, "route": route_id,
+                         "depart": f"{event.time:.2f}", "departPos": str(spec.get("depart_pos", "base")),
+                         "departSpeed": "random", "departLane": "best"}
+            ET.SubElement(root, "vehicle", attrs)
+            count += 1
+
+    ET.indent(root)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    ET.ElementTree(root).write(output_path, encoding="UTF-8", xml_declaration=True)
+    return count
+
+
+def build_route_args(config_path: str, scenario_key: str, seed: Optional[int], output_dir: str,
+                     end_time: float = 3600.0) -> Tuple[List[str], str]:
+    """
+    Sinh route file của kịch bản và tham số dòng lệnh để SUMO nạp kèm route file gốc
+
+    Args:
+        config_path: File .sumocfg
+        scenario_key: DEFAULT, SC1...SC6
+        seed: Seed ngẫu nhiên
+        output_dir: Thư mục ghi route file
+        end_time: Thời điểm SUMO kết thúc lịch
+
+    Returns:
+        (extra_args cho khoi_dong_sumo/traci.load, đường dẫn route file đã sinh)
+    """
+    base_route_files = _config_route_files(config_path)
+    output_path = os.path.join(os.path.abspath(output_dir), f"{scenario_key}_seed{seed}.rou.xml")
+    write_route_file(scenario_key, seed, output_path, end_time=end_time, base_route_files=base_route_files)
+    # --route-files ghi đè giá trị trong .sumocfg → liệt kê lại route file gốc
+    return ["--route-files", ",".join(base_route_files + [output_path])], output_path
+
+
+class ScenarioRunner:
+    """
+    Thực thi lịch kịch bản trên SimulationDriver (cùng luồng với simulationStep)
+
+    Chỉ giữ 1 sự kiện kế tiếp trong hàng đợi của driver; sau khi thực thi,
+    sự kiện tiếp theo của lịch mới được đưa vào → chạy được vô hạn.
+
+    preloaded=True: xe đã được nạp từ route file (write_route_file) → chỉ ghi
+    nhận xe theo lịch và xóa xe báo giả; khi stop(), các xe còn lại trong route
+    file sẽ bị xóa đúng lúc xuất phát để kịch bản thực sự dừng.
+    """
+
+    def __init__(self, scenario_key: str, driver, seed: Optional[int] = None,
+                 log: Callable[[str], None] = print, tag: str = "scenario", preloaded: bool = False,
+                 end_time: Optional[float] = None):
+        """
+        Args:
+            scenario_key: DEFAULT, SC1...SC6
+            driver: SimulationDriver sở hữu vòng lặp mô phỏng
+            seed: Seed ngẫu nhiên (None = tự sinh, xem self.seed để chạy lại đúng lịch)
+            log: Hàm ghi log
+            tag: Nhãn sự kiện trên driver (để hủy bằng stop())
+            preloaded: Xe đã được nạp từ route file sinh với cùng seed
+            end_time: Dừng lịch tại thời điểm này (= end_time của route file, None = vô hạn)
+        """
+        self.spec = get_spec(scenario_key)
+        self.scenario_key = scenario_key
+        self.driver = driver
+        self.traci = driver.traci
+        self.seed = seed if seed is not None else random.randrange(2 ** 31)
+        self.log = log
+        self.tag = tag
+        self.preloaded = preloaded
+        self.end_time = end_time
+        self._discarding = False
+        self._delta_t: Optional[float] = None
+        self._events: Optional[Iterator[ScenarioEvent]] = None
+        self.spawned_ids: List[str] = []
+        self.events_executed = 0
+
+    def start(self, start_time: Optional[float] = None):
+        """
+        Bắt đầu kịch bản (gọi trên luồng mô phỏng hoặc khi vòng lặp chưa chạy)
+
+        Args:
+            start_time: Thời điểm SUMO bắt đầu (None = hiện tại)
+        """
+        if start_time is None:
+            start_time = self.driver.now()
+        self._events = iter_schedule(self.scenario_key, random.Random(self.seed), start_time)
+        self._schedule_next()
+
+    def stop(self) -> int:
+        """
+        Dừng kịch bản
+
+        Returns:
+            Số sự kiện đang chờ đã bị hủy
+        """
+        cancelled = self.driver.cancel(self.tag)
+        if self.preloaded and self._events is not None and not self._discarding:
+            # Xe trong route file vẫn sẽ xuất phát → xóa xe đang chờ chèn, rồi tiếp tục
+            # duyệt lịch để xóa các xe còn lại
+            self._discarding = True
+            self.tag = f"{self.tag}_discard"
+            spawned = set(self.spawned_ids)
+            for veh_id in self.traci.simulation.getPendingVehicles():
+                if veh_id in spawned:
+                    self._try_remove(veh_id)
+            self._schedule_next()
+        else:
+            self._events = None
+        return cancelled
+
+    def _schedule_next(self):
+        """Đưa sự kiện kế tiếp của lịch vào hàng đợi của driver"""
+        if self._events is None:
+            return
+        event = next(self._events, None)
+        if event is not None and (self.end_time is None or event.time < self.end_time):
+            self.driver.schedule_at(event.time, self._execute, event, tag=self.tag)
+
+    def _execute(self, event: ScenarioEvent):
+        """Thực thi 1 sự kiện rồi đặt lịch sự kiện kế tiếp"""
+        try:
+            if self._discarding:
+                if event.action != "remove":
+                    self._discard(event)
+            elif self.preloaded:
+                if event.action == "spawn_priority":
+                    self._record_preloaded(event)
+                elif event.action == "remove":
+                    self._remove(event)
+            elif event.action == "spawn_priority":
+                self._spawn_priority(event)
+            elif event.action == "spawn_block":
+                self._spawn_block(event)
+            elif event.action == "remove":
+                self._remove(event)
+            self.events_executed += 1
+        finally:
+            self._schedule_next()
+
+    def _spawn_priority(self, event: ScenarioEvent) -> List[str]:
+        """Thêm xe ưu tiên (SUMO chèn vào mạng ở simulationStep kế tiếp)"""
+        spawned = []
+        dir_name = DIRECTION_NAMES.get(event.direction, "Không xác định")
+        depart_pos = str(self.spec.get("depart_pos", "base"))
+        for veh_id, route_id, junction_id in event.vehicles:
+            try:
+                self.traci.vehicle.add(veh_id, route_id, typeID="priority", departPos=depart_pos,
+                                       departSpeed="random", departLane="best")
+                # speedMode = 0: xe ưu tiên bỏ qua mọi quy tắc (vượt đèn đỏ); màu đỏ để dễ nhìn
+                self.traci.vehicle.setSpeedMode(veh_id, 0)
+                self.traci.vehicle.setColor(veh_id, (255, 0, 0, 255))
+            except traci.exceptions.TraCIException as e:
+                self.log(f"⚠ {junction_id}: Không thể spawn {veh_id}: {e}")
+                continue
+            spawned.append(veh_id)
+            self.log(f"🚨 Spawn xe ưu tiên [{event.scenario_id}] từ {dir_name} tại {junction_id}")
+            self.log(f"   ID: {veh_id} | Route: {route_id} | T={event.time:.1f}s")
+        self.spawned_ids.extend(spawned)
+        return spawned
+
+    def _record_preloaded(self, event: ScenarioEvent):
+        """Ghi nhận xe ưu tiên SUMO chèn từ route file (không gửi lệnh TraCI)"""
+        dir_name = DIRECTION_NAMES.get(event.direction, "Không xác định")
+        for veh_id, route_id, junction_id in event.vehicles:
+            self.log(f"🚨 Xe ưu tiên [{event.scenario_id}] từ {dir_name} tại {junction_id} (route file)")
+            self.log(f"   ID: {veh_id} | Route: {route_id} | T={event.time:.1f}s")
+        self.spawned_ids.extend(veh_id for veh_id, _, _ in event.vehicles)
+
+    def _discard(self, event: ScenarioEvent, retries: int = 3):
+        """
+        Xóa xe của route file sau khi kịch bản đã dừng
+
+        Xe đã nạp (chưa xuất phát), đang chờ chèn hoặc đã vào mạng đều xóa
+        được; xe SUMO chưa nạp sẽ được thử lại ở step kế tiếp.
+        """
+        remaining = [v for v in event.vehicles if not self._try_remove(v[0])]
+        if remaining and retries > 0:
+            retry = ScenarioEvent(event.time, event.action, remaining, event.scenario_id, event.direction)
+            self.driver.schedule_in(self._step_length(), self._discard, retry, retries - 1, tag=self.tag)
+
+    def _step_length(self) -> float:
+        """Độ dài 1 step SUMO (giây)"""
+        if self._delta_t is None:
+            self._delta_t = self.traci.simulation.getDeltaT()
+        return self._delta_t
+
+    def _try_remove(self, veh_id: str) -> bool:
+        """Xóa xe (kể cả xe đang chờ chèn), False nếu SUMO chưa biết xe"""
+        try:
+            self.traci.vehicle.remove(veh_id)
+            return True
+        except traci.exceptions.TraCIException:
+            return False
+
+    def _spawn_block(self, event: ScenarioEvent):
+        """SC5: Thêm dòng xe thường phía trước xe ưu tiên"""
+        block_type = self.spec.get("block_type", "car_normal")
+        added = 0
+        for veh_id, route_id, _ in event.vehicles:
+            try:
+                self.traci.vehicle.add(veh_id, route_id, typeID=block_type, departSpeed="max")
+                added += 1
+            except traci.exceptions.TraCIException:
+                pass
+        dir_name = DIRECTION_NAMES.get(event.direction, "Không xác định")
+        self.log(f"🚗🚗 {event.scenario_id}: Đã tạo dòng xe {added} xe từ {dir_name}, xe ưu tiên sẽ bị kẹt phía sau")
+
+    def _remove(self, event: ScenarioEvent, retries: int = 3):
+        """
+        SC4: Xóa xe báo giả (xe không thật)
+
+        Xóa cả xe đang chờ chèn (chưa vào mạng); xe SUMO chưa nạp (route file)
+        được thử lại ở step kế tiếp như _discard().
+        """
+        remaining = [v for v in event.vehicles if not self._try_remove(v[0])]
+        removed = len(event.vehicles) - len(remaining)
+        if removed:
+            self.log(f"🗑️ BÁOGIẢ - Đã xóa xe giả [{removed} xe] - Tín hiệu sai!")
+        if remaining and retries > 0:
+            retry = ScenarioEvent(event.time, event.action, remaining, event.scenario_id, event.direction)
+            self.driver.schedule_in(self._step_length(), self._remove, retry, retries - 1, tag=self.tag)
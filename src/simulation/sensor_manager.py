@@ -6,42 +6,72 @@ Module này đọc dữ liệu từ:
 - E2 Detectors (Area Detectors): Đo mật độ, queue length, occupancy
 
 Sử dụng cho hệ thống điều khiển đèn giao thông thông minh dựa trên mật độ xe.
+
+Chế độ subscription (mặc định): sau discover_detectors(), mỗi detector được
+subscribe một lần. SUMO gửi kèm toàn bộ giá trị trong phản hồi của
+simulationStep(), nên mọi lần đọc trong cùng một step chỉ tra cứu snapshot
+cục bộ thay vì gửi 5-7 lệnh TraCI cho mỗi detector.
 """
 
 import traci
-from typing import Dict, List, Tuple
+import traci.constants as tc
+from typing import Dict, List, Optional, Tuple
+
+from simulation.step_snapshot import get_step_snapshot
+from simulation.network_index import NetworkIndex, get_network_index
+
+
+# Biến subscribe cho E1 (Induction Loop)
+E1_SUBSCRIPTION_VARS = [
+    tc.LAST_STEP_VEHICLE_NUMBER,
+    tc.LAST_STEP_MEAN_SPEED,
+    tc.LAST_STEP_OCCUPANCY,
+    tc.LAST_STEP_VEHICLE_ID_LIST,
+]
+
+# Biến subscribe cho E2 (Lane Area Detector)
+E2_SUBSCRIPTION_VARS = [
+    tc.LAST_STEP_VEHICLE_NUMBER,
+    tc.LAST_STEP_VEHICLE_HALTING_NUMBER,
+    tc.LAST_STEP_MEAN_SPEED,
+    tc.LAST_STEP_OCCUPANCY,
+    tc.JAM_LENGTH_METERS,
+    tc.JAM_LENGTH_VEHICLE,
+    tc.LAST_STEP_VEHICLE_ID_LIST,
+]
 
 
 class SensorManager:
     """Quản lý cảm biến E1 và E2 trong SUMO"""
     
-    def __init__(self):
-        """Khởi tạo Sensor Manager"""
+    def __init__(self, use_subscriptions: bool = True, connection=None,
+                 network_index: Optional[NetworkIndex] = None):
+        """
+        Khởi tạo Sensor Manager
+        
+        Args:
+            use_subscriptions: True = đọc dữ liệu từ snapshot subscription mỗi step,
+                               False = gọi TraCI trực tiếp cho từng giá trị (chế độ cũ)
+            connection: Kết nối SUMO (SumoConnection), None = kết nối mặc định toàn cục
+            network_index: Chỉ mục ngã tư/hướng của mạng (None = mạng mặc định test2)
+        """
+        self.connection = connection
+        self.traci = traci if connection is None else connection
+        
         self.e1_detectors = {}  # {detector_id: {lane, position, junction}}
         self.e2_detectors = {}  # {detector_id: {lane, position, junction}}
         
-        # Mapping detector IDs theo junction và hướng
+        # Subscription mode
+        self.use_subscriptions = use_subscriptions
+        self.subscribed_e1 = set()  # Detector E1 đã subscribe thành công
+        self.subscribed_e2 = set()  # Detector E2 đã subscribe thành công
+        
+        # Mapping detector IDs theo junction và hướng (dựng từ test2.add.xml + mạng SUMO)
+        # {"J1": {"north": {"e1": [...], "e2": [...]}, ...}, "J4": {...}}
+        self.network_index = network_index or get_network_index()
         self.detector_mapping = {
-            "J1": {
-                "north": {"e1": ["e1_J1_north_0", "e1_J1_north_1", "e1_J1_north_2"],
-                         "e2": ["e2_J1_north", "e2_J1_north_lane1", "e2_J1_north_lane2"]},
-                "south": {"e1": ["e1_J1_south_0", "e1_J1_south_1", "e1_J1_south_2"],
-                         "e2": ["e2_J1_south", "e2_J1_south_lane1", "e2_J1_south_lane2"]},
-                "west":  {"e1": ["e1_J1_west_0", "e1_J1_west_1", "e1_J1_west_2"],
-                         "e2": ["e2_J1_west", "e2_J1_west_lane1", "e2_J1_west_lane2"]},
-                "east":  {"e1": ["e1_J1_east_0", "e1_J1_east_1"],
-                         "e2": ["e2_J1_east", "e2_J1_east_lane1"]},
-            },
-            "J4": {
-                "north": {"e1": ["e1_J4_north_0", "e1_J4_north_1", "e1_J4_north_2"],
-                         "e2": ["e2_J4_north", "e2_J4_north_lane1", "e2_J4_north_lane2"]},
-                "south": {"e1": ["e1_J4_south_0", "e1_J4_south_1", "e1_J4_south_2"],
-                         "e2": ["e2_J4_south", "e2_J4_south_lane1", "e2_J4_south_lane2"]},
-                "west":  {"e1": ["e1_J4_west_0", "e1_J4_west_1", "e1_J4_west_2"],
-                         "e2": ["e2_J4_west", "e2_J4_west_lane1", "e2_J4_west_lane2"]},
-                "east":  {"e1": ["e1_J4_east_0", "e1_J4_east_1"],
-                         "e2": ["e2_J4_east", "e2_J4_east_lane1"]},
-            }
+            junction_id: self.network_index.detectors(junction_id)
+            for junction_id in self.network_index.junction_ids()
         }
     
     def discover_detectors(self) -> Tuple[int, int]:
@@ -53,31 +83,75 @@ class SensorManager:
         """
         try:
             # Lấy danh sách E1 detectors (Induction Loops)
-            e1_ids = traci.inductionloop.getIDList()
+            e1_ids = self.traci.inductionloop.getIDList()
             for det_id in e1_ids:
-                lane = traci.inductionloop.getLaneID(det_id)
-                pos = traci.inductionloop.getPosition(det_id)
+                lane = self.traci.inductionloop.getLaneID(det_id)
+                pos = self.traci.inductionloop.getPosition(det_id)
                 self.e1_detectors[det_id] = {
                     "lane": lane,
                     "position": pos,
-                    "junction": "J1" if "J1" in det_id else "J4"
+                    "junction": self.detector_junction(det_id)
                 }
             
             # Lấy danh sách E2 detectors (Lane Area Detectors)
-            e2_ids = traci.lanearea.getIDList()
+            e2_ids = self.traci.lanearea.getIDList()
             for det_id in e2_ids:
-                lane = traci.lanearea.getLaneID(det_id)
+                lane = self.traci.lanearea.getLaneID(det_id)
                 self.e2_detectors[det_id] = {
                     "lane": lane,
-                    "junction": "J1" if "J1" in det_id else "J4"
+                    "junction": self.detector_junction(det_id)
                 }
             
+            if self.use_subscriptions:
+                self.subscribe_detectors()
+            
             return len(self.e1_detectors), len(self.e2_detectors)
             
         except Exception as e:
             print(f"⚠ Lỗi khi phát hiện detectors: {e}")
             return 0, 0
     
+    def detector_junction(self, detector_id: str) -> Optional[str]:
+        """
+        Ngã tư của detector (theo lane đặt detector)
+
+        Args:
+            detector_id: ID detector E1/E2
+
+        Returns:
+            ID junction hoặc None nếu detector không nằm trên edge vào ngã tư nào
+        """
+        location = self.network_index.detector_locations.get(detector_id)
+        return location[0] if location else None
+
+    def subscribe_detectors(self) -> Tuple[int, int]:
+        """
+        Subscribe tất cả detector đã phát hiện (gọi sau discover_detectors, và gọi
+        lại sau traci.load() vì SUMO bỏ mọi subscription khi nạp lại mô phỏng)
+        
+        Detector nào subscribe lỗi sẽ tự động dùng lại chế độ gọi trực tiếp.
+        
+        Returns:
+            Tuple[int, int]: (số E1 đã subscribe, số E2 đã subscribe)
+        """
+        self.subscribed_e1.clear()
+        self.subscribed_e2.clear()
+        for det_id in self.e1_detectors:
+            try:
+                self.traci.inductionloop.subscribe(det_id, E1_SUBSCRIPTION_VARS)
+                self.subscribed_e1.add(det_id)
+            except Exception as e:
+                print(f"⚠ Không thể subscribe E1 {det_id}: {e}")
+        
+        for det_id in self.e2_detectors:
+            try:
+                self.traci.lanearea.subscribe(det_id, E2_SUBSCRIPTION_VARS)
+                self.subscribed_e2.add(det_id)
+            except Exception as e:
+                print(f"⚠ Không thể subscribe E2 {det_id}: {e}")
+        
+        return len(self.subscribed_e1), len(self.subscribed_e2)
+    
     def get_e1_data(self, detector_id: str) -> Dict:
         """
         Lấy dữ liệu từ E1 detector (Induction Loop)
@@ -88,13 +162,24 @@ class SensorManager:
         Returns:
             Dict chứa: vehicle_count, speed, occupancy, last_step_count
         """
+        if detector_id in self.subscribed_e1:
+            result = self.traci.inductionloop.getSubscriptionResults(detector_id)
+            if result:
+                return {
+                    "vehicle_count": result[tc.LAST_STEP_VEHICLE_NUMBER],
+                    "speed": result[tc.LAST_STEP_MEAN_SPEED],
+                    "occupancy": result[tc.LAST_STEP_OCCUPANCY],
+                    "last_step_count": result[tc.LAST_STEP_VEHICLE_NUMBER],
+                    "vehicle_ids": result[tc.LAST_STEP_VEHICLE_ID_LIST]
+                }
+        
         try:
             return {
-                "vehicle_count": traci.inductionloop.getLastStepVehicleNumber(detector_id),
-                "speed": traci.inductionloop.getLastStepMeanSpeed(detector_id),
-                "occupancy": traci.inductionloop.getLastStepOccupancy(detector_id),
-                "last_step_count": traci.inductionloop.getLastStepVehicleNumber(detector_id),
-                "vehicle_ids": traci.inductionloop.getLastStepVehicleIDs(detector_id)
+                "vehicle_count": self.traci.inductionloop.getLastStepVehicleNumber(detector_id),
+                "speed": self.traci.inductionloop.getLastStepMeanSpeed(detector_id),
+                "occupancy": self.traci.inductionloop.getLastStepOccupancy(detector_id),
+                "last_step_count": self.traci.inductionloop.getLastStepVehicleNumber(detector_id),
+                "vehicle_ids": self.traci.inductionloop.getLastStepVehicleIDs(detector_id)
             }
         except Exception as e:
             return {"error": str(e)}
@@ -109,15 +194,28 @@ class SensorManager:
         Returns:
             Dict chứa: vehicle_count, speed, occupancy, jam_length, max_jam_length
         """
+        if detector_id in self.subscribed_e2:
+            result = self.traci.lanearea.getSubscriptionResults(detector_id)
+            if result:
+                return {
+                    "vehicle_count": result[tc.LAST_STEP_VEHICLE_NUMBER],
+                    "halting_number": result[tc.LAST_STEP_VEHICLE_HALTING_NUMBER],
+                    "speed": result[tc.LAST_STEP_MEAN_SPEED],
+                    "occupancy": result[tc.LAST_STEP_OCCUPANCY],
+                    "jam_length": result[tc.JAM_LENGTH_METERS],
+                    "jam_length_vehicle": result[tc.JAM_LENGTH_VEHICLE],
+                    "vehicle_ids": result[tc.LAST_STEP_VEHICLE_ID_LIST]
+                }
+        
         try:
             return {
-                "vehicle_count": traci.lanearea.getLastStepVehicleNumber(detector_id),
-                "halting_number": traci.lanearea.getLastStepHaltingNumber(detector_id),
-                "speed": traci.lanearea.getLastStepMeanSpeed(detector_id),
-                "occupancy": traci.lanearea.getLastStepOccupancy(detector_id),
-                "jam_length": traci.lanearea.getJamLengthMeters(detector_id),
-                "jam_length_vehicle": traci.lanearea.getJamLengthVehicle(detector_id),
-                "vehicle_ids": traci.lanearea.getLastStepVehicleIDs(detector_id)
+                "vehicle_count": self.traci.lanearea.getLastStepVehicleNumber(detector_id),
+                "halting_number": self.traci.lanearea.getLastStepHaltingNumber(detector_id),
+                "speed": self.traci.lanearea.getLastStepMeanSpeed(detector_id),
+                "occupancy": self.traci.lanearea.getLastStepOccupancy(detector_id),
+                "jam_length": self.traci.lanearea.getJamLengthMeters(detector_id),
+                "jam_length_vehicle": self.traci.lanearea.getJamLengthVehicle(detector_id),
+                "vehicle_ids": self.traci.lanearea.getLastStepVehicleIDs(detector_id)
             }
         except Exception as e:
             return {"error": str(e)}
@@ -203,6 +301,8 @@ class SensorManager:
         if junction_id not in self.detector_mapping:
             return emergency_vehicles
         
+        snapshot = get_step_snapshot(self.connection)
+        
         for direction, detectors in self.detector_mapping[junction_id].items():
             # Check E2 detectors (xa hơn)
             for det_id in detectors["e2"]:
@@ -210,7 +310,7 @@ class SensorManager:
                 if "error" not in data and "vehicle_ids" in data:
                     for veh_id in data["vehicle_ids"]:
                         try:
-                            veh_type = traci.vehicle.getTypeID(veh_id)
+                            veh_type = snapshot.vehicle_type(veh_id)
                             if "priority" in veh_type.lower():
                                 emergency_vehicles.append({
                                     "vehicle_id": veh_id,
@@ -235,6 +335,7 @@ class SensorManager:
             "e1_count": len(self.e1_detectors),
             "e2_count": len(self.e2_detectors),
             "junctions": list(self.detector_mapping.keys()),
+            "subscribed": len(self.subscribed_e1) + len(self.subscribed_e2),
             "status": "active" if len(self.e1_detectors) > 0 else "inactive"
         }
 
@@ -0,0 +1,190 @@
+"""
+Simulation Driver - Vòng lặp mô phỏng đơn luồng với lịch sự kiện theo thời gian SUMO
+
+Kết nối TraCI (socket) không an toàn đa luồng, nên mọi lệnh TraCI phải được gửi
+từ đúng một luồng - luồng gọi SimulationDriver.step(). Các hành động của kịch
+bản (spawn xe ưu tiên, xóa xe báo giả...) được đặt lịch theo THỜI GIAN MÔ PHỎNG
+trong một hàng đợi ưu tiên (heapq) và được thực thi ngay trước simulationStep()
+khi đến hạn, nên kịch bản chạy đúng ở mọi tốc độ (1x, 10x, tối đa).
+
+Luồng khác (vd: luồng UI) không gọi TraCI trực tiếp mà gửi yêu cầu qua
+call_soon(); yêu cầu được thực thi trên luồng mô phỏng ở step kế tiếp.
+
+Sử dụng:
+    driver = SimulationDriver()
+    driver.schedule_in(20.0, spawn_vehicle, "north", tag="spawning")
+    driver.call_soon(apply_timing)    # Từ luồng UI
+
+    # Luồng mô phỏng
+    while running:
+        driver.step()
+"""
+
+import heapq
+import itertools
+import queue
+import threading
+import traci
+from typing import Callable, List, Optional, Tuple
+
+from simulation.step_snapshot import get_step_snapshot
+from utils.logger import get_logger
+from utils.profiler import get_profiler
+
+
+logger = get_logger(__name__)
+
+
+class SimulationDriver:
+    """
+    Chủ sở hữu duy nhất của kết nối TraCI trong vòng lặp mô phỏng
+    """
+
+    def __init__(self, connection=None):
+        """
+        Args:
+            connection: Kết nối SUMO (SumoConnection), None = kết nối mặc định toàn cục
+        """
+        self.connection = connection
+        self.traci = traci if connection is None else connection
+        self._events: List[Tuple[float, int, Optional[str], Callable, tuple]] = []  # heap (time, seq, tag, action, args)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._commands: "queue.SimpleQueue[Tuple[Callable, tuple]]" = queue.SimpleQueue()
+        self._last_time: Optional[float] = None
+        self.step_count = 0
+        self.events_executed = 0
+
+    # ==================== ĐẶT LỊCH ====================
+
+    def now(self) -> float:
+        """Thời gian mô phỏng hiện tại (giây) - chỉ gọi trên luồng mô phỏng"""
+        return get_step_snapshot(self.connection).get_time()
+
+    def schedule_at(self, sim_time: float, action: Callable, *args, tag: Optional[str] = None):
+        """
+        Đặt lịch một hành động tại thời điểm mô phỏng tuyệt đối
+
+        Args:
+            sim_time: Thời gian mô phỏng (giây) - hành động chạy ở step đầu tiên có time >= sim_time
+            action: Hàm cần gọi (chạy trên luồng mô phỏng)
+            *args: Tham số của hàm
+            tag: Nhãn nhóm để hủy cùng lúc bằng cancel(tag)
+        """
+        with self._lock:
+            heapq.heappush(self._events, (sim_time, next(self._seq), tag, action, args))
+
+    def schedule_in(self, delay: float, action: Callable, *args, tag: Optional[str] = None):
+        """
+        Đặt lịch một hành động sau `delay` giây mô phỏng kể từ hiện tại
+        (chỉ gọi trên luồng mô phỏng hoặc khi vòng lặp chưa chạy)
+
+        Args:
+            delay: Số giây mô phỏng
+            action: Hàm cần gọi
+            *args: Tham số của hàm
+            tag: Nhãn nhóm để hủy cùng lúc bằng cancel(tag)
+        """
+        self.schedule_at(self.now() + delay, action, *args, tag=tag)
+
+    def call_soon(self, action: Callable, *args):
+        """
+        Yêu cầu thực thi một hành động trên luồng mô phỏng trước step kế tiếp
+        (an toàn khi gọi từ luồng khác, vd: luồng UI)
+
+        Args:
+            action: Hàm cần gọi
+            *args: Tham số của hàm
+        """
+        self._commands.put((action, args))
+
+    def cancel(self, tag: Optional[str] = None) -> int:
+        """
+        Hủy các sự kiện đã đặt lịch
+
+        Args:
+            tag: Nhãn nhóm cần hủy (None = hủy tất cả)
+
+        Returns:
+            Số sự kiện đã hủy
+        """
+        with self._lock:
+            before = len(self._events)
+            if tag is None:
+                self._events = []
+            else:
+                self._events = [event for event in self._events if event[2] != tag]
+                heapq.heapify(self._events)
+            return before - len(self._events)
+
+    def pending_events(self, tag: Optional[str] = None) -> int:
+        """Số sự kiện đang chờ (theo nhãn nếu có)"""
+        with self._lock:
+            if tag is None:
+                return len(self._events)
+            return sum(1 for event in self._events if event[2] == tag)
+
+    # ==================== THỰC THI ====================
+
+    def run_due(self) -> int:
+        """
+        Thực thi các yêu cầu call_soon() và các sự kiện đã đến hạn
+
+        Returns:
+            Số hành động đã thực thi
+        """
+        executed = 0
+        while True:
+            try:
+                action, args = self._commands.get_nowait()
+            except queue.Empty:
+                break
+            self._run(action, args)
+            executed += 1
+
+        current_time = self.now()
+        if self._last_time is not None and current_time < self._last_time:
+            # SUMO được load lại (thời gian quay về 0) → giữ khoảng cách tương đối của lịch
+            self._shift(current_time - self._last_time)
+        self._last_time = current_time
+
+        while True:
+            with self._lock:
+                if not self._events or self._events[0][0] > current_time:
+                    break
+                _, _, _, action, args = heapq.heappop(self._events)
+            self._run(action, args)
+            executed += 1
+
+        self.events_executed += executed
+        return executed
+
+    def step(self) -> float:
+        """
+        Một bước mô phỏng: thực thi hành động đến hạn rồi simulationStep()
+
+        Returns:
+            Thời gian mô phỏng sau bước
+        """
+        profiler = get_profiler()
+        profiler.begin_step(self._last_time)
+        with profiler.stage("scenario_events"):
+            self.run_due()
+        with profiler.stage("simulationStep"):
+            self.traci.simulationStep()
+        self.step_count += 1
+        self._last_time = self.now()
+        return self._last_time
+
+    def _run(self, action: Callable, args: tuple):
+        """Gọi một hành động, lỗi không làm dừng vòng lặp mô phỏng"""
+        try:
+            action(*args)
+        except Exception:
+            logger.exception("⚠️ Lỗi khi thực thi sự kiện %s", getattr(action, '__name__', action))
+
+    def _shift(self, offset: float):
+        """Dời toàn bộ lịch sự kiện đi `offset` giây"""
+        with self._lock:
+            self._events = [(t + offset, seq, tag, action, args) for t, seq, tag, action, args in self._events]
+            heapq.heapify(self._events)
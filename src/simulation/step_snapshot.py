@@ -0,0 +1,478 @@
+"""
+Step Snapshot - Bộ nhớ đệm dữ liệu TraCI theo từng bước mô phỏng
+
+Trong một lần traci.simulationStep(), nhiều module (AdaptiveController,
+PriorityController, VehicleCounter, SensorManager, Dashboard) cùng đọc danh
+sách xe trên edge, vận tốc, loại xe... của cùng một đối tượng. StepSnapshot
+lưu lại mỗi giá trị sau lần đọc đầu tiên, nên mỗi giá trị chỉ được hỏi SUMO
+tối đa 1 lần/step.
+
+Snapshot tự động bị xóa sau mỗi simulationStep() nhờ một StepListener của
+TraCI (không tốn thêm lệnh TraCI nào để phát hiện step mới). Mỗi kết nối
+TraCI (label) có snapshot riêng.
+
+Module cần đọc thuộc tính của MỌI xe mỗi step (vd: KPIEngine) có thể bật
+vehicle subscription qua subscribe_vehicles(): mỗi xe chỉ subscribe 1 lần khi
+vào mạng, sau đó giá trị được SUMO gửi kèm kết quả simulationStep() và các
+getter đọc thẳng từ đó thay vì gọi TraCI cho từng xe.
+
+Module chỉ quan tâm xe trong bán kính quanh một ngã tư (vd: PriorityController)
+có thể bật junction context subscription qua subscribe_junction_context(): SUMO
+tự lọc xe theo bán kính và gửi kèm vị trí/vận tốc/edge/vType của chúng sau mỗi
+step; các getter của snapshot cũng đọc từ kết quả này.
+
+Module đếm xe trên một tập edge cố định mỗi step (vd: VehicleCounter) có thể
+bật edge subscription qua subscribe_edges(): số xe (và occupancy/danh sách xe
+nếu cần) của mọi edge được gửi kèm kết quả simulationStep() thay vì 1 lệnh
+TraCI cho mỗi edge.
+
+traci.load() làm SUMO bỏ mọi subscription nhưng snapshot (và StepListener) vẫn
+còn: gọi reload() ngay sau traci.load() để subscribe lại những gì đã bật.
+
+Sử dụng:
+    snapshot = get_step_snapshot()
+    speed = snapshot.vehicle_speed("veh_0")
+"""
+
+import traci
+import traci.constants as tc
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+
+# Biến subscribe mặc định cho mỗi xe (các giá trị controllers/dashboard đọc mỗi step)
+VEHICLE_SUBSCRIPTION_VARS = (
+    tc.VAR_SPEED,
+    tc.VAR_TYPE,
+    tc.VAR_ROAD_ID,
+    tc.VAR_WAITING_TIME,
+)
+
+# Biến của xe trong context subscription quanh ngã tư (phát hiện xe ưu tiên)
+JUNCTION_CONTEXT_VARS = (
+    tc.VAR_POSITION,
+    tc.VAR_SPEED,
+    tc.VAR_ROAD_ID,
+    tc.VAR_TYPE,
+)
+
+# Biến subscribe mặc định cho mỗi edge (đếm xe theo hướng)
+EDGE_SUBSCRIPTION_VARS = (
+    tc.LAST_STEP_VEHICLE_NUMBER,
+)
+
+
+class _SnapshotStepListener(traci.StepListener):
+    """StepListener xóa snapshot sau mỗi simulationStep()"""
+
+    def __init__(self, snapshot: 'StepSnapshot'):
+        self.snapshot = snapshot
+
+    def step(self, t=0):
+        self.snapshot.invalidate()
+        self.snapshot.subscribe_departed()
+        return True  # Giữ listener cho các step tiếp theo
+
+
+class StepSnapshot:
+    """
+    Snapshot dữ liệu TraCI của step hiện tại
+
+    Mọi getter đều lưu kết quả vào cache cho đến khi step kết thúc.
+    Lỗi TraCI (xe đã rời mạng...) không được cache và được ném lại cho caller.
+    """
+
+    def __init__(self, connection=None):
+        """
+        Khởi tạo snapshot và đăng ký listener với kết nối TraCI
+
+        Args:
+            connection: SumoConnection/Connection cần theo dõi
+                        (None = kết nối đang active của module traci)
+        """
+        self.connection = _raw_connection(connection)
+        # Mọi lệnh đọc đi qua đối tượng được truyền vào (giữ được lớp bọc nếu có)
+        self.traci = self.connection if connection is None or connection is traci else connection
+        self.step_count = 0
+        # Vehicle subscription (tắt cho đến khi có module gọi subscribe_vehicles())
+        self.vehicle_sub_vars: Tuple[int, ...] = ()
+        self._vehicle_results: Dict[str, Dict[int, object]] = {}
+        # Junction context subscription {junction_id: bán kính}
+        self.context_junctions: Dict[str, float] = {}
+        self._context_results: Dict[str, Dict[str, Dict[int, object]]] = {}
+        # Edge subscription (các edge đã subscribe thành công)
+        self.edge_sub_vars: Tuple[int, ...] = ()
+        self.subscribed_edges: Set[str] = set()
+        self._edge_results: Dict[str, Dict[int, object]] = {}
+        self._clear()
+        self._listener_id = self.connection.addStepListener(_SnapshotStepListener(self))
+
+    def detach(self):
+        """Gỡ StepListener khỏi kết nối TraCI"""
+        if self._listener_id is not None:
+            try:
+                self.connection.removeStepListener(self._listener_id)
+            except Exception:
+                pass
+        self._listener_id = None
+
+    def _clear(self):
+        """Xóa toàn bộ dữ liệu đã cache"""
+        self._time: Optional[float] = None
+        self._vehicle_ids: Optional[Tuple[str, ...]] = None
+        self._vehicle_id_set: Optional[Set[str]] = None
+        self._edge_vehicles: Dict[str, Tuple[str, ...]] = {}
+        self._edge_occupancy: Dict[str, float] = {}
+        self._speed: Dict[str, float] = {}
+        self._type: Dict[str, str] = {}
+        self._vclass: Dict[str, str] = {}
+        self._road: Dict[str, str] = {}
+        self._position: Dict[str, Tuple[float, float]] = {}
+        self._waiting: Dict[str, float] = {}
+        self._route: Dict[str, str] = {}
+        self._departure: Dict[str, float] = {}
+        self._departed_ids: Optional[Tuple[str, ...]] = None
+
+    def invalidate(self):
+        """Đánh dấu bắt đầu step mới - xóa toàn bộ cache"""
+        self.step_count += 1
+        self._clear()
+
+    def reload(self):
+        """
+        Subscribe lại sau traci.load() (SUMO bỏ mọi subscription khi nạp lại mô phỏng)
+
+        Vehicle/junction context/edge subscription đã bật trước đó được gửi lại,
+        nên các module đã subscribe (PriorityController, VehicleCounter, KPIEngine)
+        tiếp tục đọc từ subscription mà không cần khởi động lại.
+        """
+        vehicle_vars = self.vehicle_sub_vars
+        context_junctions = dict(self.context_junctions)
+        edge_vars, edges = self.edge_sub_vars, sorted(self.subscribed_edges)
+
+        self.vehicle_sub_vars = ()
+        self._vehicle_results = {}
+        self.context_junctions = {}
+        self._context_results = {}
+        self.edge_sub_vars = ()
+        self.subscribed_edges = set()
+        self._edge_results = {}
+        self.invalidate()
+
+        if vehicle_vars:
+            self.subscribe_vehicles(vehicle_vars)
+        for junction_id, radius in context_junctions.items():
+            try:
+                self.subscribe_junction_context(junction_id, radius)
+            except traci.exceptions.TraCIException as e:
+                print(f"⚠️ Không thể subscribe lại context cho {junction_id}: {e}")
+        if edges:
+            failed = self.subscribe_edges(edges, edge_vars)
+            if failed:
+                print(f"⚠️ Không thể subscribe lại {len(failed)} edge: {sorted(failed)}")
+
+    # ==================== SUBSCRIPTION ====================
+
+    def subscribe_vehicles(self, var_ids: Iterable[int] = VEHICLE_SUBSCRIPTION_VARS):
+        """
+        Bật vehicle subscription cho tất cả xe (hiện tại và xe vào mạng sau này)
+
+        Gọi nhiều lần với các biến khác nhau sẽ gộp danh sách biến.
+
+        Args:
+            var_ids: Các biến tc.VAR_* cần subscribe cho mỗi xe
+        """
+        merged = tuple(dict.fromkeys(self.vehicle_sub_vars + tuple(var_ids)))
+        if merged == self.vehicle_sub_vars:
+            return
+        first_time = not self.vehicle_sub_vars
+        self.vehicle_sub_vars = merged
+
+        if first_time:
+            # Danh sách xe departed được gửi kèm mỗi simulationStep()
+            self.traci.simulation.subscribe([tc.VAR_DEPARTED_VEHICLES_IDS])
+            # Dict kết quả của TraCI được làm mới tại chỗ sau mỗi step → giữ tham chiếu
+            self._vehicle_results = self.traci.vehicle.getAllSubscriptionResults()
+
+        for vehicle_id in self.vehicle_ids():
+            self._subscribe_vehicle(vehicle_id)
+
+    def subscribe_departed(self):
+        """Subscribe các xe vừa vào mạng trong step này (gọi bởi StepListener)"""
+        if not self.vehicle_sub_vars:
+            return
+        for vehicle_id in self.departed_ids():
+            self._subscribe_vehicle(vehicle_id)
+
+    def _subscribe_vehicle(self, vehicle_id: str):
+        """Subscribe một xe (SUMO trả về giá trị của step hiện tại ngay khi subscribe)"""
+        try:
+            self.traci.vehicle.subscribe(vehicle_id, self.vehicle_sub_vars)
+        except traci.exceptions.TraCIException:
+            pass  # Xe đã rời mạng
+
+    def subscribe_junction_context(self, junction_id: str, radius: float,
+                                   var_ids: Iterable[int] = JUNCTION_CONTEXT_VARS, force: bool = False):
+        """
+        Bật context subscription: các xe trong bán kính quanh ngã tư
+
+        Args:
+            junction_id: ID ngã tư (junction)
+            radius: Bán kính (mét)
+            var_ids: Các biến tc.VAR_* cần lấy cho mỗi xe trong bán kính
+            force: Gửi lại lệnh subscribe kể cả khi đã subscribe cùng bán kính
+
+        Raises:
+            TraCIException: Nếu junction không tồn tại
+        """
+        if not force and self.context_junctions.get(junction_id) == radius:
+            return
+        self.traci.junction.subscribeContext(junction_id, tc.CMD_GET_VEHICLE_VARIABLE, radius, list(var_ids))
+        # Dict kết quả của TraCI được làm mới tại chỗ sau mỗi step → giữ tham chiếu
+        self._context_results = self.traci.junction.getAllContextSubscriptionResults()
+        self.context_junctions[junction_id] = radius
+
+    def subscribe_edges(self, edge_ids: Iterable[str],
+                        var_ids: Iterable[int] = EDGE_SUBSCRIPTION_VARS) -> Set[str]:
+        """
+        Bật variable subscription cho các edge
+
+        Gọi nhiều lần sẽ gộp danh sách edge/biến; edge đã subscribe với đủ biến
+        không tốn thêm lệnh TraCI nào.
+
+        Args:
+            edge_ids: Các edge cần subscribe
+            var_ids: Các biến tc.LAST_STEP_* cần lấy cho mỗi edge
+
+        Returns:
+            Tập edge subscribe thất bại (vd: không tồn tại trong network)
+        """
+        merged = tuple(dict.fromkeys(self.edge_sub_vars + tuple(var_ids)))
+        if merged != self.edge_sub_vars:
+            # Thêm biến mới → subscribe lại cả các edge cũ (subscribe thay thế danh sách biến)
+            self.edge_sub_vars = merged
+            edge_ids = list(self.subscribed_edges) + [e for e in edge_ids if e not in self.subscribed_edges]
+            self.subscribed_edges = set()
+        failed = set()
+        for edge_id in edge_ids:
+            if edge_id in self.subscribed_edges:
+                continue
+            try:
+                self.traci.edge.subscribe(edge_id, self.edge_sub_vars)
+                self.subscribed_edges.add(edge_id)
+            except traci.exceptions.TraCIException:
+                failed.add(edge_id)
+        # Dict kết quả của TraCI được làm mới tại chỗ sau mỗi step → giữ tham chiếu
+        self._edge_results = self.traci.edge.getAllSubscriptionResults()
+        return failed
+
+    def junction_vehicles(self, junction_id: str) -> Dict[str, Dict[int, object]]:
+        """
+        Các xe trong bán kính quanh ngã tư ở step hiện tại
+
+        Args:
+            junction_id: ID ngã tư đã bật subscribe_junction_context()
+
+        Returns:
+            Dict {vehicle_id: {tc.VAR_*: giá trị}}
+        """
+        return self._context_results.get(junction_id) or {}
+
+    def _subscribed_value(self, vehicle_id: str, var_id: int):
+        """Giá trị subscription của xe trong step hiện tại (None nếu không có)"""
+        values = self._vehicle_results.get(vehicle_id)
+        if values is not None and var_id in values:
+            return values[var_id]
+        for junction_values in self._context_results.values():
+            values = junction_values.get(vehicle_id)
+            if values is not None:
+                return values.get(var_id)
+        return None
+
+    # ==================== SIMULATION ====================
+
+    def get_time(self) -> float:
+        """Thời gian mô phỏng hiện tại (giây)"""
+        if self._time is None:
+            self._time = self.traci.simulation.getTime()
+        return self._time
+
+    def departed_ids(self) -> Tuple[str, ...]:
+        """ID các xe vừa vào mạng trong step hiện tại"""
+        if self._departed_ids is None:
+            departed = None
+            if self.vehicle_sub_vars:
+                departed = self.traci.simulation.getSubscriptionResults().get(tc.VAR_DEPARTED_VEHICLES_IDS)
+            if departed is None:
+                departed = self.traci.simulation.getDepartedIDList()
+            self._departed_ids = tuple(departed)
+        return self._departed_ids
+
+    # ==================== VEHICLE ====================
+
+    def vehicle_ids(self) -> Tuple[str, ...]:
+        """Danh sách ID tất cả xe đang chạy trong mạng"""
+        if self._vehicle_ids is None:
+            self._vehicle_ids = tuple(self.traci.vehicle.getIDList())
+        return self._vehicle_ids
+
+    def has_vehicle(self, vehicle_id: str) -> bool:
+        """Kiểm tra xe còn trong mạng (O(1) thay vì duyệt getIDList())"""
+        if self._vehicle_id_set is None:
+            self._vehicle_id_set = set(self.vehicle_ids())
+        return vehicle_id in self._vehicle_id_set
+
+    def vehicle_speed(self, vehicle_id: str) -> float:
+        """Vận tốc xe (m/s)"""
+        speed = self._speed.get(vehicle_id)
+        if speed is None:
+            speed = self._subscribed_value(vehicle_id, tc.VAR_SPEED)
+            if speed is None:
+                speed = self.traci.vehicle.getSpeed(vehicle_id)
+            self._speed[vehicle_id] = speed
+        return speed
+
+    def vehicle_type(self, vehicle_id: str) -> str:
+        """vType ID của xe"""
+        veh_type = self._type.get(vehicle_id)
+        if veh_type is None:
+            veh_type = self._subscribed_value(vehicle_id, tc.VAR_TYPE)
+            if veh_type is None:
+                veh_type = self.traci.vehicle.getTypeID(vehicle_id)
+            self._type[vehicle_id] = veh_type
+        return veh_type
+
+    def vehicle_class(self, vehicle_id: str) -> str:
+        """vClass của xe (passenger, emergency...)"""
+        vclass = self._vclass.get(vehicle_id)
+        if vclass is None:
+            vclass = self._subscribed_value(vehicle_id, tc.VAR_VEHICLECLASS)
+            if vclass is None:
+                vclass = self.traci.vehicle.getVehicleClass(vehicle_id)
+            self._vclass[vehicle_id] = vclass
+        return vclass
+
+    def vehicle_road(self, vehicle_id: str) -> str:
+        """Edge hiện tại của xe"""
+        road = self._road.get(vehicle_id)
+        if road is None:
+            road = self._subscribed_value(vehicle_id, tc.VAR_ROAD_ID)
+            if road is None:
+                road = self.traci.vehicle.getRoadID(vehicle_id)
+            self._road[vehicle_id] = road
+        return road
+
+    def vehicle_position(self, vehicle_id: str) -> Tuple[float, float]:
+        """Tọa độ (x, y) của xe"""
+        position = self._position.get(vehicle_id)
+        if position is None:
+            position = self._subscribed_value(vehicle_id, tc.VAR_POSITION)
+            if position is None:
+                position = self.traci.vehicle.getPosition(vehicle_id)
+            self._position[vehicle_id] = position
+        return position
+
+    def vehicle_waiting_time(self, vehicle_id: str) -> float:
+        """Thời gian chờ liên tục hiện tại của xe (giây)"""
+        waiting = self._waiting.get(vehicle_id)
+        if waiting is None:
+            waiting = self._subscribed_value(vehicle_id, tc.VAR_WAITING_TIME)
+            if waiting is None:
+                waiting = self.traci.vehicle.getWaitingTime(vehicle_id)
+            self._waiting[vehicle_id] = waiting
+        return waiting
+
+    def vehicle_route_id(self, vehicle_id: str) -> str:
+        """Route ID của xe"""
+        route = self._route.get(vehicle_id)
+        if route is None:
+            route = self._subscribed_value(vehicle_id, tc.VAR_ROUTE_ID)
+            if route is None:
+                route = self.traci.vehicle.getRouteID(vehicle_id)
+            self._route[vehicle_id] = route
+        return route
+
+    def vehicle_departure(self, vehicle_id: str) -> float:
+        """Thời điểm xe xuất phát (giây, -1 nếu chưa xuất phát)"""
+        departure = self._departure.get(vehicle_id)
+        if departure is None:
+            departure = self._subscribed_value(vehicle_id, tc.VAR_DEPARTURE)
+            if departure is None:
+                departure = self.traci.vehicle.getDeparture(vehicle_id)
+            self._departure[vehicle_id] = departure
+        return departure
+
+    # ==================== EDGE ====================
+
+    def _edge_value(self, edge_id: str, var_id: int):
+        """Giá trị subscription của edge trong step hiện tại (None nếu không có)"""
+        values = self._edge_results.get(edge_id)
+        if values is not None:
+            return values.get(var_id)
+        return None
+
+    def edge_vehicle_ids(self, edge_id: str) -> Tuple[str, ...]:
+        """Danh sách xe trên edge trong step hiện tại"""
+        vehicles = self._edge_vehicles.get(edge_id)
+        if vehicles is None:
+            vehicles = self._edge_value(edge_id, tc.LAST_STEP_VEHICLE_ID_LIST)
+            if vehicles is None:
+                vehicles = self.traci.edge.getLastStepVehicleIDs(edge_id)
+            vehicles = tuple(vehicles)
+            self._edge_vehicles[edge_id] = vehicles
+        return vehicles
+
+    def edge_vehicle_count(self, edge_id: str) -> int:
+        """Số xe trên edge trong step hiện tại (đọc từ edge subscription nếu có)"""
+        count = self._edge_value(edge_id, tc.LAST_STEP_VEHICLE_NUMBER)
+        if count is None:
+            count = len(self.edge_vehicle_ids(edge_id))
+        return count
+
+    def edge_occupancy(self, edge_id: str) -> float:
+        """Occupancy (%) của edge trong step hiện tại"""
+        occupancy = self._edge_occupancy.get(edge_id)
+        if occupancy is None:
+            occupancy = self._edge_value(edge_id, tc.LAST_STEP_OCCUPANCY)
+            if occupancy is None:
+                occupancy = self.traci.edge.getLastStepOccupancy(edge_id)
+            self._edge_occupancy[edge_id] = occupancy
+        return occupancy
+
+
+def _raw_connection(connection=None):
+    """
+    Lấy traci.connection.Connection gốc
+
+    Args:
+        connection: None/module traci (kết nối đang active), SumoConnection hoặc Connection
+    """
+    if connection is None or connection is traci:
+        return traci.connection.check()
+    return getattr(connection, "connection", connection)
+
+
+# Mỗi kết nối TraCI có đúng 1 snapshot dùng chung {Connection: StepSnapshot}
+_snapshots: Dict[object, StepSnapshot] = {}
+
+
+def get_step_snapshot(connection=None) -> StepSnapshot:
+    """
+    Lấy snapshot dùng chung của một kết nối TraCI
+
+    Kết nối mới (vd: SUMO được khởi động lại) sẽ tự có snapshot mới.
+
+    Args:
+        connection: SumoConnection/Connection (None = kết nối đang active)
+
+    Returns:
+        StepSnapshot dùng chung của kết nối đó
+    """
+    raw = _raw_connection(connection)
+    snapshot = _snapshots.get(raw)
+    if snapshot is None:
+        # Bỏ snapshot của các kết nối đã đóng
+        for old_raw in [c for c in _snapshots if getattr(c, "_socket", None) is None]:
+            del _snapshots[old_raw]
+        snapshot = StepSnapshot(connection)
+        _snapshots[raw] = snapshot
+    return snapshot
@@ -4,8 +4,74 @@ from sumolib import checkBinary
 import sys
 import os
 
-def khoi_dong_sumo(config_path, gui=True):
-    """Khởi động mô phỏng SUMO."""
+
+class SumoConnection:
+    """
+    Kết nối TraCI có nhãn (label) - bọc traci.getConnection(label)
+    
+    Có cùng API với module traci (vehicle, edge, trafficlight, simulation,
+    simulationStep, close, isLoaded...), nên có thể truyền vào mọi hàm/class
+    nhận tham số `connection` thay cho kết nối mặc định toàn cục. Nhờ đó nhiều
+    mô phỏng chạy đồng thời trong cùng tiến trình không ghi đè lên nhau.
+    """
+    
+    def __init__(self, label="default"):
+        """
+        Args:
+            label: Nhãn đã dùng khi traci.start(..., label=label)
+        """
+        self.label = label
+        self.connection = traci.getConnection(label)  # traci.connection.Connection
+    
+    def __getattr__(self, name):
+        # Domain (vehicle, edge, ...) và simulationStep/close/load... lấy từ Connection gốc
+        value = getattr(self.connection, name)
+        setattr(self, name, value)  # Cache để lần sau không qua __getattr__
+        return value
+    
+    def isLoaded(self):
+        """Kết nối còn hoạt động hay không"""
+        return traci.connection.has(self.label)
+    
+    def close(self, wait=True):
+        """Đóng kết nối và SUMO tương ứng"""
+        self.connection.close(wait)
+    
+    def __repr__(self):
+        return f"SumoConnection(label={self.label!r})"
+
+
+def lay_ket_noi(label=None):
+    """
+    Lấy đối tượng kết nối theo label.
+    
+    Args:
+        label: Nhãn kết nối, None = kết nối mặc định toàn cục (module traci)
+    
+    Returns:
+        SumoConnection hoặc module traci (khi label=None)
+    """
+    if label is None:
+        return traci
+    return SumoConnection(label)
+
+
+def _ket_noi(connection):
+    """Trả về connection được truyền vào hoặc kết nối mặc định toàn cục"""
+    return traci if connection is None else connection
+
+
+def khoi_dong_sumo(config_path, gui=True, label=None, extra_args=None):
+    """
+    Khởi động mô phỏng SUMO.
+    
+    Args:
+        config_path: Đường dẫn file .sumocfg
+        gui: True = sumo-gui, False = sumo (headless)
+        label: Tên kết nối TraCI (None = kết nối mặc định). Dùng khi chạy
+               nhiều mô phỏng song song, mỗi mô phỏng một label riêng.
+        extra_args: List tham số dòng lệnh bổ sung cho SUMO (vd: ["--seed", "42"])
+    """
     try:
         # Kiểm tra file cấu hình có tồn tại không
         if not os.path.exists(config_path):
@@ -26,11 +92,18 @@ def khoi_dong_sumo(config_path, gui=True):
         if not gui:
             sumo_cmd.extend(["--no-warnings", "true"])
         
-        traci.start(sumo_cmd)
+        if extra_args:
+            sumo_cmd.extend(str(arg) for arg in extra_args)
+        
+        if label:
+            traci.start(sumo_cmd, label=label)
+        else:
+            traci.start(sumo_cmd)
         print(f"[OK] SUMO da duoc khoi dong voi cau hinh: {config_path}")
         
         # Kiểm tra số lượng xe trong mô phỏng
-        num_vehicles = traci.simulation.getMinExpectedNumber()
+        conn = lay_ket_noi(label)
+        num_vehicles = conn.simulation.getMinExpectedNumber()
         print(f"[INFO] So xe du kien trong mo phong: {num_vehicles}")
         
         return True
@@ -41,12 +114,13 @@ def khoi_dong_sumo(config_path, gui=True):
         traceback.print_exc()
         return False
 
-def kiem_tra_mo_phong_con_chay():
+def kiem_tra_mo_phong_con_chay(connection=None):
     """Kiểm tra xem mô phỏng còn đang chạy hay không."""
+    conn = _ket_noi(connection)
     try:
         # Kiểm tra số xe hiện tại và số xe tối thiểu còn lại
-        num_vehicles = traci.simulation.getMinExpectedNumber()
-        current_time = traci.simulation.getTime()
+        num_vehicles = conn.simulation.getMinExpectedNumber()
+        current_time = conn.simulation.getTime()
         
         # Trả về True nếu còn xe hoặc thời gian chưa hết
         return num_vehicles > 0 or current_time < 3600
@@ -55,22 +129,24 @@ def kiem_tra_mo_phong_con_chay():
     except Exception:
         return False
 
-def dung_sumo():
+def dung_sumo(connection=None):
     """Dừng mô phỏng."""
+    conn = _ket_noi(connection)
     try:
-        if traci.isLoaded():
-            traci.close()
+        if conn.isLoaded():
+            conn.close()
             print("[STOP] Da dung mo phong SUMO.")
     except Exception as e:
         print(f"[WARNING] Loi khi dung SUMO: {str(e)}")
 
-def lay_thong_tin_mo_phong():
+def lay_thong_tin_mo_phong(connection=None):
     """Lấy thông tin hiện tại của mô phỏng."""
+    conn = _ket_noi(connection)
     try:
-        current_time = traci.simulation.getTime()
-        num_vehicles = traci.simulation.getMinExpectedNumber()
-        departed_vehicles = traci.simulation.getDepartedNumber()
-        arrived_vehicles = traci.simulation.getArrivedNumber()
+        current_time = conn.simulation.getTime()
+        num_vehicles = conn.simulation.getMinExpectedNumber()
+        departed_vehicles = conn.simulation.getDepartedNumber()
+        arrived_vehicles = conn.simulation.getArrivedNumber()
         
         return {
             'thoi_gian': current_time,
@@ -82,16 +158,17 @@ def lay_thong_tin_mo_phong():
         print(f"[ERROR] Loi khi lay thong tin mo phong: {str(e)}")
         return None
 
-def lay_thong_tin_den_giao_thong(tls_id):
+def lay_thong_tin_den_giao_thong(tls_id, connection=None):
     """Lấy thông tin hiện tại của đèn giao thông."""
+    conn = _ket_noi(connection)
     try:
-        if not traci.isLoaded():
+        if not conn.isLoaded():
             print("[WARNING] SUMO chua duoc khoi dong.")
             return None
         
-        current_phase = traci.trafficlight.getPhase(tls_id)
-        phase_duration = traci.trafficlight.getPhaseDuration(tls_id)
-        next_switch = traci.trafficlight.getNextSwitch(tls_id)
+        current_phase = conn.trafficlight.getPhase(tls_id)
+        phase_duration = conn.trafficlight.getPhaseDuration(tls_id)
+        next_switch = conn.trafficlight.getNextSwitch(tls_id)
         
         return {
             'phase_hien_tai': current_phase,
@@ -102,74 +179,80 @@ def lay_thong_tin_den_giao_thong(tls_id):
         print(f"[ERROR] Loi khi lay thong tin den giao thong: {str(e)}")
         return None
 
-def dat_phase_den_giao_thong(tls_id, phase_index):
+def dat_phase_den_giao_thong(tls_id, phase_index, connection=None):
     """Đặt phase cho đèn giao thông."""
+    conn = _ket_noi(connection)
     try:
-        if not traci.isLoaded():
+        if not conn.isLoaded():
             print("[WARNING] SUMO chua duoc khoi dong.")
             return False
         
-        traci.trafficlight.setPhase(tls_id, phase_index)
+        conn.trafficlight.setPhase(tls_id, phase_index)
         print(f"[OK] Da dat phase {phase_index} cho den giao thong {tls_id}")
         return True
     except Exception as e:
         print(f"[ERROR] Loi khi dat phase: {str(e)}")
         return False
 
-def dat_thoi_gian_phase(tls_id, phase_index, duration):
+def dat_thoi_gian_phase(tls_id, phase_index, duration, connection=None):
     """Đặt thời gian cho một phase cụ thể của đèn giao thông."""
+    conn = _ket_noi(connection)
     try:
-        if not traci.isLoaded():
+        if not conn.isLoaded():
             print("[WARNING] SUMO chua duoc khoi dong.")
             return False
         
-        traci.trafficlight.setPhaseDuration(tls_id, phase_index, duration)
+        conn.trafficlight.setPhaseDuration(tls_id, phase_index, duration)
         print(f"[OK] Da dat thoi gian {duration}s cho phase {phase_index} cua den {tls_id}")
         return True
     except Exception as e:
         print(f"[ERROR] Loi khi dat thoi gian phase: {str(e)}")
         return False
 
-def dieu_chinh_den_giao_thong(tls_id, phase_durations):
+def dieu_chinh_den_giao_thong(tls_id, phase_durations, connection=None):
     """
     Điều chỉnh thời gian các phase của đèn giao thông bằng cách tạo chương trình mới.
     
     Args:
         tls_id: ID của traffic light system
         phase_durations: Dict với key là phase_index, value là duration (giây)
+        connection: Kết nối SUMO (None = kết nối mặc định toàn cục)
     """
-    return tao_chuong_trinh_den(tls_id, phase_durations)
+    return tao_chuong_trinh_den(tls_id, phase_durations, connection)
 
-def lay_danh_sach_den_giao_thong():
+def lay_danh_sach_den_giao_thong(connection=None):
     """Lấy danh sách tất cả đèn giao thông trong mô phỏng."""
+    conn = _ket_noi(connection)
     try:
-        if not traci.isLoaded():
+        if not conn.isLoaded():
             print("[WARNING] SUMO chua duoc khoi dong.")
             return []
         
-        tls_ids = traci.trafficlight.getIDList()
+        tls_ids = conn.trafficlight.getIDList()
         print(f"[INFO] Tim thay {len(tls_ids)} den giao thong: {tls_ids}")
         return tls_ids
     except Exception as e:
         print(f"[ERROR] Loi khi lay danh sach den giao thong: {str(e)}")
         return []
 
-def dieu_chinh_nhieu_den(tls_ids, phase_durations):
+def dieu_chinh_nhieu_den(tls_ids, phase_durations, connection=None):
     """
     Điều chỉnh thời gian các phase cho nhiều đèn giao thông.
     
     Args:
         tls_ids: List các ID của traffic light systems
         phase_durations: Dict với key là phase_index, value là duration (giây)
+        connection: Kết nối SUMO (None = kết nối mặc định toàn cục)
     """
+    conn = _ket_noi(connection)
     try:
-        if not traci.isLoaded():
+        if not conn.isLoaded():
             print("[WARNING] SUMO chua duoc khoi dong.")
             return False
         
         for tls_id in tls_ids:
             print(f"[INFO] Dang dieu chinh den {tls_id}...")
-            if not tao_chuong_trinh_den(tls_id, phase_durations):
+            if not tao_chuong_trinh_den(tls_id, phase_durations, connection):
                 return False
         
         print(f"[OK] Hoan thanh dieu chinh {len(tls_ids)} den giao thong")
@@ -178,7 +261,7 @@ def dieu_chinh_nhieu_den(tls_ids, phase_durations):
         print(f"[ERROR] Loi khi dieu chinh nhieu den giao thong: {str(e)}")
         return False
 
-def dieu_chinh_tat_ca_den(phase_durations):
+def dieu_chinh_tat_ca_den(phase_durations, connection=None):
     """
     Điều chỉnh thời gian các phase cho tất cả đèn giao thông trong mô phỏng.
     
@@ -186,20 +269,21 @@ def dieu_chinh_tat_ca_den(phase_durations):
         phase_durations: Dict với format:
             - Nếu có key 'xanh_chung', 'vang_chung', 'do_toan_phan': fixed-time mode
             - Nếu có key số (0, 1, ...): adaptive mode
+        connection: Kết nối SUMO (None = kết nối mặc định toàn cục)
     """
-    tls_ids = lay_danh_sach_den_giao_thong()
+    tls_ids = lay_danh_sach_den_giao_thong(connection)
     if not tls_ids:
         return False
     
     # Kiểm tra format của phase_durations
     if 'xanh_chung' in phase_durations:
         # Fixed-time mode: tạo chương trình mới với thời gian cố định
-        return tao_chuong_trinh_fixed_time(tls_ids, phase_durations)
+        return tao_chuong_trinh_fixed_time(tls_ids, phase_durations, connection)
     else:
         # Adaptive mode (legacy)
-        return dieu_chinh_nhieu_den(tls_ids, phase_durations)
+        return dieu_chinh_nhieu_den(tls_ids, phase_durations, connection)
 
-def tao_chuong_trinh_fixed_time(tls_ids, phase_durations):
+def tao_chuong_trinh_fixed_time(tls_ids, phase_durations, connection=None):
     """
     Tạo chương trình đèn giao thông fixed-time với thời gian tùy chỉnh.
     
@@ -209,9 +293,11 @@ def tao_chuong_trinh_fixed_time(tls_ids, phase_durations):
             - 'xanh_chung': thời gian xanh (giây)
             - 'vang_chung': thời gian vàng (giây)
             - 'do_toan_phan': thời gian all-red (giây)
+        connection: Kết nối SUMO (None = kết nối mặc định toàn cục)
     """
+    conn = _ket_noi(connection)
     try:
-        if not traci.isLoaded():
+        if not conn.isLoaded():
             print("[WARNING] SUMO chua duoc khoi dong.")
             return False
         
@@ -229,7 +315,7 @@ def tao_chuong_trinh_fixed_time(tls_ids, phase_durations):
         for tls_id in tls_ids:
             try:
                 # Lấy logic hiện tại
-                all_logics = traci.trafficlight.getAllProgramLogics(tls_id)
+                all_logics = conn.trafficlight.getAllProgramLogics(tls_id)
                 
                 if not all_logics:
                     print(f"⚠️ {tls_id} không có program logic, bỏ qua")
@@ -263,11 +349,11 @@ def tao_chuong_trinh_fixed_time(tls_ids, phase_durations):
                     new_logic.programID = "0"
                     
                     # Áp dụng logic mới
-                    traci.trafficlight.setProgram(tls_id, "0")
-                    traci.trafficlight.setCompleteRedYellowGreenDefinition(tls_id, new_logic)
+                    conn.trafficlight.setProgram(tls_id, "0")
+                    conn.trafficlight.setCompleteRedYellowGreenDefinition(tls_id, new_logic)
                     
                     # Đặt phase về 0 để bắt đầu lại chu kỳ
-                    traci.trafficlight.setPhase(tls_id, 0)
+                    conn.trafficlight.setPhase(tls_id, 0)
                     
                     print(f"[OK] {tls_id}: Da cap nhat Fixed-Time (Chu ky: {(green_time + yellow_time + all_red_time) * 2}s)")
                     success_count += 1
@@ -294,7 +380,7 @@ def tao_chuong_trinh_fixed_time(tls_ids, phase_durations):
         traceback.print_exc()
         return False
 
-def tao_chuong_trinh_den(tls_id, phase_durations):
+def tao_chuong_trinh_den(tls_id, phase_durations, connection=None):
     """
     Tạo chương trình đèn giao thông mới với thời gian phase tùy chỉnh.
     
@@ -302,14 +388,16 @@ def tao_chuong_trinh_den(tls_id, phase_durations):
         tls_id: ID của traffic light system
         phase_durations: Dict với key là phase_index, value là duration (giây)
                          0: phase xanh Bắc-Nam, 1: phase xanh Đông-Tây
+        connection: Kết nối SUMO (None = kết nối mặc định toàn cục)
     """
+    conn = _ket_noi(connection)
     try:
-        if not traci.isLoaded():
+        if not conn.isLoaded():
             print("⚠️ SUMO chưa được khởi động.")
             return False
         
         # Lấy logic hiện tại
-        current_logic = traci.trafficlight.getCompleteRedYellowGreenDefinition(tls_id)[0]
+        current_logic = conn.trafficlight.getCompleteRedYellowGreenDefinition(tls_id)[0]
         
         # Mapping phase chính: 0->0 (Bắc-Nam), 1->3 (Đông-Tây)
         phase_mapping = {0: 0, 1: 3}
@@ -321,7 +409,7 @@ def tao_chuong_trinh_den(tls_id, phase_durations):
                 print(f"[INFO] Phase chinh {logical_phase} (actual {actual_phase}): duration = {phase_durations[logical_phase]}s")
         
         # Đặt lại logic đã sửa
-        traci.trafficlight.setCompleteRedYellowGreenDefinition(tls_id, current_logic)
+        conn.trafficlight.setCompleteRedYellowGreenDefinition(tls_id, current_logic)
         print(f"[OK] Da cap nhat chuong trinh cho den {tls_id}")
         return True
         
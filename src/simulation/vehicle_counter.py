@@ -7,54 +7,59 @@ import traci
 import time
 import json
 from collections import defaultdict
-from typing import Dict, Set
+from typing import Dict, Optional, Set
 import threading
 
+from simulation.step_snapshot import get_step_snapshot
+from simulation.sumo_connector import lay_ket_noi
+from simulation.network_index import DIRECTION_NAMES, NetworkIndex, get_network_index
+
 
 class VehicleCounter:
     """
     Đếm số lượng xe tại các ngã tư theo từng hướng (Bắc, Nam, Đông, Tây)
     """
     
-    def __init__(self, sumo_config: str):
+    def __init__(self, sumo_config: str, connection=None, label: str = None,
+                 use_subscription: bool = True, network_index: Optional[NetworkIndex] = None):
         """
         Khởi tạo vehicle counter
         
         Args:
             sumo_config: Đường dẫn đến file .sumocfg
+            connection: Kết nối SUMO đã mở sẵn (SumoConnection), None = kết nối mặc định
+            label: Nhãn kết nối khi tự khởi động SUMO bằng start_sumo()/run()
+            use_subscription: Đếm bằng edge subscription (LAST_STEP_VEHICLE_NUMBER,
+                              0 lệnh TraCI/step) thay vì đọc danh sách xe từng edge
+            network_index: Chỉ mục ngã tư/hướng của mạng (None = dựng từ sumo_config)
         """
         self.sumo_config = sumo_config
+        self.connection = connection
+        self.traci = traci if connection is None else connection
+        self.label = label
+        self.use_subscription = use_subscription
+        self._subscribed_snapshot = None  # Snapshot (kết nối) đã subscribe các edge
         self.running = False
         self.thread = None
         
-        # Định nghĩa mapping giữa edge và hướng cho mỗi junction
-        # ✅ FIX: Đếm CẢ xe VÀO và xe RA cho mỗi hướng
-        # Junction J1 tại tọa độ (0, 0)
+        # Mapping giữa edge và hướng cho mỗi junction (dựng từ mạng SUMO)
+        # ✅ FIX: Đếm CẢ xe VÀO và xe RA cho mỗi hướng, vd J1: Bắc → ["-E1" (VÀO), "E1" (RA)]
+        self.network_index = network_index or get_network_index(sumo_config)
         self.junction_edges = {
-            "J1": {
-                "Bắc": ["-E1", "E1"],  # VÀO: -E1 (từ J2), RA: E1 (đi J2)
-                "Nam": ["-E2", "E2"],  # VÀO: -E2 (từ J3), RA: E2 (đi J3)
-                "Đông": ["-E3", "E3"], # VÀO: -E3 (từ J4), RA: E3 (đi J4)
-                "Tây": ["E0", "-E0"],  # VÀO: E0 (từ J0), RA: -E0 (đi J0)
-            },
-            "J4": {
-                "Bắc": ["-E4", "E4"],  # VÀO: -E4 (từ J5), RA: E4 (đi J5)
-                "Nam": ["-E5", "E5"],  # VÀO: -E5 (từ J6), RA: E5 (đi J6)
-                "Đông": ["-E6", "E6"], # VÀO: -E6 (từ J7), RA: E6 (đi J7)
-                "Tây": ["E3", "-E3"],  # VÀO: E3 (từ J1), RA: -E3 (đi J1)
-            }
+            junction_id: self.network_index.direction_edges(junction_id, outgoing=True, names=DIRECTION_NAMES)
+            for junction_id in self.network_index.junction_ids()
         }
         
         # Dictionary để tracking xe đã đếm (tránh đếm trùng)
         self.counted_vehicles: Dict[str, Dict[str, Set[str]]] = {
-            "J1": {"Bắc": set(), "Nam": set(), "Đông": set(), "Tây": set()},
-            "J4": {"Bắc": set(), "Nam": set(), "Đông": set(), "Tây": set()}
+            junction_id: {direction: set() for direction in directions}
+            for junction_id, directions in self.junction_edges.items()
         }
         
         # Kết quả đếm hiện tại
         self.current_counts: Dict[str, Dict[str, int]] = {
-            "J1": {"Bắc": 0, "Nam": 0, "Đông": 0, "Tây": 0},
-            "J4": {"Bắc": 0, "Nam": 0, "Đông": 0, "Tây": 0}
+            junction_id: {direction: 0 for direction in directions}
+            for junction_id, directions in self.junction_edges.items()
         }
         
         # Thời gian reset counter (giây)
@@ -64,7 +69,13 @@ class VehicleCounter:
     def start_sumo(self):
         """Khởi động SUMO với TraCI"""
         try:
-            traci.start(["sumo", "-c", self.sumo_config, "--start"])
+            if self.label:
+                # Kết nối riêng có nhãn - không đụng tới kết nối mặc định toàn cục
+                traci.start(["sumo", "-c", self.sumo_config, "--start"], label=self.label)
+                self.connection = lay_ket_noi(self.label)
+                self.traci = self.connection
+            else:
+                traci.start(["sumo", "-c", self.sumo_config, "--start"])
             print(f"✅ Đã kết nối SUMO với file config: {self.sumo_config}")
             
             # Lấy danh sách edges thực tế từ SUMO
@@ -78,7 +89,7 @@ class VehicleCounter:
         """Tự động phát hiện edges từ SUMO network"""
         try:
             # Lấy tất cả edges
-            all_edges = traci.edge.getIDList()
+            all_edges = self.traci.edge.getIDList()
             print(f"\n📋 Phát hiện {len(all_edges)} edges trong network")
             
             # Lọc ra edges không phải internal (không bắt đầu bằng ":")
@@ -87,30 +98,21 @@ class VehicleCounter:
             print(f"  └─ Danh sách: {normal_edges[:10]}...")  # In 10 edges đầu
             
             # Cập nhật junction_edges
-            self.auto_assign_directions(normal_edges, "J1")
-            self.auto_assign_directions(normal_edges, "J4")
+            for junction_id in self.junction_edges:
+                self.auto_assign_directions(normal_edges, junction_id)
             
         except Exception as e:
             print(f"⚠️ Không thể tự động phát hiện edges: {e}")
     
     def auto_assign_directions(self, edges: list, junction_id: str):
-        """Tự động gán edges vào các hướng Bắc/Nam/Đông/Tây"""
-        if junction_id == "J1":
-            # ✅ Junction J1: Đếm CẢ xe VÀO và RA
-            bac = [e for e in edges if e in ["-E1", "E1"]]   # VÀO: -E1, RA: E1
-            nam = [e for e in edges if e in ["-E2", "E2"]]   # VÀO: -E2, RA: E2
-            dong = [e for e in edges if e in ["-E3", "E3"]]  # VÀO: -E3, RA: E3
-            tay = [e for e in edges if e in ["E0", "-E0"]]   # VÀO: E0, RA: -E0
-        
-        elif junction_id == "J4":
-            # ✅ Junction J4: Đếm CẢ xe VÀO và RA
-            bac = [e for e in edges if e in ["-E4", "E4"]]   # VÀO: -E4, RA: E4
-            nam = [e for e in edges if e in ["-E5", "E5"]]   # VÀO: -E5, RA: E5
-            dong = [e for e in edges if e in ["-E6", "E6"]]  # VÀO: -E6, RA: E6
-            tay = [e for e in edges if e in ["E3", "-E3"]]   # VÀO: E3, RA: -E3
-        
-        else:
-            bac = nam = dong = tay = []
+        """Gán các edge có trong SUMO vào hướng Bắc/Nam/Đông/Tây theo chỉ mục mạng"""
+        existing = set(edges)
+        # ✅ Đếm CẢ xe VÀO và RA của mỗi hướng
+        direction_edges = self.network_index.direction_edges(junction_id, outgoing=True, names=DIRECTION_NAMES)
+        bac = [e for e in direction_edges.get("Bắc", []) if e in existing]
+        nam = [e for e in direction_edges.get("Nam", []) if e in existing]
+        dong = [e for e in direction_edges.get("Đông", []) if e in existing]
+        tay = [e for e in direction_edges.get("Tây", []) if e in existing]
         
         self.junction_edges[junction_id] = {
             "Bắc": bac,
@@ -118,6 +120,7 @@ class VehicleCounter:
             "Đông": dong,
             "Tây": tay
         }
+        self._subscribed_snapshot = None  # Danh sách edge đổi → subscribe lại
         
         print(f"\n🧭 Gán hướng cho {junction_id}:")
         print(f"  ├─ Bắc:  {len(bac)} edges - {bac}")
@@ -132,17 +135,27 @@ class VehicleCounter:
             for direction in self.current_counts[junction_id]:
                 self.current_counts[junction_id][direction] = 0
         
+        # Snapshot dùng chung: danh sách xe/edge chỉ đọc 1 lần mỗi step
+        snapshot = get_step_snapshot(self.connection)
+        if self.use_subscription and snapshot is not self._subscribed_snapshot:
+            self.subscribe_edges(snapshot)
+        
         # ✅ FIX: Đếm lại từ đầu - CHỈ xe trên edge được chỉ định
         for junction_id, directions in self.junction_edges.items():
             for direction, edges in directions.items():
                 vehicle_count = 0
                 for edge in edges:
                     try:
+                        if self.use_subscription and edge in snapshot.subscribed_edges:
+                            # Số xe SUMO gửi kèm simulationStep() (chỉ gồm xe đang ở trên edge)
+                            vehicle_count += snapshot.edge_vehicle_count(edge)
+                            continue
+                        
                         # Lấy danh sách xe HIỆN TẠI trên edge này
-                        vehicles = traci.edge.getLastStepVehicleIDs(edge)
+                        vehicles = snapshot.edge_vehicle_ids(edge)
                         
                         # ✅ FIX: Chỉ đếm xe ĐANG CHẠY (loại bỏ xe đã arrived/departed)
-                        valid_vehicles = [v for v in vehicles if v in traci.vehicle.getIDList()]
+                        valid_vehicles = [v for v in vehicles if snapshot.has_vehicle(v)]
                         vehicle_count += len(valid_vehicles)
                     
                     except Exception:
@@ -152,6 +165,24 @@ class VehicleCounter:
                 # Cập nhật số đếm hiện tại (không tích lũy)
                 self.current_counts[junction_id][direction] = vehicle_count
     
+    def subscribe_edges(self, snapshot=None):
+        """
+        Subscribe LAST_STEP_VEHICLE_NUMBER cho mọi edge đang theo dõi
+
+        Edge subscribe lỗi được đếm theo cách cũ (đọc danh sách xe mỗi step).
+
+        Args:
+            snapshot: StepSnapshot của kết nối (None = snapshot của self.connection)
+        """
+        if snapshot is None:
+            snapshot = get_step_snapshot(self.connection)
+        edges = [edge for directions in self.junction_edges.values()
+                 for edge_list in directions.values() for edge in edge_list]
+        failed = snapshot.subscribe_edges(edges)
+        if failed:
+            print(f"⚠️ Không thể subscribe {len(failed)} edge, đếm trực tiếp: {sorted(failed)}")
+        self._subscribed_snapshot = snapshot
+
     def reset_counters(self):
         """Reset bộ đếm về 0"""
         current_time = time.time()
@@ -195,9 +226,9 @@ class VehicleCounter:
         
         try:
             step = 0
-            while self.running and traci.simulation.getMinExpectedNumber() > 0:
+            while self.running and self.traci.simulation.getMinExpectedNumber() > 0:
                 # Thực hiện simulation step
-                traci.simulationStep()
+                self.traci.simulationStep()
                 step += 1
                 
                 # Đếm xe
@@ -241,7 +272,7 @@ class VehicleCounter:
         """Dừng vehicle counter và đóng kết nối TraCI"""
         self.running = False
         try:
-            traci.close()
+            self.traci.close()
             print("\n✅ Đã đóng kết nối SUMO")
         except:
             pass
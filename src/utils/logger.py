@@ -0,0 +1,265 @@
+"""
+Logger - Ghi log theo cấp độ, không chặn vòng lặp mô phỏng
+
+Mỗi module lấy logger riêng qua get_logger(__name__) (cây "smart_traffic.*").
+Bản ghi được định dạng lười kiểu logging ("ETA=%.1fs", eta): log ở cấp độ
+đang tắt (mặc định DEBUG) chỉ tốn 1 phép so sánh cấp độ. Bản ghi đang bật được
+đẩy vào hàng đợi và một thread nền ghi ra sys.stdout theo lô → vòng lặp mô
+phỏng và GUI không phải chờ I/O console.
+
+Cấu hình qua biến môi trường (hoặc setup_logging()):
+    SMART_TRAFFIC_LOG_LEVEL   DEBUG / INFO (mặc định) / WARNING / ERROR
+    SMART_TRAFFIC_LOG_FORMAT  Format của logging, mặc định "%(message)s"
+                              vd: "%(relativeCreated)8.0f %(levelname)-7s %(name)s [%(junction)s] %(message)s"
+
+Sử dụng:
+    logger = get_logger(__name__, junction="J1")
+    logger.debug("ETA=%.1fs, khoảng cách=%.1fm", eta, distance)
+    logger.info("🚨 Kích hoạt ưu tiên cho %s", vehicle_id)
+"""
+
+import atexit
+import contextlib
+import logging
+import os
+import queue
+import sys
+import threading
+from typing import Dict, Optional, Union
+
+
+ROOT_LOGGER = "smart_traffic"
+DEFAULT_LEVEL = "INFO"
+DEFAULT_FORMAT = "%(message)s"
+FLUSH_INTERVAL = 0.05  # Thread nền ghi theo lô mỗi 50ms
+
+LEVEL_ENV = "SMART_TRAFFIC_LOG_LEVEL"
+FORMAT_ENV = "SMART_TRAFFIC_LOG_FORMAT"
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Ghi ra sys.stdout tại thời điểm ghi (theo contextlib.redirect_stdout của batch_runner)"""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+
+class _ContextFilter(logging.Filter):
+    """Gắn các trường ngữ cảnh (vd: junction) vào bản ghi"""
+
+    def __init__(self, context: Dict):
+        super().__init__()
+        self.context = context
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in self.context.items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class _QueueHandler(logging.Handler):
+    """
+    Đưa bản ghi vào hàng đợi (thay cho logging.handlers.QueueHandler)
+
+    Chỉ ghép message với tham số ngay lúc log (giống chi phí của f-string cũ) để
+    giá trị không bị đổi sau đó; định dạng và ghi ra stream do thread nền làm.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue):
+        super().__init__()
+        self.queue = log_queue
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+class _BackgroundWriter:
+    """
+    Thread nền ghi bản ghi ra handler theo lô
+
+    Thức dậy mỗi `interval` giây, lấy hết hàng đợi rồi ghi 1 lần (1 write + 1 flush)
+    → vòng lặp mô phỏng không bị thread ghi log tranh GIL sau mỗi bản ghi.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, handler: logging.Handler, interval: float):
+        self.queue = log_queue
+        self.handler = handler
+        self.interval = interval
+        self._drain_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="smart_traffic-log", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Dừng thread rồi ghi nốt phần còn lại của hàng đợi"""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self.drain()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.drain()
+
+    def drain(self):
+        """Ghi hết các bản ghi đang trong hàng đợi"""
+        with self._drain_lock:
+            records = []
+            try:
+                while True:
+                    records.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not records:
+                return
+            handler = self.handler
+            if isinstance(handler, logging.StreamHandler):
+                lines = [handler.format(r) for r in records if handler.filter(r) and r.levelno >= handler.level]
+                if lines:
+                    with handler.lock:
+                        try:
+                            stream = handler.stream
+                            stream.write(handler.terminator.join(lines) + handler.terminator)
+                            stream.flush()
+                        except Exception:
+                            handler.handleError(records[-1])
+            else:
+                for record in records:
+                    handler.handle(record)
+
+
+_lock = threading.RLock()
+_writer: Optional[_BackgroundWriter] = None
+_config: Dict = {}
+
+
+def setup_logging(level: Union[str, int, None] = None, fmt: Optional[str] = None,
+                  handler: Optional[logging.Handler] = None, interval: float = FLUSH_INTERVAL) -> logging.Logger:
+    """
+    Cấu hình (lại) cây logger "smart_traffic": hàng đợi → thread nền → handler
+
+    Args:
+        level: Cấp độ log (None = SMART_TRAFFIC_LOG_LEVEL hoặc INFO)
+        fmt: Format (None = SMART_TRAFFIC_LOG_FORMAT hoặc "%(message)s")
+        handler: Handler đích (None = sys.stdout)
+        interval: Chu kỳ ghi theo lô của thread nền (giây)
+
+    Returns:
+        Logger gốc "smart_traffic"
+    """
+    global _writer
+    with _lock:
+        shutdown_logging()
+        if level is None:
+            level = os.environ.get(LEVEL_ENV, DEFAULT_LEVEL)
+        if isinstance(level, str):
+            level = level.upper()
+        fmt = fmt or os.environ.get(FORMAT_ENV, DEFAULT_FORMAT)
+        target = handler or _StdoutHandler()
+        target.setFormatter(logging.Formatter(fmt))
+        target.addFilter(_ContextFilter({"junction": "-"}))  # Mặc định để format không lỗi
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level)
+        root.propagate = False
+        for old_handler in list(root.handlers):
+            root.removeHandler(old_handler)
+        log_queue = queue.SimpleQueue()
+        root.addHandler(_QueueHandler(log_queue))
+
+        _writer = _BackgroundWriter(log_queue, target, interval)
+        _writer.start()
+        _config.update(level=level, fmt=fmt, handler=target, interval=interval)
+        return root
+
+
+def flush_logging():
+    """Ghi ngay các bản ghi đang trong hàng đợi (vd: trước khi trả lại stdout)"""
+    if _writer is not None:
+        _writer.drain()
+
+
+def shutdown_logging():
+    """Ghi hết hàng đợi và dừng thread nền"""
+    global _writer
+    with _lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None
+
+
+def set_level(level: Union[str, int]):
+    """Đổi cấp độ log khi đang chạy (vd: "DEBUG" để xem toàn bộ trace của controllers)"""
+    logging.getLogger(ROOT_LOGGER).setLevel(level.upper() if isinstance(level, str) else level)
+
+
+@contextlib.contextmanager
+def muted_logging():
+    """
+    Tắt toàn bộ log của controllers trong khối lệnh (vd: khi stdout là os.devnull)
+
+    Bản ghi bị chặn ngay ở bước kiểm tra cấp độ nên không tốn chi phí tạo LogRecord.
+    """
+    root = logging.getLogger(ROOT_LOGGER)
+    previous = root.level
+    root.setLevel(logging.CRITICAL + 1)
+    try:
+        yield
+    finally:
+        root.setLevel(previous)
+
+
+def get_logger(name: str, **context) -> logging.Logger:
+    """
+    Lấy logger của một module (tự cấu hình ở lần gọi đầu tiên)
+
+    Args:
+        name: Tên module (thường là __name__)
+        **context: Trường ngữ cảnh gắn vào mọi bản ghi (vd: junction="J1")
+
+    Returns:
+        Logger "smart_traffic.<name>" (logger con "<name>.<giá trị context>" nếu có context;
+        dùng Logger thay vì LoggerAdapter để log ở cấp độ đang tắt chỉ tốn 1 lần kiểm tra)
+    """
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                setup_logging()
+    logger_name = f"{ROOT_LOGGER}.{name}"
+    if context:
+        logger_name += "." + ".".join(str(value) for value in context.values())
+    logger = logging.getLogger(logger_name)
+    if context and not logger.filters:
+        logger.addFilter(_ContextFilter(context))
+    return logger
+
+
+def _restart_after_fork():
+    """Tiến trình con (fork) không có thread nền → tạo lại với cùng cấu hình"""
+    global _writer
+    if _writer is not None:
+        _writer = None
+        setup_logging(_config.get("level"), _config.get("fmt"), _config.get("handler"), _config.get("interval"))
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(shutdown_logging)
@@ -0,0 +1,336 @@
+"""
+Profiler - Đo thời gian từng giai đoạn của mỗi step mô phỏng (tùy chọn bật)
+
+Mỗi step của vòng lặp mô phỏng gồm nhiều giai đoạn (simulationStep,
+AdaptiveController.step, PriorityController.step, update_data_from_sumo,
+update_ui...). StepProfiler ghi lại thời gian thực (wall time) và số lệnh TraCI
+của từng giai đoạn, cộng dồn theo step vào histogram (RingBuffer có bins), rồi
+xuất bảng tổng kết hoặc file Chrome trace (mở bằng chrome://tracing hoặc
+https://ui.perfetto.dev) khi kết thúc.
+
+Khi tắt (mặc định), stage() trả về một context manager rỗng dùng chung và
+@profiled chỉ kiểm tra 1 cờ → chi phí gần như bằng 0.
+
+Sử dụng:
+    profiler = get_profiler()
+    profiler.enable(trace=True)
+    profiler.attach_traci()               # Đếm lệnh TraCI (sau khi SUMO đã chạy)
+
+    profiler.begin_step(sim_time)         # SimulationDriver.step() tự gọi
+    with profiler.stage("simulationStep"):
+        traci.simulationStep()
+
+    @profiled("AdaptiveController.step")
+    def step(self): ...
+
+    print(profiler.format_summary())
+    profiler.write_chrome_trace("trace.json")
+"""
+
+import functools
+import json
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.ring_buffer import RingBuffer
+from utils.traci_monitor import TraCIMonitor, get_traci_monitor
+
+
+# Ngưỡng histogram thời gian mỗi giai đoạn trong 1 step (ms)
+DEFAULT_BINS_MS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0)
+
+STEP_STAGE = "step"  # Tên dòng tổng thời gian cả step trong bảng tổng kết
+
+
+class _NullStage:
+    """Context manager rỗng khi profiler tắt"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """Đo 1 lần chạy của 1 giai đoạn (wall time + số lệnh TraCI)"""
+
+    __slots__ = ("profiler", "name", "start", "calls")
+
+    def __init__(self, profiler: 'StepProfiler', name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.calls = self.profiler.command_count()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        self.profiler.record(self.name, self.start, end, self.profiler.command_count() - self.calls)
+        return False
+
+
+class StepProfiler:
+    """
+    Bộ đo thời gian theo step: {giai đoạn: histogram thời gian/step, số lệnh TraCI/step}
+    """
+
+    def __init__(self, history: int = 1000, bins_ms: Tuple[float, ...] = DEFAULT_BINS_MS,
+                 max_trace_events: int = 200000):
+        """
+        Args:
+            history: Số step gần nhất giữ lại để tính phân vị (p50/p95)
+            bins_ms: Ngưỡng histogram (ms)
+            max_trace_events: Số sự kiện tối đa lưu cho Chrome trace
+        """
+        self.history = history
+        self.bins_ms = tuple(bins_ms)
+        self.max_trace_events = max_trace_events
+        self.enabled = False
+        self.trace_enabled = False
+        self._monitor: Optional[TraCIMonitor] = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    # ==================== BẬT / TẮT ====================
+
+    def enable(self, trace: bool = False, connection=None):
+        """
+        Bật profiler
+
+        Args:
+            trace: Lưu từng lần chạy của giai đoạn để xuất Chrome trace
+            connection: Kết nối TraCI cần đếm lệnh (None = không đếm, gọi attach_traci sau)
+        """
+        self.enabled = True
+        self.trace_enabled = trace
+        if connection is not None:
+            self.attach_traci(connection)
+
+    def disable(self):
+        """Tắt profiler (giữ số liệu đã đo)"""
+        self.end_step()
+        self.enabled = False
+        self.detach_traci()
+
+    def attach_traci(self, connection=None):
+        """
+        Đếm lệnh TraCI của một kết nối
+
+        Args:
+            connection: SumoConnection/Connection (None = kết nối đang active)
+        """
+        self._monitor = get_traci_monitor(connection)
+
+    def detach_traci(self):
+        """Bỏ đếm lệnh TraCI (monitor của kết nối vẫn giữ nguyên)"""
+        self._monitor = None
+
+    def reset(self):
+        """Xóa toàn bộ số liệu đã đo"""
+        with self._lock:
+            self.step_count = 0
+            self.stage_times: Dict[str, RingBuffer] = {}   # ms/step
+            self.stage_calls: Dict[str, RingBuffer] = {}   # lệnh TraCI/step
+            self.trace_events: List[Dict] = []
+            self.dropped_trace_events = 0
+            self._step_totals: Dict[str, List[int]] = {}   # {giai đoạn: [ns, lệnh]} của step đang đo
+            self._step_start: Optional[int] = None
+            self._step_calls = 0
+            self._step_sim_time: Optional[float] = None
+            self._origin = time.perf_counter_ns()
+
+    # ==================== ĐO ====================
+
+    def command_count(self) -> int:
+        """Tổng số lệnh TraCI đã gửi (0 nếu chưa attach_traci)"""
+        return self._monitor.commands if self._monitor is not None else 0
+
+    def stage(self, name: str):
+        """
+        Context manager đo 1 giai đoạn
+
+        Args:
+            name: Tên giai đoạn (vd: "simulationStep")
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def begin_step(self, sim_time: Optional[float] = None):
+        """
+        Bắt đầu step mới (tự kết thúc step trước nếu còn mở)
+
+        Args:
+            sim_time: Thời gian SUMO của step (ghi vào trace)
+        """
+        if not self.enabled:
+            return
+        self.end_step()
+        self._step_start = time.perf_counter_ns()
+        self._step_calls = self.command_count()
+        self._step_sim_time = sim_time
+
+    def end_step(self):
+        """Kết thúc step đang đo: cộng dồn thời gian từng giai đoạn vào histogram"""
+        if self._step_start is None:
+            return
+        end = time.perf_counter_ns()
+        with self._lock:
+            totals = self._step_totals
+            self._step_totals = {}
+            totals[STEP_STAGE] = [end - self._step_start, self.command_count() - self._step_calls]
+            for name, (elapsed_ns, calls) in totals.items():
+                times = self.stage_times.get(name)
+                if times is None:
+                    times = self.stage_times[name] = RingBuffer(self.history, bins=self.bins_ms)
+                    self.stage_calls[name] = RingBuffer(self.history)
+                times.append(elapsed_ns / 1e6)
+                self.stage_calls[name].append(calls)
+            self.step_count += 1
+        self._add_trace_event(STEP_STAGE, self._step_start, end, totals[STEP_STAGE][1], self._step_sim_time)
+        self._step_start = None
+
+    def record(self, name: str, start_ns: int, end_ns: int, calls: int = 0):
+        """
+        Ghi 1 lần chạy của giai đoạn (gọi bởi stage()/profiled)
+
+        Args:
+            name: Tên giai đoạn
+            start_ns, end_ns: time.perf_counter_ns() lúc bắt đầu/kết thúc
+            calls: Số lệnh TraCI trong lần chạy
+        """
+        with self._lock:
+            totals = self._step_totals.get(name)
+            if totals is None:
+                self._step_totals[name] = [end_ns - start_ns, calls]
+            else:
+                totals[0] += end_ns - start_ns
+                totals[1] += calls
+        self._add_trace_event(name, start_ns, end_ns, calls)
+
+    def _add_trace_event(self, name: str, start_ns: int, end_ns: int, calls: int,
+                         sim_time: Optional[float] = None):
+        """Lưu sự kiện dạng "complete event" (ph="X") của Chrome trace"""
+        if not self.trace_enabled:
+            return
+        if len(self.trace_events) >= self.max_trace_events:
+            self.dropped_trace_events += 1
+            return
+        args = {"traci_calls": calls}
+        if sim_time is not None:
+            args["sim_time"] = sim_time
+        self.trace_events.append({
+            "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+            "ts": (start_ns - self._origin) / 1000.0, "dur": (end_ns - start_ns) / 1000.0, "args": args,
+        })
+
+    # ==================== KẾT QUẢ ====================
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        Tổng kết theo giai đoạn
+
+        Returns:
+            {giai đoạn: {steps, mean_ms, p50_ms, p95_ms, max_ms, total_ms, share,
+                         calls_per_step, histogram: [(ngưỡng ms, số step)]}}
+            share = tỉ lệ tổng thời gian của giai đoạn so với tổng thời gian các step
+        """
+        with self._lock:
+            step_times = self.stage_times.get(STEP_STAGE)
+            step_total = step_times.total if step_times is not None else 0.0
+            result = {}
+            for name, times in self.stage_times.items():
+                recent = sorted(times)
+                result[name] = {
+                    "steps": times.count,
+                    "mean_ms": times.mean,
+                    "p50_ms": _percentile(recent, 0.50),
+                    "p95_ms": _percentile(recent, 0.95),
+                    "max_ms": times.max or 0.0,
+                    "total_ms": times.total,
+                    "share": times.total / step_total if step_total else 0.0,
+                    "calls_per_step": self.stage_calls[name].mean,
+                    "histogram": list(zip(self.bins_ms + (float("inf"),), times.bin_counts)),
+                }
+        return result
+
+    def format_summary(self) -> str:
+        """Bảng tổng kết dạng text (sắp xếp theo tổng thời gian giảm dần)"""
+        rows = sorted(self.summary().items(), key=lambda item: item[1]["total_ms"], reverse=True)
+        lines = [f"⏱ Profile {self.step_count} step",
+                 f"{'Giai đoạn':<32}{'steps':>8}{'mean ms':>10}{'p50':>9}{'p95':>9}{'max':>9}"
+                 f"{'%step':>8}{'TraCI/step':>12}"]
+        for name, stats in rows:
+            lines.append(f"{name:<32}{stats['steps']:>8}{stats['mean_ms']:>10.3f}{stats['p50_ms']:>9.3f}"
+                         f"{stats['p95_ms']:>9.3f}{stats['max_ms']:>9.3f}{stats['share'] * 100:>7.1f}%"
+                         f"{stats['calls_per_step']:>12.1f}")
+        return "\n".join(lines)
+
+    def write_chrome_trace(self, path: str) -> int:
+        """
+        Ghi file Chrome trace JSON
+
+        Args:
+            path: File cần ghi
+
+        Returns:
+            Số sự kiện đã ghi
+        """
+        with self._lock:
+            events = list(self.trace_events)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"steps": self.step_count,
+                                     "dropped_events": self.dropped_trace_events}}, f)
+        return len(events)
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """Phân vị q (0..1) của list đã sắp xếp (nearest-rank)"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+# Profiler dùng chung của tiến trình
+_profiler = StepProfiler()
+
+
+def get_profiler() -> StepProfiler:
+    """Lấy profiler dùng chung của tiến trình"""
+    return _profiler
+
+
+def profiled(name: Optional[str] = None) -> Callable:
+    """
+    Decorator đo thời gian một hàm bằng profiler dùng chung
+
+    Args:
+        name: Tên giai đoạn (None = tên hàm)
+    """
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profiler.enabled:
+                return func(*args, **kwargs)
+            with _Stage(_profiler, stage_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
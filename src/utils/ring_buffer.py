@@ -0,0 +1,155 @@
+"""
+Ring Buffer - Bộ đệm vòng có dung lượng cố định cho lịch sử của controllers
+
+- RingBuffer: chuỗi số thực lưu trong array('d') vòng. Chỉ giữ `capacity`
+  giá trị gần nhất nhưng các thống kê tích lũy (count, total, mean, min, max,
+  số giá trị theo ngưỡng) tính trên TOÀN BỘ giá trị đã thêm, cập nhật O(1)
+  mỗi lần append → thống kê không phụ thuộc độ dài lịch sử.
+- BoundedHistory: deque giới hạn cho lịch sử dạng object (tuple/dict/xe),
+  có đếm tổng số phần tử đã thêm và hỗ trợ lấy lát cắt ([-10:]).
+
+Sử dụng:
+    times = RingBuffer(1000, bins=(15.0, 25.0))
+    times.append(12.3)
+    times.mean, times.max, times.bin_counts
+"""
+
+from array import array
+from collections import deque
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+
+class RingBuffer:
+    """
+    Bộ đệm vòng số thực (array('d')) kèm thống kê tích lũy
+    """
+
+    def __init__(self, capacity: int, bins: Sequence[float] = ()):
+        """
+        Args:
+            capacity: Số giá trị gần nhất được giữ lại
+            bins: Các ngưỡng tăng dần để đếm tích lũy; bin i đếm giá trị
+                  <= bins[i] (và > bins[i-1]), bin cuối đếm giá trị > bins[-1]
+        """
+        if capacity <= 0:
+            raise ValueError("capacity phải > 0")
+        self.capacity = capacity
+        self.bins = tuple(bins)
+        self._data = array('d', [0.0]) * capacity
+        self._start = 0   # Vị trí phần tử cũ nhất
+        self._size = 0    # Số phần tử đang giữ
+        self.clear_stats()
+
+    def clear_stats(self):
+        """Xóa thống kê tích lũy (giữ nguyên dữ liệu trong bộ đệm)"""
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.bin_counts: List[int] = [0] * (len(self.bins) + 1)
+
+    def clear(self):
+        """Xóa toàn bộ dữ liệu và thống kê"""
+        self._start = 0
+        self._size = 0
+        self.clear_stats()
+
+    def append(self, value: float):
+        """Thêm một giá trị (ghi đè giá trị cũ nhất khi đầy)"""
+        value = float(value)
+        if self._size < self.capacity:
+            self._data[(self._start + self._size) % self.capacity] = value
+            self._size += 1
+        else:
+            self._data[self._start] = value
+            self._start = (self._start + 1) % self.capacity
+
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.bins:
+            index = 0
+            while index < len(self.bins) and value > self.bins[index]:
+                index += 1
+            self.bin_counts[index] += 1
+
+    def extend(self, values: Iterable[float]):
+        """Thêm nhiều giá trị"""
+        for value in values:
+            self.append(value)
+
+    @property
+    def mean(self) -> float:
+        """Trung bình của toàn bộ giá trị đã thêm (0.0 nếu chưa có)"""
+        return self.total / self.count if self.count else 0.0
+
+    def last(self, default: Optional[float] = None) -> Optional[float]:
+        """Giá trị mới nhất"""
+        if self._size == 0:
+            return default
+        return self._data[(self._start + self._size - 1) % self.capacity]
+
+    def to_list(self) -> List[float]:
+        """Các giá trị đang giữ, cũ nhất → mới nhất"""
+        return list(self)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __iter__(self) -> Iterator[float]:
+        data, start, capacity = self._data, self._start, self.capacity
+        for i in range(self._size):
+            yield data[(start + i) % capacity]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.to_list()[index]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("RingBuffer index out of range")
+        return self._data[(self._start + index) % self.capacity]
+
+    def __repr__(self) -> str:
+        return repr(self.to_list())
+
+
+class BoundedHistory(deque):
+    """
+    deque giới hạn `capacity` phần tử gần nhất, kèm tổng số phần tử đã thêm
+    """
+
+    def __init__(self, capacity: int, iterable: Iterable = ()):
+        """
+        Args:
+            capacity: Số phần tử gần nhất được giữ lại
+            iterable: Dữ liệu ban đầu
+        """
+        super().__init__(iterable, maxlen=capacity)
+        self.total_count = len(self)
+
+    def append(self, item):
+        """Thêm một phần tử (bỏ phần tử cũ nhất khi đầy)"""
+        super().append(item)
+        self.total_count += 1
+
+    def extend(self, items: Iterable):
+        """Thêm nhiều phần tử"""
+        for item in items:
+            self.append(item)
+
+    def clear(self):
+        """Xóa dữ liệu và bộ đếm"""
+        super().clear()
+        self.total_count = 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return super().__getitem__(index)
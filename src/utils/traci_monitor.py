@@ -0,0 +1,289 @@
+"""
+TraCI Monitor - Đếm lệnh TraCI theo domain/phương thức và đo độ trễ socket theo step
+
+Trả lời câu hỏi "mỗi step tốn bao nhiêu round-trip tới SUMO, do ai gọi":
+- Mỗi phương thức của domain TraCI (vehicle.getSpeed, edge.getLastStepVehicleIDs,
+  trafficlight.setPhase...) được đếm số lần gọi, số round-trip socket và thời
+  gian. Lệnh không đi qua domain (simulationStep, load...) được ghi theo tên lệnh.
+- Độ trễ socket (gửi + chờ kết quả) được cộng dồn theo step; thời gian của chính
+  lệnh simulationStep (SUMO tính toán) được tách riêng.
+- Có thể ghi log tóm tắt mỗi N step.
+
+Monitor chỉ hoạt động trên kết nối đã gắn (get_traci_monitor); các phương thức
+domain được bọc 1 lần ở mức class và chỉ tra 1 dict khi kết nối không có monitor.
+
+Sử dụng:
+    monitor = get_traci_monitor(log_every=100)   # Sau khi SUMO đã chạy
+    ...
+    monitor.stats()["methods"]["vehicle.getSpeed"]
+    print(monitor.format_stats())
+"""
+
+import functools
+import time
+from typing import Callable, Dict, List, Optional
+
+import traci
+import traci.constants as tc
+from traci import domain as traci_domain
+
+from utils.ring_buffer import RingBuffer
+
+
+# Tên các lệnh gửi thẳng qua Connection (không qua domain)
+COMMAND_NAMES = {
+    tc.CMD_SIMSTEP: "simulationStep",
+    tc.CMD_LOAD: "load",
+    tc.CMD_CLOSE: "close",
+    tc.CMD_GETVERSION: "getVersion",
+    tc.CMD_SETORDER: "setOrder",
+}
+
+
+# Monitor của từng kết nối {Connection gốc: TraCIMonitor}
+_monitors: Dict[object, 'TraCIMonitor'] = {}
+_domains_wrapped = False
+
+
+def _wrap_domain_method(cls, name: str, func: Callable):
+    """Bọc 1 phương thức domain: ghi nhận vào monitor của kết nối (nếu có)"""
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        monitor = _monitors.get(self._connection)
+        if monitor is None or monitor._current is not None:
+            return func(self, *args, **kwargs)  # Không theo dõi hoặc lời gọi lồng nhau
+        return monitor._call(f"{self._name}.{name}", func, self, args, kwargs)
+
+    wrapper._traci_monitor_wrapped = True
+    setattr(cls, name, wrapper)
+
+
+def _wrap_domains():
+    """Bọc mọi phương thức public của các class domain TraCI (1 lần cho tiến trình)"""
+    global _domains_wrapped
+    if _domains_wrapped:
+        return
+    for domain in traci_domain.DOMAINS:
+        for cls in type(domain).__mro__:
+            if cls is object:
+                continue
+            for name, func in list(vars(cls).items()):
+                if name.startswith("_") or not callable(func) or getattr(func, "_traci_monitor_wrapped", False):
+                    continue
+                _wrap_domain_method(cls, name, func)
+    _domains_wrapped = True
+
+
+class _MonitorStepListener(traci.StepListener):
+    """StepListener chốt số liệu của step sau mỗi simulationStep()"""
+
+    def __init__(self, monitor: 'TraCIMonitor'):
+        self.monitor = monitor
+
+    def step(self, t=0):
+        self.monitor.end_step()
+        return True
+
+
+class TraCIMonitor:
+    """
+    Thống kê lệnh TraCI của một kết nối
+    """
+
+    def __init__(self, connection=None, log_every: int = 0, log: Callable[[str], None] = print,
+                 history: int = 1000):
+        """
+        Args:
+            connection: SumoConnection/Connection (None = kết nối đang active)
+            log_every: Ghi log tóm tắt mỗi N step (0 = không ghi)
+            log: Hàm ghi log
+            history: Số step gần nhất giữ lại
+        """
+        if connection is None or connection is traci:
+            self.raw = traci.connection.check()
+        else:
+            self.raw = getattr(connection, "connection", connection)
+        self.log_every = log_every
+        self.log = log
+        self.methods: Dict[str, List[float]] = {}   # {"vehicle.getSpeed": [số lần gọi, round-trip, giây]}
+        self.commands = 0                           # Tổng round-trip
+        self.latency = 0.0                          # Tổng độ trễ (giây, không tính simulationStep)
+        self.step_count = 0
+        self.step_commands = RingBuffer(history)    # Round-trip/step
+        self.step_latency_ms = RingBuffer(history)  # Độ trễ/step (ms, không tính simulationStep)
+        self.step_sim_ms = RingBuffer(history)      # Thời gian lệnh simulationStep (ms)
+        self.last_step: Dict[str, float] = {}
+        self._current: Optional[List[float]] = None  # Phương thức domain đang chạy
+        self.recorder = None                         # TraCIRecorder (utils.traci_replay) nếu đang ghi
+        self._reset_step()
+        self._window_start = self._method_counts()
+
+        _wrap_domains()
+        send_cmd = self.raw._sendCmd
+
+        def monitored_send_cmd(cmdID, varID, objID, format="", *values):
+            start = time.perf_counter()
+            try:
+                return send_cmd(cmdID, varID, objID, format, *values)
+            finally:
+                self._record_command(cmdID, time.perf_counter() - start)
+
+        self.raw._sendCmd = monitored_send_cmd
+        self._listener_id = self.raw.addStepListener(_MonitorStepListener(self))
+        _monitors[self.raw] = self
+
+    def detach(self):
+        """Gỡ monitor khỏi kết nối"""
+        self.raw.__dict__.pop("_sendCmd", None)
+        if self._listener_id is not None:
+            try:
+                self.raw.removeStepListener(self._listener_id)
+            except Exception:
+                pass
+        self._listener_id = None
+        if _monitors.get(self.raw) is self:
+            del _monitors[self.raw]
+
+    # ==================== GHI NHẬN ====================
+
+    def _call(self, key: str, func: Callable, obj, args, kwargs):
+        """Gọi phương thức domain và ghi nhận số round-trip + thời gian của nó"""
+        entry = self.methods.get(key)
+        if entry is None:
+            entry = self.methods[key] = [0, 0, 0.0]
+        entry[0] += 1
+        self._current = entry
+        start = time.perf_counter()
+        try:
+            result = func(obj, *args, **kwargs)
+        except Exception as e:
+            if self.recorder is not None:
+                self.recorder.record_error(key, args, kwargs, e)
+            raise
+        finally:
+            entry[2] += time.perf_counter() - start
+            self._current = None
+        if self.recorder is not None:
+            self.recorder.record(key, args, kwargs, result)
+        return result
+
+    def _record_command(self, cmd_id: int, elapsed: float):
+        """Ghi nhận 1 round-trip socket"""
+        self.commands += 1
+        self._step_commands += 1
+        entry = self._current
+        if entry is None:
+            # Lệnh gửi thẳng qua Connection (simulationStep, load...)
+            key = COMMAND_NAMES.get(cmd_id, f"cmd_0x{cmd_id:02x}")
+            entry = self.methods.get(key)
+            if entry is None:
+                entry = self.methods[key] = [0, 0, 0.0]
+            entry[0] += 1
+            entry[2] += elapsed
+        entry[1] += 1
+        if cmd_id == tc.CMD_SIMSTEP:
+            self._step_sim += elapsed
+            if self.recorder is not None:
+                self.recorder.next_step()
+        else:
+            self.latency += elapsed
+            self._step_latency += elapsed
+
+    def _reset_step(self):
+        self._step_commands = 0
+        self._step_latency = 0.0
+        self._step_sim = 0.0
+
+    def end_step(self):
+        """Chốt số liệu của step vừa xong (gọi bởi StepListener)"""
+        self.step_count += 1
+        self.last_step = {
+            "commands": self._step_commands,
+            "latency_ms": self._step_latency * 1000.0,
+            "simulation_step_ms": self._step_sim * 1000.0,
+        }
+        self.step_commands.append(self._step_commands)
+        self.step_latency_ms.append(self.last_step["latency_ms"])
+        self.step_sim_ms.append(self.last_step["simulation_step_ms"])
+        self._reset_step()
+        if self.log_every and self.step_count % self.log_every == 0:
+            self.log(self._format_window())
+
+    # ==================== KẾT QUẢ ====================
+
+    def _method_counts(self) -> Dict[str, int]:
+        return {key: entry[1] for key, entry in self.methods.items()}
+
+    def _format_window(self, top: int = 5) -> str:
+        """Tóm tắt N step gần nhất: round-trip/step và phương thức tốn nhiều round-trip nhất"""
+        counts = self._method_counts()
+        window = {key: count - self._window_start.get(key, 0) for key, count in counts.items()}
+        self._window_start = counts
+        steps = self.log_every
+        busiest = sorted(((c, k) for k, c in window.items() if c), reverse=True)[:top]
+        recent = self.step_commands[-steps:]
+        latency = self.step_latency_ms[-steps:]
+        return (f"📡 TraCI step {self.step_count}: {sum(recent) / len(recent):.1f} lệnh/step, "
+                f"trễ {sum(latency) / len(latency):.2f} ms/step | "
+                + ", ".join(f"{key}×{count / steps:.1f}" for count, key in busiest))
+
+    def stats(self) -> Dict:
+        """
+        Thống kê dạng dict
+
+        Returns:
+            {steps, commands, commands_per_step, latency_ms_per_step, simulation_step_ms,
+             last_step, methods: {"domain.method": {calls, round_trips, time_ms}}}
+        """
+        return {
+            "steps": self.step_count,
+            "commands": self.commands,
+            "commands_per_step": self.step_commands.mean,
+            "latency_ms_per_step": self.step_latency_ms.mean,
+            "simulation_step_ms": self.step_sim_ms.mean,
+            "last_step": dict(self.last_step),
+            "methods": {key: {"calls": int(calls), "round_trips": int(trips), "time_ms": seconds * 1000.0}
+                        for key, (calls, trips, seconds) in self.methods.items()},
+        }
+
+    def format_stats(self, top: int = 20) -> str:
+        """Bảng thống kê theo phương thức (sắp xếp theo số round-trip giảm dần)"""
+        steps = max(1, self.step_count)
+        lines = [f"📡 TraCI {self.step_count} step: {self.step_commands.mean:.1f} lệnh/step, "
+                 f"trễ {self.step_latency_ms.mean:.2f} ms/step, simulationStep {self.step_sim_ms.mean:.2f} ms",
+                 f"{'Phương thức':<44}{'gọi':>10}{'round-trip':>12}{'/step':>9}{'ms':>10}"]
+        rows = sorted(self.methods.items(), key=lambda item: (item[1][1], item[1][0]), reverse=True)
+        for key, (calls, trips, seconds) in rows[:top]:
+            lines.append(f"{key:<44}{int(calls):>10}{int(trips):>12}{trips / steps:>9.2f}{seconds * 1000.0:>10.1f}")
+        return "\n".join(lines)
+
+
+def get_traci_monitor(connection=None, log_every: Optional[int] = None,
+                      log: Optional[Callable[[str], None]] = None) -> TraCIMonitor:
+    """
+    Lấy (hoặc gắn mới) monitor của một kết nối TraCI
+
+    Args:
+        connection: SumoConnection/Connection (None = kết nối đang active)
+        log_every: Ghi log tóm tắt mỗi N step (None = giữ nguyên)
+        log: Hàm ghi log (None = giữ nguyên)
+
+    Returns:
+        TraCIMonitor của kết nối
+    """
+    if connection is None or connection is traci:
+        raw = traci.connection.check()
+    else:
+        raw = getattr(connection, "connection", connection)
+    monitor = _monitors.get(raw)
+    if monitor is None:
+        # Bỏ monitor của các kết nối đã đóng
+        for old_raw in [c for c in _monitors if getattr(c, "_socket", None) is None]:
+            del _monitors[old_raw]
+        monitor = TraCIMonitor(connection)
+    if log_every is not None:
+        monitor.log_every = log_every
+    if log is not None:
+        monitor.log = log
+    return monitor
@@ -0,0 +1,290 @@
+"""
+TraCI Replay - Ghi lại mọi phản hồi TraCI của một lần chạy và phát lại không cần SUMO
+
+Ghi (TraCIRecorder): mọi lời gọi phương thức domain (vehicle.getSpeed,
+edge.getLastStepVehicleIDs, trafficlight.setPhase...) cùng tham số và kết quả
+(hoặc lỗi) được lưu theo từng step, nhờ hook của TraCIMonitor
+(utils.traci_monitor). Dữ liệu subscription mà traci đọc được (sau
+simulationStep và khi subscribe) được ghi thành sự kiện xen giữa các lời gọi.
+
+Phát lại (ReplayConnection): kết nối giả có cùng API với Connection của traci
+(domain, simulationStep, StepListener, isLoaded, close), trả về đúng kết quả đã
+ghi theo thứ tự lời gọi. Controllers, SensorManager, StepSnapshot... nhận nó qua
+tham số `connection` như kết nối thật, nên chạy với đầu vào y hệt lần ghi mà
+không tốn socket hay thời gian SUMO → đo được riêng chi phí Python của logic
+điều khiển. Dict kết quả subscription được làm mới tại chỗ giống traci, nên
+code giữ tham chiếu tới getAllSubscriptionResults() vẫn thấy dữ liệu mới mỗi step.
+Khi code gọi khác với lần ghi (thứ tự, tham số), ReplayMismatchError chỉ ra
+step và lời gọi đầu tiên bị lệch.
+
+Sử dụng:
+    recorder = TraCIRecorder(conn, meta={"scenario": "SC1"})   # Ngay sau khi SUMO chạy
+    ...                                                         # Vòng lặp mô phỏng
+    recorder.save("sc1.traci.gz")
+
+    conn = ReplayConnection("sc1.traci.gz")
+    ctrl = AdaptiveController(junction_id="J1", connection=conn)
+"""
+
+import copy
+import gzip
+import pickle
+from typing import Dict, List, Optional
+
+from traci import domain as traci_domain
+from traci.step import StepManager
+
+from utils.traci_monitor import get_traci_monitor
+
+
+TRACE_FORMAT = 1
+
+# Loại kết quả của 1 lời gọi
+_RESULT = 0
+_ERROR = 1
+_SUBSCRIPTION = 2  # Sự kiện: dữ liệu subscription của 1 đối tượng vừa được traci đọc
+
+# Getter đọc dict subscription (không có round-trip) → khi phát lại trả về dict sống
+SUBSCRIPTION_GETTERS = frozenset((
+    "getSubscriptionResults", "getAllSubscriptionResults",
+    "getContextSubscriptionResults", "getAllContextSubscriptionResults",
+))
+
+# Response ID của context subscription (còn lại là variable subscription)
+_CONTEXT_RESPONSES = frozenset(getattr(domain, "_contextResponseID", None) for domain in traci_domain.DOMAINS)
+
+
+class ReplayMismatchError(RuntimeError):
+    """Lời gọi TraCI khi phát lại không khớp với trace đã ghi"""
+
+
+def _copy_result(value):
+    """Sao chép kết quả có thể bị traci sửa sau đó (dict/list kết quả subscription)"""
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
+
+
+class TraCIRecorder:
+    """
+    Ghi mọi lời gọi domain TraCI của một kết nối theo từng step
+    """
+
+    def __init__(self, connection=None, meta: Optional[Dict] = None):
+        """
+        Args:
+            connection: SumoConnection/Connection (None = kết nối đang active)
+            meta: Thông tin lần chạy lưu kèm trace (kịch bản, seed, số step...)
+        """
+        self.meta = dict(meta or {})
+        # steps[i] = các lời gọi sau simulationStep thứ i: (key, args, kwargs, loại, kết quả)
+        self.steps: List[List[tuple]] = [[]]
+        self._calls = self.steps[0]
+        self.monitor = get_traci_monitor(connection)
+        self.monitor.recorder = self
+
+        raw = self.monitor.raw
+        read_subscription = raw._readSubscription
+
+        def recording_read_subscription(result):
+            object_id, response = read_subscription(result)
+            self._record_subscription(raw._subscriptionMapping[response], response, object_id)
+            return object_id, response
+
+        raw._readSubscription = recording_read_subscription
+
+    def record(self, key: str, args: tuple, kwargs: Dict, result):
+        """Ghi 1 lời gọi thành công (gọi bởi TraCIMonitor)"""
+        if key.rpartition(".")[2] in SUBSCRIPTION_GETTERS:
+            result = None  # Phát lại từ các sự kiện subscription
+        self._calls.append((key, args, kwargs or None, _RESULT, _copy_result(result)))
+
+    def _record_subscription(self, results, response: int, object_id: str):
+        """Ghi dữ liệu subscription hiện tại của 1 đối tượng (sau khi traci vừa đọc)"""
+        if response in _CONTEXT_RESPONSES:
+            data = {oid: dict(values) for oid, values in results._contextResults.get(object_id, {}).items()}
+        else:
+            data = dict(results._results.get(object_id, {}))
+        self._calls.append(("#subscription", (response, object_id), None, _SUBSCRIPTION, data))
+
+    def record_error(self, key: str, args: tuple, kwargs: Dict, error: Exception):
+        """Ghi 1 lời gọi bị lỗi (gọi bởi TraCIMonitor)"""
+        self._calls.append((key, args, kwargs or None, _ERROR, (type(error), str(error))))
+
+    def next_step(self):
+        """Bắt đầu ghi step mới (gọi khi lệnh simulationStep trả về)"""
+        self._calls = []
+        self.steps.append(self._calls)
+
+    def detach(self):
+        """Ngừng ghi"""
+        if self.monitor.recorder is self:
+            self.monitor.recorder = None
+        self.monitor.raw.__dict__.pop("_readSubscription", None)
+
+    def save(self, path: str) -> int:
+        """
+        Lưu trace (pickle nén gzip)
+
+        Args:
+            path: File cần ghi
+
+        Returns:
+            Số step đã ghi
+        """
+        with gzip.open(path, "wb") as f:
+            pickle.dump({"format": TRACE_FORMAT, "meta": self.meta, "steps": self.steps}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        return len(self.steps) - 1
+
+
+def load_trace(path: str) -> Dict:
+    """
+    Đọc trace đã ghi bằng TraCIRecorder.save()
+
+    Returns:
+        {"format", "meta", "steps"}
+    """
+    with gzip.open(path, "rb") as f:
+        trace = pickle.load(f)
+    if trace.get("format") != TRACE_FORMAT:
+        raise ValueError(f"Trace {path} có định dạng {trace.get('format')}, cần {TRACE_FORMAT}")
+    return trace
+
+
+class _ReplayDomain:
+    """Domain giả (vehicle, edge...): mỗi phương thức trả về kết quả kế tiếp trong trace"""
+
+    def __init__(self, connection: 'ReplayConnection', name: str,
+                 results: Dict[str, Dict], context_results: Dict[str, Dict]):
+        self._connection = connection
+        self._name = name
+        self._results = results                  # {objectID: {varID: giá trị}} - làm mới mỗi step
+        self._context_results = context_results  # {objectID: {oid: {varID: giá trị}}}
+
+    def __getattr__(self, method: str):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        key = f"{self._name}.{method}"
+        replay = self._connection._replay
+
+        if method in SUBSCRIPTION_GETTERS:
+            # Giống traci: trả về dict sống (hoặc phần tử của nó), không phải bản ghi
+            source = self._context_results if "Context" in method else self._results
+
+            def replay_method(*args, **kwargs):
+                replay(key, args, kwargs)
+                return source.get(args[0], {}) if args else source
+        else:
+            def replay_method(*args, **kwargs):
+                return replay(key, args, kwargs)
+
+        replay_method.__name__ = method
+        setattr(self, method, replay_method)  # Cache để lần sau không qua __getattr__
+        return replay_method
+
+
+class ReplayConnection(StepManager):
+    """
+    Kết nối TraCI giả phát lại trace đã ghi (không cần SUMO)
+    """
+
+    def __init__(self, trace, strict: bool = True):
+        """
+        Args:
+            trace: Đường dẫn file trace hoặc dict đã load_trace()
+            strict: Kiểm tra cả tham số của từng lời gọi và số lời gọi mỗi step
+        """
+        StepManager.__init__(self)
+        if isinstance(trace, str):
+            trace = load_trace(trace)
+        self.meta: Dict = trace.get("meta", {})
+        self._steps: List[List[tuple]] = trace["steps"]
+        self.strict = strict
+        self.step_index = 0
+        self.calls = 0
+        self._calls = self._steps[0]
+        self._pos = 0
+        self._socket = True  # Giống Connection: None = đã đóng
+        # Dict subscription sống theo response ID (giống Connection._subscriptionMapping)
+        self._subscription_results: Dict[int, Dict] = {}
+        for domain in traci_domain.DOMAINS:
+            results, context_results = {}, {}
+            for response, target in ((getattr(domain, "_subscribeResponseID", None), results),
+                                     (getattr(domain, "_contextResponseID", None), context_results)):
+                if response is not None:
+                    self._subscription_results[response] = target
+            setattr(self, domain._name, _ReplayDomain(self, domain._name, results, context_results))
+
+    @property
+    def recorded_steps(self) -> int:
+        """Số simulationStep có trong trace"""
+        return len(self._steps) - 1
+
+    def _mismatch(self, message: str):
+        raise ReplayMismatchError(f"Replay lệch ở step {self.step_index}, lời gọi #{self._pos}: {message}")
+
+    def _apply_subscriptions(self):
+        """Cập nhật dict subscription theo các sự kiện đứng trước lời gọi kế tiếp"""
+        calls = self._calls
+        pos = self._pos
+        while pos < len(calls) and calls[pos][3] == _SUBSCRIPTION:
+            response, object_id = calls[pos][1]
+            self._subscription_results[response][object_id] = calls[pos][4]
+            pos += 1
+        self._pos = pos
+
+    def _replay(self, key: str, args: tuple, kwargs: Dict):
+        """Trả về kết quả đã ghi của lời gọi kế tiếp"""
+        calls = self._calls
+        pos = self._pos
+        if pos < len(calls) and calls[pos][3] == _SUBSCRIPTION:
+            self._apply_subscriptions()
+            pos = self._pos
+        if pos >= len(calls):
+            self._mismatch(f"{key}{args} nhưng trace không còn lời gọi nào trong step")
+        entry = calls[pos]
+        if entry[0] != key:
+            self._mismatch(f"{key}{args}, trace ghi {entry[0]}{entry[1]}")
+        if self.strict and (entry[1] != args or entry[2] != (kwargs or None)) \
+                and repr((entry[1], entry[2])) != repr((args, kwargs or None)):
+            # So bằng repr cho tham số không có __eq__ (vd: trafficlight.Logic)
+            self._mismatch(f"{key}{args} {kwargs or ''}, trace ghi {entry[0]}{entry[1]} {entry[2] or ''}")
+        self._pos = pos + 1
+        self.calls += 1
+        if entry[3] == _ERROR:
+            error_type, message = entry[4]
+            raise error_type(message)
+        return entry[4]
+
+    def simulationStep(self, step=0.):
+        """Chuyển sang step kế tiếp của trace rồi gọi các StepListener"""
+        self._apply_subscriptions()
+        if self.strict and self._pos != len(self._calls):
+            self._mismatch(f"simulationStep() khi còn {len(self._calls) - self._pos} lời gọi chưa phát lại, "
+                           f"kế tiếp là {self._calls[self._pos][0]}")
+        if self.step_index >= self.recorded_steps:
+            raise ReplayMismatchError(f"Trace chỉ có {self.recorded_steps} step")
+        self.step_index += 1
+        self._calls = self._steps[self.step_index]
+        self._pos = 0
+        # Giống traci: xóa kết quả cũ tại chỗ rồi đọc kết quả của step mới
+        for results in self._subscription_results.values():
+            if results:
+                results.clear()
+        self._apply_subscriptions()
+        self.manageStepListeners(step)
+        return []
+
+    def isLoaded(self) -> bool:
+        """Kết nối giả còn mở hay không"""
+        return self._socket is not None
+
+    def close(self, wait=True):
+        """Đóng kết nối giả (gỡ các StepListener như Connection thật)"""
+        for listener_id in list(self._stepListeners.keys()):
+            self.removeStepListener(listener_id)
+        self._socket = None
+
+    def __repr__(self):
+        return f"ReplayConnection(step={self.step_index}/{self.recorded_steps})"
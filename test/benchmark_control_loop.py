@@ -0,0 +1,307 @@
+"""
+Benchmark vòng điều khiển - Đo hiệu năng vòng lặp mô phỏng headless
+
+Chạy test2.sumocfg không GUI với các mốc step cố định (mặc định 1000 và 3600)
+cho từng kịch bản (FIXED, ADAPTIVE, SC1..SC6) và ghi kết quả ra JSON:
+    - steps_per_sec        : số step mô phỏng mỗi giây (wall time của vòng lặp)
+    - traci_calls_per_step : số round-trip TraCI trung bình mỗi step
+    - peak_rss_mb          : bộ nhớ đỉnh của tiến trình Python và của SUMO
+    - stages_ms            : thời gian trung bình mỗi step của từng giai đoạn
+                             (simulationStep, AdaptiveController.step...)
+
+Mỗi lần chạy nằm trong một tiến trình con riêng (để đo RSS đỉnh chính xác) và
+chạy tuần tự (để các lần chạy không tranh CPU của nhau). Khi có --baseline,
+kết quả được so với file JSON cũ; trả về mã lỗi 1 nếu steps/s giảm quá ngưỡng.
+
+Backend:
+    sumo   - SUMO thật (headless) qua TraCI
+    replay - Phát lại trace TraCI đã ghi (utils.traci_replay), không cần SUMO:
+             chỉ đo chi phí Python của controllers. Trace được ghi 1 lần bằng
+             SUMO vào --trace-dir nếu chưa có.
+
+Sử dụng:
+    python test/benchmark_control_loop.py --output results/bench.json
+    python test/benchmark_control_loop.py --scenarios ADAPTIVE SC1 --steps 1000 \\
+        --repeat 3 --baseline results/bench.json
+    python test/benchmark_control_loop.py --backend replay --trace-dir results/traces
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+try:
+    import resource  # Chỉ có trên Unix
+except ImportError:
+    resource = None
+
+# ==================== PATH SETUP ====================
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+for path in (PROJECT_ROOT, SRC_ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from simulation.batch_runner import SCENARIOS, DEFAULT_CONFIG, chay_mot_thi_nghiem, chay_replay, trace_path
+
+
+DEFAULT_STEPS = [1000, 3600]
+
+BACKENDS = ("sumo", "replay")
+
+# Ngưỡng giảm steps/s so với baseline bị coi là regression
+DEFAULT_THRESHOLD = 0.10
+
+
+def _peak_rss_mb(who) -> Optional[float]:
+    """RSS đỉnh (MB) của tiến trình hiện tại hoặc các tiến trình con đã kết thúc"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _chay_benchmark(scenario_key: str, seed: int, steps: int, config_path: str,
+                    replay_path: Optional[str] = None) -> Dict:
+    """
+    Chạy 1 lần đo (trong tiến trình con mới)
+
+    Args:
+        replay_path: File trace cần phát lại (None = chạy SUMO thật)
+
+    Returns:
+        Dòng KPI của batch_runner + RSS đỉnh
+    """
+    if replay_path:
+        row = chay_replay(replay_path, profile=True)
+    else:
+        row = chay_mot_thi_nghiem(scenario_key, seed, steps, config_path, profile=True, traci_stats=0)
+    if resource is not None:
+        row["python_peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_SELF)
+        row["sumo_peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    return row
+
+
+def _trong_tien_trinh_moi(*args) -> Dict:
+    """Chạy _chay_benchmark trong tiến trình mới → RSS đỉnh không lẫn giữa các lần"""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(_chay_benchmark, *args).result()
+
+
+def _ghi_trace(scenario_key: str, seed: int, steps: int, config_path: str, path: str) -> Optional[str]:
+    """Ghi trace TraCI bằng SUMO thật (trong tiến trình con). Trả về lỗi nếu có"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        row = executor.submit(chay_mot_thi_nghiem, scenario_key, seed, steps, config_path,
+                              record_path=path).result()
+    return row.get("error") or None
+
+
+def _trung_vi(runs: List[Dict], key: str) -> Optional[float]:
+    values = [r[key] for r in runs if r.get(key) is not None]
+    return statistics.median(values) if values else None
+
+
+def do_mot_truong_hop(scenario_key: str, steps: int, seed: int = 1, repeat: int = 1,
+                      config_path: str = DEFAULT_CONFIG, backend: str = "sumo",
+                      trace_dir: Optional[str] = None) -> Dict:
+    """
+    Đo 1 tổ hợp kịch bản × số step (lặp lại `repeat` lần, lấy trung vị)
+
+    Args:
+        scenario_key: Mã kịch bản trong batch_runner.SCENARIOS
+        steps: Số step mô phỏng
+        seed: Seed cho SUMO và lịch xe ưu tiên
+        repeat: Số lần chạy lặp lại
+        config_path: File .sumocfg
+        backend: "sumo" hoặc "replay"
+        trace_dir: Thư mục trace TraCI (backend replay)
+
+    Returns:
+        Dict kết quả của trường hợp
+    """
+    result = {"scenario": scenario_key, "steps": steps, "seed": seed, "backend": backend}
+    replay_path = None
+    if backend == "replay":
+        replay_path = trace_path(trace_dir or "benchmark_traces", scenario_key, seed, steps)
+        if not os.path.exists(replay_path):
+            print(f"🎬 Ghi trace {replay_path}...")
+            error = _ghi_trace(scenario_key, seed, steps, config_path, replay_path)
+            if error:
+                result["error"] = error
+                return result
+
+    runs = []
+    for _ in range(repeat):
+        row = _trong_tien_trinh_moi(scenario_key, seed, steps, config_path, replay_path)
+        if row.get("error"):
+            result["error"] = row["error"]
+            return result
+        runs.append(row)
+
+    stage_names = [key for key in runs[0] if key.startswith("stage_") and key.endswith("_ms")]
+    result.update({
+        "repeat": repeat,
+        "steps_per_sec": round(statistics.median(r["steps_per_sec"] for r in runs), 1),
+        "steps_per_sec_runs": [r["steps_per_sec"] for r in runs],
+        "wall_time": round(statistics.median(r["wall_time"] for r in runs), 2),
+        "traci_calls_per_step": _trung_vi(runs, "traci_calls_per_step"),
+        "traci_latency_ms_per_step": _trung_vi(runs, "traci_latency_ms_per_step"),
+        # Backend replay: số lời gọi domain được phát lại (không có round-trip socket)
+        "replay_calls_per_step": _trung_vi(runs, "replay_calls_per_step"),
+        "preemptions": runs[0].get("preemptions"),
+        "avg_cycle": runs[0].get("avg_cycle"),
+        "python_peak_rss_mb": max((r.get("python_peak_rss_mb") or 0.0) for r in runs) or None,
+        "sumo_peak_rss_mb": max((r.get("sumo_peak_rss_mb") or 0.0) for r in runs) or None,
+        "stages_ms": {name[len("stage_"):-len("_ms")]: statistics.median(r.get(name, 0.0) for r in runs)
+                      for name in stage_names},
+    })
+    return result
+
+
+def _so_lenh(result: Dict) -> float:
+    """Số lệnh TraCI/step (hoặc số lời gọi phát lại/step với backend replay)"""
+    value = result.get("traci_calls_per_step")
+    if value is None:
+        value = result.get("replay_calls_per_step")
+    return value or 0.0
+
+
+def _thong_tin_moi_truong() -> Dict:
+    """Thông tin môi trường chạy (để so sánh kết quả giữa các máy/commit)"""
+    info = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": None,
+        "sumo_version": None,
+    }
+    try:
+        info["git_commit"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                            capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        pass
+    try:
+        from sumolib import checkBinary
+        output = subprocess.run([checkBinary("sumo"), "--version"], capture_output=True, text=True).stdout
+        info["sumo_version"] = output.splitlines()[0].strip() if output else None
+    except Exception:
+        pass
+    return info
+
+
+def so_sanh_baseline(results: List[Dict], baseline_path: str,
+                     threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    So sánh kết quả với file JSON baseline và in bảng chênh lệch
+
+    Args:
+        results: Kết quả vừa đo
+        baseline_path: File JSON của lần đo trước
+        threshold: Tỉ lệ giảm steps/s tối đa cho phép (0.10 = 10%)
+
+    Returns:
+        Danh sách trường hợp bị regression
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["scenario"], r["steps"], r.get("backend", "sumo")): r
+                    for r in json.load(f).get("results", [])}
+
+    print(f"\n📈 So sánh với {baseline_path}")
+    print(f"{'Trường hợp':<18}{'step/s':>10}{'cũ':>10}{'Δ':>9}{'TraCI/step':>12}{'cũ':>8}")
+    regressions = []
+    for result in results:
+        key = (result["scenario"], result["steps"], result.get("backend", "sumo"))
+        old = baseline.get(key)
+        name = f"{result['scenario']}@{result['steps']}"
+        if old is None or result.get("error") or old.get("error"):
+            print(f"{name:<18}{'-':>10}")
+            continue
+        change = result["steps_per_sec"] / old["steps_per_sec"] - 1.0 if old["steps_per_sec"] else 0.0
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  ⚠ regression"
+        print(f"{name:<18}{result['steps_per_sec']:>10.1f}{old['steps_per_sec']:>10.1f}{change * 100:>8.1f}%"
+              f"{_so_lenh(result):>12.1f}{_so_lenh(old):>8.1f}{flag}")
+    return regressions
+
+
+def in_ket_qua(results: List[Dict]):
+    """In bảng tóm tắt kết quả"""
+    print(f"\n{'Trường hợp':<18}{'step/s':>10}{'TraCI/step':>12}{'RSS py MB':>11}{'RSS sumo MB':>13}"
+          f"{'sim ms':>9}{'ctrl ms':>9}")
+    for result in results:
+        name = f"{result['scenario']}@{result['steps']}"
+        if result.get("error"):
+            print(f"{name:<18} ❌ {result['error']}")
+            continue
+        stages = result["stages_ms"]
+        controller_ms = sum(ms for stage, ms in stages.items() if stage.endswith("Controller.step"))
+        print(f"{name:<18}{result['steps_per_sec']:>10.1f}{_so_lenh(result):>12.1f}"
+              f"{result['python_peak_rss_mb'] or 0.0:>11.1f}{result['sumo_peak_rss_mb'] or 0.0:>13.1f}"
+              f"{stages.get('simulationStep', 0.0):>9.3f}{controller_ms:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vòng điều khiển (headless)")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS.keys()),
+                        choices=list(SCENARIOS.keys()), help="Các kịch bản cần đo")
+    parser.add_argument("--steps", nargs="+", type=int, default=DEFAULT_STEPS, help="Các mốc số step")
+    parser.add_argument("--seed", type=int, default=1, help="Seed cho SUMO và lịch xe ưu tiên")
+    parser.add_argument("--repeat", type=int, default=1, help="Số lần chạy mỗi trường hợp (lấy trung vị)")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="File .sumocfg")
+    parser.add_argument("--backend", choices=BACKENDS, default="sumo",
+                        help="sumo = SUMO thật; replay = phát lại trace TraCI (chỉ đo controllers)")
+    parser.add_argument("--trace-dir", default=None,
+                        help="Thư mục trace TraCI cho --backend replay (mặc định: benchmark_traces cạnh --output)")
+    parser.add_argument("--output", default="benchmark_results.json", help="File JSON kết quả")
+    parser.add_argument("--baseline", default=None, help="File JSON của lần đo trước để so sánh")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Tỉ lệ giảm steps/s coi là regression (mặc định 0.10)")
+    args = parser.parse_args()
+
+    trace_dir = args.trace_dir or os.path.join(os.path.dirname(os.path.abspath(args.output)), "benchmark_traces")
+    cases = [(scenario, steps) for steps in args.steps for scenario in args.scenarios]
+    print(f"🚀 Benchmark {len(cases)} trường hợp × {args.repeat} lần (backend {args.backend})...")
+    results = []
+    bench_start = time.perf_counter()
+    for index, (scenario, steps) in enumerate(cases, 1):
+        result = do_mot_truong_hop(scenario, steps, seed=args.seed, repeat=args.repeat, config_path=args.config,
+                                   backend=args.backend, trace_dir=trace_dir)
+        results.append(result)
+        if result.get("error"):
+            print(f"❌ [{index}/{len(cases)}] {scenario}@{steps}: {result['error']}")
+        else:
+            print(f"✅ [{index}/{len(cases)}] {scenario}@{steps}: {result['steps_per_sec']} step/s, "
+                  f"{_so_lenh(result)} lệnh TraCI/step")
+
+    in_ket_qua(results)
+
+    report = {"environment": _thong_tin_moi_truong(), "config": os.path.relpath(args.config, PROJECT_ROOT),
+              "results": results}
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n📊 Đã ghi {len(results)} kết quả vào {args.output} ({time.perf_counter() - bench_start:.1f}s)")
+
+    if args.baseline:
+        regressions = so_sanh_baseline(results, args.baseline, args.threshold)
+        if regressions:
+            print(f"⚠ steps/s giảm quá {args.threshold * 100:.0f}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
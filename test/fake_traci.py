@@ -0,0 +1,309 @@
+"""
+Kết nối TraCI giả lập trong bộ nhớ cho unit test (không cần SUMO)
+
+FakeConnection mô phỏng phần API TraCI mà StepSnapshot, EmergencyRegistry,
+VehicleCounter, PriorityController dùng: getter của simulation/vehicle/edge/
+junction, variable/context subscription (kết quả làm mới tại chỗ sau mỗi
+simulationStep(), mất hết sau load()), StepListener. Mọi lệnh được đếm trong
+`calls` để kiểm tra số lệnh TraCI.
+
+Sử dụng:
+    conn = FakeConnection(edges={"E0": 0.1})
+    conn.add_vehicle("veh_0", road="E0", speed=3.0)
+    conn.simulationStep()
+"""
+
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+import traci
+import traci.constants as tc
+
+
+class FakeVehicle:
+    def __init__(self, vehicle_id: str, type_id: str = "car", vclass: str = "passenger", road: str = "",
+                 speed: float = 0.0, position: Tuple[float, float] = (0.0, 0.0), waiting: float = 0.0,
+                 route: str = "r0", departure: float = 0.0):
+        self.id = vehicle_id
+        self.type_id = type_id
+        self.vclass = vclass
+        self.road = road
+        self.speed = speed
+        self.position = position
+        self.waiting = waiting
+        self.route = route
+        self.departure = departure
+
+
+VEHICLE_VARS = {
+    tc.VAR_SPEED: lambda v: v.speed,
+    tc.VAR_TYPE: lambda v: v.type_id,
+    tc.VAR_VEHICLECLASS: lambda v: v.vclass,
+    tc.VAR_ROAD_ID: lambda v: v.road,
+    tc.VAR_POSITION: lambda v: v.position,
+    tc.VAR_WAITING_TIME: lambda v: v.waiting,
+    tc.VAR_ROUTE_ID: lambda v: v.route,
+    tc.VAR_DEPARTURE: lambda v: v.departure,
+}
+
+
+def _unknown(kind: str, object_id: str):
+    return traci.exceptions.TraCIException(f"{kind} '{object_id}' is not known")
+
+
+class _Domain:
+    def __init__(self, conn: 'FakeConnection', name: str):
+        self._conn = conn
+        self._name = name
+
+    def _call(self, method: str):
+        self._conn.calls[f"{self._name}.{method}"] += 1
+
+
+class _Simulation(_Domain):
+    def getTime(self):
+        self._call("getTime")
+        return self._conn.time
+
+    def getDeltaT(self):
+        self._call("getDeltaT")
+        return self._conn.delta_t
+
+    def getDepartedIDList(self):
+        self._call("getDepartedIDList")
+        return tuple(self._conn.departed)
+
+    def getPendingVehicles(self):
+        self._call("getPendingVehicles")
+        return tuple(v.id for v in self._conn.pending)
+
+    def subscribe(self, var_ids):
+        self._call("subscribe")
+        self._conn.sim_sub_vars = tuple(var_ids)
+        self._conn.refresh_subscriptions()
+
+    def getSubscriptionResults(self):
+        self._call("getSubscriptionResults")
+        return self._conn.sim_results
+
+
+class _Vehicle(_Domain):
+    def _get(self, method: str, vehicle_id: str) -> FakeVehicle:
+        self._call(method)
+        vehicle = self._conn.vehicles.get(vehicle_id)
+        if vehicle is None:
+            raise _unknown("Vehicle", vehicle_id)
+        return vehicle
+
+    def getIDList(self):
+        self._call("getIDList")
+        return tuple(self._conn.vehicles)
+
+    def getSpeed(self, vehicle_id):
+        return self._get("getSpeed", vehicle_id).speed
+
+    def getTypeID(self, vehicle_id):
+        return self._get("getTypeID", vehicle_id).type_id
+
+    def getVehicleClass(self, vehicle_id):
+        return self._get("getVehicleClass", vehicle_id).vclass
+
+    def getRoadID(self, vehicle_id):
+        return self._get("getRoadID", vehicle_id).road
+
+    def getPosition(self, vehicle_id):
+        return self._get("getPosition", vehicle_id).position
+
+    def getWaitingTime(self, vehicle_id):
+        return self._get("getWaitingTime", vehicle_id).waiting
+
+    def getRouteID(self, vehicle_id):
+        return self._get("getRouteID", vehicle_id).route
+
+    def getDeparture(self, vehicle_id):
+        return self._get("getDeparture", vehicle_id).departure
+
+    def subscribe(self, vehicle_id, var_ids):
+        self._get("subscribe", vehicle_id)
+        self._conn.vehicle_subs[vehicle_id] = tuple(var_ids)
+        self._conn.refresh_subscriptions()
+
+    def getAllSubscriptionResults(self):
+        self._call("getAllSubscriptionResults")
+        return self._conn.vehicle_results
+
+    def remove(self, vehicle_id):
+        self._call("remove")
+        if self._conn.vehicles.pop(vehicle_id, None) is None:
+            pending = [v for v in self._conn.pending if v.id == vehicle_id]
+            if not pending:
+                raise _unknown("Vehicle", vehicle_id)
+            self._conn.pending.remove(pending[0])
+
+
+class _Edge(_Domain):
+    def _check(self, method: str, edge_id: str):
+        self._call(method)
+        if edge_id not in self._conn.edges:
+            raise _unknown("Edge", edge_id)
+
+    def getIDList(self):
+        self._call("getIDList")
+        return tuple(self._conn.edges)
+
+    def getLastStepVehicleIDs(self, edge_id):
+        self._check("getLastStepVehicleIDs", edge_id)
+        return self._conn.edge_vehicles(edge_id)
+
+    def getLastStepVehicleNumber(self, edge_id):
+        self._check("getLastStepVehicleNumber", edge_id)
+        return len(self._conn.edge_vehicles(edge_id))
+
+    def getLastStepOccupancy(self, edge_id):
+        self._check("getLastStepOccupancy", edge_id)
+        return self._conn.edges[edge_id]
+
+    def subscribe(self, edge_id, var_ids):
+        self._check("subscribe", edge_id)
+        self._conn.edge_subs[edge_id] = tuple(var_ids)
+        self._conn.refresh_subscriptions()
+
+    def getAllSubscriptionResults(self):
+        self._call("getAllSubscriptionResults")
+        return self._conn.edge_results
+
+
+class _Junction(_Domain):
+    def subscribeContext(self, junction_id, domain, radius, var_ids):
+        self._call("subscribeContext")
+        if junction_id not in self._conn.junctions:
+            raise _unknown("Junction", junction_id)
+        self._conn.context_subs[junction_id] = (radius, tuple(var_ids))
+        self._conn.refresh_subscriptions()
+
+    def getAllContextSubscriptionResults(self):
+        self._call("getAllContextSubscriptionResults")
+        return self._conn.context_results
+
+    def getPosition(self, junction_id):
+        self._call("getPosition")
+        return self._conn.junctions[junction_id]
+
+
+class FakeConnection:
+    """
+    Mạng giả: edges {edge_id: occupancy}, junctions {junction_id: (x, y)}
+    """
+
+    def __init__(self, edges: Optional[Dict[str, float]] = None,
+                 junctions: Optional[Dict[str, Tuple[float, float]]] = None, delta_t: float = 1.0):
+        self.edges: Dict[str, float] = dict(edges or {})
+        self.junctions: Dict[str, Tuple[float, float]] = dict(junctions or {})
+        self.delta_t = delta_t
+        self.calls: Counter = Counter()
+        self._socket = object()  # None sau close() (như traci.connection.Connection)
+        self.simulation = _Simulation(self, "simulation")
+        self.vehicle = _Vehicle(self, "vehicle")
+        self.edge = _Edge(self, "edge")
+        self.junction = _Junction(self, "junction")
+        self._listeners: Dict[int, traci.StepListener] = {}
+        self._next_listener = 0
+        # Dict kết quả giữ nguyên đối tượng (như traci: reset() rồi điền lại)
+        self.sim_results: Dict[int, object] = {}
+        self.vehicle_results: Dict[str, Dict[int, object]] = {}
+        self.edge_results: Dict[str, Dict[int, object]] = {}
+        self.context_results: Dict[str, Dict[str, Dict[int, object]]] = {}
+        self._reset_world()
+
+    def _reset_world(self):
+        self.time = 0.0
+        self.vehicles: Dict[str, FakeVehicle] = {}
+        self.pending = []
+        self.departed: Tuple[str, ...] = ()
+        self.sim_sub_vars: Tuple[int, ...] = ()
+        self.vehicle_subs: Dict[str, Tuple[int, ...]] = {}
+        self.edge_subs: Dict[str, Tuple[int, ...]] = {}
+        self.context_subs: Dict[str, Tuple[float, Tuple[int, ...]]] = {}
+        self.refresh_subscriptions()
+
+    # ==================== ĐIỀU KHIỂN MẠNG GIẢ ====================
+
+    def add_vehicle(self, vehicle_id: str, **attrs) -> FakeVehicle:
+        """Xe chờ chèn: vào mạng (departed) ở simulationStep() kế tiếp"""
+        vehicle = FakeVehicle(vehicle_id, **attrs)
+        self.pending.append(vehicle)
+        return vehicle
+
+    def edge_vehicles(self, edge_id: str) -> Tuple[str, ...]:
+        return tuple(v.id for v in self.vehicles.values() if v.road == edge_id)
+
+    def refresh_subscriptions(self):
+        """Điền lại kết quả subscription theo trạng thái hiện tại (SUMO gửi kèm mỗi step)"""
+        self.sim_results.clear()
+        if tc.VAR_DEPARTED_VEHICLES_IDS in self.sim_sub_vars:
+            self.sim_results[tc.VAR_DEPARTED_VEHICLES_IDS] = tuple(self.departed)
+
+        self.vehicle_results.clear()
+        for vehicle_id in [v for v in self.vehicle_subs if v not in self.vehicles]:
+            del self.vehicle_subs[vehicle_id]  # Xe rời mạng → mất subscription
+        for vehicle_id, var_ids in self.vehicle_subs.items():
+            vehicle = self.vehicles[vehicle_id]
+            self.vehicle_results[vehicle_id] = {var: VEHICLE_VARS[var](vehicle) for var in var_ids}
+
+        self.edge_results.clear()
+        for edge_id, var_ids in self.edge_subs.items():
+            values = {}
+            for var in var_ids:
+                if var == tc.LAST_STEP_VEHICLE_NUMBER:
+                    values[var] = len(self.edge_vehicles(edge_id))
+                elif var == tc.LAST_STEP_VEHICLE_ID_LIST:
+                    values[var] = self.edge_vehicles(edge_id)
+                elif var == tc.LAST_STEP_OCCUPANCY:
+                    values[var] = self.edges[edge_id]
+            self.edge_results[edge_id] = values
+
+        self.context_results.clear()
+        for junction_id, (radius, var_ids) in self.context_subs.items():
+            jx, jy = self.junctions[junction_id]
+            inside = {}
+            for vehicle in self.vehicles.values():
+                x, y = vehicle.position
+                if (x - jx) ** 2 + (y - jy) ** 2 <= radius ** 2:
+                    inside[vehicle.id] = {var: VEHICLE_VARS[var](vehicle) for var in var_ids}
+            if inside:
+                self.context_results[junction_id] = inside
+
+    # ==================== API TRACI ====================
+
+    def simulationStep(self, step=0.0):
+        self.calls["simulationStep"] += 1
+        self.time += self.delta_t
+        self.departed = tuple(v.id for v in self.pending)
+        for vehicle in self.pending:
+            vehicle.departure = self.time
+            self.vehicles[vehicle.id] = vehicle
+        self.pending = []
+        self.refresh_subscriptions()
+        for listener in list(self._listeners.values()):
+            listener.step(self.time)
+
+    def load(self, args=None):
+        """Nạp lại mô phỏng: SUMO bỏ mọi subscription, thời gian về 0"""
+        self.calls["load"] += 1
+        self._reset_world()
+
+    def addStepListener(self, listener) -> int:
+        listener_id = self._next_listener
+        self._next_listener += 1
+        listener.setID(listener_id)
+        self._listeners[listener_id] = listener
+        return listener_id
+
+    def removeStepListener(self, listener_id: int) -> bool:
+        return self._listeners.pop(listener_id, None) is not None
+
+    def close(self):
+        self._socket = None
+
+    def reset_calls(self):
+        self.calls.clear()
@@ -1 +1,216 @@
-# Kiểm thử (unit test, integration test)
\ No newline at end of file
+# Kiểm thử (unit test, integration test)
+"""
+Unit tests cho controllers.cycle_tracker.CycleTracker
+
+So sánh với công thức cũ duyệt lại phase_history (AdaptiveController.get_cycle_time
+và KPI "Chu kỳ TB" của Dashboard) trên cùng chuỗi pha.
+
+Chạy: python -m pytest test/test_controllers.py -q
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from controllers.cycle_tracker import CycleTracker
+
+
+PHASE_ORDER = ["NS_GREEN", "NS_YELLOW", "ALL_RED", "EW_GREEN", "EW_YELLOW", "ALL_RED"]
+
+
+# ==================== CÔNG THỨC CŨ ====================
+
+def old_get_cycle_time(phase_history, current_phase):
+    """AdaptiveController.get_cycle_time trước khi có CycleTracker"""
+    if len(phase_history) < 2:
+        return 0.0
+
+    ns_green_times = []
+    for phase, start_time, duration in reversed(phase_history):
+        if phase == "NS_GREEN":
+            ns_green_times.append(start_time)
+            if len(ns_green_times) == 2:
+                break
+    if len(ns_green_times) >= 2:
+        return ns_green_times[0] - ns_green_times[1]
+
+    if current_phase in ["NS_GREEN", "EW_GREEN"]:
+        same_phase_times = [start_time for phase, start_time, _ in phase_history
+                            if phase == current_phase]
+        if len(same_phase_times) >= 2:
+            return same_phase_times[-1] - same_phase_times[-2]
+    return 0.0
+
+
+def old_average_cycle(phase_history):
+    """KPI "Chu kỳ TB" của Dashboard trước khi có CycleTracker (None = không thêm vào danh sách)"""
+    if len(phase_history) == 0:
+        return None
+
+    full_history = phase_history[-100:]
+    all_ns_green_times = [start_time for phase, start_time, _ in full_history if "NS_GREEN" in phase]
+
+    if len(all_ns_green_times) >= 2:
+        intervals = [all_ns_green_times[i + 1] - all_ns_green_times[i]
+                     for i in range(len(all_ns_green_times) - 1)]
+        valid_intervals = [x for x in intervals if 15 <= x <= 90]
+        if valid_intervals:
+            return sum(valid_intervals) / len(valid_intervals)
+        sorted_intervals = sorted(intervals)
+        median_interval = sorted_intervals[len(sorted_intervals) // 2]
+        return max(20.0, min(60.0, median_interval))
+
+    recent_history = phase_history[-10:]
+    total_duration = sum(duration for _, _, duration in recent_history)
+    num_phases = len(recent_history)
+    if num_phases >= 5:
+        return total_duration / (num_phases / 5.0)
+
+    green_durations = [duration for phase, _, duration in recent_history
+                       if "GREEN" in phase and "YELLOW" not in phase]
+    if green_durations:
+        return (sum(green_durations) / len(green_durations)) * 2 + 10.0
+    return 40.0
+
+
+# ==================== TIỆN ÍCH ====================
+
+def feed(phases):
+    """
+    Chạy chuỗi (phase, duration) qua CycleTracker và phase_history, trả về
+    từng bước (tracker, phase_history, current_phase) sau mỗi lần kết thúc pha
+    """
+    tracker = CycleTracker()
+    history = []
+    time = 0.0
+    for i, (phase, duration) in enumerate(phases):
+        history.append((phase, time, duration))
+        tracker.record_phase(phase, time, duration)
+        time += duration
+        current_phase = phases[i + 1][0] if i + 1 < len(phases) else phase
+        yield tracker, history, current_phase
+
+
+def assert_same(phases):
+    for tracker, history, current_phase in feed(phases):
+        assert tracker.cycle_time(current_phase) == pytest.approx(old_get_cycle_time(history, current_phase))
+        expected = old_average_cycle(history)
+        actual = tracker.average_cycle(default=40.0)
+        if expected is None:
+            assert actual is None
+        else:
+            assert actual == pytest.approx(expected)
+
+
+def random_phases(seed, count, green=(5.0, 45.0), skip_rate=0.1):
+    """Chuỗi pha ngẫu nhiên; đôi khi bỏ qua pha (chuyển nhanh/ưu tiên) để sinh ngoại lai"""
+    rng = random.Random(seed)
+    phases = []
+    index = 0
+    while len(phases) < count:
+        phase = PHASE_ORDER[index % len(PHASE_ORDER)]
+        index += 1
+        if rng.random() < skip_rate:
+            continue
+        if "GREEN" in phase:
+            duration = round(rng.uniform(*green), 1)
+        elif "YELLOW" in phase:
+            duration = 3.0
+        else:
+            duration = 2.0
+        phases.append((phase, duration))
+    return phases
+
+
+# ==================== CYCLE TRACKER ====================
+
+@pytest.mark.parametrize("seed", range(5))
+def test_trung_khop_cong_thuc_cu_chuoi_ngau_nhien(seed):
+    """Chuỗi dài (> 100 pha) để kiểm tra cả cửa sổ 100 pha"""
+    assert_same(random_phases(seed, 400))
+
+
+def test_trung_khop_chu_ky_dai_ngan_xen_ke():
+    """Chu kỳ rất dài (starvation) xen chu kỳ rất ngắn → một phần ngoại lai"""
+    assert_same(random_phases(7, 300, green=(1.0, 80.0), skip_rate=0.3))
+
+
+def test_toan_ngoai_lai_dung_trung_vi_kep():
+    """Mọi chu kỳ < 15s → trung vị kẹp vào [20, 60]"""
+    phases = [("NS_GREEN", 2.0), ("EW_GREEN", 2.0), ("ALL_RED", 1.0)] * 10
+    assert_same(phases)
+    tracker = CycleTracker()
+    for tracker, _, _ in feed(phases):
+        pass
+    assert tracker.filtered_mean is None
+    assert tracker.average_cycle() == 20.0
+
+    # Mọi chu kỳ > 90s → kẹp 60
+    phases = [("NS_GREEN", 60.0), ("EW_GREEN", 60.0)] * 5
+    assert_same(phases)
+    for tracker, _, _ in feed(phases):
+        pass
+    assert tracker.average_cycle() == 60.0
+
+
+def test_it_hon_5_pha_uoc_luong_tu_pha_xanh():
+    phases = [("NS_GREEN", 20.0), ("NS_YELLOW", 3.0), ("ALL_RED", 2.0), ("EW_GREEN", 30.0)]
+    assert_same(phases)
+    tracker = CycleTracker()
+    for tracker, _, _ in feed(phases):
+        pass
+    assert tracker.average_cycle() == pytest.approx(25.0 * 2 + 10.0)
+
+
+def test_it_hon_5_pha_khong_co_pha_xanh():
+    phases = [("NS_YELLOW", 3.0), ("ALL_RED", 2.0)]
+    assert_same(phases)
+    tracker = CycleTracker()
+    for tracker, _, _ in feed(phases):
+        pass
+    assert tracker.average_cycle(default=40.0) == 40.0
+
+
+def test_chua_du_2_ns_green_uoc_luong_tu_10_pha_gan_nhat():
+    """Chỉ một lần NS_GREEN nhưng nhiều pha → ước lượng từ durations (>= 5 pha)"""
+    phases = [("NS_GREEN", 30.0)] + [("EW_GREEN", 20.0), ("EW_YELLOW", 3.0), ("ALL_RED", 2.0)] * 5
+    assert_same(phases)
+
+
+def test_cycle_time_du_phong_chi_cho_pha_xanh():
+    """Chưa đủ 2 NS_GREEN: chỉ pha xanh hiện tại được dùng làm mốc"""
+    tracker = CycleTracker()
+    tracker.record_phase("NS_GREEN", 0.0, 20.0)
+    tracker.record_phase("ALL_RED", 20.0, 2.0)
+    tracker.record_phase("EW_GREEN", 22.0, 20.0)
+    tracker.record_phase("ALL_RED", 42.0, 2.0)
+    tracker.record_phase("EW_GREEN", 44.0, 20.0)
+    assert tracker.cycle_time("EW_GREEN") == 22.0
+    assert tracker.cycle_time("ALL_RED") == 0.0
+    assert tracker.cycle_time("EW_YELLOW") == 0.0
+    assert tracker.cycle_time(None) == 0.0
+
+
+def test_chua_co_pha_nao():
+    tracker = CycleTracker()
+    assert tracker.cycle_time("NS_GREEN") == 0.0
+    assert tracker.average_cycle() is None
+    assert tracker.last_cycle == 0.0
+
+
+def test_reset():
+    tracker = CycleTracker()
+    for tracker, _, _ in feed(random_phases(1, 50)):
+        pass
+    assert tracker.cycle_count > 0
+    tracker.reset()
+    assert tracker.phase_count == 0
+    assert tracker.cycle_count == 0
+    assert tracker.average_cycle() is None
@@ -0,0 +1,119 @@
+"""
+Unit tests cho simulation.emergency_registry.EmergencyRegistry (dùng kết nối TraCI giả)
+
+Chạy: python -m pytest test/test_emergency_registry.py -q
+"""
+
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from fake_traci import FakeConnection
+from simulation.emergency_registry import EmergencyRegistry, get_emergency_registry
+
+
+def make_connection():
+    conn = FakeConnection()
+    conn.add_vehicle("car_0", type_id="car")
+    conn.add_vehicle("amb_0", type_id="ambulance")
+    conn.simulationStep()
+    return conn
+
+
+def test_xe_co_san_va_xe_moi_vao_mang():
+    conn = make_connection()
+    registry = EmergencyRegistry(conn)
+    assert registry.vehicle_ids() == ("amb_0",)
+
+    conn.add_vehicle("police_0", type_id="car_police")
+    conn.add_vehicle("fire_0", type_id="truck", vclass="emergency")
+    conn.add_vehicle("bus_0", type_id="bus")
+    conn.simulationStep()
+    assert registry.vehicle_ids() == ("amb_0", "fire_0", "police_0")
+    assert "fire_0" in registry and "bus_0" not in registry
+    assert registry.vehicles["fire_0"] == "truck"
+
+
+def test_moi_xe_chi_phan_loai_1_lan():
+    conn = make_connection()
+    registry = EmergencyRegistry(conn)
+    assert registry.classified_count == 2
+
+    conn.add_vehicle("car_1", type_id="car")
+    conn.add_vehicle("amb_1", type_id="ambulance")
+    conn.simulationStep()
+    conn.reset_calls()
+    for _ in range(5):
+        conn.simulationStep()
+        registry.vehicle_ids()
+    assert registry.classified_count == 4
+    assert conn.calls["vehicle.getTypeID"] == 0
+    assert conn.calls["vehicle.getVehicleClass"] == 0
+
+
+def test_xe_roi_mang_bi_loai():
+    """Xe bị traci.vehicle.remove (không có trong arrived list) vẫn bị loại nhờ has_vehicle"""
+    conn = make_connection()
+    registry = EmergencyRegistry(conn)
+    conn.add_vehicle("amb_1", type_id="ambulance")
+    conn.simulationStep()
+    assert len(registry) == 2
+
+    conn.vehicle.remove("amb_0")
+    conn.simulationStep()
+    assert registry.vehicle_ids() == ("amb_1",)
+    assert "amb_0" not in registry.vehicles
+    assert len(registry) == 1
+
+
+def test_xe_roi_mang_truoc_khi_phan_loai():
+    conn = FakeConnection()
+    conn.add_vehicle("amb_0", type_id="ambulance")
+    registry = EmergencyRegistry(conn)
+    conn.simulationStep()
+    # Xe departed nhưng đã rời mạng trước khi đọc type → bỏ qua, không lỗi
+    del conn.vehicles["amb_0"]
+    conn.add_vehicle("amb_1", type_id="ambulance")
+    conn.simulationStep()
+    assert registry.vehicle_ids() == ("amb_1",)
+
+
+def test_detach():
+    conn = make_connection()
+    registry = EmergencyRegistry(conn)
+    registry.detach()
+    conn.add_vehicle("amb_1", type_id="ambulance")
+    conn.simulationStep()
+    assert "amb_1" not in registry
+
+
+def test_registry_dung_chung_theo_ket_noi_va_bo_tu_khoa():
+    conn = make_connection()
+    other = make_connection()
+    registry = get_emergency_registry(conn)
+    assert get_emergency_registry(conn) is registry
+    assert get_emergency_registry(other) is not registry
+    assert get_emergency_registry(conn) is registry
+
+    police_only = get_emergency_registry(conn, {"police"})
+    assert police_only is not registry
+    assert get_emergency_registry(conn, ("police",)) is police_only
+    assert police_only.vehicle_ids() == ()
+    assert registry.vehicle_ids() == ("amb_0",)
+
+    # Chỉ 1 listener mỗi registry: xe mới được phân loại 1 lần
+    conn.add_vehicle("amb_1", type_id="ambulance")
+    conn.simulationStep()
+    assert registry.classified_count == 3
+
+
+def test_ket_noi_da_dong_tao_registry_moi():
+    conn = make_connection()
+    registry = get_emergency_registry(conn)
+    conn.close()
+    get_emergency_registry(make_connection())  # Dọn registry của kết nối đã đóng
+    assert get_emergency_registry(conn) is not registry
@@ -0,0 +1,88 @@
+"""
+Unit tests cho simulation.kpi_recorder (KPIRecorder, controller_schema)
+
+Chạy: python -m pytest test/test_kpi_recorder.py -q
+"""
+
+import csv
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from simulation.kpi_recorder import KPIRecorder, controller_schema
+from simulation.network_index import NetworkIndex
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_controller_schema_du_cot_moi_den_va_nga_tu(tmp_path):
+    schema = controller_schema(NetworkIndex(cache_dir=str(tmp_path)))
+    for tls_id in ("J1", "J3"):
+        assert schema[f"{tls_id}_phase"] is str
+        for name in ("north", "south", "east", "west"):
+            assert schema[f"{tls_id}_queue_{name}"] is float
+            assert schema[f"{tls_id}_pressure_{name}"] is float
+    for junction_id in ("J1", "J4"):
+        assert schema[f"{junction_id}_preempt_state"] is str
+        assert schema[f"{junction_id}_served"] is int
+    assert "J3_preempt_state" not in schema
+
+
+def test_cot_khai_bao_truoc_giu_duoc_cot_xuat_hien_sau(tmp_path):
+    """Lô đầu chưa có cột controller (chế độ Mặc định), các lô sau mới có"""
+    path = str(tmp_path / "kpi.csv")
+    recorder = KPIRecorder(path, batch_rows=2,
+                           columns={"step": int, "mode": str, "J1_phase": str, "J1_queue_north": float})
+    recorder.record({"step": 1, "mode": "Mặc định"})
+    recorder.record({"step": 2, "mode": "Mặc định"})
+    recorder.record({"step": 3, "mode": "Thông minh", "J1_phase": "NS_GREEN", "J1_queue_north": 2.5})
+    assert recorder.close() == 3
+    assert recorder.error is None
+    assert recorder.dropped_columns == set()
+
+    rows = read_csv(path)
+    assert list(rows[0]) == ["step", "mode", "J1_phase", "J1_queue_north"]
+    assert rows[0]["J1_phase"] == ""
+    assert rows[2]["J1_phase"] == "NS_GREEN"
+    assert rows[2]["J1_queue_north"] == "2.5"
+
+
+def test_cot_ngoai_schema_bi_bao(tmp_path, capsys):
+    path = str(tmp_path / "kpi.csv")
+    recorder = KPIRecorder(path, batch_rows=1, columns={"step": int})
+    recorder.record({"step": 1, "extra": 5})
+    recorder.record({"step": 2, "extra": 6})
+    recorder.close()
+
+    assert recorder.dropped_columns == {"extra"}
+    out = capsys.readouterr().out
+    assert out.count("extra") == 1  # Cảnh báo 1 lần
+    assert [list(row) for row in read_csv(path)] == [["step"], ["step"]]
+
+
+def test_khong_khai_bao_lay_cot_lo_dau(tmp_path):
+    path = str(tmp_path / "kpi.csv")
+    recorder = KPIRecorder(path, batch_rows=2)
+    recorder.record({"step": 1, "a": 1})
+    recorder.record({"step": 2, "b": 2})
+    recorder.record({"step": 3, "c": 3})
+    recorder.close()
+
+    rows = read_csv(path)
+    assert list(rows[0]) == ["step", "a", "b"]
+    assert recorder.dropped_columns == {"c"}
+
+
+def test_due_moi_n_step(tmp_path):
+    recorder = KPIRecorder(str(tmp_path / "kpi.csv"), every=5)
+    try:
+        assert [step for step in range(12) if recorder.due(step)] == [0, 5, 10]
+    finally:
+        recorder.close()
@@ -0,0 +1,170 @@
+"""
+Unit tests cho gui.log_buffer.LogBuffer (widget Tk giả, không cần màn hình)
+
+Chạy: python -m pytest test/test_log_buffer.py -q
+"""
+
+import os
+import sys
+import threading
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from gui.log_buffer import LogBuffer
+
+
+class FakeText:
+    """tk.Text tối giản: insert/index("end-1c")/delete theo dòng/see"""
+
+    def __init__(self):
+        self.content = ""
+        self.seen = 0
+
+    def insert(self, index, text):
+        assert index == "end"
+        self.content += text
+
+    def index(self, index):
+        assert index == "end-1c"
+        lines = self.content.split("\n")
+        return f"{len(lines)}.{len(lines[-1])}"
+
+    def delete(self, start, end):
+        assert start == "1.0" and end.endswith(".0")
+        self.content = "".join(self.content.splitlines(keepends=True)[int(end.split(".")[0]) - 1:])
+
+    def see(self, index):
+        self.seen += 1
+
+    def lines(self):
+        return self.content.splitlines()
+
+
+class FakeWindow:
+    """Widget đặt lịch after(): chạy callback khi gọi run_pending()"""
+
+    def __init__(self):
+        self.scheduled = {}
+        self._next_id = 0
+
+    def after(self, ms, callback):
+        self._next_id += 1
+        self.scheduled[self._next_id] = callback
+        return self._next_id
+
+    def after_cancel(self, after_id):
+        del self.scheduled[after_id]
+
+    def run_pending(self):
+        callbacks, self.scheduled = list(self.scheduled.values()), {}
+        for callback in callbacks:
+            callback()
+
+
+def test_gioi_han_max_lines():
+    buffer = LogBuffer(max_lines=3)
+    for i in range(5):
+        buffer.append(f"line {i}")
+    assert buffer.lines() == ["line 2", "line 3", "line 4"]
+    assert buffer.total_lines == 5
+
+
+def test_dropped_lines_khi_ghi_don_dap():
+    buffer = LogBuffer(max_lines=10)
+    text = FakeText()
+    buffer.attach(None, text)
+
+    for i in range(25):
+        buffer.append(f"a{i}")
+    assert buffer.dropped_lines == 15  # Lô chờ hiển thị chỉ giữ 10 dòng mới nhất
+    buffer.flush()
+    assert text.lines() == [f"a{i}" for i in range(15, 25)]
+
+    for i in range(4):
+        buffer.append(f"b{i}")
+    assert buffer.dropped_lines == 15  # Lô mới chưa đầy → không bỏ dòng nào
+
+
+def test_dropped_lines_nhieu_luong():
+    buffer = LogBuffer(max_lines=50)
+
+    def worker(n):
+        for i in range(200):
+            buffer.append(f"t{n}-{i}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert buffer.total_lines == 800
+    assert buffer.dropped_lines == 750
+    assert len(buffer.lines()) == 50
+
+
+def test_flush_cat_widget_con_max_lines():
+    buffer = LogBuffer(max_lines=5)
+    text = FakeText()
+    buffer.attach(None, text)
+
+    for i in range(3):
+        buffer.append(f"x{i}")
+    buffer.flush()
+    assert text.lines() == ["x0", "x1", "x2"]
+
+    for i in range(3, 9):
+        buffer.append(f"x{i}")
+    buffer.flush()
+    assert text.lines() == ["x4", "x5", "x6", "x7", "x8"]
+    assert text.content.endswith("\n")
+    assert text.seen == 2
+
+    buffer.flush()  # Không có dòng mới → không chạm widget
+    assert text.seen == 2
+
+
+def test_start_stop_theo_chu_ky():
+    buffer = LogBuffer(max_lines=5)
+    window, text = FakeWindow(), FakeText()
+    buffer.attach(window, text)
+    buffer.start()
+    buffer.append("tick")
+    window.run_pending()
+    assert text.lines() == ["tick"]
+    assert len(window.scheduled) == 1  # Nhịp kế tiếp đã được đặt lịch
+
+    buffer.stop()
+    assert window.scheduled == {}
+
+
+def test_export_tu_file_lich_su(tmp_path):
+    history = tmp_path / "history.txt"
+    buffer = LogBuffer(max_lines=2, history_path=str(history))
+    try:
+        for i in range(5):
+            buffer.append(f"line {i}")
+        out = tmp_path / "export.txt"
+        assert buffer.export(str(out)) == 5  # Toàn bộ lịch sử, không chỉ max_lines
+        assert out.read_text(encoding="utf-8").splitlines() == [f"line {i}" for i in range(5)]
+    finally:
+        buffer.close()
+
+
+def test_export_khong_co_file_lich_su(tmp_path):
+    buffer = LogBuffer(max_lines=2)
+    for i in range(5):
+        buffer.append(f"line {i}")
+    out = tmp_path / "export.txt"
+    assert buffer.export(str(out)) == 2
+    assert out.read_text(encoding="utf-8") == "line 3\nline 4\n"
+
+
+def test_khong_mo_duoc_file_lich_su(tmp_path):
+    buffer = LogBuffer(history_path=str(tmp_path / "missing" / "history.txt"))
+    assert buffer.history_path is None
+    buffer.append("ok")
+    out = tmp_path / "export.txt"
+    assert buffer.export(str(out)) == 1
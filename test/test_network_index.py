@@ -0,0 +1,121 @@
+"""
+Unit tests cho simulation.network_index (chỉ mục ngã tư/hướng dựng từ data/sumo/test2)
+
+Chạy: python -m pytest test/test_network_index.py -q
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from simulation.network_index import DEFAULT_CONFIG, NetworkIndex
+
+
+SUMO_DIR = os.path.dirname(DEFAULT_CONFIG)
+
+
+@pytest.fixture(scope="module")
+def index():
+    return NetworkIndex(cache_dir=None)
+
+
+@pytest.fixture
+def config_copy(tmp_path):
+    """Bản sao test2.sumocfg + net + add trong thư mục tạm (để sửa file mạng)"""
+    for name in ("test2.sumocfg", "test2.net.xml", "test2.add.xml"):
+        shutil.copy(os.path.join(SUMO_DIR, name), tmp_path / name)
+    return tmp_path
+
+
+def test_nga_tu_va_den(index):
+    assert index.junction_ids() == ["J1", "J4"]
+    assert index.junction_for_tls("J1") == "J1"
+    assert index.junction_for_tls("J3") == "J4"
+    assert index.tls_for_junction("J4") == "J3"
+    assert index.tls_for_junction("J1") == "J1"
+
+
+def test_direction_edges_j1(index):
+    assert index.direction_edges("J1") == {
+        "north": ["-E1"], "south": ["-E2"], "east": ["-E3"], "west": ["E0"]}
+    assert index.direction_edges("J1", outgoing=True) == {
+        "north": ["-E1", "E1"], "south": ["-E2", "E2"], "east": ["-E3", "E3"], "west": ["E0", "-E0"]}
+
+
+def test_direction_edges_j4(index):
+    # Hướng theo hình học: -E6 vào J4 từ phía Đông, E3 (từ J1) vào từ phía Tây
+    assert index.direction_edges("J4") == {
+        "north": ["-E4"], "south": ["-E5"], "east": ["-E6"], "west": ["E3"]}
+    assert index.direction_edges("J4", outgoing=True) == {
+        "north": ["-E4", "E4"], "south": ["-E5", "E5"], "east": ["-E6", "E6"], "west": ["E3", "-E3"]}
+
+
+def test_direction_edges_ten_tieng_viet(index):
+    names = {"north": "Bắc", "south": "Nam", "east": "Đông", "west": "Tây"}
+    assert index.direction_edges("J1", names=names)["Tây"] == ["E0"]
+    assert index.direction_edges("J9") == {}
+
+
+def test_tra_cuu_edge(index):
+    assert index.incoming("-E1") == ("J1", "north")
+    assert index.incoming("-E6") == ("J4", "east")
+    assert index.incoming("E3") == ("J4", "west")
+    assert index.incoming("E1") is None  # Edge ra
+    assert index.edge_direction("E3", "J1") == "east"
+    assert index.edge_direction("E3", "J4") == "west"
+    assert index.direction_lanes("J1")["east"] == ["-E3_0", "-E3_1", "-E3_2"]
+
+
+def test_detector_theo_huong(index):
+    j1 = index.detectors("J1")
+    assert j1["east"] == {"e1": ["e1_J1_east_0", "e1_J1_east_1", "e1_J1_east_2"],
+                          "e2": ["e2_J1_east", "e2_J1_east_lane1", "e2_J1_east_lane2"]}
+    assert index.detector_locations["e2_J1_east_lane2"] == ("J1", "east")
+    assert index.detector_locations["e1_J1_west_0"] == ("J1", "west")
+
+    # add.xml đặt tên "west" cho detector trên -E6 nhưng -E6 vào J4 từ phía Đông
+    j4 = index.detectors("J4")
+    assert j4["east"]["e2"] == ["e2_J4_west", "e2_J4_west_lane1", "e2_J4_west_lane2"]
+    assert j4["west"]["e2"] == ["e2_J4_east", "e2_J4_east_lane1", "e2_J4_east_lane2"]
+    assert index.detector_locations["e2_J4_east_lane2"] == ("J4", "west")
+    assert index.detector_locations["e1_J4_west_0"] == ("J4", "east")
+
+    for junction_id in index.junction_ids():
+        for direction, kinds in index.detectors(junction_id).items():
+            assert len(kinds["e1"]) == 3 and len(kinds["e2"]) == 3, (junction_id, direction)
+
+
+def test_cache_doc_lai_giong_ban_dung(config_copy, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    config = str(config_copy / "test2.sumocfg")
+    built = NetworkIndex(config, cache_dir=cache_dir)
+    cached = NetworkIndex(config, cache_dir=cache_dir)
+    assert not built.from_cache
+    assert cached.from_cache
+    assert cached.key == built.key
+    assert cached.junctions == built.junctions
+    assert cached.tls_junctions == built.tls_junctions
+    assert cached.detector_locations == built.detector_locations
+
+
+@pytest.mark.parametrize("name", ["test2.net.xml", "test2.add.xml"])
+def test_khoa_cache_doi_khi_file_mang_doi(config_copy, tmp_path, name):
+    cache_dir = str(tmp_path / "cache")
+    config = str(config_copy / "test2.sumocfg")
+    before = NetworkIndex(config, cache_dir=cache_dir)
+
+    with open(config_copy / name, "a", encoding="utf-8") as f:
+        f.write("\n<!-- modified -->\n")
+    after = NetworkIndex(config, cache_dir=cache_dir)
+
+    assert after.key != before.key
+    assert after.cache_path != before.cache_path
+    assert not after.from_cache
+    assert NetworkIndex(config, cache_dir=cache_dir).key == after.key
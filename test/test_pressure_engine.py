@@ -0,0 +1,318 @@
+"""
+Unit tests cho controllers.pressure_engine.PressureEngine
+
+So sánh với công thức cũ tính riêng từng hướng (convert_to_pcu,
+get_sensor_data_for_direction, calculate_pressure) trên cùng snapshot giả.
+
+Chạy: python -m pytest test/test_pressure_engine.py -q
+"""
+
+import os
+import random
+import sys
+from collections import Counter
+
+import pytest
+import traci
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from controllers.adaptive_controller import AdaptiveController, TrafficDirection
+
+
+VEHICLE_TYPES = ["car", "motorcycle", "bike_1", "bus", "truck", "emergency", "priority"]
+SENSOR_DIRECTIONS = {
+    TrafficDirection.NORTH: "north",
+    TrafficDirection.SOUTH: "south",
+    TrafficDirection.EAST: "east",
+    TrafficDirection.WEST: "west",
+}
+
+
+class FakeSnapshot:
+    """Snapshot giả: {edge: [xe]}, {xe: (speed m/s, vType)}; edge/xe không có → TraCIException"""
+
+    def __init__(self, edges, occupancy, vehicles):
+        self.step_count = 0
+        self.edges = edges
+        self.occupancy = occupancy
+        self.vehicles = vehicles
+        self.calls = Counter()
+
+    def edge_vehicle_ids(self, edge_id):
+        self.calls["edge_vehicle_ids"] += 1
+        if edge_id not in self.edges:
+            raise traci.exceptions.TraCIException(f"Edge '{edge_id}' is not known")
+        return tuple(self.edges[edge_id])
+
+    def edge_occupancy(self, edge_id):
+        self.calls["edge_occupancy"] += 1
+        return self.occupancy[edge_id]
+
+    def vehicle_speed(self, vehicle_id):
+        self.calls["vehicle_speed"] += 1
+        if vehicle_id not in self.vehicles:
+            raise traci.exceptions.TraCIException(f"Vehicle '{vehicle_id}' is not known")
+        return self.vehicles[vehicle_id][0]
+
+    def vehicle_type(self, vehicle_id):
+        self.calls["vehicle_type"] += 1
+        return self.vehicles[vehicle_id][1]
+
+
+class FakeSensorManager:
+    """{(junction_id, hướng): dữ liệu E2} - không có → lỗi, giá trị Exception → ném ra"""
+
+    def __init__(self, data):
+        self.data = data
+        self.calls = []
+
+    def get_junction_density(self, junction_id, direction):
+        self.calls.append((junction_id, direction))
+        value = self.data.get((junction_id, direction), {"error": "không có detector"})
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+class FakeSnapshotController(AdaptiveController):
+    """AdaptiveController đọc từ FakeSnapshot thay vì kết nối TraCI"""
+
+    fake_snapshot = None
+
+    @property
+    def snapshot(self):
+        return self.fake_snapshot
+
+
+# ==================== CÔNG THỨC CŨ ====================
+
+def old_convert_to_pcu(ctrl, direction):
+    total_pcu = 0.0
+    snapshot = ctrl.snapshot
+    for edge in ctrl.direction_edges.get(direction, []):
+        try:
+            vehicles_on_edge = snapshot.edge_vehicle_ids(edge)
+            for veh_id in vehicles_on_edge:
+                try:
+                    speed = snapshot.vehicle_speed(veh_id)
+                    if speed < 2.0:
+                        veh_type = snapshot.vehicle_type(veh_id)
+                        if 'motorcycle' in veh_type.lower() or 'bike' in veh_type.lower():
+                            pcu_value = ctrl.PCU_CONVERSION['motorcycle']
+                        elif 'bus' in veh_type.lower():
+                            pcu_value = ctrl.PCU_CONVERSION['bus']
+                        elif 'truck' in veh_type.lower():
+                            pcu_value = ctrl.PCU_CONVERSION['truck']
+                        elif 'emergency' in veh_type.lower():
+                            pcu_value = ctrl.PCU_CONVERSION['emergency']
+                        else:
+                            pcu_value = ctrl.PCU_CONVERSION['car']
+                        total_pcu += pcu_value
+                except traci.exceptions.TraCIException:
+                    continue
+        except traci.exceptions.TraCIException:
+            continue
+    return total_pcu
+
+
+def old_sensor_data(ctrl, direction, sensor_junction):
+    if ctrl.sensor_manager:
+        try:
+            sensor_dir = SENSOR_DIRECTIONS.get(direction)
+            if sensor_dir:
+                density_data = ctrl.sensor_manager.get_junction_density(sensor_junction, sensor_dir)
+                if "error" not in density_data:
+                    return {
+                        "vehicle_count": density_data.get("total_vehicles", 0),
+                        "occupancy": density_data.get("avg_occupancy", 0.0),
+                        "avg_speed": density_data.get("avg_speed", 0.0),
+                        "queue_length": density_data.get("queue_length", 0)
+                    }
+        except Exception:
+            pass
+
+    total_vehicles = 0
+    total_occupancy = 0.0
+    total_speed = 0.0
+    vehicle_count = 0
+    edge_count = 0
+    snapshot = ctrl.snapshot
+    for edge in ctrl.direction_edges.get(direction, []):
+        try:
+            vehicles = snapshot.edge_vehicle_ids(edge)
+            total_vehicles += len(vehicles)
+            total_occupancy += snapshot.edge_occupancy(edge)
+            edge_count += 1
+            for veh_id in vehicles:
+                try:
+                    speed = snapshot.vehicle_speed(veh_id) * 3.6
+                    total_speed += speed
+                    vehicle_count += 1
+                except Exception:
+                    continue
+        except Exception:
+            continue
+
+    avg_occupancy = total_occupancy / max(edge_count, 1)
+    avg_speed = total_speed / max(vehicle_count, 1) if vehicle_count > 0 else ctrl.SPEED_LIMIT
+    return {
+        "vehicle_count": total_vehicles,
+        "occupancy": avg_occupancy,
+        "avg_speed": avg_speed,
+        "queue_length": total_vehicles
+    }
+
+
+def old_calculate_pressure(ctrl, direction, sensor_junction):
+    queue_pcu = old_convert_to_pcu(ctrl, direction)
+    sensor_data = old_sensor_data(ctrl, direction, sensor_junction)
+    norm_queue = min(queue_pcu / ctrl.QUEUE_MAX, 1.0)
+    avg_occupancy = sensor_data.get("occupancy", 0.0)
+    avg_speed = sensor_data.get("avg_speed", ctrl.SPEED_LIMIT)
+    norm_speed_factor = 1.0 - min(avg_speed / ctrl.SPEED_LIMIT, 1.0)
+    pressure = (
+        ctrl.PRESSURE_WEIGHT_QUEUE * norm_queue +
+        ctrl.PRESSURE_WEIGHT_OCCUPANCY * avg_occupancy +
+        ctrl.PRESSURE_WEIGHT_SPEED * norm_speed_factor
+    )
+    if queue_pcu > 0 and pressure < 0.05:
+        pressure = ctrl.ALPHA * queue_pcu
+    return pressure
+
+
+# ==================== TIỆN ÍCH ====================
+
+def make_controller(tls_id, snapshot, sensor_manager=None):
+    ctrl = FakeSnapshotController(junction_id=tls_id, sensor_manager=sensor_manager)
+    ctrl.fake_snapshot = snapshot
+    return ctrl
+
+
+def random_snapshot(ctrl, seed, missing_edge=True):
+    """Xe ngẫu nhiên trên các edge của controller (kèm 1 edge không tồn tại và xe đã rời mạng)"""
+    rng = random.Random(seed)
+    edges, occupancy, vehicles = {}, {}, {}
+    all_edges = [edge for direction_edges in ctrl.direction_edges.values() for edge in direction_edges]
+    for edge in all_edges:
+        if missing_edge and edge == all_edges[0]:
+            continue
+        ids = []
+        for i in range(rng.randint(0, 12)):
+            vehicle_id = f"{edge}_{i}"
+            ids.append(vehicle_id)
+            if rng.random() < 0.1:
+                continue  # Xe đã rời mạng (speed → TraCIException)
+            speed = 0.0 if rng.random() < 0.4 else rng.uniform(0.0, 15.0)
+            vehicles[vehicle_id] = (speed, rng.choice(VEHICLE_TYPES))
+        edges[edge] = ids
+        occupancy[edge] = rng.uniform(0.0, 0.6)
+    return FakeSnapshot(edges, occupancy, vehicles)
+
+
+def assert_same_as_old(ctrl, sensor_junction):
+    state = ctrl.get_pressure_state()
+    for direction in TrafficDirection:
+        i = state.index[direction]
+        old = old_sensor_data(ctrl, direction, sensor_junction)
+        assert state.queue_pcu[i] == pytest.approx(old_convert_to_pcu(ctrl, direction))
+        assert state.sensor_data(direction) == pytest.approx(old)
+        assert state.pressure[i] == pytest.approx(old_calculate_pressure(ctrl, direction, sensor_junction))
+        assert ctrl.convert_to_pcu(direction) == state.queue_pcu[i]
+        assert ctrl.calculate_pressure(direction) == pytest.approx(state.pressure[i])
+    return state
+
+
+# ==================== PRESSURE ENGINE ====================
+
+@pytest.mark.parametrize("seed", range(8))
+@pytest.mark.parametrize("tls_id", ["J1", "J3"])
+def test_trung_khop_cong_thuc_cu_du_lieu_edge(tls_id, seed):
+    ctrl = make_controller(tls_id, None)
+    ctrl.fake_snapshot = random_snapshot(ctrl, seed)
+    assert_same_as_old(ctrl, ctrl.node_id)
+
+
+def test_nhanh_fallback_alpha_x_queue():
+    """Có queue nhưng P < 0.05 → P = ALPHA × queue PCU"""
+    ctrl = make_controller("J1", None)
+    edge = ctrl.direction_edges[TrafficDirection.NORTH][0]
+    vehicles = {"moto": (0.0, "motorcycle")}
+    vehicles.update({f"fast_{i}": (15.0, "car") for i in range(6)})
+    ctrl.fake_snapshot = FakeSnapshot({edge: list(vehicles)}, {edge: 0.0}, vehicles)
+
+    state = assert_same_as_old(ctrl, ctrl.node_id)
+    i = state.index[TrafficDirection.NORTH]
+    assert state.fallback[i] == 1
+    assert state.pressure[i] == pytest.approx(ctrl.ALPHA * ctrl.PCU_CONVERSION["motorcycle"])
+    assert not any(state.fallback[state.index[d]] for d in TrafficDirection if d != TrafficDirection.NORTH)
+
+
+def test_sensor_manager_theo_node_id():
+    """Đèn J3 điều khiển junction J4 → đọc detector của J4; hướng lỗi/không có detector dùng edge"""
+    ctrl = make_controller("J3", None)
+    assert ctrl.node_id == "J4"
+    sensor_manager = FakeSensorManager({
+        ("J4", "north"): {"total_vehicles": 7, "avg_occupancy": 0.42, "avg_speed": 12.5, "queue_length": 4},
+        ("J4", "south"): {"total_vehicles": 1, "avg_occupancy": 0.05, "avg_speed": 38.0, "queue_length": 0},
+        ("J4", "east"): RuntimeError("detector lỗi"),
+        # west: {"error": ...} → dữ liệu edge
+    })
+    ctrl.sensor_manager = sensor_manager
+    ctrl.fake_snapshot = random_snapshot(ctrl, 3, missing_edge=False)
+
+    state = assert_same_as_old(ctrl, "J4")
+    assert {junction for junction, _ in sensor_manager.calls} == {"J4"}
+    assert state.sensor_data(TrafficDirection.NORTH) == {
+        "vehicle_count": 7, "occupancy": 0.42, "avg_speed": 12.5, "queue_length": 4}
+    # Hướng lỗi → dữ liệu edge như khi không có SensorManager
+    without_sensor = make_controller("J3", ctrl.fake_snapshot)
+    edge_state = without_sensor.get_pressure_state()
+    for direction in (TrafficDirection.EAST, TrafficDirection.WEST):
+        assert state.sensor_data(direction) == pytest.approx(edge_state.sensor_data(direction))
+
+
+def test_tinh_1_lan_moi_step():
+    ctrl = make_controller("J1", None)
+    ctrl.fake_snapshot = random_snapshot(ctrl, 5)
+    snapshot = ctrl.fake_snapshot
+
+    state = ctrl.get_pressure_state()
+    calls = sum(snapshot.calls.values())
+    assert state.step_key == (id(snapshot), 0)
+    for direction in TrafficDirection:
+        ctrl.calculate_pressure(direction)
+        ctrl.convert_to_pcu(direction)
+        ctrl.get_sensor_data_for_direction(direction)
+    assert ctrl.get_pressure_state() is state
+    assert ctrl.pressure_engine.cached_state() is state
+    assert ctrl.pressure_engine.compute_count == 1
+    assert sum(snapshot.calls.values()) == calls
+
+    # Step mới → tính lại
+    snapshot.step_count += 1
+    assert ctrl.pressure_engine.cached_state() is None
+    new_state = ctrl.get_pressure_state()
+    assert new_state is not state
+    assert new_state.step_key == (id(snapshot), 1)
+    assert ctrl.pressure_engine.compute_count == 2
+
+    # Snapshot khác (kết nối mới) cùng số step → tính lại
+    other = random_snapshot(ctrl, 6)
+    other.step_count = snapshot.step_count
+    ctrl.fake_snapshot = other
+    assert ctrl.pressure_engine.cached_state() is None
+    assert ctrl.get_pressure_state().step_key == (id(other), 1)
+    assert ctrl.pressure_engine.compute_count == 3
+
+
+def test_invalidate_doc_lai_pcu_conversion():
+    ctrl = make_controller("J1", None)
+    ctrl.fake_snapshot = random_snapshot(ctrl, 2, missing_edge=False)
+    ctrl.get_pressure_state()
+    ctrl.PCU_CONVERSION = dict(ctrl.PCU_CONVERSION, car=2.0)
+    ctrl.pressure_engine.invalidate()
+    assert_same_as_old(ctrl, ctrl.node_id)
@@ -0,0 +1,80 @@
+"""
+Unit tests cho controllers.priority_controller.PriorityController (dùng kết nối TraCI giả)
+
+Chạy: python -m pytest test/test_priority_controller.py -q
+"""
+
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from fake_traci import FakeConnection
+from controllers.priority_controller import EmergencyVehicle, PriorityController
+
+VEHICLE_ID = "priority_SC1_west_J1_0"
+
+
+def make_controller():
+    """J1 ở gốc tọa độ; xe ưu tiên vào từ phía Tây (E0), ra phía Đông (E3)"""
+    conn = FakeConnection(junctions={"J1": (0.0, 0.0)})
+    conn.add_vehicle(VEHICLE_ID, type_id="priority", road="E0", speed=10.0, position=(-120.0, 0.0))
+    conn.simulationStep()
+    return conn, PriorityController(junction_id="J1", connection=conn)
+
+
+def move(conn, x, road):
+    vehicle = conn.vehicles[VEHICLE_ID]
+    vehicle.position = (x, 0.0)
+    vehicle.road = road
+    conn.simulationStep()
+
+
+def test_xe_qua_nga_tu_chi_dem_1_lan():
+    conn, ctrl = make_controller()
+    ctrl.handle_normal_state()
+    assert VEHICLE_ID in ctrl.confirmed_vehicles
+    record = ctrl.vehicle_records[VEHICLE_ID]
+
+    for x, road in ((-60.0, "E0"), (-10.0, "E0"), (10.0, "E3"), (60.0, "E3")):
+        move(conn, x, road)
+        ctrl._track_confirmed_vehicles(conn.time)
+    assert ctrl.served_vehicles.total_count == 1
+    assert ctrl.clearance_times.count == 1
+    assert VEHICLE_ID not in ctrl.confirmed_vehicles
+
+    # Xe vẫn trong bán kính 150m trên edge ra E3 → không bị phát hiện/ưu tiên lại
+    for x in (80.0, 110.0, 140.0):
+        move(conn, x, "E3")
+        assert ctrl.scan_for_emergency_vehicles() == []
+        ctrl.handle_normal_state()
+        assert not ctrl.confirmed_vehicles
+    assert ctrl.vehicle_records[VEHICLE_ID] is record
+
+    # Rời mạng → bản ghi bị dọn, vẫn chỉ đếm 1 lần
+    conn.vehicle.remove(VEHICLE_ID)
+    conn.simulationStep()
+    ctrl.handle_normal_state()
+    assert VEHICLE_ID not in ctrl.vehicle_records
+    assert ctrl.served_vehicles.total_count == 1
+
+
+def test_xe_da_phuc_vu_bi_bo_khoi_pending():
+    conn, ctrl = make_controller()
+    vehicle = EmergencyVehicle(VEHICLE_ID, "priority", conn.time, "Tây", 120.0, 10.0, "SC1")
+    ctrl.confirmed_vehicles[VEHICLE_ID] = vehicle
+    ctrl.pending_vehicles[VEHICLE_ID] = vehicle
+
+    conn.vehicle.remove(VEHICLE_ID)
+    conn.simulationStep()
+    ctrl._track_confirmed_vehicles(conn.time)
+    assert vehicle.served
+    assert ctrl.pending_vehicles == {}
+    assert ctrl.served_vehicles.total_count == 1
+
+    # Xe đã phục vụ không bị đếm lại dù đi qua nhánh phục vụ khác
+    ctrl._mark_served(vehicle, conn.time)
+    assert ctrl.served_vehicles.total_count == 1
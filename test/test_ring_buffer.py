@@ -0,0 +1,166 @@
+"""
+Unit tests cho utils.ring_buffer (RingBuffer, BoundedHistory)
+
+Chạy: python -m pytest test/test_ring_buffer.py -q
+"""
+
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from utils.ring_buffer import BoundedHistory, RingBuffer
+
+
+# ==================== RingBuffer ====================
+
+def test_capacity_phai_duong():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+
+def test_thu_tu_sau_khi_quay_vong():
+    """Khi đầy, giá trị cũ nhất bị ghi đè và thứ tự vẫn là cũ nhất → mới nhất"""
+    buf = RingBuffer(3)
+    buf.extend([1, 2, 3, 4, 5])
+    assert len(buf) == 3
+    assert buf.to_list() == [3.0, 4.0, 5.0]
+    assert list(buf) == [3.0, 4.0, 5.0]
+    assert buf.last() == 5.0
+
+    buf.append(6)
+    assert buf.to_list() == [4.0, 5.0, 6.0]
+
+
+def test_quay_vong_nhieu_vong():
+    buf = RingBuffer(4)
+    values = list(range(23))
+    buf.extend(values)
+    assert buf.to_list() == [float(v) for v in values[-4:]]
+
+
+def test_getitem_chi_so_am_va_lat_cat():
+    buf = RingBuffer(4)
+    buf.extend([10, 20, 30, 40, 50, 60])  # Đang giữ [30, 40, 50, 60]
+    assert buf[0] == 30.0
+    assert buf[3] == 60.0
+    assert buf[-1] == 60.0
+    assert buf[-4] == 30.0
+    assert buf[-2:] == [50.0, 60.0]
+    assert buf[1:3] == [40.0, 50.0]
+    assert buf[::-1] == [60.0, 50.0, 40.0, 30.0]
+    assert buf[-10:] == [30.0, 40.0, 50.0, 60.0]
+
+
+@pytest.mark.parametrize("index", [4, -5, 100])
+def test_getitem_ngoai_pham_vi(index):
+    buf = RingBuffer(4)
+    buf.extend([1, 2, 3, 4, 5])
+    with pytest.raises(IndexError):
+        buf[index]
+
+
+def test_buffer_rong():
+    buf = RingBuffer(2)
+    assert not buf
+    assert len(buf) == 0
+    assert buf.last() is None
+    assert buf.last(default=-1.0) == -1.0
+    assert buf.mean == 0.0
+    assert buf.min is None and buf.max is None
+    with pytest.raises(IndexError):
+        buf[0]
+
+
+def test_thong_ke_giu_nguyen_sau_khi_ghi_de():
+    """count/total/mean/min/max tính trên toàn bộ giá trị đã thêm, không chỉ phần đang giữ"""
+    buf = RingBuffer(2)
+    values = [5.0, -3.0, 100.0, 7.0, 1.0]
+    buf.extend(values)
+    assert buf.to_list() == [7.0, 1.0]
+    assert buf.count == len(values)
+    assert buf.total == pytest.approx(sum(values))
+    assert buf.mean == pytest.approx(sum(values) / len(values))
+    assert buf.min == -3.0
+    assert buf.max == 100.0
+
+
+def test_bin_bien_thuoc_bin_duoi():
+    """Giá trị bằng đúng ngưỡng bins[i] được đếm vào bin i (<= bins[i])"""
+    buf = RingBuffer(10, bins=(15.0, 25.0))
+    buf.extend([15.0, 25.0])
+    assert buf.bin_counts == [1, 1, 0]
+
+    buf.extend([14.999, 15.001, 25.001, 0.0, -1.0])
+    assert buf.bin_counts == [4, 2, 1]
+
+
+def test_bin_giu_nguyen_sau_khi_ghi_de():
+    buf = RingBuffer(2, bins=(10.0,))
+    buf.extend([1, 2, 3, 20, 30])
+    assert buf.to_list() == [20.0, 30.0]
+    assert buf.bin_counts == [3, 2]
+
+
+def test_clear_stats_va_clear():
+    buf = RingBuffer(3, bins=(1.0,))
+    buf.extend([0.5, 2.0])
+
+    buf.clear_stats()
+    assert buf.to_list() == [0.5, 2.0]  # Dữ liệu giữ nguyên
+    assert buf.count == 0 and buf.total == 0.0
+    assert buf.min is None and buf.max is None
+    assert buf.bin_counts == [0, 0]
+
+    buf.clear()
+    assert len(buf) == 0
+    buf.extend([7, 8, 9, 10])
+    assert buf.to_list() == [8.0, 9.0, 10.0]
+    assert buf.count == 4
+
+
+# ==================== BoundedHistory ====================
+
+def test_bounded_history_giu_n_phan_tu_gan_nhat():
+    history = BoundedHistory(3)
+    history.extend(["a", "b", "c", "d", "e"])
+    assert list(history) == ["c", "d", "e"]
+    assert history.total_count == 5
+
+    history.append("f")
+    assert list(history) == ["d", "e", "f"]
+    assert history.total_count == 6
+
+
+def test_bounded_history_du_lieu_ban_dau():
+    history = BoundedHistory(2, [1, 2, 3])
+    assert list(history) == [2, 3]
+    assert history.total_count == 2
+
+
+def test_bounded_history_getitem():
+    history = BoundedHistory(4)
+    history.extend(range(10))  # Đang giữ [6, 7, 8, 9]
+    assert history[0] == 6
+    assert history[-1] == 9
+    assert history[-4] == 6
+    assert history[-2:] == [8, 9]
+    assert history[-10:] == [6, 7, 8, 9]
+    assert history[1:3] == [7, 8]
+    with pytest.raises(IndexError):
+        history[4]
+    with pytest.raises(IndexError):
+        history[-5]
+
+
+def test_bounded_history_clear():
+    history = BoundedHistory(2)
+    history.extend([1, 2, 3])
+    history.clear()
+    assert len(history) == 0
+    assert history.total_count == 0
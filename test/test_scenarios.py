@@ -0,0 +1,158 @@
+"""
+Unit tests cho simulation.scenarios: lịch kịch bản phải tất định theo seed
+
+Chạy: python -m pytest test/test_scenarios.py -q
+"""
+
+import heapq
+import itertools
+import os
+import random
+import sys
+from types import SimpleNamespace
+
+import pytest
+import traci
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from simulation.scenarios import SCENARIO_SPECS, ScenarioRunner, compile_schedule, iter_schedule
+
+
+END_TIME = 3600.0
+
+
+def as_tuples(events):
+    return [(e.time, e.action, list(e.vehicles), e.scenario_id, e.direction) for e in events]
+
+
+def drain(heap):
+    """Lấy sự kiện theo thứ tự heappop (như khi ghi route file / chạy lịch)"""
+    heap = list(heap)
+    return [heapq.heappop(heap) for _ in range(len(heap))]
+
+
+@pytest.mark.parametrize("scenario_key", list(SCENARIO_SPECS))
+def test_cung_seed_cung_lich(scenario_key):
+    first = compile_schedule(scenario_key, seed=42, end_time=END_TIME)
+    second = compile_schedule(scenario_key, seed=42, end_time=END_TIME)
+    assert first, "Lịch rỗng"
+    assert as_tuples(first) == as_tuples(second)
+    assert as_tuples(drain(first)) == as_tuples(drain(second))
+
+
+@pytest.mark.parametrize("scenario_key", list(SCENARIO_SPECS))
+def test_lich_theo_thu_tu_thoi_gian(scenario_key):
+    events = drain(compile_schedule(scenario_key, seed=7, end_time=END_TIME))
+    times = [e.time for e in events]
+    assert times == sorted(times)
+    assert all(0.0 <= t < END_TIME for t in times)
+
+
+@pytest.mark.parametrize("scenario_key", list(SCENARIO_SPECS))
+def test_iter_schedule_trung_khop_compile(scenario_key):
+    """ScenarioRunner (iter_schedule) và route file (compile_schedule) cùng seed → cùng sự kiện"""
+    compiled = drain(compile_schedule(scenario_key, seed=3, end_time=END_TIME))
+    streamed = list(itertools.islice(iter_schedule(scenario_key, random.Random(3)), len(compiled)))
+    assert as_tuples(streamed) == as_tuples(compiled)
+
+
+@pytest.mark.parametrize("scenario_key", list(SCENARIO_SPECS))
+def test_khac_seed_khac_lich(scenario_key):
+    assert (as_tuples(compile_schedule(scenario_key, seed=1, end_time=END_TIME))
+            != as_tuples(compile_schedule(scenario_key, seed=2, end_time=END_TIME)))
+
+
+def test_start_time_dich_lich():
+    base = drain(compile_schedule("SC1", seed=5, end_time=END_TIME))
+    shifted = drain(compile_schedule("SC1", seed=5, end_time=END_TIME + 100.0, start_time=100.0))
+    assert [e.time + 100.0 for e in base] == [e.time for e in shifted]
+
+
+@pytest.mark.parametrize("seed", [0, 42, 2024])
+def test_sc4_cua_so_xoa_xe_bao_gia(seed):
+    """Mỗi lần spawn báo giả được xóa đúng các xe đó sau remove_after giây"""
+    low, high = SCENARIO_SPECS["SC4"]["remove_after"]
+    first = drain(compile_schedule("SC4", seed=seed, end_time=END_TIME))
+    second = drain(compile_schedule("SC4", seed=seed, end_time=END_TIME))
+    assert as_tuples(first) == as_tuples(second)
+
+    spawns = [e for e in first if e.action == "spawn_priority"]
+    removes = [e for e in first if e.action == "remove"]
+    assert spawns and len(removes) >= len(spawns) - 1
+
+    for spawn, remove in zip(spawns, removes):
+        assert remove.vehicles == spawn.vehicles
+        assert low <= remove.time - spawn.time <= high
+        assert remove.scenario_id == "SC4_FALSE"
+
+    # Lịch xen kẽ spawn → remove → spawn...
+    actions = [e.action for e in first]
+    assert actions[::2] == ["spawn_priority"] * len(actions[::2])
+    assert actions[1::2] == ["remove"] * len(actions[1::2])
+
+
+# ==================== SC4 XÓA XE BÁO GIẢ ====================
+
+class FakeVehicleDomain:
+    def __init__(self, known):
+        self.known = set(known)
+        self.removed = []
+        self.attempts = 0
+
+    def remove(self, veh_id):
+        self.attempts += 1
+        if veh_id not in self.known:
+            raise traci.exceptions.TraCIException(f"Vehicle '{veh_id}' is not known")
+        self.known.discard(veh_id)
+        self.removed.append(veh_id)
+
+
+class FakeDriver:
+    """Driver tối giản: chỉ ghi lại các lệnh schedule_in"""
+
+    def __init__(self, known):
+        self.traci = SimpleNamespace(vehicle=FakeVehicleDomain(known),
+                                     simulation=SimpleNamespace(getDeltaT=lambda: 0.1))
+        self.scheduled = []
+
+    def schedule_in(self, delay, action, *args, tag=None):
+        self.scheduled.append((delay, action, args, tag))
+
+
+def test_sc4_xoa_xe_dang_cho_chen_va_thu_lai():
+    """Xe đang chờ chèn bị xóa ngay; xe SUMO chưa nạp được thử lại ở step kế tiếp"""
+    event = next(e for e in drain(compile_schedule("SC4", seed=1, end_time=END_TIME)) if e.action == "remove")
+    assert len(event.vehicles) == 2
+    pending_id, late_id = event.vehicles[0][0], event.vehicles[1][0]
+
+    driver = FakeDriver(known=[pending_id])
+    runner = ScenarioRunner("SC4", driver, seed=1, log=lambda msg: None, preloaded=True)
+    runner._remove(event)
+
+    assert driver.traci.vehicle.removed == [pending_id]
+    assert len(driver.scheduled) == 1
+    delay, action, (retry, retries), tag = driver.scheduled[0]
+    assert delay == 0.1 and tag == runner.tag
+    assert [v[0] for v in retry.vehicles] == [late_id]
+
+    # Step kế tiếp SUMO đã nạp xe còn lại
+    driver.traci.vehicle.known.add(late_id)
+    action(retry, retries)
+    assert driver.traci.vehicle.removed == [pending_id, late_id]
+    assert len(driver.scheduled) == 1
+
+
+def test_sc4_ngung_thu_lai_sau_so_lan_toi_da():
+    event = next(e for e in drain(compile_schedule("SC4", seed=1, end_time=END_TIME)) if e.action == "remove")
+    driver = FakeDriver(known=[])
+    runner = ScenarioRunner("SC4", driver, seed=1, log=lambda msg: None, preloaded=True)
+    runner._remove(event)
+    while driver.scheduled:
+        _, action, args, _ = driver.scheduled.pop()
+        action(*args)
+    assert driver.traci.vehicle.removed == []
+    assert driver.traci.vehicle.attempts == len(event.vehicles) * 4  # Lần đầu + 3 lần thử lại
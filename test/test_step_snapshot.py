@@ -0,0 +1,235 @@
+"""
+Unit tests cho simulation.step_snapshot.StepSnapshot (dùng kết nối TraCI giả)
+
+Chạy: python -m pytest test/test_step_snapshot.py -q
+"""
+
+import os
+import sys
+
+import pytest
+import traci
+import traci.constants as tc
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from fake_traci import FakeConnection
+from simulation.step_snapshot import StepSnapshot
+
+
+@pytest.fixture
+def conn():
+    conn = FakeConnection(edges={"E0": 0.25, "E1": 0.5, "E2": 0.0}, junctions={"J1": (0.0, 0.0)})
+    conn.add_vehicle("car_0", road="E0", speed=1.5, type_id="car")
+    conn.add_vehicle("bus_0", road="E1", speed=8.0, type_id="bus")
+    conn.simulationStep()
+    return conn
+
+
+# ==================== CACHE THEO STEP ====================
+
+def test_moi_gia_tri_chi_doc_1_lan_moi_step(conn):
+    snapshot = StepSnapshot(conn)
+    conn.reset_calls()
+    for _ in range(3):
+        assert snapshot.get_time() == 1.0
+        assert snapshot.vehicle_speed("car_0") == 1.5
+        assert snapshot.edge_vehicle_ids("E0") == ("car_0",)
+        assert snapshot.has_vehicle("bus_0")
+    assert conn.calls["simulation.getTime"] == 1
+    assert conn.calls["vehicle.getSpeed"] == 1
+    assert conn.calls["edge.getLastStepVehicleIDs"] == 1
+    assert conn.calls["vehicle.getIDList"] == 1
+
+
+def test_step_moi_xoa_cache(conn):
+    snapshot = StepSnapshot(conn)
+    assert snapshot.vehicle_speed("car_0") == 1.5
+    step_count = snapshot.step_count
+
+    conn.vehicles["car_0"].speed = 4.0
+    conn.vehicles["car_0"].road = "E2"
+    conn.simulationStep()
+
+    assert snapshot.step_count == step_count + 1
+    assert snapshot.get_time() == 2.0
+    assert snapshot.vehicle_speed("car_0") == 4.0
+    assert snapshot.edge_vehicle_ids("E0") == ()
+    assert snapshot.edge_vehicle_ids("E2") == ("car_0",)
+
+
+def test_loi_traci_khong_bi_cache(conn):
+    snapshot = StepSnapshot(conn)
+    with pytest.raises(traci.exceptions.TraCIException):
+        snapshot.vehicle_speed("ghost")
+    conn.add_vehicle("ghost", speed=2.0)
+    conn.simulationStep()
+    assert snapshot.vehicle_speed("ghost") == 2.0
+
+
+def test_detach_dung_lam_moi(conn):
+    snapshot = StepSnapshot(conn)
+    snapshot.detach()
+    step_count = snapshot.step_count
+    conn.simulationStep()
+    assert snapshot.step_count == step_count
+
+
+# ==================== VEHICLE SUBSCRIPTION ====================
+
+def test_subscribe_vehicles_va_xe_moi_vao_mang(conn):
+    snapshot = StepSnapshot(conn)
+    snapshot.subscribe_vehicles((tc.VAR_SPEED, tc.VAR_TYPE))
+    assert set(conn.vehicle_subs) == {"car_0", "bus_0"}
+
+    conn.add_vehicle("truck_0", road="E2", speed=0.5, type_id="truck")
+    conn.simulationStep()
+    # StepListener subscribe xe vừa departed
+    assert "truck_0" in conn.vehicle_subs
+    assert snapshot.departed_ids() == ("truck_0",)
+
+    conn.reset_calls()
+    assert snapshot.vehicle_speed("truck_0") == 0.5
+    assert snapshot.vehicle_type("truck_0") == "truck"
+    assert snapshot.vehicle_speed("bus_0") == 8.0
+    assert conn.calls["vehicle.getSpeed"] == 0
+    assert conn.calls["vehicle.getTypeID"] == 0
+    assert conn.calls["simulation.getDepartedIDList"] == 0
+
+
+def test_subscribe_vehicles_gop_bien(conn):
+    snapshot = StepSnapshot(conn)
+    snapshot.subscribe_vehicles((tc.VAR_SPEED,))
+    snapshot.subscribe_vehicles((tc.VAR_SPEED, tc.VAR_ROAD_ID))
+    assert snapshot.vehicle_sub_vars == (tc.VAR_SPEED, tc.VAR_ROAD_ID)
+    assert conn.vehicle_subs["car_0"] == (tc.VAR_SPEED, tc.VAR_ROAD_ID)
+    conn.reset_calls()
+    snapshot.subscribe_vehicles((tc.VAR_ROAD_ID,))  # Không có biến mới → không gửi lệnh
+    assert sum(conn.calls.values()) == 0
+
+
+def test_bien_khong_subscribe_doc_truc_tiep(conn):
+    snapshot = StepSnapshot(conn)
+    snapshot.subscribe_vehicles((tc.VAR_SPEED,))
+    conn.reset_calls()
+    assert snapshot.vehicle_road("car_0") == "E0"
+    assert conn.calls["vehicle.getRoadID"] == 1
+
+
+def test_xe_mat_subscription_doc_truc_tiep(conn):
+    """Kết quả subscription thiếu (xe subscribe lỗi/đã bị bỏ) → gọi TraCI trực tiếp"""
+    snapshot = StepSnapshot(conn)
+    snapshot.subscribe_vehicles((tc.VAR_SPEED,))
+    del conn.vehicle_subs["car_0"]
+    conn.simulationStep()  # StepListener chỉ subscribe xe mới departed
+    assert "car_0" not in conn.vehicle_results
+    conn.reset_calls()
+    assert snapshot.vehicle_speed("car_0") == 1.5
+    assert conn.calls["vehicle.getSpeed"] == 1
+
+
+# ==================== EDGE SUBSCRIPTION ====================
+
+def test_subscribe_edges_doc_tu_ket_qua(conn):
+    snapshot = StepSnapshot(conn)
+    failed = snapshot.subscribe_edges(["E0", "E1", "missing"])
+    assert failed == {"missing"}
+    assert snapshot.subscribed_edges == {"E0", "E1"}
+
+    conn.simulationStep()
+    conn.reset_calls()
+    assert snapshot.edge_vehicle_count("E0") == 1
+    assert snapshot.edge_vehicle_count("E1") == 1
+    assert sum(conn.calls.values()) == 0
+
+    # Edge không subscribe → đọc danh sách xe
+    assert snapshot.edge_vehicle_count("E2") == 0
+    assert conn.calls["edge.getLastStepVehicleIDs"] == 1
+
+
+def test_subscribe_edges_gop_bien_va_subscribe_lai_edge_cu(conn):
+    snapshot = StepSnapshot(conn)
+    snapshot.subscribe_edges(["E0"])
+    assert conn.edge_subs == {"E0": (tc.LAST_STEP_VEHICLE_NUMBER,)}
+
+    conn.reset_calls()
+    snapshot.subscribe_edges(["E0"])  # Đã subscribe đủ biến → không gửi lệnh subscribe
+    assert conn.calls["edge.subscribe"] == 0
+
+    snapshot.subscribe_edges(["E1"], (tc.LAST_STEP_OCCUPANCY,))
+    merged = (tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_OCCUPANCY)
+    assert snapshot.edge_sub_vars == merged
+    assert conn.edge_subs == {"E0": merged, "E1": merged}
+    assert snapshot.subscribed_edges == {"E0", "E1"}
+
+    conn.simulationStep()
+    conn.reset_calls()
+    assert snapshot.edge_occupancy("E0") == 0.25
+    assert snapshot.edge_occupancy("E1") == 0.5
+    assert conn.calls["edge.getLastStepOccupancy"] == 0
+
+
+# ==================== JUNCTION CONTEXT ====================
+
+def test_junction_context(conn):
+    conn.vehicles["car_0"].position = (10.0, 0.0)
+    conn.vehicles["bus_0"].position = (500.0, 0.0)
+    snapshot = StepSnapshot(conn)
+    snapshot.subscribe_junction_context("J1", 150.0)
+    conn.simulationStep()
+
+    assert set(snapshot.junction_vehicles("J1")) == {"car_0"}
+    assert snapshot.junction_vehicles("J9") == {}
+    conn.reset_calls()
+    assert snapshot.vehicle_position("car_0") == (10.0, 0.0)
+    assert conn.calls["vehicle.getPosition"] == 0
+
+
+def test_edge_thieu_ket_qua_subscription_doc_truc_tiep(conn):
+    snapshot = StepSnapshot(conn)
+    snapshot.subscribe_edges(["E0"])
+    del conn.edge_subs["E0"]  # SUMO không còn gửi kết quả của E0
+    conn.simulationStep()
+    conn.reset_calls()
+    assert snapshot.edge_vehicle_count("E0") == 1
+    assert conn.calls["edge.getLastStepVehicleIDs"] == 1
+
+
+# ==================== NẠP LẠI MÔ PHỎNG ====================
+
+def test_reload_subscribe_lai_sau_load(conn):
+    """traci.load bỏ mọi subscription → reload() gửi lại context/edge/vehicle subscription"""
+    snapshot = StepSnapshot(conn)
+    snapshot.subscribe_vehicles((tc.VAR_SPEED,))
+    snapshot.subscribe_junction_context("J1", 150.0)
+    snapshot.subscribe_edges(["E0", "E1"])
+
+    conn.load()
+    assert conn.context_subs == {} and conn.edge_subs == {}
+    snapshot.reload()
+    assert set(conn.context_subs) == {"J1"}
+    assert set(conn.edge_subs) == {"E0", "E1"}
+    assert snapshot.subscribed_edges == {"E0", "E1"}
+
+    conn.add_vehicle("amb_0", road="E0", speed=9.0, type_id="ambulance", position=(20.0, 0.0))
+    conn.simulationStep()
+    assert "amb_0" in conn.vehicle_subs  # Xe vào mạng sau load vẫn được subscribe
+    conn.reset_calls()
+    assert set(snapshot.junction_vehicles("J1")) == {"amb_0"}
+    assert snapshot.edge_vehicle_count("E0") == 1
+    assert snapshot.vehicle_speed("amb_0") == 9.0
+    assert sum(conn.calls.values()) == 0
+
+
+def test_subscribe_junction_context_force(conn):
+    snapshot = StepSnapshot(conn)
+    snapshot.subscribe_junction_context("J1", 150.0)
+    conn.load()
+    conn.reset_calls()
+    snapshot.subscribe_junction_context("J1", 150.0)  # Snapshot vẫn ghi nhận đã subscribe
+    assert conn.calls["junction.subscribeContext"] == 0
+    snapshot.subscribe_junction_context("J1", 150.0, force=True)
+    assert set(conn.context_subs) == {"J1"}
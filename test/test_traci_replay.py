@@ -0,0 +1,156 @@
+"""
+Unit tests cho utils.traci_replay (TraCIRecorder, ReplayConnection)
+
+Ghi một lần chạy ngắn của SUMO (bỏ qua nếu không có SUMO), phát lại không cần
+SUMO ở chế độ strict và kiểm tra lời gọi lệch khỏi trace bị báo lỗi.
+
+Chạy: python -m pytest test/test_traci_replay.py -q
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+import traci
+from sumolib import checkBinary
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from simulation.step_snapshot import StepSnapshot
+from simulation.sumo_connector import khoi_dong_sumo
+from utils.traci_replay import ReplayConnection, ReplayMismatchError, TraCIRecorder, load_trace
+
+CONFIG_PATH = os.path.join(PROJECT_ROOT, "data", "sumo", "test2.sumocfg")
+STEPS = 15
+EDGES = ["E0", "-E1", "-E6"]
+
+needs_sumo = pytest.mark.skipif(shutil.which(checkBinary("sumo")) is None, reason="Không có SUMO")
+
+
+def drive(conn, steps=STEPS):
+    """Vòng lặp mô phỏng nhỏ: đọc thời gian, xe, số xe theo edge (subscription) và 1 lời gọi lỗi"""
+    snapshot = StepSnapshot(conn)
+    snapshot.subscribe_edges(EDGES)
+    observed = []
+    try:
+        for _ in range(steps):
+            conn.simulationStep()
+            vehicle_ids = snapshot.vehicle_ids()
+            speeds = [round(snapshot.vehicle_speed(v), 6) for v in sorted(vehicle_ids)[:3]]
+            counts = [snapshot.edge_vehicle_count(e) for e in EDGES]
+            try:
+                conn.vehicle.getSpeed("ghost")
+                error = None
+            except traci.exceptions.TraCIException as e:
+                error = type(e).__name__
+            observed.append((snapshot.get_time(), len(vehicle_ids), speeds, counts, error))
+    finally:
+        snapshot.detach()
+    return observed
+
+
+@pytest.fixture(scope="module")
+def recorded(tmp_path_factory):
+    """Trace của STEPS step test2 + kết quả quan sát được khi ghi"""
+    if shutil.which(checkBinary("sumo")) is None:
+        pytest.skip("Không có SUMO")
+    label = "test_traci_replay"
+    assert khoi_dong_sumo(CONFIG_PATH, gui=False, label=label, extra_args=["--seed", "1"])
+    conn = traci.getConnection(label)
+    try:
+        recorder = TraCIRecorder(conn, meta={"scenario": "test2", "steps": STEPS})
+        observed = drive(conn)
+        recorder.detach()
+        path = str(tmp_path_factory.mktemp("trace") / "test2.traci.gz")
+        assert recorder.save(path) == STEPS
+    finally:
+        conn.close()
+    return path, observed
+
+
+@needs_sumo
+def test_phat_lai_strict_giong_luc_ghi(recorded):
+    path, observed = recorded
+    conn = ReplayConnection(path, strict=True)
+    assert conn.meta == {"scenario": "test2", "steps": STEPS}
+    assert conn.recorded_steps == STEPS
+    assert drive(conn) == observed
+    assert any(counts != [0, 0, 0] for _, _, _, counts, _ in observed)  # Subscription có dữ liệu
+    assert all(error == "TraCIException" for *_, error in observed)
+    with pytest.raises(ReplayMismatchError):
+        conn.simulationStep()  # Hết trace
+
+
+@needs_sumo
+def test_loi_goi_khac_trace(recorded):
+    path, _ = recorded
+    conn = ReplayConnection(path)
+    with pytest.raises(ReplayMismatchError, match="edge.getIDList"):
+        conn.edge.getIDList()  # Lần ghi gọi subscribe_edges trước
+
+
+@needs_sumo
+def test_tham_so_khac_trace_chi_loi_o_strict(recorded):
+    path, _ = recorded
+    trace = load_trace(path)
+    strict = ReplayConnection(trace, strict=True)
+    with pytest.raises(ReplayMismatchError, match="step 0"):
+        strict.edge.subscribe("E9", (0x10,))
+
+    loose = ReplayConnection(trace, strict=False)
+    loose.edge.subscribe("E9", (0x10,))  # Chỉ so tên lời gọi
+    assert loose.calls == 1
+
+
+# ==================== TRACE TỰ DỰNG (không cần SUMO) ====================
+
+def make_trace():
+    steps = [
+        [("simulation.getTime", (), None, 0, 0.0)],
+        [("simulation.getTime", (), None, 0, 1.0),
+         ("vehicle.getSpeed", ("veh_0",), None, 0, 3.5),
+         ("vehicle.getSpeed", ("ghost",), None, 1, (traci.exceptions.TraCIException, "Vehicle 'ghost' is not known"))],
+        [],
+    ]
+    return {"format": 1, "meta": {}, "steps": steps}
+
+
+def test_trace_tu_dung_phat_lai_ket_qua_va_loi():
+    conn = ReplayConnection(make_trace())
+    assert conn.simulation.getTime() == 0.0
+    conn.simulationStep()
+    assert conn.simulation.getTime() == 1.0
+    assert conn.vehicle.getSpeed("veh_0") == 3.5
+    with pytest.raises(traci.exceptions.TraCIException, match="ghost"):
+        conn.vehicle.getSpeed("ghost")
+    conn.simulationStep()
+    assert conn.calls == 4
+
+
+def test_trace_tu_dung_bo_sot_loi_goi():
+    conn = ReplayConnection(make_trace(), strict=True)
+    conn.simulation.getTime()
+    conn.simulationStep()
+    conn.simulation.getTime()
+    with pytest.raises(ReplayMismatchError, match="vehicle.getSpeed"):
+        conn.simulationStep()  # Còn 2 lời gọi chưa phát lại
+
+
+def test_trace_tu_dung_goi_them():
+    conn = ReplayConnection(make_trace())
+    conn.simulation.getTime()
+    with pytest.raises(ReplayMismatchError, match="không còn lời gọi"):
+        conn.simulation.getTime()
+
+
+def test_trace_tu_dung_tham_so_khac():
+    conn = ReplayConnection(make_trace(), strict=True)
+    conn.simulation.getTime()
+    conn.simulationStep()
+    conn.simulation.getTime()
+    with pytest.raises(ReplayMismatchError, match="veh_1"):
+        conn.vehicle.getSpeed("veh_1")
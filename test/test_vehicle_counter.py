@@ -0,0 +1,98 @@
+"""
+Unit tests cho simulation.vehicle_counter.VehicleCounter (dùng kết nối TraCI giả)
+
+Chạy: python -m pytest test/test_vehicle_counter.py -q
+"""
+
+import os
+import random
+import sys
+
+import pytest
+import traci
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_ROOT = os.path.join(PROJECT_ROOT, 'src')
+if SRC_ROOT not in sys.path:
+    sys.path.insert(0, SRC_ROOT)
+
+from fake_traci import FakeConnection
+from simulation.network_index import DEFAULT_CONFIG, NetworkIndex
+from simulation.vehicle_counter import VehicleCounter
+
+MISSING_EDGE = "E5"        # Không có trong mạng giả → subscribe lỗi, đọc danh sách xe cũng lỗi
+UNSUBSCRIBABLE_EDGE = "-E2"  # Có trong mạng nhưng subscribe lỗi → đếm bằng danh sách xe
+
+
+@pytest.fixture(scope="module")
+def index():
+    return NetworkIndex(cache_dir=None)
+
+
+def make_connection(index):
+    edges = {edge for junction_id in index.junction_ids()
+             for edge_list in index.direction_edges(junction_id, outgoing=True).values() for edge in edge_list}
+    edges.discard(MISSING_EDGE)
+    conn = FakeConnection(edges={edge: 0.0 for edge in sorted(edges | {"other", ":J1_0"})})
+
+    subscribe = conn.edge.subscribe
+
+    def failing_subscribe(edge_id, var_ids):
+        if edge_id == UNSUBSCRIBABLE_EDGE:
+            raise traci.exceptions.TraCIException(f"Edge '{edge_id}' cannot be subscribed")
+        subscribe(edge_id, var_ids)
+
+    conn.edge.subscribe = failing_subscribe
+    return conn
+
+
+def shuffle_vehicles(conn, rng, step):
+    """Xe mới vào mạng, xe đổi edge, xe rời mạng"""
+    roads = sorted(conn.edges) + [MISSING_EDGE]
+    for i in range(rng.randint(0, 6)):
+        conn.add_vehicle(f"veh_{step}_{i}", road=rng.choice(roads))
+    for vehicle_id in list(conn.vehicles):
+        roll = rng.random()
+        if roll < 0.15:
+            conn.vehicle.remove(vehicle_id)
+        elif roll < 0.5:
+            conn.vehicles[vehicle_id].road = rng.choice(roads)
+    conn.simulationStep()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_subscription_khop_cach_doc_danh_sach_xe(index, seed):
+    conn = make_connection(index)
+    by_subscription = VehicleCounter(DEFAULT_CONFIG, connection=conn, network_index=index)
+    by_scan = VehicleCounter(DEFAULT_CONFIG, connection=conn, network_index=index, use_subscription=False)
+    rng = random.Random(seed)
+
+    for step in range(30):
+        shuffle_vehicles(conn, rng, step)
+        conn.reset_calls()
+        by_subscription.count_vehicles_on_edges()
+        # Chỉ edge không subscribe được mới đọc danh sách xe
+        assert conn.calls["edge.getLastStepVehicleIDs"] == 2
+        by_scan.count_vehicles_on_edges()
+        assert by_subscription.get_current_counts() == by_scan.get_current_counts()
+
+    snapshot = by_subscription._subscribed_snapshot
+    assert UNSUBSCRIBABLE_EDGE not in snapshot.subscribed_edges
+    assert MISSING_EDGE not in snapshot.subscribed_edges
+    assert sum(sum(c.values()) for c in by_scan.get_current_counts().values()) > 0
+
+
+def test_dem_xe_theo_huong(index):
+    conn = make_connection(index)
+    conn.add_vehicle("a", road="E0")   # J1 Tây (vào)
+    conn.add_vehicle("b", road="-E0")  # J1 Tây (ra)
+    conn.add_vehicle("c", road=UNSUBSCRIBABLE_EDGE)  # J1 Nam, đếm bằng danh sách xe
+    conn.add_vehicle("d", road="E3")   # J1 Đông (ra) = J4 Tây (vào)
+    conn.add_vehicle("e", road="other")
+    conn.simulationStep()
+
+    counter = VehicleCounter(DEFAULT_CONFIG, connection=conn, network_index=index)
+    counter.count_vehicles_on_edges()
+    counts = counter.get_current_counts()
+    assert counts["J1"] == {"Bắc": 0, "Nam": 1, "Đông": 1, "Tây": 2}
+    assert counts["J4"] == {"Bắc": 0, "Nam": 0, "Đông": 0, "Tây": 1}